@@ -0,0 +1,659 @@
+"""Бенчмарки слоев хранения, фильтрации и команд книжной библиотеки.
+
+Генерирует детерминированный синтетический каталог (русские и английские
+книги, авторы и жанры с распределением Ципфа, разное количество цитат),
+загружает его в тестовую базу данных и замеряет время основных операций.
+Результаты выводятся в формате JSON, чтобы их можно было сравнивать
+между коммитами.
+
+Примеры использования:
+    python bench.py --size 10000
+    python bench.py --size 100000 --repeat 5 --output bench_output.txt
+    python bench.py --size 1000000 --parallel 8
+    python bench.py --size 10000 --shared-quotes 0.5
+    python bench.py --size 1000 --pg-dsn "dbname=bench user=postgres" --pg-reset
+    python bench.py --pg-dsn "dbname=bench user=postgres" --partitioning 10000000
+
+Функции:
+    generate_catalogue: Генерация синтетического каталога книг.
+    run_benchmarks: Запуск всех сценариев и сбор результатов.
+    run_partition_benchmarks: Сравнение book_quotes без секций и с секциями (PostgreSQL).
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from booklib import Book, BookFilter, LibraryStorage
+from booklib.columnar import open_catalogue
+from booklib.connection import connect as open_connection, load_settings
+from booklib.models import quote_hash
+from booklib.pool import STATEMENTS
+from create_db import backfill_dimensions, migrate
+from fakedb import FakeDatabase
+
+RU_FIRST = ['Лев', 'Фёдор', 'Антон', 'Михаил', 'Анна', 'Иван', 'Николай', 'Марина',
+            'Александр', 'Ольга', 'Сергей', 'Борис', 'Владимир', 'Татьяна', 'Юрий']
+RU_LAST = ['Толстой', 'Достоевский', 'Чехов', 'Булгаков', 'Ахматова', 'Тургенев',
+           'Гоголь', 'Цветаева', 'Пушкин', 'Берггольц', 'Есенин', 'Пастернак',
+           'Набоков', 'Ёлкин', 'Шолохов', 'Платонов', 'Бунин', 'Лермонтов']
+EN_FIRST = ['Jane', 'Charles', 'George', 'Virginia', 'Mark', 'Ernest', 'Emily',
+            'John', 'Agatha', 'Oscar', 'Herman', 'Mary']
+EN_LAST = ['Austen', 'Dickens', 'Orwell', 'Woolf', 'Twain', 'Hemingway', 'Bronte',
+           'Steinbeck', 'Christie', 'Wilde', 'Melville', 'Shelley']
+RU_WORDS = ['война', 'мир', 'преступление', 'наказание', 'мастер', 'ёлка', 'сад',
+            'вишнёвый', 'тихий', 'дон', 'белая', 'гвардия', 'отцы', 'дети', 'мёртвые',
+            'души', 'герой', 'нашего', 'времени', 'идиот', 'бесы', 'чайка', 'лето']
+EN_WORDS = ['pride', 'prejudice', 'great', 'expectations', 'farm', 'animal', 'old',
+            'man', 'sea', 'whale', 'moby', 'dorian', 'gray', 'picture', 'heights',
+            'wuthering', 'grapes', 'wrath', 'murder', 'orient', 'express']
+# Размер набора известных цитат (см. generate_catalogue(shared_quotes=...))
+FAMOUS_QUOTES = 200
+
+# Количество цитат в бенчмарке секционирования и цитат на одну книгу
+PARTITION_BENCH_QUOTES = 10_000_000
+PARTITION_BENCH_QUOTES_PER_BOOK = 10
+
+GENRES = ['Роман', 'Повесть', 'Рассказ', 'Поэзия', 'Драма', 'Фэнтези', 'Детектив',
+          'Фантастика', 'Novel', 'Poetry', 'Drama', 'Mystery', 'Science Fiction',
+          'Биография', 'Мемуары', 'Сатира', 'Эссе', 'Horror', 'Romance', 'Thriller']
+
+
+def _zipf_cum_weights(n, s=1.1):
+    """Возвращает накопленные веса распределения Ципфа для n элементов.
+
+    Args:
+        n (int): Количество элементов.
+        s (float, optional): Показатель распределения.
+
+    Returns:
+        list: Накопленные веса для random.choices().
+    """
+    return list(itertools.accumulate(1.0 / (k ** s) for k in range(1, n + 1)))
+
+
+def _famous_quotes(seed, count=FAMOUS_QUOTES):
+    """Генерирует набор длинных «известных» цитат, общих для многих книг."""
+    rng = random.Random(f"famous-{seed}")  # отдельный генератор: каталог без общих цитат не меняется
+    quotes = []
+    for i in range(count):
+        words = RU_WORDS if i % 2 == 0 else EN_WORDS
+        quotes.append(' '.join(rng.choices(words, k=rng.randint(20, 60))).capitalize() + '.')
+    return quotes
+
+
+def generate_catalogue(size, seed=0, quotes_mean=2.0, shared_quotes=0.0):
+    """Генерирует детерминированный синтетический каталог книг.
+
+    Авторы и жанры выбираются по распределению Ципфа, поэтому небольшое
+    число авторов пишет большую часть книг, как в реальных библиотеках.
+    Примерно половина книг русские, половина английские.
+
+    Args:
+        size (int): Количество книг.
+        seed (int, optional): Зерно генератора случайных чисел. По умолчанию 0.
+        quotes_mean (float, optional): Среднее количество цитат на книгу.
+        shared_quotes (float, optional): Доля цитат, взятых из общего набора
+            известных цитат (выбираются по распределению Ципфа).
+
+    Returns:
+        list: Список объектов Book без идентификаторов.
+    """
+    rng = random.Random(seed)
+    famous = _famous_quotes(seed) if shared_quotes else []
+    famous_weights = _zipf_cum_weights(len(famous)) if famous else None
+
+    n_authors = max(20, size // 20)
+    authors = []
+    for i in range(n_authors):
+        if i % 2 == 0:
+            authors.append(f"{rng.choice(RU_FIRST)} {rng.choice(RU_LAST)}")
+        else:
+            authors.append(f"{rng.choice(EN_FIRST)} {rng.choice(EN_LAST)}")
+    author_weights = _zipf_cum_weights(n_authors)
+    genre_weights = _zipf_cum_weights(len(GENRES))
+
+    books = []
+    for i in range(size):
+        author = rng.choices(authors, cum_weights=author_weights)[0]
+        genre = rng.choices(GENRES, cum_weights=genre_weights)[0]
+        words = RU_WORDS if rng.random() < 0.5 else EN_WORDS
+        title = ' '.join(rng.sample(words, rng.randint(1, 4))).capitalize()
+        title = f"{title} {i}"
+        year = rng.randint(1800, 2024)
+
+        n_quotes = int(rng.expovariate(1.0 / quotes_mean)) if quotes_mean > 0 else 0
+        quotes = []
+        for _ in range(n_quotes):
+            if famous and rng.random() < shared_quotes:
+                quotes.append(rng.choices(famous, cum_weights=famous_weights)[0])
+            else:
+                quotes.append(' '.join(rng.choices(words, k=rng.randint(4, 20))).capitalize() + '.')
+
+        books.append(Book(title, author, year, genre, quotes))
+
+    return books
+
+
+def _measure(func, repeat):
+    """Замеряет время выполнения функции.
+
+    Args:
+        func (callable): Функция без аргументов.
+        repeat (int): Количество повторов.
+
+    Returns:
+        dict: Минимальное, медианное время и количество повторов (в секундах).
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'repeat': repeat}
+
+
+def _git_commit():
+    """Возвращает хеш текущего коммита или None, если git недоступен."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _quote_sizes(connect, tmpdir):
+    """Сравнивает объем цитат с общими текстами и без них.
+
+    Args:
+        connect (callable): Функция подключения к базе бенчмарка.
+        tmpdir (str): Каталог для временных файлов.
+
+    Returns:
+        dict: Байты текстов цитат в БД (копия на каждую книгу против одной
+            копии в quote_texts, с хешами), память строк цитат в кеше
+            (копии против общих объектов) и размер упакованного каталога
+            без сжатия и со сжатием zlib.
+    """
+    conn = connect()
+    cur = conn.cursor()
+    cur.execute("SELECT qt.quote FROM book_quotes bq JOIN quote_texts qt ON qt.quote_hash = bq.quote_hash")
+    linked = [quote for quote, in cur.fetchall()]
+    cur.execute("SELECT quote FROM quote_texts")
+    texts = [quote for quote, in cur.fetchall()]
+    conn.close()
+    digest = 64  # хеш SHA-256 в шестнадцатеричном виде
+    sizes = {
+        'quotes': len(linked),
+        'quote_texts': len(texts),
+        'db.per_book_bytes': sum(len(q.encode('utf-8')) + digest for q in linked),
+        'db.shared_bytes': sum(len(q.encode('utf-8')) + digest for q in texts) + digest * len(linked),
+    }
+
+    storage = LibraryStorage(eager_quotes=True)
+    quotes = [quote for book in storage.books for quote in book.quotes]
+    sizes['memory.copies_bytes'] = sum(sys.getsizeof(q) for q in quotes)
+    sizes['memory.interned_bytes'] = sum(sys.getsizeof(q) for q in {id(q): q for q in quotes}.values())
+
+    path = os.path.join(tmpdir, 'sizes.pack')
+    sizes['pack.plain_bytes'] = storage.pack(path)
+    sizes['pack.compressed_bytes'] = storage.pack(path, compress=True)
+    storage.close()
+    return sizes
+
+
+def _pg_backend(dsn, books, reset):
+    """Готовит базу PostgreSQL для бенчмарка.
+
+    Args:
+        dsn (str): Строка подключения psycopg2.
+        books (list): Каталог для загрузки.
+        reset (bool): Очищать ли таблицы перед загрузкой.
+
+    Returns:
+        callable: Функция, открывающая подключение к базе.
+    """
+    settings = load_settings(dsn=dsn, statement_timeout=0)  # загрузка большого каталога идет долго
+
+    def connect():
+        return open_connection(settings)
+
+    conn = connect()
+    migrate(conn, verbose=False)
+    cur = conn.cursor()
+    if reset:
+        cur.execute("TRUNCATE books, book_quotes, quote_texts, book_tombstones, authors, genres RESTART IDENTITY CASCADE")
+        for book in books:
+            cur.execute("INSERT INTO books (title, author, year, genre, natural_key) "
+                        "VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                        (book.title, book.author, book.year, book.genre, book.natural_key))
+            book_id = cur.fetchone()[0]
+            for quote in dict.fromkeys(book.quotes):
+                cur.execute("INSERT INTO quote_texts (quote_hash, quote) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                            (quote_hash(quote), quote))
+                cur.execute("INSERT INTO book_quotes (book_id, quote_hash) VALUES (%s, %s)",
+                            (book_id, quote_hash(quote)))
+        backfill_dimensions(cur)
+        conn.commit()
+    cur.close()
+    conn.close()
+    return connect
+
+
+def run_benchmarks(size, seed=0, repeat=3, connect=None, books=None, shared_quotes=0.0):
+    """Запускает все сценарии бенчмарка.
+
+    Args:
+        size (int): Размер синтетического каталога.
+        seed (int, optional): Зерно генератора каталога.
+        repeat (int, optional): Количество повторов каждого замера.
+        connect (callable, optional): Функция подключения к базе данных.
+            По умолчанию используется временная FakeDatabase.
+        books (list, optional): Заранее сгенерированный каталог.
+        shared_quotes (float, optional): Доля общих цитат в генерируемом каталоге.
+
+    Returns:
+        dict: Результаты в виде {'meta': {...}, 'results': {...}, 'sizes': {...}}.
+    """
+    if books is None:
+        books = generate_catalogue(size, seed, shared_quotes=shared_quotes)
+
+    fake = None
+    if connect is None:
+        fake = FakeDatabase()
+        fake.populate(books)
+        connect = fake.connect
+        backend = 'fake'
+    else:
+        backend = 'postgresql'
+
+    results = {}
+    tmpdir = tempfile.mkdtemp(prefix='booklib-bench-')
+    rng = random.Random(seed + 1)
+    sample = rng.sample(books, min(20, len(books)))
+
+    try:
+        # input() отвечает '1' на случай, если команда попросит выбрать книгу
+        with mock.patch.object(LibraryStorage, '_connect', lambda self: connect()), \
+                mock.patch('builtins.input', return_value='1'), \
+                contextlib.redirect_stdout(io.StringIO()):
+            results['load_books'] = _measure(lambda: LibraryStorage(), repeat)
+            results['load_books.eager_quotes'] = _measure(
+                lambda: LibraryStorage(eager_quotes=True), repeat)
+
+            storage = LibraryStorage()
+            catalogue = storage.get_all_books()
+            book_filter = BookFilter()
+
+            queries = [{'author': b.author.split()[-1]} for b in sample[:5]]
+            queries += [{'title': b.title.split()[0]} for b in sample[5:10]]
+            queries += [{'year': b.year, 'genre': b.genre} for b in sample[10:15]]
+
+            def search():
+                for query in queries:
+                    book_filter.search_books(catalogue, **query)
+
+            results['search_books'] = _measure(search, repeat)
+
+            cached = BookFilter(cache=storage.query_cache)
+
+            def search_cached():
+                for query in queries:
+                    cached.search_books(catalogue, **query)
+
+            search_cached()  # прогрев кеша
+            results['search_books.cached'] = _measure(search_cached, repeat)
+
+            # Запросы по автору и жанру: строки каждой книги против id из справочников
+            author_queries = [{'author': b.author.split()[-1]} for b in sample]
+            author_queries += [{'genre': b.genre, 'not_author': b.author} for b in sample[:5]]
+            by_ids = BookFilter(dimensions=storage.dimensions)
+
+            def search_authors(flt):
+                for query in author_queries:
+                    flt.search_books(catalogue, **query)
+
+            results['search_books.authors'] = _measure(lambda: search_authors(book_filter), repeat)
+            results['search_books.authors.ids'] = _measure(lambda: search_authors(by_ids), repeat)
+
+            # Диапазоны лет и списки жанров: полный проход, индекс лет и запрос к БД
+            genres = sorted({b.genre for b in sample})
+            range_queries = [{'year_from': b.year, 'year_to': b.year + 2} for b in sample[:5]]
+            range_queries += [{'year': [b.year, b.year + 10], 'genre': genres[:3]} for b in sample[5:10]]
+            range_queries += [{'any_of': [{'year_from': b.year, 'year_to': b.year + 1}, {'author': b.author}]}
+                              for b in sample[10:15]]
+            by_years = BookFilter(years=storage.year_index)
+
+            def search_ranges(run):
+                for query in range_queries:
+                    run(query)
+
+            results['search_books.ranges'] = _measure(
+                lambda: search_ranges(lambda q: book_filter.search_books(catalogue, **q)), repeat)
+            search_ranges(lambda q: by_years.search_books(catalogue, **q))  # построение индекса лет
+            results['search_books.ranges.year_index'] = _measure(
+                lambda: search_ranges(lambda q: by_years.search_books(catalogue, **q)), repeat)
+            results['search_books.ranges.sql'] = _measure(
+                lambda: search_ranges(storage.query_books), repeat)
+
+            pack_path = os.path.join(tmpdir, 'catalogue.pack')
+            results['pack'] = _measure(lambda: storage.pack(pack_path), repeat)
+            results['open_pack'] = _measure(lambda: open_catalogue(pack_path).close(), repeat)
+            with open_catalogue(pack_path) as packed:
+                def search_packed():
+                    for query in queries:
+                        book_filter.search_books(packed, **query)
+
+                results['search_books.packed'] = _measure(search_packed, repeat)
+            sizes = _quote_sizes(connect, tmpdir)
+
+            for field in ('title', 'author', 'year', 'genre'):
+                results[f'sort_books.{field}'] = _measure(
+                    lambda: book_filter.sort_books(catalogue, sort_by=field), repeat)
+
+            indexed = BookFilter(index=storage.sort_index)
+            indexed.sort_books(catalogue, sort_by='author')  # прогрев индекса
+            results['sort_index.author.limit20'] = _measure(
+                lambda: indexed.sort_books(catalogue, sort_by='author', limit=20), repeat)
+            results['sort_books.author.limit20'] = _measure(
+                lambda: book_filter.sort_books(catalogue, sort_by='author', limit=20), repeat)
+
+            results['stats.sql'] = _measure(lambda: storage.stats(source='sql'), repeat)
+            results['stats.cache'] = _measure(lambda: storage.stats(source='cache'), repeat)
+
+            csv_path = os.path.join(tmpdir, 'export.csv')
+            results['export_to_csv'] = _measure(lambda: storage.export_to_csv(csv_path), repeat)
+
+            counter = itertools.count()
+
+            def add_remove(target=storage):
+                n = next(counter)
+                book = Book(f"Бенчмарк {n}", "Автор Бенчмарка", 2000, "Роман", ["Цитата"])
+                target.add_book(book)
+                target.add_quote_to_book(book.id, "Ещё одна цитата")
+                target.remove_quote(book.id, 0)
+                target.remove_book(book.id)
+
+            results['add_remove'] = _measure(add_remove, repeat)
+            # Без пула: подключение на каждую операцию, запросы не подготавливаются
+            unpooled = LibraryStorage(pool_size=0)
+            results['add_remove.unpooled'] = _measure(lambda: add_remove(unpooled), repeat)
+
+            def add_many():
+                n = next(counter)
+                storage.add_books([Book(f"Пакет {n}.{i}", f"Автор пакета {i % 50}", 2000, "Роман",
+                                        [f"Цитата {i}", "Общая цитата"]) for i in range(1000)])
+
+            results['add_books.1000'] = _measure(add_many, repeat)
+
+            # Поток отдельных цитат: фиксация каждой против групповой фиксации очереди
+            quote_target = catalogue[1]
+            writer = LibraryStorage(write_behind=True)
+
+            def add_quotes(target):
+                n = next(counter)
+                futures = [target.add_quote_to_book(quote_target.id, f"Поток {n}.{i}") for i in range(200)]
+                if target.writes is not None:
+                    target.flush_writes()
+                    for future in futures:
+                        future.result()
+
+            results['add_quote.200'] = _measure(lambda: add_quotes(storage), repeat)
+            results['add_quote.200.write_behind'] = _measure(lambda: add_quotes(writer), repeat)
+            writer.close()
+
+            import main as cli
+
+            def run_cli(*argv):
+                with mock.patch.object(sys, 'argv', ['main.py', *argv]):
+                    cli.main()
+
+            target = sample[0]
+            results['cli.list'] = _measure(lambda: run_cli('list', '--sort-by', 'author'), repeat)
+            results['cli.search'] = _measure(
+                lambda: run_cli('search', '--author', target.author.split()[-1]), repeat)
+            results['cli.stats'] = _measure(lambda: run_cli('stats'), repeat)
+            results['cli.add_quote'] = _measure(
+                lambda: run_cli('add-quote', '--title', target.title, '--author', target.author,
+                                '--quote', 'Цитата из CLI'), repeat)
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+        if fake is not None:
+            fake.close()
+
+    meta = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'backend': backend,
+        'size': size,
+        'seed': seed,
+        'quotes': sum(len(b.quotes) for b in books),
+        'shared_quotes': shared_quotes,
+    }
+    return {'meta': meta, 'results': results, 'sizes': sizes}
+
+
+def run_parallel_benchmarks(books, repeat=3, max_workers=None):
+    """Замеряет масштабирование параллельного поиска и экспорта.
+
+    Для каждого количества процессов (1, 2, 4, ... до max_workers)
+    замеряет поиск подстроки и экспорт CSV/JSONL через ParallelCatalogue,
+    а также последовательные варианты для сравнения.
+
+    Args:
+        books (list): Каталог книг.
+        repeat (int, optional): Количество повторов каждого замера.
+        max_workers (int, optional): Наибольшее количество процессов.
+            По умолчанию количество ядер процессора.
+
+    Returns:
+        dict: Результаты замеров; для параллельных вариантов указано
+            ускорение (speedup) относительно одного процесса.
+    """
+    from booklib.parallel import ParallelCatalogue
+
+    max_workers = max_workers or os.cpu_count() or 1
+    criteria = {'author': 'толстой', 'title': 'мир'}
+    results = {'serial.search': _measure(lambda: BookFilter().search_books(books, **criteria), repeat)}
+
+    storage = LibraryStorage(lazy=True, pool_size=0)  # хранилище без подключения к БД
+    storage.books = books
+
+    tmpdir = tempfile.mkdtemp(prefix='booklib-bench-')
+    path = os.path.join(tmpdir, 'export')
+    try:
+        results['serial.export_csv'] = _measure(lambda: storage.export_to_csv(path), repeat)
+        results['serial.export_jsonl'] = _measure(lambda: storage.export_to_jsonl(path), repeat)
+
+        workers = 1
+        while workers <= max_workers:
+            with ParallelCatalogue(books, workers) as parallel:
+                parallel.search(**criteria)  # прогрев процессов пула
+                for name, func in (('search', lambda: parallel.search(**criteria)),
+                                   ('export_csv', lambda: parallel.export(path, 'csv')),
+                                   ('export_jsonl', lambda: parallel.export(path, 'jsonl'))):
+                    result = _measure(func, repeat)
+                    base = results.get(f'parallel.{name}.workers1', result)
+                    result['speedup'] = base['min'] / result['min']
+                    results[f'parallel.{name}.workers{workers}'] = result
+            workers *= 2
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rmdir(tmpdir)
+    return results
+
+
+def _partition_layout(settings, schema, target, quotes):
+    """Создает схему с миграциями до версии target и заполняет ее на стороне сервера.
+
+    Args:
+        settings (ConnectionSettings): Настройки подключения.
+        schema (str): Имя схемы (пересоздается).
+        target (int): Последняя применяемая миграция.
+        quotes (int): Количество цитат (книг - в PARTITION_BENCH_QUOTES_PER_BOOK раз меньше).
+
+    Returns:
+        dict: Время загрузки и размер book_quotes с индексами (байты).
+    """
+    books = max(1, quotes // PARTITION_BENCH_QUOTES_PER_BOOK)
+    conn = open_connection(settings)
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cur.execute(f"CREATE SCHEMA {schema}")
+    cur.execute(f"SET search_path TO {schema}")
+    conn.commit()
+    migrate(conn, verbose=False, target=target)
+
+    start = time.perf_counter()
+    cur.execute("INSERT INTO books (title, author, year, genre, natural_key) "
+                "SELECT 'Книга ' || g, 'Автор ' || mod(g, 1000), 1800 + mod(g, 200), 'Роман', 'книга ' || g "
+                "FROM generate_series(1, %s) g", (books,))
+    cur.execute("INSERT INTO quote_texts (quote_hash, quote) "
+                "SELECT md5(g::text), 'Цитата ' || g FROM generate_series(1, %s) g", (quotes,))
+    cur.execute("INSERT INTO book_quotes (book_id, quote_hash) "
+                "SELECT 1 + mod(g, %s), md5(g::text) FROM generate_series(1, %s) g", (books, quotes))
+    conn.commit()
+    load = time.perf_counter() - start
+
+    conn.autocommit = True  # VACUUM не выполняется внутри транзакции
+    start = time.perf_counter()
+    cur.execute("VACUUM ANALYZE book_quotes")
+    vacuum = time.perf_counter() - start
+    cur.execute("SELECT SUM(pg_total_relation_size(relid)) FROM pg_partition_tree('book_quotes')")
+    size = int(cur.fetchone()[0])
+    cur.close()
+    conn.close()
+    return {'load': load, 'vacuum_analyze': vacuum, 'book_quotes_bytes': size}
+
+
+def run_partition_benchmarks(dsn, quotes=PARTITION_BENCH_QUOTES, repeat=3, seed=0):
+    """Сравнивает book_quotes одной таблицей (до миграции 10) и с секциями по book_id.
+
+    Для каждой схемы замеряются выборка цитат 100 случайных книг
+    запросом хранилища и удаление 20 книг: каскадом по внешнему ключу и
+    так, как удаляет remove_book (ссылки по book_id, затем книга).
+    Удаления откатываются, поэтому данные между повторами не меняются.
+    Схемы bench_heap и bench_partitioned пересоздаются.
+
+    Args:
+        dsn (str): Строка подключения psycopg2 к PostgreSQL.
+        quotes (int, optional): Количество цитат в каждой схеме.
+        repeat (int, optional): Количество повторов каждого замера.
+        seed (int, optional): Зерно выбора книг.
+
+    Returns:
+        dict: Результаты в виде {'meta': {...}, 'results': {...}, 'sizes': {...}}.
+    """
+    settings = load_settings(dsn=dsn, statement_timeout=0)
+    books = max(1, quotes // PARTITION_BENCH_QUOTES_PER_BOOK)
+    results, sizes = {}, {}
+    for layout, target in (('heap', 9), ('partitioned', None)):
+        schema = f'bench_{layout}'
+        sizes[layout] = _partition_layout(settings, schema, target, quotes)
+
+        rng = random.Random(seed)
+        conn = open_connection(settings)
+        cur = conn.cursor()
+        cur.execute(f"SET search_path TO {schema}")
+        fetch_ids = rng.sample(range(1, books + 1), min(100, books))
+        delete_ids = rng.sample(range(1, books + 1), min(20, books))
+
+        def fetch_quotes():
+            for book_id in fetch_ids:
+                cur.execute(STATEMENTS['book_quotes'], (book_id,))
+                cur.fetchall()
+
+        def delete_books(explicit):
+            for book_id in delete_ids:
+                if explicit:
+                    cur.execute(STATEMENTS['delete_book_quotes'], (book_id,))
+                    cur.fetchall()
+                cur.execute(STATEMENTS['delete_book'], (book_id,))
+            conn.rollback()
+
+        fetch_quotes()  # прогрев кеша страниц
+        results[f'{layout}.fetch_quotes.100'] = _measure(fetch_quotes, repeat)
+        results[f'{layout}.cascade_delete.20'] = _measure(lambda: delete_books(False), repeat)
+        results[f'{layout}.remove_book.20'] = _measure(lambda: delete_books(True), repeat)
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+    meta = {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'backend': 'postgresql',
+        'quotes': quotes,
+        'books': books,
+        'seed': seed,
+    }
+    return {'meta': meta, 'results': results, 'sizes': sizes}
+
+
+def main():
+    """Разбирает аргументы командной строки и запускает бенчмарк."""
+    parser = argparse.ArgumentParser(description='Бенчмарки книжной библиотеки.')
+    parser.add_argument('--size', type=int, default=10000, help='Количество книг (1000-1000000)')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора каталога')
+    parser.add_argument('--repeat', type=int, default=3, help='Количество повторов замера')
+    parser.add_argument('--output', help='Файл для результатов JSON (по умолчанию stdout)')
+    parser.add_argument('--pg-dsn', help='Строка подключения к локальному PostgreSQL')
+    parser.add_argument('--pg-reset', action='store_true',
+                        help='Очистить таблицы в PostgreSQL и загрузить синтетический каталог')
+    parser.add_argument('--shared-quotes', type=float, default=0.0, metavar='FRACTION',
+                        help='Доля цитат из общего набора известных цитат (0-1)')
+    parser.add_argument('--parallel', type=int, nargs='?', const=0, metavar='MAX_WORKERS',
+                        help='Замерить только масштабирование параллельного поиска и экспорта')
+    parser.add_argument('--partitioning', type=int, nargs='?', const=PARTITION_BENCH_QUOTES, metavar='QUOTES',
+                        help='Сравнить book_quotes без секций и с секциями (нужен --pg-dsn)')
+    args = parser.parse_args()
+    if args.partitioning is not None and not args.pg_dsn:
+        parser.error("--partitioning требует --pg-dsn")
+
+    if args.partitioning is not None:
+        report = run_partition_benchmarks(args.pg_dsn, args.partitioning, args.repeat, args.seed)
+    elif args.parallel is not None:
+        books = generate_catalogue(args.size, args.seed, shared_quotes=args.shared_quotes)
+        report = {
+            'meta': {'commit': _git_commit(), 'python': platform.python_version(),
+                     'platform': platform.platform(), 'cpus': os.cpu_count(),
+                     'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                     'size': args.size, 'seed': args.seed},
+            'results': run_parallel_benchmarks(books, args.repeat, args.parallel or None),
+        }
+    else:
+        books = generate_catalogue(args.size, args.seed, shared_quotes=args.shared_quotes)
+        connect = _pg_backend(args.pg_dsn, books, args.pg_reset) if args.pg_dsn else None
+        report = run_benchmarks(args.size, args.seed, args.repeat, connect=connect, books=books,
+                                shared_quotes=args.shared_quotes)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,9 +9,16 @@
     Этот класс отвечает за загрузку и сохранение книг в базу данных
     BookFilter- Делает доступным класс для фильтрации и сортировки книг (поиск по автору, названию)
     LibraryCommands Делает доступным класс, который содержит все команды для работы с библиотекой (добавить, удалить, найти книгу)
+    METRICS-Реестр метрик: таймеры операций и счетчики запросов к БД (по умолчанию выключен)
 """
 
+import logging
+
 from .models import Book
 from .storage import LibraryStorage
 from .filters import BookFilter
 from .commands import LibraryCommands
+from .metrics import METRICS
+
+# Библиотека не настраивает вывод логов сама, это делает приложение (main.py)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
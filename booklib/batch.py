@@ -0,0 +1,228 @@
+"""Модуль пакетного выполнения команд библиотеки.
+
+Читает поток операций в формате JSON Lines (по одной на строку) и
+выполняет их в одном процессе с одним хранилищем: каталог загружается
+один раз, а изменения группируются в транзакции по batch_size операций.
+Аргументы операции совпадают с аргументами подкоманд main.py (дефисы
+в именах можно заменять подчеркиваниями):
+
+    {"command": "add", "title": "Война и мир", "author": "Лев Толстой",
+     "year": 1869, "genre": "Роман", "quotes": ["..."]}
+    {"command": "add-quote", "title": "Война и мир", "author": "Толстой", "quote": "..."}
+    {"command": "edit", "title": "Война и мир", "author": "Толстой", "new-genre": "Эпопея"}
+    {"command": "remove-quote", "title": "...", "author": "...", "quote-index": 0}
+    {"command": "remove", "title": "...", "author": "..."}
+
+Вместо title и author книгу можно указать по id. Книга ищется по
+подстрокам, как в CLI; если подходит несколько книг, выбирается точное
+совпадение названия и автора, иначе операция завершается ошибкой
+(в пакетном режиме спросить пользователя нельзя).
+
+Результаты выводятся построчно в JSON Lines после завершения каждой
+транзакции, последней строкой - итог. Политики при ошибке операции:
+    skip: откатить только эту операцию и продолжить;
+    stop: зафиксировать операции до нее и остановиться;
+    rollback: откатить всю текущую транзакцию и остановиться
+        (ранее зафиксированные транзакции остаются).
+
+Классы:
+    BatchError: Ошибка операции пакета.
+
+Функции:
+    run_batch: Выполнение потока операций.
+"""
+
+import json
+from collections import Counter
+from itertools import islice
+
+from .filters import BookFilter
+from .models import Book
+
+ON_ERROR = ('skip', 'stop', 'rollback')
+
+# Количество операций в одной транзакции по умолчанию
+DEFAULT_BATCH_SIZE = 500
+
+
+class BatchError(Exception):
+    """Ошибка операции пакета: неверные аргументы или книга не найдена."""
+
+
+class _Rollback(Exception):
+    """Сигнал отката текущей транзакции пакета."""
+
+
+def _required(args, name):
+    """Возвращает обязательный аргумент операции."""
+    value = args.get(name)
+    if value is None or value == '':
+        raise BatchError(f"Не указан аргумент '{name}'")
+    return value
+
+
+def _year(value):
+    """Преобразует год в число."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise BatchError("Год должен быть числом") from None
+
+
+def _find_book(storage, args):
+    """Находит единственную книгу по id или по названию и автору."""
+    if args.get('id') is not None:
+        book = storage.get_book(args['id'])
+        if book is None:
+            raise BatchError(f"Книга с id {args['id']} не найдена")
+        return book
+
+    title, author = args.get('title'), args.get('author')
+    if not title and not author:
+        raise BatchError("Не указаны ни id, ни название или автор книги")
+    book_filter = BookFilter(index=storage.sort_index, stats=storage.token_stats,
+                             dimensions=storage.dimensions)
+    books = book_filter.search_books(storage.books, title=title, author=author)
+    if len(books) > 1:
+        exact = [b for b in books
+                 if (title is None or b.title.lower() == title.lower())
+                 and (author is None or b.author.lower() == author.lower())]
+        books = exact or books
+    if not books:
+        raise BatchError("Книга не найдена")
+    if len(books) > 1:
+        raise BatchError(f"Найдено несколько книг ({len(books)}), уточните название или укажите id")
+    return books[0]
+
+
+def _add(storage, args):
+    book = Book(_required(args, 'title'), _required(args, 'author'), _year(_required(args, 'year')),
+                _required(args, 'genre'), args.get('quotes') or [])
+    return storage.add_book(book)
+
+
+def _remove(storage, args):
+    storage.remove_book(_find_book(storage, args).id)
+    return 'removed'
+
+
+def _add_quote(storage, args):
+    storage.add_quote_to_book(_find_book(storage, args).id, _required(args, 'quote'))
+    return 'added'
+
+
+def _remove_quote(storage, args):
+    book = _find_book(storage, args)
+    quote_index = args.get('quote_index')
+    if quote_index is None:
+        raise BatchError("Не указан аргумент 'quote-index'")
+    if not storage.remove_quote(book.id, int(quote_index)):
+        raise BatchError("Неверный номер цитаты")
+    return 'removed'
+
+
+def _edit(storage, args):
+    book = _find_book(storage, args)
+    year = _year(args['new_year']) if args.get('new_year') else book.year
+    updated = Book(args.get('new_title') or book.title, args.get('new_author') or book.author,
+                   year, args.get('new_genre') or book.genre)
+    storage.update_book(book, updated)
+    return 'updated'
+
+
+OPERATIONS = {
+    'add': _add,
+    'remove': _remove,
+    'add-quote': _add_quote,
+    'remove-quote': _remove_quote,
+    'edit': _edit,
+}
+
+
+def _parse(line):
+    """Разбирает строку операции.
+
+    Returns:
+        tuple: (команда, аргументы с подчеркиваниями вместо дефисов).
+    """
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise BatchError(f"Неверный JSON: {e}") from None
+    if not isinstance(record, dict):
+        raise BatchError("Операция должна быть объектом JSON")
+    args = {key.replace('-', '_'): value for key, value in record.items()}
+    command = args.pop('command', None)
+    if command not in OPERATIONS:
+        raise BatchError(f"Неизвестная команда: {command}")
+    return command, args
+
+
+def run_batch(storage, lines, out, batch_size=DEFAULT_BATCH_SIZE, on_error='rollback'):
+    """Выполняет поток операций пакетами транзакций.
+
+    Args:
+        storage (LibraryStorage): Хранилище, к которому применяются операции.
+        lines (iterable): Строки JSON Lines с операциями; пустые строки пропускаются.
+        out: Файл для результатов в формате JSON Lines.
+        batch_size (int, optional): Количество операций в транзакции
+            (0 - все операции в одной транзакции).
+        on_error (str, optional): Политика при ошибке: 'skip', 'stop'
+            или 'rollback' (по умолчанию).
+
+    Returns:
+        dict: Итог: количество операций со статусами ok, error,
+            rolled_back и not_run.
+
+    Raises:
+        ValueError: При неизвестной политике on_error.
+    """
+    if on_error not in ON_ERROR:
+        raise ValueError(f"Неизвестная политика обработки ошибок: {on_error}")
+
+    operations = ((n, line) for n, line in enumerate(lines, 1) if line.strip())
+    summary = Counter(ok=0, error=0, rolled_back=0, not_run=0)
+    stopped = False
+    while not stopped:
+        group = list(islice(operations, batch_size) if batch_size else operations)
+        if not group:
+            break
+
+        results = []
+        try:
+            with storage.batch():
+                for n, line in group:
+                    command = None
+                    try:
+                        command, args = _parse(line)
+                        result = OPERATIONS[command](storage, args)
+                    except Exception as e:
+                        results.append({'line': n, 'command': command,
+                                        'status': 'error', 'error': str(e)})
+                        if on_error == 'skip':
+                            continue
+                        stopped = True
+                        if on_error == 'rollback':
+                            raise _Rollback
+                        break
+                    results.append({'line': n, 'command': command,
+                                    'status': 'ok', 'result': result})
+        except Exception as e:
+            # Транзакция откатана целиком: при ошибке операции или фиксации
+            stopped = True
+            for record in results:
+                if record['status'] == 'ok':
+                    record['status'] = 'rolled_back'
+            if not isinstance(e, _Rollback):
+                results.append({'status': 'error', 'error': f"Ошибка фиксации: {e}"})
+
+        summary['not_run'] += len(group) - len([r for r in results if 'line' in r])
+        for record in results:
+            summary[record['status']] += 1
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+
+    summary['not_run'] += sum(1 for _ in operations)
+    out.write(json.dumps({'summary': dict(summary)}, ensure_ascii=False) + '\n')
+    out.flush()
+    return dict(summary)
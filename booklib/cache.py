@@ -0,0 +1,199 @@
+"""Модуль кеша результатов поиска и сортировки книг.
+
+Содержит класс QueryCache - потокобезопасный LRU-кеш с ограничением по
+количеству записей, оценке занимаемой памяти и времени жизни (TTL).
+Ключом служит нормализованный запрос, поэтому 'search --author Толстой'
+и 'search --author толстой' попадают в одну запись.
+
+Кеш инвалидируется счетчиком поколений: каждый метод LibraryStorage,
+меняющий состав или поля книг, увеличивает поколение, и записи старых
+поколений больше не используются, даже если результат для них
+досчитывался параллельно в другом потоке.
+
+Классы:
+    QueryCache: Кеш результатов запросов к каталогу.
+
+Функции:
+    normalize_query: Нормализация критериев поиска для ключа кеша.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import METRICS
+
+# Оценка памяти записи: заголовок списка и ключа плюс ссылка на каждую книгу
+_ENTRY_OVERHEAD = 256
+_REF_SIZE = 8
+
+
+def _normalize_value(value):
+    """Нормализует значение критерия поиска."""
+    if isinstance(value, str):
+        return value.lower()
+    if isinstance(value, dict):
+        return normalize_query(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(_normalize_value(v) for v in value)
+    return value
+
+
+def normalize_query(criteria):
+    """Нормализует критерии поиска для использования в ключе кеша.
+
+    Пустые критерии отбрасываются, строки приводятся к нижнему регистру
+    (поиск по строкам и так не чувствителен к регистру), порядок
+    критериев не учитывается.
+
+    Args:
+        criteria (dict): Критерии поиска.
+
+    Returns:
+        tuple: Хешируемый нормализованный запрос.
+    """
+    return tuple(sorted(
+        (key, _normalize_value(value)) for key, value in criteria.items() if value is not None
+    ))
+
+
+class QueryCache:
+    """Потокобезопасный LRU-кеш результатов запросов с TTL и поколениями.
+
+    Attributes:
+        max_entries (int): Максимальное количество записей.
+        max_bytes (int): Ограничение оценки занимаемой памяти в байтах.
+        ttl (float or None): Время жизни записи в секундах (None - без ограничения).
+        generation (int): Текущее поколение данных каталога.
+        source (list or None): Список книг, для которого действуют записи.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=None):
+        """Создает пустой кеш.
+
+        Args:
+            max_entries (int, optional): Максимальное количество записей.
+            max_bytes (int, optional): Ограничение памяти. По умолчанию 64 МБ.
+            ttl (float, optional): Время жизни записи в секундах.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        self.source = None
+        self._entries = OrderedDict()  # ключ -> (результат, размер, срок жизни)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def covers(self, books):
+        """Проверяет, относятся ли записи кеша к этому списку книг."""
+        return books is self.source
+
+    def invalidate(self, source=None):
+        """Начинает новое поколение: все записи становятся недействительными.
+
+        Args:
+            source (list, optional): Новый список книг каталога. Если не
+                указан, список остается прежним.
+        """
+        with self._lock:
+            self.generation += 1
+            if source is not None:
+                self.source = source
+            self._entries.clear()
+            self._bytes = 0
+
+    def key(self, books, kind, *parts):
+        """Строит ключ записи для текущего поколения.
+
+        Поколение и принадлежность списка книг проверяются атомарно,
+        поэтому результат, посчитанный по старому снимку каталога, не
+        попадет в новое поколение.
+
+        Args:
+            books (list): Список книг, по которому выполняется запрос.
+            kind (str): Вид запроса, например 'search' или 'sort'.
+            *parts: Нормализованные параметры запроса.
+
+        Returns:
+            tuple or None: Ключ записи или None, если кеш не относится
+                к этому списку книг.
+        """
+        with self._lock:
+            if books is not self.source:
+                return None
+            return (self.generation, kind) + parts
+
+    def get(self, key):
+        """Возвращает копию сохраненного результата.
+
+        Args:
+            key (tuple): Ключ, построенный методом key().
+
+        Returns:
+            list or None: Результат или None, если записи нет.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                METRICS.incr('cache.query_misses')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        METRICS.incr('cache.query_hits')
+        return list(entry[0])
+
+    def put(self, key, result):
+        """Сохраняет результат запроса.
+
+        Результат, посчитанный для устаревшего поколения, не сохраняется.
+
+        Args:
+            key (tuple): Ключ, построенный методом key().
+            result (list): Результат запроса.
+        """
+        size = _ENTRY_OVERHEAD + _REF_SIZE * len(result) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key[0] != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (list(result), size, expires)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        """Удаляет запись (вызывается под блокировкой)."""
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+
+    def stats(self):
+        """Возвращает статистику кеша.
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, entries, bytes, generation.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'generation': self.generation,
+            }
@@ -0,0 +1,437 @@
+"""Модуль колоночного представления каталога книг.
+
+Упаковывает список книг в один непрерывный буфер байтов: массивы
+фиксированной ширины для идентификаторов и годов и, для каждого строкового
+поля, таблицу смещений и кучу строк в UTF-8. Такой буфер можно положить в
+разделяемую память или файл и читать из нескольких процессов без
+сериализации объектов Book.
+
+Формат буфера (все числа little-endian):
+    заголовок: магическое число b'BLCL', версия (uint32), число книг n (uint64),
+        затем для каждого строкового столбца позиция таблицы смещений,
+        позиция кучи и длина кучи (3 x uint64), затем позиции массивов
+        ids и years (2 x uint64), затем позиции ссылок на цитаты (2 x uint64)
+        и словаря цитат (число текстов m и 3 x uint64);
+    ids: n x int64 (-1, если у книги нет id);
+    years: n x int32;
+    для каждого строкового столбца: (n + 1) x uint64 смещений в куче
+        и куча, где каждая строка завершается нулевым байтом;
+    ссылки на цитаты: (n + 1) x uint64 смещений и массив номеров текстов
+        в словаре (uint32) - цитаты книги i занимают отрезок
+        [смещение i, смещение i + 1);
+    словарь цитат: m x uint8 флагов, (m + 1) x uint64 смещений и куча
+        текстов в UTF-8 (флаг FLAG_ZLIB - текст сжат zlib).
+
+Каждый различный текст цитаты хранится в словаре один раз, сколько бы
+книг его ни цитировали. При упаковке с compress=True длинные тексты
+(от COMPRESS_MIN_LENGTH байт) сжимаются zlib, если это уменьшает их
+размер; при чтении тексты распаковываются прозрачно, один раз на каталог.
+
+Буфер можно сохранить в файл (save_catalogue, команда 'main.py pack') и
+открыть через mmap (open_catalogue) только для чтения. Все процессы,
+открывшие один файл, используют одну копию страниц в кеше ОС вместо
+собственных объектов Book; BookFilter ищет прямо по открытому каталогу
+и создает объекты Book только для найденных книг.
+
+Классы:
+    ColumnarCatalogue: Чтение колоночного буфера.
+
+Функции:
+    encode_catalogue: Упаковка списка книг в колоночный буфер.
+    save_catalogue: Запись упакованного каталога в файл.
+    open_catalogue: Открытие файла каталога через mmap.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from itertools import repeat
+
+from .models import Book
+from .query import ID_FIELDS, compile_query
+
+MAGIC = b'BLCL'
+VERSION = 2
+STRING_COLUMNS = ('title', 'author', 'genre')
+QUOTE_SEPARATOR = '\x1e'
+
+# Флаг текста в словаре цитат: текст сжат zlib
+FLAG_ZLIB = 1
+
+# Тексты короче этого размера (в байтах UTF-8) не сжимаются
+COMPRESS_MIN_LENGTH = 200
+
+_HEADER = struct.Struct('<4sIQ' + 'QQQ' * len(STRING_COLUMNS) + 'QQ' + 'QQ' + 'QQQQ')
+
+# Сколько книг декодируется за один шаг поиска по каталогу
+SEARCH_CHUNK_SIZE = 50000
+
+
+def _align(n):
+    """Округляет смещение вверх до кратного 8 байтам."""
+    return (n + 7) & ~7
+
+
+def _quote_dictionary(books, compress):
+    """Строит словарь различных текстов цитат и ссылки книг на него.
+
+    Returns:
+        tuple: (смещения ссылок книг, номера текстов, флаги текстов,
+            смещения текстов, куча текстов).
+    """
+    numbers = {}
+    ref_offsets = array('Q', [0])
+    refs = array('I')
+    for book in books:
+        refs.extend(numbers.setdefault(quote, len(numbers)) for quote in book.quotes)
+        ref_offsets.append(len(refs))
+
+    flags = bytearray(len(numbers))
+    text_offsets = array('Q', [0])
+    heap = bytearray()
+    for number, quote in enumerate(numbers):
+        data = quote.encode('utf-8')
+        if compress and len(data) >= COMPRESS_MIN_LENGTH:
+            packed = zlib.compress(data, 9)
+            if len(packed) < len(data):
+                data = packed
+                flags[number] = FLAG_ZLIB
+        heap += data
+        text_offsets.append(len(heap))
+    return ref_offsets, refs, flags, text_offsets, heap
+
+
+def encode_catalogue(books, compress=False):
+    """Упаковывает список книг в колоночный буфер.
+
+    Args:
+        books (list): Список объектов Book.
+        compress (bool, optional): Сжимать длинные тексты цитат zlib.
+
+    Returns:
+        bytes: Буфер в формате, описанном в модуле.
+    """
+    n = len(books)
+    ids = array('q', (book.id if book.id is not None else -1 for book in books))
+    years = array('i', (book.year for book in books))
+
+    columns = []
+    for column in STRING_COLUMNS:
+        offsets = array('Q', [0])
+        heap = bytearray()
+        for book in books:
+            heap += getattr(book, column).encode('utf-8')
+            heap += b'\0'
+            offsets.append(len(heap))
+        columns.append((offsets, heap))
+    ref_offsets, refs, flags, text_offsets, text_heap = _quote_dictionary(books, compress)
+    m = len(flags)
+
+    # Раскладка секций после заголовка с выравниванием по 8 байтам
+    pos = _align(_HEADER.size)
+    ids_pos = pos
+    pos = _align(pos + 8 * n)
+    years_pos = pos
+    pos = _align(pos + 4 * n)
+    positions = []
+    for offsets, heap in columns:
+        offsets_pos = pos
+        pos = _align(pos + 8 * (n + 1))
+        heap_pos = pos
+        pos = _align(pos + len(heap))
+        positions.append((offsets_pos, heap_pos, len(heap)))
+    ref_offsets_pos = pos
+    pos = _align(pos + 8 * (n + 1))
+    refs_pos = pos
+    pos = _align(pos + 4 * len(refs))
+    flags_pos = pos
+    pos = _align(pos + m)
+    text_offsets_pos = pos
+    pos = _align(pos + 8 * (m + 1))
+    text_heap_pos = pos
+    pos = _align(pos + len(text_heap))
+
+    buffer = bytearray(pos)
+    header = [MAGIC, VERSION, n]
+    for item in positions:
+        header.extend(item)
+    header.extend((ids_pos, years_pos, ref_offsets_pos, refs_pos,
+                   m, flags_pos, text_offsets_pos, text_heap_pos))
+    _HEADER.pack_into(buffer, 0, *header)
+
+    buffer[ids_pos:ids_pos + 8 * n] = ids.tobytes()
+    buffer[years_pos:years_pos + 4 * n] = years.tobytes()
+    for (offsets, heap), (offsets_pos, heap_pos, heap_len) in zip(columns, positions):
+        buffer[offsets_pos:offsets_pos + 8 * (n + 1)] = offsets.tobytes()
+        buffer[heap_pos:heap_pos + heap_len] = heap
+    buffer[ref_offsets_pos:ref_offsets_pos + 8 * (n + 1)] = ref_offsets.tobytes()
+    buffer[refs_pos:refs_pos + 4 * len(refs)] = refs.tobytes()
+    buffer[flags_pos:flags_pos + m] = flags
+    buffer[text_offsets_pos:text_offsets_pos + 8 * (m + 1)] = text_offsets.tobytes()
+    buffer[text_heap_pos:text_heap_pos + len(text_heap)] = text_heap
+    return bytes(buffer)
+
+
+class ColumnarCatalogue:
+    """Чтение каталога из колоночного буфера без копирования.
+
+    Буфером может быть bytes, разделяемая память или mmap файла.
+    Столбец 'quotes' (цитаты книги через QUOTE_SEPARATOR) собирается из
+    словаря цитат; каждый текст словаря декодируется один раз, и книги
+    с одной цитатой получают один объект строки.
+
+    Attributes:
+        ids (memoryview): Идентификаторы книг (int64).
+        years (memoryview): Годы издания (int32).
+    """
+
+    def __init__(self, buffer):
+        """Открывает буфер.
+
+        Args:
+            buffer: Объект с поддержкой протокола буфера.
+
+        Raises:
+            ValueError: Если буфер не является колоночным каталогом.
+        """
+        view = memoryview(buffer)
+        fields = _HEADER.unpack_from(view, 0) if len(view) >= _HEADER.size else (None, None)
+        magic, version = fields[:2]
+        if magic != MAGIC or version != VERSION:
+            view.release()  # иначе mmap файла нельзя будет закрыть
+            raise ValueError("Неизвестный формат колоночного каталога")
+        n = fields[2]
+        self._n = n
+        self._view = view
+        self._mmap = None  # файл, открытый open_catalogue()
+
+        self._columns = {}
+        rest = fields[3:]
+        for i, column in enumerate(STRING_COLUMNS):
+            offsets_pos, heap_pos, heap_len = rest[3 * i:3 * i + 3]
+            offsets = view[offsets_pos:offsets_pos + 8 * (n + 1)].cast('Q')
+            heap = view[heap_pos:heap_pos + heap_len]
+            self._columns[column] = (offsets, heap)
+        (ids_pos, years_pos, ref_offsets_pos, refs_pos,
+         m, flags_pos, text_offsets_pos, text_heap_pos) = rest[3 * len(STRING_COLUMNS):]
+        self.ids = view[ids_pos:ids_pos + 8 * n].cast('q')
+        self.years = view[years_pos:years_pos + 4 * n].cast('i')
+
+        self._ref_offsets = view[ref_offsets_pos:ref_offsets_pos + 8 * (n + 1)].cast('Q')
+        self._refs = view[refs_pos:refs_pos + 4 * self._ref_offsets[n]].cast('I')
+        self._flags = view[flags_pos:flags_pos + m]
+        self._text_offsets = view[text_offsets_pos:text_offsets_pos + 8 * (m + 1)].cast('Q')
+        self._text_heap = view[text_heap_pos:text_heap_pos + self._text_offsets[m]]
+        self._texts = {}  # номер текста -> декодированная строка
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        """Возвращает книгу i как объект Book (см. book())."""
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self.book(i)
+
+    def raw(self, column, i):
+        """Возвращает строку i столбца в виде байтов UTF-8 без копирования.
+
+        Args:
+            column (str): Одно из STRING_COLUMNS.
+            i (int): Номер книги.
+
+        Returns:
+            memoryview: Байты строки (без завершающего нуля).
+        """
+        offsets, heap = self._columns[column]
+        return heap[offsets[i]:offsets[i + 1] - 1]
+
+    def _text(self, number):
+        """Возвращает текст цитаты из словаря (распаковывается один раз)."""
+        text = self._texts.get(number)
+        if text is None:
+            data = self._text_heap[self._text_offsets[number]:self._text_offsets[number + 1]]
+            if self._flags[number] & FLAG_ZLIB:
+                data = zlib.decompress(data)
+            text = self._texts.setdefault(number, str(data, 'utf-8'))
+        return text
+
+    def quotes(self, i):
+        """Возвращает цитаты книги i.
+
+        Args:
+            i (int): Номер книги.
+
+        Returns:
+            list: Тексты цитат; одинаковые тексты разных книг - один объект.
+        """
+        return [self._text(number)
+                for number in self._refs[self._ref_offsets[i]:self._ref_offsets[i + 1]]]
+
+    def value(self, column, i):
+        """Возвращает строку i столбца.
+
+        Args:
+            column (str): Одно из STRING_COLUMNS или 'quotes'.
+            i (int): Номер книги.
+
+        Returns:
+            str: Декодированная строка (цитаты - через QUOTE_SEPARATOR).
+        """
+        if column == 'quotes':
+            return QUOTE_SEPARATOR.join(self.quotes(i))
+        return str(self.raw(column, i), 'utf-8')
+
+    def column(self, column, start=0, stop=None, lower=False):
+        """Декодирует часть строкового столбца одним вызовом.
+
+        Args:
+            column (str): Одно из STRING_COLUMNS или 'quotes'.
+            start (int, optional): Номер первой книги.
+            stop (int, optional): Номер после последней книги.
+            lower (bool, optional): Привести строки к нижнему регистру.
+
+        Returns:
+            list: Строки столбца для книг [start, stop).
+        """
+        stop = self._n if stop is None else stop
+        if start >= stop:
+            return []
+        if column == 'quotes':
+            values = [self.value('quotes', i) for i in range(start, stop)]
+            return [value.lower() for value in values] if lower else values
+        offsets, heap = self._columns[column]
+        text = str(heap[offsets[start]:offsets[stop] - 1], 'utf-8')
+        if lower:
+            text = text.lower()
+        return text.split('\0')
+
+    def book(self, i):
+        """Создает объект Book для книги i.
+
+        Args:
+            i (int): Номер книги.
+
+        Returns:
+            Book: Книга с цитатами и id (None, если id не был задан).
+        """
+        book = Book(self.value('title', i), self.value('author', i), self.years[i],
+                    self.value('genre', i), self.quotes(i))
+        book_id = self.ids[i]
+        book.id = book_id if book_id >= 0 else None
+        return book
+
+    def search(self, criteria, start=0, stop=None):
+        """Ищет книги по критериям прямо в столбцах буфера.
+
+        Столбцы декодируются частями по SEARCH_CHUNK_SIZE книг, поэтому
+        поиск по большому каталогу не создает его полной копии.
+
+        Args:
+            criteria (dict): Критерии поиска, как у BookFilter.search_books.
+            start (int, optional): Номер первой книги.
+            stop (int, optional): Номер после последней книги.
+
+        Returns:
+            list: Номера подходящих книг по возрастанию.
+
+        Raises:
+            ValueError: Если критерии проверяют author_id или genre_id
+                (идентификаторы справочников в буфер не упаковываются).
+        """
+        stop = self._n if stop is None else stop
+        plan = compile_query(criteria)
+        fields = plan.fields
+        if not fields.isdisjoint(ID_FIELDS):
+            raise ValueError("Упакованный каталог не поддерживает поиск по идентификаторам")
+        result = []
+        for lo in range(start, stop, SEARCH_CHUNK_SIZE):
+            hi = min(lo + SEARCH_CHUNK_SIZE, stop)
+
+            # Декодируются только нужные запросу столбцы; каждый приводится
+            # к нижнему регистру целиком, одним вызовом
+            def column(name):
+                return self.column(name, lo, hi, lower=True) if name in fields else repeat('')
+
+            matches = plan.execute_columns(column('title'), column('author'),
+                                           self.years[lo:hi], column('genre'))
+            result.extend(lo + i for i in matches)
+        return result
+
+    def close(self):
+        """Освобождает буфер, а для каталога из файла закрывает mmap.
+
+        Note:
+            Перед закрытием нужно освободить полученные от каталога
+            memoryview (например, результаты raw()).
+        """
+        for offsets, heap in self._columns.values():
+            offsets.release()
+            heap.release()
+        for view in (self.ids, self.years, self._ref_offsets, self._refs,
+                     self._flags, self._text_offsets, self._text_heap):
+            view.release()
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_catalogue(books, filename, compress=False):
+    """Упаковывает книги и записывает каталог в файл.
+
+    Файл заменяется атомарно: процессы, уже открывшие старый каталог,
+    продолжают читать его до закрытия.
+
+    Args:
+        books (list): Список объектов Book (с загруженными цитатами).
+        filename (str): Имя файла каталога.
+        compress (bool, optional): Сжимать длинные тексты цитат zlib.
+
+    Returns:
+        int: Размер файла в байтах.
+    """
+    data = encode_catalogue(books, compress)
+    tmp = f"{filename}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+    return len(data)
+
+
+def open_catalogue(filename):
+    """Открывает файл каталога через mmap только для чтения.
+
+    Args:
+        filename (str): Имя файла, созданного save_catalogue().
+
+    Returns:
+        ColumnarCatalogue: Каталог поверх отображенного файла. Закрывается
+            методом close() или при выходе из блока with.
+
+    Raises:
+        ValueError: Если файл не является колоночным каталогом.
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:  # пустой файл нельзя отобразить
+            raise ValueError("Неизвестный формат колоночного каталога")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        catalogue = ColumnarCatalogue(mapped)
+    except ValueError:
+        mapped.close()
+        raise
+    catalogue._mmap = mapped
+    return catalogue
@@ -10,9 +10,18 @@
     BookFilter- Делает доступным класс для фильтрации и сортировки книг (поиск по автору, названию)
 """
 
+import json
+import sys
+
 from .models import Book
-from .storage import LibraryStorage
+from .storage import ADDED, UPDATED, LibraryStorage
 from .filters import BookFilter
+from .columnar import open_catalogue
+from .connection import load_settings
+from .batch import DEFAULT_BATCH_SIZE, run_batch
+from .export import read_books
+from .query import validate_criteria
+from .shards import ShardedStorage
 
 class LibraryCommands:
     """Основной класс для управления операциями библиотеки.
@@ -24,13 +33,41 @@ class LibraryCommands:
         storage (LibraryStorage): Объект для работы с базой данных.
     """
 
-    def __init__(self):
+    def __init__(self, eager_quotes=False, lazy=False, **storage_options):
         """Инициализирует объект LibraryCommands.
 
         Создает атрибут, который содержит в себе
         список всех книг и доступ к вызову методов
+
+        Args:
+            eager_quotes (bool, optional): Загрузить цитаты всех книг сразу
+                (для show-quotes и export). По умолчанию цитаты загружаются
+                при первом обращении.
+            lazy (bool, optional): Не загружать книги до первого обращения
+                к кешу (для команд, работающих запросами к БД).
+            **storage_options: Остальные параметры LibraryStorage
+                (pool_size, write_behind, settings и др.). Если заданы шарды
+                (параметр shards или settings.shards), используется
+                ShardedStorage.
+        """
+        settings = storage_options.pop('settings', None) or load_settings()
+        storage_class = ShardedStorage if storage_options.get('shards') or settings.shards else LibraryStorage
+        self.storage = storage_class(eager_quotes=eager_quotes, lazy=lazy, settings=settings, **storage_options)
+
+    def _book_filter(self, workers=None):
+        """Создает фильтр, использующий индексы, статистику и кеш хранилища.
+
+        Args:
+            workers (int, optional): Если больше 1, поиск выполняется
+                параллельно в пуле из workers процессов.
+
+        Returns:
+            BookFilter: Фильтр для поиска и сортировки книг из кеша.
         """
-        self.storage = LibraryStorage()
+        parallel = self.storage.parallel(workers) if workers and workers > 1 else None
+        return BookFilter(index=self.storage.sort_index, stats=self.storage.token_stats,
+                          parallel=parallel, cache=self.storage.query_cache,
+                          dimensions=self.storage.dimensions, years=self.storage.year_index)
 
     def add_book(self, title, author, year, genre):
         """Добавляет новую книгу в библиотеку.
@@ -50,11 +87,41 @@ class LibraryCommands:
         try:
             year = int(year)
             book = Book(title, author, year, genre)
-            self.storage.add_book(book)
-            print(f"Книга успешно добавлена в базу данных.")
+            status = self.storage.add_book(book)
+            if status == ADDED:
+                print(f"Книга успешно добавлена в базу данных.")
+            elif status == UPDATED:
+                print("Книга уже есть в библиотеке, данные обновлены.")
+            elif status is not None:
+                print("Книга уже есть в библиотеке.")
         except ValueError:
             print("Ошибка, год должен быть числом.")
 
+    def import_books(self, filename, fmt='csv'):
+        """
+        Импортирует книги из файла экспорта.
+
+        Книги, которые уже есть в библиотеке, не дублируются: обновляется
+        жанр и добавляются только новые цитаты, поэтому импорт одного
+        файла можно безопасно повторить.
+
+        Args:
+            filename (str): Имя файла.
+            fmt (str): Формат файла: 'csv' (по умолчанию) или 'jsonl'.
+        """
+        try:
+            books = list(read_books(filename, fmt))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ошибка чтения файла '{filename}': {e}")
+            return
+
+        statuses = self.storage.add_books(books)
+        if statuses is None:
+            return
+        added = statuses.count(ADDED)
+        updated = statuses.count(UPDATED)
+        print(f"Импорт завершен: добавлено {added}, обновлено {updated}, "
+              f"без изменений {len(statuses) - added - updated}.")
 
     def remove_book(self, title=None, author=None):
         """Удаляет книгу из библиотеки по названию или автору (также возможны оба варианта).
@@ -112,39 +179,75 @@ class LibraryCommands:
             except (ValueError, IndexError):
                 print("Неверный выбор.")
 
-    def list_books(self, sort_by='title', reverse=False):
+    def remove_books_where(self, criteria, dry_run=False):
+        """Удаляет все книги, подходящие под критерии поиска, без выбора по одной.
+
+        Удаление выполняется одним запросом DELETE ... WHERE (см.
+        LibraryStorage.remove_books); при dry_run книги только считаются.
+
+        Args:
+            criteria (dict): Критерии поиска, как у search_books (см. booklib.query).
+            dry_run (bool, optional): Только показать, сколько книг будет удалено.
+
+        Examples:
+            python main.py remove --where '{"author": "Толстой", "year_to": 1870}' --dry-run
+        """
+        try:
+            validate_criteria(criteria)
+            if dry_run:
+                count = self.storage.count_books(criteria)
+                if count is not None:
+                    print(f"Будет удалено книг: {count}")
+                return
+            count = self.storage.remove_books(criteria)
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+            return
+        if count is not None:
+            print(f"Удалено книг: {count}.")
+
+    def list_books(self, sort_by='title', reverse=False, limit=None):
         """Выводит список всех книг в библиотеке с возможностью сортировки.
 
         Args:
             sort_by (str)-поле для выбора сортировки, по умолчанию "название":
                           'title', 'author', 'year', 'genre'.
             reverse (bool): Если True, сортировка в обратном порядке.
+            limit (int, optional): Сколько первых книг показать. По умолчанию все.
 
         Note:
             Показывает количество цитат для каждой книги.
         """
         books = self.storage.get_all_books() #вывод всех книг
-        sorted_books = BookFilter().sort_books(books, sort_by, reverse) #сортировка списка книг п оубыванию
+        sorted_books = self._book_filter().sort_books(books, sort_by, reverse, limit) #сортировка списка книг п оубыванию
 
         if not sorted_books:
             print("Библиотека пуста.")
             return
 
         print("Список книг в библиотеке:")
-        print(f"Всего книг: {len(sorted_books)}")
+        print(f"Всего книг: {len(books)}")
 
         for i, book in enumerate(sorted_books, 1):
-            quotes_count = len(book.quotes) #считает количество цитат по строчам
+            quotes_count = book.quote_count #количество цитат известно без загрузки их текста
             print(f"{i}. '{book.title}' - {book.author} ({book.year}), {book.genre}, количество цитат {quotes_count}.")
 
-    def search_books(self, author=None, title=None, year=None, genre=None):
+    def search_books(self, author=None, title=None, year=None, genre=None, workers=None, pack=None,
+                     year_from=None, year_to=None, any_of=None):
         """Ищет книги по указанным критериям.
 
+        Если кеш книг еще не загружен, поиск выполняется одним запросом
+        к БД (условия переводятся в WHERE), иначе - по кешу.
+
         Args:
-            author-Часть имени автора для поиска, указано изначально пусто.
+            author-Часть имени автора для поиска, указано изначально пусто (или список вариантов).
             title-Часть названия книги для поиска.
             year-Точный год издания.
-            genre Часть названия жанра для поиска.
+            genre Часть названия жанра для поиска (или список вариантов).
+            workers-Количество процессов для параллельного поиска (по умолчанию один).
+            pack-Файл упакованного каталога (см. pack_catalogue): искать в нем, а не в БД.
+            year_from, year_to-Границы диапазона годов издания (включительно).
+            any_of-Список групп критериев: книга подходит, если подходит под любую группу.
 
         Raises:
             ValueError: Если год не может быть преобразован в целое число.
@@ -154,11 +257,27 @@ class LibraryCommands:
             Можно комбинировать несколько критериев поиска.
         """
         try:
-            if year:
+            if isinstance(year, (list, tuple)):
+                year = [int(y) for y in year]
+            elif year:
                 year = int(year)
 
-            books = self.storage.get_all_books()
-            results = BookFilter().search_books(books, author=author, title=title, year=year, genre=genre)
+            criteria = dict(author=author, title=title, year=year, genre=genre,
+                            year_from=year_from, year_to=year_to, any_of=any_of)
+            if pack:
+                try:
+                    catalogue = open_catalogue(pack)
+                except (OSError, ValueError) as e:
+                    print(f"Ошибка чтения каталога '{pack}': {e}")
+                    return
+                with catalogue:
+                    results = BookFilter().search_books(catalogue, **criteria)
+            elif not self.storage.loaded and not (workers and workers > 1):
+                # Разовый поиск: из БД читаются только найденные книги
+                results = self.storage.query_books(criteria)
+            else:
+                books = self.storage.get_all_books()
+                results = self._book_filter(workers).search_books(books, **criteria)
             #.search_books(books, author=None, title="война", year=None, genre=None)
 
             if not results:
@@ -184,7 +303,7 @@ class LibraryCommands:
             Если найдено несколько книг, запрашивает выбор у пользователя.
         """
         books = self.storage.get_all_books()
-        filtered_books = BookFilter().search_books(books, title=title, author=author)
+        filtered_books = self._book_filter().search_books(books, title=title, author=author)
 
         if not filtered_books:
             print("Книга не найдена")
@@ -222,7 +341,7 @@ class LibraryCommands:
             Если quote_index не указан, показывает все цитаты для выбора.
         """
         books = self.storage.get_all_books()
-        filtered_books = BookFilter().search_books(books, title=title, author=author)
+        filtered_books = self._book_filter().search_books(books, title=title, author=author)
 
         if not filtered_books:
             print("Книга не найдена")
@@ -276,13 +395,15 @@ class LibraryCommands:
         books = self.storage.get_all_books()
 
         if title or author:
-            filtered_books = BookFilter().search_books(books, title=title, author=author)
+            filtered_books = self._book_filter().search_books(books, title=title, author=author)
             books = filtered_books
 
         if not books:
             print("Книги не найдены")
             return
 
+        self.storage.quote_loader.touch(books)  # цитаты всех найденных книг загрузятся одним запросом
+
         found_quotes = False
         for book in books:
             if book.quotes:
@@ -294,16 +415,104 @@ class LibraryCommands:
         if not found_quotes:
             print("Цитаты не найдены")
 
-    def export_to_csv(self,filename='export.csv'):
+    def export_to_csv(self,filename='export.csv', fmt='csv', workers=None):
         """
         Экспортирует все данные из базы данных в CSV файл.
 
+        Args:
+            filename (str): Имя файла.
+            fmt (str): Формат файла: 'csv' (по умолчанию) или 'jsonl'.
+            workers (int, optional): Количество процессов для параллельного экспорта.
+
         Note:
             Создает файл 'library_export.csv' в текущей директории.
             Формат: title,author,year,genre,quotes
         """
-        self.storage.export_to_csv(filename)
+        if fmt == 'jsonl':
+            self.storage.export_to_jsonl(filename, workers)
+        else:
+            self.storage.export_to_csv(filename, workers)
+
 
+    def export_changes(self, filename, since, fmt='csv'):
+        """
+        Экспортирует изменения после водяного знака (дельту).
+
+        Args:
+            filename (str): Имя файла дельты.
+            since (str): Водяной знак предыдущего экспорта ('0' - весь каталог).
+            fmt (str): Формат файла: 'csv' (по умолчанию) или 'jsonl'.
+
+        Note:
+            Прерванный экспорт при повторном запуске с теми же параметрами
+            продолжается с последней контрольной точки.
+        """
+        try:
+            export = self.storage.export_changes(filename, since, fmt)
+        except ValueError:
+            print(f"Ошибка: неверный водяной знак '{since}'")
+            return
+
+        if export.resumed:
+            print("Экспорт продолжен с контрольной точки.")
+        print(f"Изменения записаны в '{filename}'.")
+        print(f"Водяной знак для следующего экспорта: {export.watermark or '0'}")
+
+    def run_batch(self, filename, batch_size=DEFAULT_BATCH_SIZE, on_error='rollback', output=None):
+        """
+        Выполняет команды из файла операций в одном процессе (см. booklib.batch).
+
+        Args:
+            filename (str): Файл JSON Lines с операциями ('-' - стандартный ввод).
+            batch_size (int): Количество операций в одной транзакции (0 - все).
+            on_error (str): Политика при ошибке: 'skip', 'stop' или 'rollback'.
+            output (str, optional): Файл для результатов. По умолчанию
+                результаты выводятся на экран.
+        """
+        try:
+            source = sys.stdin if filename == '-' else open(filename, encoding='utf-8')
+        except OSError as e:
+            print(f"Ошибка чтения файла '{filename}': {e}")
+            return
+        try:
+            out = open(output, 'w', encoding='utf-8') if output else sys.stdout
+            try:
+                run_batch(self.storage, source, out, batch_size, on_error)
+            finally:
+                if output:
+                    out.close()
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+    def pack_catalogue(self, filename, compress=False):
+        """
+        Упаковывает каталог в файл для поиска без БД.
+
+        Файл открывается через mmap, поэтому любое количество процессов
+        читает одну копию каталога (см. booklib.columnar).
+
+        Args:
+            filename (str): Имя файла каталога.
+            compress (bool, optional): Сжимать длинные цитаты (zlib).
+        """
+        size = self.storage.pack(filename, compress)
+        if size is not None:
+            print(f"Каталог упакован в '{filename}': книг {len(self.storage.books)}, "
+                  f"{size / 1024 / 1024:.1f} МБ.")
+
+    def show_stats(self, top=None, source=None):
+        """
+        Выводит сводную статистику каталога в формате JSON.
+
+        Args:
+            top (int, optional): Сколько самых частых авторов показать.
+            source (str, optional): 'cache' или 'sql' (см. LibraryStorage.stats).
+                По умолчанию статистика считается запросами к БД.
+        """
+        result = self.storage.stats(top, source)
+        if result is not None:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
 
     def clear_database(self):
         """
@@ -317,24 +526,7 @@ class LibraryCommands:
 
         if confirm.lower() == 'yes':
             try:
-                import psycopg2
-                conn = psycopg2.connect(
-                    dbname="book_library",
-                    user="postgres",
-                    password="11111",
-                    host="localhost",
-                    port="5432"
-                )
-                cur = conn.cursor()
-
-                cur.execute("DELETE FROM books")
-                conn.commit()
-
-                cur.close()
-                conn.close()
-
-                self.storage.books = [] #ощищаем кеш локальной памяти
-
+                self.storage.clear()  # очищает и кеш локальной памяти
                 print("Все данные удалены.")
 
             except Exception as e:
@@ -362,7 +554,7 @@ class LibraryCommands:
             Обновляет только указанные поля.
         """
         books = self.storage.get_all_books()
-        filtered_books = BookFilter().search_books(books, title=title, author=author)
+        filtered_books = self._book_filter().search_books(books, title=title, author=author)
 
         if not filtered_books:
             print("Книга не найдена")
@@ -381,43 +573,53 @@ class LibraryCommands:
         else:
             book = filtered_books[0] #если найдена одна кннига
 
-        old_title, old_author = book.title, book.author
-
-        if new_title:
-            book.title = new_title
-        if new_author:
-            book.author = new_author
+        year = book.year
         if new_year:
             try:
-                book.year = int(new_year)
+                year = int(new_year)
             except ValueError:
                 print("Ошибка: год должен быть числом")
                 return
-        if new_genre:
-            book.genre = new_genre
 
+        # Книга в кеше не меняется на месте: хранилище подменяет ее новой
+        # вместе с записью в БД, и другие потоки видят либо старую, либо новую
+        updated = Book(new_title or book.title, new_author or book.author, year,
+                       new_genre or book.genre)
+        if self.storage.update_book(book, updated):
+            print(f"Книга '{book.title}' успешно обновлена.")
+
+    def edit_books_where(self, criteria, new_title=None, new_author=None, new_year=None, new_genre=None,
+                         dry_run=False):
+        """Изменяет поля всех книг, подходящих под критерии поиска.
+
+        Изменение выполняется одним запросом UPDATE ... WHERE (см.
+        LibraryStorage.update_books); при dry_run книги только считаются.
+
+        Args:
+            criteria (dict): Критерии поиска, как у search_books (см. booklib.query).
+            new_title, new_author, new_year, new_genre (optional): Новые
+                значения полей; остальные поля не меняются.
+            dry_run (bool, optional): Только показать, сколько книг будет изменено.
+
+        Examples:
+            python main.py edit --where '{"genre": "Повесть"}' --new-genre "Рассказ"
+        """
         try:
-            import psycopg2
-            conn = psycopg2.connect(
-                dbname="book_library",
-                user="postgres",
-                password="11111",
-                host="localhost",
-                port="5432"
-            )
-            cur = conn.cursor()
-
-            cur.execute("""
-                UPDATE books 
-                SET title = %s, author = %s, year = %s, genre = %s
-                WHERE title = %s AND author = %s
-            """, (book.title, book.author, book.year, book.genre, old_title, old_author))
-
-            conn.commit()
-            cur.close()
-            conn.close()
-
-            print(f"Книга '{old_title}' успешно обновлена.")
-
-        except Exception as e:
-            print(f"Ошибка при обновлении: {e}")
\ No newline at end of file
+            if new_year is not None:
+                new_year = int(new_year)
+        except ValueError:
+            print("Ошибка: год должен быть числом")
+            return
+        try:
+            validate_criteria(criteria)
+            if dry_run:
+                count = self.storage.count_books(criteria)
+                if count is not None:
+                    print(f"Будет изменено книг: {count}")
+                return
+            count = self.storage.update_books(criteria, new_title, new_author, new_year, new_genre)
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+            return
+        if count is not None:
+            print(f"Изменено книг: {count}.")
\ No newline at end of file
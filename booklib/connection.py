@@ -0,0 +1,286 @@
+"""Модуль настроек и фабрики подключений к PostgreSQL.
+
+Все точки подключения к БД (хранилище и его реплики, create_db, команды
+check и clear-db) открывают подключения функцией connect() с одними
+настройками ConnectionSettings. Настройки берутся (по возрастанию
+приоритета) из значений по умолчанию, файла конфигурации, переменных
+окружения и явных параметров (аргументов командной строки).
+
+Файл конфигурации - INI с секцией [database]; путь задается параметром
+path, переменной BOOKLIB_CONFIG или по умолчанию booklib.ini в текущем
+каталоге (если он есть):
+
+    [database]
+    host = db1.internal
+    password = secret
+    statement_timeout = 15
+    replicas = host=db2.internal; host=db3.internal
+
+Переменные окружения - имена параметров с префиксом BOOKLIB_ в верхнем
+регистре (BOOKLIB_HOST, BOOKLIB_STATEMENT_TIMEOUT, BOOKLIB_REPLICAS,
+BOOKLIB_SHARDS, ...).
+
+Каждое подключение получает тайм-ауты подключения, запроса, ожидания
+блокировки и простоя в транзакции, а также TCP keepalive, поэтому
+медленный запрос или пропавший сервер не блокирует процесс бесконечно.
+Неудачное подключение из-за временной ошибки (сервер недоступен,
+исчерпаны подключения) повторяется с экспоненциальной паузой.
+
+Классы:
+    ConnectionSettings: Параметры подключения, тайм-ауты и повторы.
+
+Функции:
+    load_settings: Чтение настроек из файла, окружения и параметров.
+    connect: Открытие подключения с повтором при временных ошибках.
+"""
+
+import configparser
+import logging
+import os
+import random
+import time
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Переменная окружения с путем к файлу конфигурации
+CONFIG_ENV = 'BOOKLIB_CONFIG'
+
+# Файл конфигурации по умолчанию (читается, если существует)
+DEFAULT_CONFIG_FILE = 'booklib.ini'
+
+# Префикс переменных окружения с параметрами
+ENV_PREFIX = 'BOOKLIB_'
+
+# Наибольшая пауза между повторами подключения (секунды)
+MAX_RETRY_DELAY = 5.0
+
+# Ошибки подключения, которые повтор не исправит
+PERMANENT_ERRORS = ('authentication failed', 'does not exist', 'no password supplied')
+
+
+def _dsn_list(text):
+    """Разбирает список строк подключения, разделенных ';'."""
+    return tuple(part.strip() for part in text.split(';') if part.strip())
+
+
+class ConnectionSettings:
+    """Параметры подключения к PostgreSQL, тайм-ауты и повторы.
+
+    Тайм-ауты задаются в секундах; 0 - без ограничения.
+
+    Attributes:
+        dsn (str or None): Строка подключения; если задана, ее параметры
+            важнее host, port, dbname, user и password.
+        host, port, dbname, user, password: Параметры подключения.
+        connect_timeout (float): Тайм-аут установки подключения.
+        statement_timeout (float): Наибольшее время выполнения запроса.
+        lock_timeout (float): Наибольшее время ожидания блокировки.
+        idle_timeout (float): Наибольший простой внутри транзакции
+            (сервер закрывает такое подключение); подключения, простоявшие
+            в пуле дольше, открываются заново.
+        keepalives_idle, keepalives_interval, keepalives_count (int):
+            Параметры TCP keepalive.
+        retries (int): Сколько раз повторить подключение при временной ошибке.
+        retry_backoff (float): Пауза перед первым повтором (дальше удваивается).
+        replicas (tuple): Строки подключения к репликам для чтения.
+        max_replica_lag (float): Наибольшее отставание реплики, при
+            котором с нее читают (см. booklib.replicas).
+        shards (tuple): Строки подключения к шардам по порядку номеров
+            (см. booklib.shards); пустой - каталог в одной базе.
+    """
+
+    # Имя параметра -> (значение по умолчанию, преобразование строки из файла/окружения)
+    FIELDS = {
+        'dsn': (None, str),
+        'host': ('localhost', str),
+        'port': (5432, int),
+        'dbname': ('book_library', str),
+        'user': ('postgres', str),
+        'password': ('11111', str),
+        'connect_timeout': (5.0, float),
+        'statement_timeout': (30.0, float),
+        'lock_timeout': (10.0, float),
+        'idle_timeout': (60.0, float),
+        'keepalives_idle': (30, int),
+        'keepalives_interval': (10, int),
+        'keepalives_count': (3, int),
+        'retries': (3, int),
+        'retry_backoff': (0.2, float),
+        'replicas': ((), _dsn_list),
+        'max_replica_lag': (5.0, float),
+        'shards': ((), _dsn_list),
+    }
+
+    def __init__(self, **values):
+        """Создает настройки.
+
+        Args:
+            **values: Значения параметров (см. FIELDS); остальные берутся
+                по умолчанию.
+
+        Raises:
+            TypeError: Если передан неизвестный параметр.
+        """
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise TypeError(f"Неизвестные параметры подключения: {', '.join(sorted(unknown))}")
+        for name, (default, _) in self.FIELDS.items():
+            setattr(self, name, values.get(name, default))
+        self.replicas = tuple(self.replicas)
+        self.shards = tuple(self.shards)
+
+    def replace(self, **values):
+        """Возвращает копию настроек с измененными параметрами.
+
+        Args:
+            **values: Новые значения параметров.
+
+        Returns:
+            ConnectionSettings: Новые настройки.
+        """
+        current = {name: getattr(self, name) for name in self.FIELDS}
+        current.update(values)
+        return ConnectionSettings(**current)
+
+    def database(self):
+        """Возвращает имя базы данных с учетом строки подключения.
+
+        Returns:
+            str: Имя базы данных.
+        """
+        if self.dsn:
+            return parse_dsn(self.dsn).get('dbname', self.dbname)
+        return self.dbname
+
+    def connect_kwargs(self, dbname=None):
+        """Возвращает параметры для psycopg2.connect().
+
+        Args:
+            dbname (str, optional): Подключиться к другой базе того же
+                сервера (например, 'postgres' для CREATE DATABASE).
+
+        Returns:
+            dict: Именованные параметры (dsn - под ключом 'dsn').
+        """
+        options = []
+        for name, setting in (('statement_timeout', self.statement_timeout),
+                              ('lock_timeout', self.lock_timeout),
+                              ('idle_in_transaction_session_timeout', self.idle_timeout)):
+            options.append(f"-c {name}={int(setting * 1000)}")
+        kwargs = {
+            'connect_timeout': max(1, int(round(self.connect_timeout))) if self.connect_timeout else 0,
+            'keepalives': 1,
+            'keepalives_idle': self.keepalives_idle,
+            'keepalives_interval': self.keepalives_interval,
+            'keepalives_count': self.keepalives_count,
+            'options': ' '.join(options),
+            'client_encoding': 'utf8',
+        }
+        if self.dsn:
+            kwargs['dsn'] = self.dsn
+        else:
+            kwargs.update(host=self.host, port=self.port, dbname=self.dbname,
+                          user=self.user, password=self.password)
+        if dbname is not None:
+            kwargs['dbname'] = dbname
+        return kwargs
+
+    def __repr__(self):
+        shown = {name: getattr(self, name) for name in self.FIELDS if name not in ('password', 'dsn')}
+        return f"ConnectionSettings({', '.join(f'{k}={v!r}' for k, v in shown.items())})"
+
+
+def load_settings(path=None, environ=None, **overrides):
+    """Читает настройки подключения.
+
+    Приоритет (по возрастанию): значения по умолчанию, файл конфигурации,
+    переменные окружения, overrides. Значения None в overrides
+    пропускаются, поэтому им можно передавать необязательные аргументы CLI.
+
+    Args:
+        path (str, optional): Файл конфигурации. По умолчанию - из
+            BOOKLIB_CONFIG или booklib.ini, если он существует.
+        environ (dict, optional): Переменные окружения. По умолчанию os.environ.
+        **overrides: Явные значения параметров.
+
+    Returns:
+        ConnectionSettings: Настройки.
+
+    Raises:
+        ValueError: Если значение параметра не удалось преобразовать
+            или заданный файл конфигурации не найден.
+    """
+    environ = os.environ if environ is None else environ
+    values = {}
+
+    path = path or environ.get(CONFIG_ENV)
+    if path is None and os.path.exists(DEFAULT_CONFIG_FILE):
+        path = DEFAULT_CONFIG_FILE
+    if path is not None:
+        parser = configparser.ConfigParser(interpolation=None)
+        if not parser.read(path, encoding='utf-8'):
+            raise ValueError(f"Файл конфигурации '{path}' не найден")
+        if parser.has_section('database'):
+            values.update(_convert(parser.items('database'), f"файл '{path}'"))
+
+    values.update(_convert(((name[len(ENV_PREFIX):].lower(), value) for name, value in environ.items()
+                            if name.startswith(ENV_PREFIX) and name != CONFIG_ENV),
+                           "переменная окружения"))
+    values.update((name, value) for name, value in overrides.items() if value is not None)
+    return ConnectionSettings(**values)
+
+
+def _convert(items, source):
+    """Преобразует строковые значения известных параметров."""
+    values = {}
+    for name, text in items:
+        if name not in ConnectionSettings.FIELDS:
+            continue
+        try:
+            values[name] = ConnectionSettings.FIELDS[name][1](text)
+        except ValueError:
+            raise ValueError(f"Неверное значение параметра '{name}' ({source}): {text!r}") from None
+    return values
+
+
+def _transient(error):
+    """Проверяет, может ли повтор подключения исправить ошибку."""
+    message = str(error).lower()
+    return not any(text in message for text in PERMANENT_ERRORS)
+
+
+def connect(settings=None, dbname=None):
+    """Открывает подключение с тайм-аутами и повтором при временных ошибках.
+
+    Args:
+        settings (ConnectionSettings, optional): Настройки. По умолчанию
+            читаются load_settings().
+        dbname (str, optional): Подключиться к другой базе того же сервера.
+
+    Returns:
+        psycopg2.extensions.connection: Подключение.
+
+    Raises:
+        psycopg2.OperationalError: Если подключиться не удалось после
+            всех повторов или ошибка не временная.
+    """
+    if settings is None:
+        settings = load_settings()
+    kwargs = settings.connect_kwargs(dbname)
+    for attempt in range(settings.retries + 1):
+        try:
+            return psycopg2.connect(**kwargs)
+        except psycopg2.OperationalError as e:
+            if attempt == settings.retries or not _transient(e):
+                raise
+            # Экспоненциальная пауза со случайной долей, чтобы клиенты не повторяли хором
+            delay = min(MAX_RETRY_DELAY, settings.retry_backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning("Подключение не удалось (%s), повтор через %.2f с", e, delay,
+                           extra={'error': str(e)})
+            METRICS.incr('db.connect_retries')
+            time.sleep(delay)
@@ -0,0 +1,270 @@
+"""Модуль справочников авторов и жанров.
+
+В БД автор и жанр книги хранятся не только строкой, но и ссылкой на
+справочник (books.author_id -> authors.id, books.genre_id -> genres.id).
+Записи справочника уникальны по нормализованному имени (normalize_name),
+поэтому варианты написания одного автора получают один идентификатор.
+
+Хранилище держит в памяти процесса идентификаторы имен, встреченных
+у книг каталога: они разрешаются без запросов к БД (остальные - одним
+INSERT ... ON CONFLICT на пакет имен), а поиск по автору или жанру можно
+переписать в проверку идентификатора книги по множеству: подстрока
+сравнивается один раз с каждым различным написанием, а не с полем
+каждой книги.
+
+Классы:
+    Dimension: Кеш одного справочника (имя <-> идентификатор).
+    Dimensions: Справочники авторов и жанров каталога.
+"""
+
+import threading
+
+from .models import normalize_name
+
+# Поля книги, для которых есть справочники
+DIMENSION_FIELDS = ('author', 'genre')
+
+# Максимальное количество новых имен в одном запросе resolve()
+RESOLVE_CHUNK_SIZE = 1000
+
+
+class Dimension:
+    """Кеш одного справочника: нормализованное имя <-> идентификатор.
+
+    Запоминаются все написания, встреченные у книг каталога: по ним
+    вычисляются идентификаторы для поиска по подстроке.
+
+    Attributes:
+        table (str): Таблица справочника ('authors' или 'genres').
+    """
+
+    def __init__(self, table):
+        """Создает пустой справочник.
+
+        Args:
+            table (str): Таблица справочника в БД.
+        """
+        self.table = table
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self, variants=None):
+        """Заменяет содержимое кеша справочника.
+
+        Args:
+            variants (dict, optional): Написание -> идентификатор.
+        """
+        with self._lock:
+            self._ids = {}       # нормализованное имя -> id
+            self._names = {}     # id -> первое встреченное написание
+            self._variants = {}  # написание -> (написание в нижнем регистре, id)
+            for text, dimension_id in (variants or {}).items():
+                self._ids.setdefault(normalize_name(text), dimension_id)
+                self._names.setdefault(dimension_id, text)
+                self._variants[text] = (text.lower(), dimension_id)
+
+    def __len__(self):
+        return len(self._names)
+
+    def id_for(self, name):
+        """Возвращает идентификатор имени без обращения к БД.
+
+        Args:
+            name (str): Имя в любом написании.
+
+        Returns:
+            int or None: Идентификатор или None, если имени нет в кеше.
+        """
+        return self._ids.get(normalize_name(name))
+
+    def name(self, dimension_id):
+        """Возвращает имя по идентификатору (первое встреченное написание).
+
+        Args:
+            dimension_id (int): Идентификатор записи справочника.
+
+        Returns:
+            str or None: Имя или None, если идентификатора нет в кеше.
+        """
+        return self._names.get(dimension_id)
+
+    def remember(self, dimension_id, text):
+        """Запоминает идентификатор написания (после фиксации транзакции).
+
+        Args:
+            dimension_id (int): Идентификатор записи справочника.
+            text (str): Написание имени у книги.
+        """
+        if text in self._variants:
+            return
+        with self._lock:
+            self._ids.setdefault(normalize_name(text), dimension_id)
+            self._names.setdefault(dimension_id, text)
+            self._variants[text] = (text.lower(), dimension_id)
+
+    def resolve(self, cur, names):
+        """Возвращает идентификаторы имен, при необходимости создавая записи.
+
+        Неизвестные кешу имена сохраняются одним запросом INSERT ... ON
+        CONFLICT и читаются одним SELECT (частями по RESOLVE_CHUNK_SIZE),
+        а не запросом на каждое имя. Новые записи не попадают в кеш:
+        транзакция может откатиться. После фиксации вызывающий код
+        передает идентификаторы в remember().
+
+        Args:
+            cur: Курсор транзакции.
+            names (list): Имена в любом написании.
+
+        Returns:
+            dict: Имя -> идентификатор записи справочника.
+        """
+        ids, missing = {}, {}
+        for name in names:
+            dimension_id = self.id_for(name)
+            if dimension_id is None:
+                missing.setdefault(normalize_name(name), name)
+            else:
+                ids[name] = dimension_id
+        keys = list(missing)
+        found = {}
+        for start in range(0, len(keys), RESOLVE_CHUNK_SIZE):
+            chunk = keys[start:start + RESOLVE_CHUNK_SIZE]
+            values = ', '.join(['(%s, %s)'] * len(chunk))
+            cur.execute(f"INSERT INTO {self.table} (name, normalized_name) VALUES {values} "
+                        f"ON CONFLICT (normalized_name) DO NOTHING",
+                        [value for key in chunk for value in (missing[key], key)])
+            # Записи, созданные раньше в этой же транзакции или другим процессом, тоже читаются
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cur.execute(f"SELECT normalized_name, id FROM {self.table} "
+                        f"WHERE normalized_name IN ({placeholders})", chunk)
+            found.update(cur.fetchall())
+        for name in names:
+            if name not in ids:
+                ids[name] = found[normalize_name(name)]
+        return ids
+
+    def matching(self, needle):
+        """Возвращает идентификаторы написаний, содержащих подстроку.
+
+        Args:
+            needle (str): Подстрока в нижнем регистре.
+
+        Returns:
+            frozenset or None: Идентификаторы или None, если у одного
+                идентификатора есть написания и с подстрокой, и без нее
+                (тогда проверка по идентификатору изменила бы результат).
+        """
+        found, other = set(), set()
+        with self._lock:
+            for lowered, dimension_id in self._variants.values():
+                (found if needle in lowered else other).add(dimension_id)
+        if found & other:
+            return None
+        return frozenset(found)
+
+
+class Dimensions:
+    """Справочники авторов и жанров каталога хранилища.
+
+    Поиск по идентификаторам допустим, только если у всех книг списка
+    известны author_id и genre_id; covers() проверяет это так же, как
+    SortIndex.covers() проверяет, построен ли индекс для списка.
+
+    Attributes:
+        authors (Dimension): Справочник авторов.
+        genres (Dimension): Справочник жанров.
+        source (list or None): Список книг, для которого заполнены справочники.
+    """
+
+    def __init__(self):
+        """Создает пустые справочники."""
+        self.authors = Dimension('authors')
+        self.genres = Dimension('genres')
+        self.reset(None)
+
+    def reset(self, books):
+        """Заполняет справочники для нового списка книг.
+
+        Args:
+            books (list or None): Список книг каталога.
+        """
+        authors, genres = {}, {}
+        complete = True
+        for book in books or ():
+            if book.author_id is None or book.genre_id is None:
+                complete = False
+            else:
+                authors.setdefault(book.author, book.author_id)
+                genres.setdefault(book.genre, book.genre_id)
+        self.authors.reset(authors)
+        self.genres.reset(genres)
+        self._complete = complete
+        self.source = books
+
+    def rebind(self, books):
+        """Привязывает справочники к новому снимку каталога.
+
+        Args:
+            books (list): Новый список книг.
+        """
+        self.source = books
+
+    def add(self, book):
+        """Запоминает написания автора и жанра книги.
+
+        Args:
+            book (Book): Книга каталога.
+        """
+        if book.author_id is None or book.genre_id is None:
+            self._complete = False  # поиск по этому каталогу идет по строкам
+            return
+        self.authors.remember(book.author_id, book.author)
+        self.genres.remember(book.genre_id, book.genre)
+
+    def covers(self, books):
+        """Проверяет, можно ли искать в списке книг по идентификаторам.
+
+        Args:
+            books (list): Список книг.
+
+        Returns:
+            bool: True, если справочники построены для этого списка
+                и у всех его книг известны идентификаторы.
+        """
+        return self._complete and books is self.source
+
+    def rewrite(self, criteria):
+        """Заменяет условия на автора и жанр условиями на идентификаторы.
+
+        Например, {'author': 'толстой'} превращается в
+        {'author_id': frozenset({3, 17})}, а список подстрок - в
+        объединение их идентификаторов.
+
+        Args:
+            criteria (dict): Критерии поиска (см. booklib.query).
+
+        Returns:
+            dict or None: Новые критерии или None, если переписать
+                условия без изменения результата нельзя.
+        """
+        result = {}
+        for key, value in criteria.items():
+            field = key[4:] if key.startswith('not_') else key
+            if value is not None and field in DIMENSION_FIELDS:
+                # Список подстрок - объединение идентификаторов по каждой
+                needles = [value] if isinstance(value, str) else value
+                ids = frozenset()
+                for needle in needles:
+                    found = getattr(self, field + 's').matching(needle.lower())
+                    if found is None:
+                        return None
+                    ids |= found
+                result[key + '_id'] = ids
+            elif value is not None and key == 'any_of':
+                groups = [self.rewrite(group) for group in value]
+                if any(group is None for group in groups):
+                    return None
+                result[key] = groups
+            else:
+                result[key] = value
+        return result
@@ -0,0 +1,405 @@
+"""Модуль инкрементального экспорта каталога с возобновлением.
+
+Каждое изменение книги или ее цитат обновляет поле books.updated_at, а
+удаление книги оставляет запись в таблице book_tombstones. Экспорт с
+водяным знаком (since) выгружает только книги, измененные после него, и
+удаленные после него книги, поэтому ночной экспорт пишет десятки строк
+вместо всего каталога. Экспорт без водяного знака выгружает весь каталог
+в том же формате и служит базой, к которой применяются дельты.
+
+Отметки изменений ставит сервер БД (SERVER_TIMESTAMP, UTC). Транзакция
+может поставить отметку раньше другой, а зафиксироваться позже нее, и
+после экспорта; поэтому водяной знак отстает от времени сервера на
+WATERMARK_MARGIN секунд, и последние изменения попадают и в следующую
+дельту (повторный upsert идемпотентен). Изменение теряется, только если
+транзакция шла дольше WATERMARK_MARGIN.
+
+Формат файлов (CSV и JSONL) содержит операцию и id книги:
+    CSV: op,id,title,author,year,genre,quotes (цитаты через '|');
+    JSONL: {"op": ..., "id": ..., "title": ..., ..., "quotes": [...]}.
+Операция 'upsert' добавляет или заменяет книгу, 'delete' удаляет ее.
+Строки упорядочены по id, что позволяет применять дельту потоково.
+
+Экспорт идет частями по chunk_size книг. После записи каждой части на
+диск сохраняется контрольная точка (файл <имя>.checkpoint); прерванный
+экспорт с теми же параметрами продолжается с последней сохраненной части.
+
+Классы:
+    IncrementalExport: Инкрементальный экспорт с контрольными точками.
+
+Функции:
+    format_watermark: Приведение отметки времени к строке водяного знака.
+    apply_delta: Применение дельты к предыдущему экспорту.
+    read_books: Чтение книг из файла экспорта для импорта.
+"""
+
+import csv
+import heapq
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+from .metrics import METRICS
+from .models import Book
+
+# Формат водяного знака: лексикографический порядок совпадает с хронологическим
+WATERMARK_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+CSV_HEADER = ['op', 'id', 'title', 'author', 'year', 'genre', 'quotes']
+
+# Количество книг в одной части экспорта (между контрольными точками)
+DEFAULT_CHUNK_SIZE = 10000
+
+# Отметка времени изменения для updated_at и deleted_at: время сервера БД в UTC
+# (TIMESTAMP без часового пояса), не зависящее от часов клиента и пояса сервера
+SERVER_TIMESTAMP = "(clock_timestamp() AT TIME ZONE 'UTC')"
+
+# Отставание водяного знака от времени сервера (секунды): наибольшая
+# длительность транзакции, изменения которой гарантированно попадут в дельту
+WATERMARK_MARGIN = 600
+
+
+def format_watermark(value):
+    """Приводит отметку времени из БД или командной строки к водяному знаку.
+
+    Args:
+        value (datetime, str or None): Отметка времени. psycopg2 возвращает
+            datetime, SQLite - строку.
+
+    Returns:
+        str or None: Строка водяного знака или None для пустого значения.
+
+    Raises:
+        ValueError: Если строка не является отметкой времени ISO 8601.
+    """
+    if value is None or value == '' or value == '0':
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime(WATERMARK_FORMAT)
+
+
+class _Writer:
+    """Запись строк экспорта в CSV или JSONL."""
+
+    def __init__(self, f, fmt):
+        self._f = f
+        self._fmt = fmt
+        self._csv = csv.writer(f) if fmt == 'csv' else None
+
+    def header(self):
+        if self._csv is not None:
+            self._csv.writerow(CSV_HEADER)
+
+    def upsert(self, book_id, title, author, year, genre, quotes):
+        if self._csv is not None:
+            self._csv.writerow(['upsert', book_id, title, author, year, genre, '|'.join(quotes)])
+        else:
+            record = {'op': 'upsert', 'id': book_id, 'title': title, 'author': author,
+                      'year': year, 'genre': genre, 'quotes': quotes}
+            self._f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def delete(self, book_id):
+        if self._csv is not None:
+            self._csv.writerow(['delete', book_id, '', '', '', '', ''])
+        else:
+            self._f.write(json.dumps({'op': 'delete', 'id': book_id}) + '\n')
+
+
+class IncrementalExport:
+    """Инкрементальный экспорт книг с контрольными точками.
+
+    Attributes:
+        filename (str): Имя файла экспорта.
+        since (str or None): Водяной знак предыдущего экспорта (None - весь каталог).
+        fmt (str): 'csv' или 'jsonl'.
+        chunk_size (int): Количество книг между контрольными точками.
+        margin (float): Отставание водяного знака от времени сервера (секунды).
+        watermark (str or None): Водяной знак этого экспорта; передается
+            как since следующему экспорту.
+        resumed (bool): Продолжен ли прерванный экспорт.
+    """
+
+    def __init__(self, storage, filename, since=None, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE, margin=None):
+        """Готовит экспорт.
+
+        Args:
+            storage (LibraryStorage): Хранилище, через которое идут запросы к БД.
+            filename (str): Имя файла экспорта.
+            since (str, optional): Водяной знак предыдущего экспорта.
+            fmt (str, optional): 'csv' (по умолчанию) или 'jsonl'.
+            chunk_size (int, optional): Количество книг в одной части.
+            margin (float, optional): Отставание водяного знака от времени
+                сервера. По умолчанию WATERMARK_MARGIN.
+        """
+        self._storage = storage
+        self.filename = filename
+        self.since = format_watermark(since)
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.margin = WATERMARK_MARGIN if margin is None else margin
+        self.watermark = None
+        self.resumed = False
+
+    @property
+    def checkpoint_path(self):
+        """str: Имя файла контрольной точки."""
+        return self.filename + '.checkpoint'
+
+    def _load_checkpoint(self):
+        """Возвращает сохраненную контрольную точку этого экспорта или None."""
+        try:
+            with open(self.checkpoint_path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('since') != self.since or state.get('fmt') != self.fmt:
+            return None  # контрольная точка другого экспорта
+        if not os.path.exists(self.filename) or os.path.getsize(self.filename) < state['bytes']:
+            return None
+        return state
+
+    def _save_checkpoint(self, state):
+        """Атомарно сохраняет контрольную точку."""
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def _where(self, column, after_id, id_column):
+        """Возвращает условие выборки следующей части и его параметры."""
+        conditions, params = [f"{id_column} > %s"], [after_id]
+        if self.since is not None:
+            conditions.append(f"{column} > %s")
+            params.append(self.since)
+        return ' AND '.join(conditions), params
+
+    def _current_watermark(self, cur):
+        """Возвращает водяной знак по состоянию БД.
+
+        Это самая поздняя отметка изменений, но не позже времени сервера
+        минус margin (см. описание модуля) и не раньше since. Ограничение
+        временем сервера отбрасывает и отметки из будущего, например
+        поставленные до миграции в местном часовом поясе сервера.
+        """
+        cur.execute("SELECT MAX(updated_at) FROM books")
+        updated = format_watermark(cur.fetchone()[0])
+        cur.execute("SELECT MAX(deleted_at) FROM book_tombstones")
+        deleted = format_watermark(cur.fetchone()[0])
+        cur.execute(f"SELECT {SERVER_TIMESTAMP}")
+        now = datetime.strptime(format_watermark(cur.fetchone()[0]), WATERMARK_FORMAT)
+        limit = (now - timedelta(seconds=self.margin)).strftime(WATERMARK_FORMAT)
+
+        marks = [m for m in (updated, deleted) if m is not None]
+        watermark = min(max(marks), limit) if marks else None
+        marks = [m for m in (watermark, self.since) if m is not None]
+        return max(marks) if marks else None
+
+    def _read(self, fetch):
+        """Выполняет fetch(cur) в подключении хранилища для чтения."""
+        conn = self._storage._open(read=True)
+        try:
+            cur = conn.cursor()
+            result = fetch(cur)
+            cur.close()
+        finally:
+            conn.close()
+        return result
+
+    def _watermark(self):
+        """Возвращает водяной знак этого экспорта (см. _current_watermark)."""
+        return self._read(self._current_watermark)
+
+    def _export(self, writer, f, state):
+        """Выгружает изменения и удаления, продолжая с контрольной точки state."""
+        def write(cur):
+            if state['phase'] == 'upsert':
+                self._write_upserts(cur, writer, f, state)
+                state.update(phase='delete', last_id=0)
+                self._commit_chunk(f, state)
+            if self.since is not None:  # полному экспорту удаления не нужны
+                self._write_deletes(cur, writer, f, state)
+        self._read(write)
+
+    def _write_upserts(self, cur, writer, f, state):
+        """Выгружает измененные книги частями, сохраняя контрольные точки."""
+        while True:
+            where, params = self._where('updated_at', state['last_id'], 'id')
+            cur.execute(f"SELECT id, title, author, year, genre FROM books WHERE {where} "
+                        f"ORDER BY id LIMIT %s", params + [self.chunk_size])
+            rows = cur.fetchall()
+            if not rows:
+                return
+            quotes = {row[0]: [] for row in rows}
+            placeholders = ', '.join(['%s'] * len(rows))
+            cur.execute(f"SELECT bq.book_id, qt.quote FROM book_quotes bq "
+                        f"JOIN quote_texts qt ON qt.quote_hash = bq.quote_hash "
+                        f"WHERE bq.book_id IN ({placeholders}) ORDER BY bq.id", list(quotes))
+            for book_id, quote in cur.fetchall():
+                quotes[book_id].append(quote)
+            for book_id, title, author, year, genre in rows:
+                writer.upsert(book_id, title, author, year, genre, quotes[book_id])
+            state['last_id'] = rows[-1][0]
+            state['rows'] += len(rows)
+            self._commit_chunk(f, state)
+
+    def _write_deletes(self, cur, writer, f, state):
+        """Выгружает удаленные книги частями, сохраняя контрольные точки."""
+        while True:
+            where, params = self._where('deleted_at', state['last_id'], 'book_id')
+            cur.execute(f"SELECT book_id FROM book_tombstones WHERE {where} "
+                        f"ORDER BY book_id LIMIT %s", params + [self.chunk_size])
+            rows = cur.fetchall()
+            if not rows:
+                return
+            for (book_id,) in rows:
+                writer.delete(book_id)
+            state['last_id'] = rows[-1][0]
+            state['rows'] += len(rows)
+            self._commit_chunk(f, state)
+
+    def _commit_chunk(self, f, state):
+        """Сбрасывает записанную часть на диск и сохраняет контрольную точку."""
+        f.flush()
+        os.fsync(f.fileno())
+        state['bytes'] = os.fstat(f.fileno()).st_size
+        self._save_checkpoint(state)
+        METRICS.incr('export.chunks')
+
+    @METRICS.timed('export.incremental')
+    def run(self):
+        """Выполняет (или продолжает) экспорт.
+
+        Returns:
+            int: Количество записанных строк (книг и удалений).
+        """
+        state = self._load_checkpoint()
+        if state is None:
+            # Водяной знак фиксируется до чтения строк: изменения, сделанные
+            # во время экспорта, попадут и в следующую дельту (upsert идемпотентен)
+            state = {'since': self.since, 'fmt': self.fmt, 'watermark': self._watermark(),
+                     'phase': 'upsert', 'last_id': 0, 'rows': 0, 'bytes': 0}
+            f = open(self.filename, 'w', newline='', encoding='utf-8')
+            writer = _Writer(f, self.fmt)
+            writer.header()
+            self._commit_chunk(f, state)
+        else:
+            # Недописанная часть после контрольной точки отбрасывается
+            self.resumed = True
+            os.truncate(self.filename, state['bytes'])
+            f = open(self.filename, 'a', newline='', encoding='utf-8')
+            writer = _Writer(f, self.fmt)
+
+        with f:
+            self._export(writer, f, state)
+
+        self.watermark = state['watermark']
+        os.remove(self.checkpoint_path)
+        return state['rows']
+
+
+def _read_rows(path, fmt):
+    """Читает строки файла экспорта как пары (id, строка)."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                yield int(row[1]), row
+        else:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record['id'], record
+
+
+def _is_delete(row, fmt):
+    """Проверяет, является ли строка удалением."""
+    return (row[0] if fmt == 'csv' else row['op']) == 'delete'
+
+
+def apply_delta(base, delta, output, fmt='csv'):
+    """Применяет дельту к предыдущему экспорту.
+
+    Оба файла упорядочены по id, поэтому слияние идет потоково и не
+    требует загрузки экспорта в память.
+
+    Args:
+        base (str): Файл предыдущего экспорта (полного или уже с дельтами).
+        delta (str): Файл дельты.
+        output (str): Файл результата (не должен совпадать с base).
+        fmt (str, optional): 'csv' (по умолчанию) или 'jsonl'.
+
+    Returns:
+        int: Количество книг в результате.
+    """
+    # В дельте сначала идут все upsert, затем все delete - каждая группа по id
+    upserts = (item for item in _read_rows(delta, fmt) if not _is_delete(item[1], fmt))
+    deletes = (item for item in _read_rows(delta, fmt) if _is_delete(item[1], fmt))
+    changes = heapq.merge(upserts, deletes, key=lambda item: item[0])
+
+    count = 0
+    with open(output, 'w', newline='', encoding='utf-8') as f:
+        csv_writer = csv.writer(f) if fmt == 'csv' else None
+        if csv_writer is not None:
+            csv_writer.writerow(CSV_HEADER)
+
+        def write(row):
+            nonlocal count
+            count += 1
+            if csv_writer is not None:
+                csv_writer.writerow(row)
+            else:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+        change = next(changes, None)
+        for book_id, row in _read_rows(base, fmt):
+            while change is not None and change[0] < book_id:
+                if not _is_delete(change[1], fmt):
+                    write(change[1])
+                change = next(changes, None)
+            if change is not None and change[0] == book_id:
+                if not _is_delete(change[1], fmt):
+                    write(change[1])
+                change = next(changes, None)
+            elif not _is_delete(row, fmt):
+                write(row)
+        while change is not None:
+            if not _is_delete(change[1], fmt):
+                write(change[1])
+            change = next(changes, None)
+    return count
+
+
+def read_books(filename, fmt='csv'):
+    """Читает книги из файла экспорта для повторного импорта.
+
+    Подходят файлы полного экспорта (title,author,year,genre,quotes) и
+    файлы инкрементального экспорта; строки удаления пропускаются.
+
+    Args:
+        filename (str): Имя файла.
+        fmt (str, optional): 'csv' (по умолчанию) или 'jsonl'.
+
+    Yields:
+        Book: Книга с цитатами (без id).
+
+    Raises:
+        ValueError: Если год книги не число.
+    """
+    with open(filename, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            if record.get('op', 'upsert') == 'delete':
+                continue
+            quotes = record.get('quotes') or []
+            if isinstance(quotes, str):
+                quotes = quotes.split('|')
+            yield Book(record['title'], record['author'], int(record['year']), record['genre'], quotes)
@@ -5,16 +5,375 @@
 
 Классы:
     BookFilter: Основной класс для фильтрации и сортировки книг.
+    SortIndex: Заранее вычисленные порядки сортировки каталога по полям.
+    YearIndex: Отсортированный массив лет каталога для выборки диапазонов.
+
+Функции:
+    collation_key: Ключ сравнения строк с учетом русского алфавита.
 """
 
+import heapq
+import itertools
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+from .cache import normalize_query
+from .columnar import ColumnarCatalogue
+from .metrics import METRICS
+from .query import MULTI_VALUE_TYPES, compile_query
+
+# Поля, по которым можно сортировать книги
+SORT_FIELDS = ('title', 'author', 'year', 'genre')
+
+# Доля каталога, до которой условие на год выбирается по YearIndex, а не полным проходом
+YEAR_INDEX_MAX_FRACTION = 0.25
+
+
+def collation_key(value):
+    """Возвращает ключ сравнения строки с учетом русского алфавита.
+
+    Сравнение по кодам символов ставит 'ё' после 'я' и все заглавные буквы
+    перед строчными. Ключ сначала сравнивает строки без учета регистра,
+    считая 'ё' равной 'е', затем различает 'е'/'ё', затем регистр.
+
+    Args:
+        value (str): Исходная строка.
+
+    Returns:
+        tuple: Ключ для sorted(), heapq и bisect.
+
+    Examples:
+        sorted(["Ёлкин", "Яковлев", "Ершов"], key=collation_key)
+        ['Ёлкин', 'Ершов', 'Яковлев']
+    """
+    folded = value.casefold()
+    return (folded.replace('ё', 'е'), folded, value)
+
+
+def _sort_key(book, field):
+    """Вычисляет ключ сортировки книги по полю.
+
+    Args:
+        book (Book): Книга.
+        field (str): Одно из SORT_FIELDS.
+
+    Returns:
+        Ключ сортировки: год как число, строки через collation_key().
+    """
+    if field == 'year':
+        return book.year
+    return collation_key(getattr(book, field))
+
+
+class SortIndex:
+    """Заранее вычисленные порядки сортировки каталога по полям.
+
+    Для каждого поля хранит отсортированный список (ключ, номер, книга).
+    Ключи сравнения вычисляются один раз на книгу, а порядок строится при
+    первом запросе и дальше поддерживается инкрементально при добавлении,
+    удалении и изменении книг. Поэтому выдача первых k книг из уже
+    построенного порядка стоит O(k).
+
+    Методы индекса выполняются под блокировкой lock. Если несколько
+    изменений должны быть видны другим потокам разом (изменение и rebind),
+    их выполняют внутри 'with index.lock'.
+
+    Attributes:
+        source (list): Список книг, для которого построен индекс.
+        lock (threading.RLock): Блокировка индекса.
+    """
+
+    def __init__(self, books=()):
+        """Создает индекс для списка книг.
+
+        Args:
+            books (list, optional): Исходный список книг.
+        """
+        self.lock = threading.RLock()
+        self.reset(books)
+
+    def reset(self, books):
+        """Перестраивает индекс для нового списка книг.
+
+        Порядки сортировки сбрасываются и будут построены заново
+        при следующем запросе.
+
+        Args:
+            books (list): Новый список книг.
+        """
+        with self.lock:
+            self.source = books
+            self._seq = itertools.count()
+            self._entries = {}  # id(book) -> (book, номер, {поле: ключ})
+            self._orders = {}   # поле -> отсортированный список (ключ, номер, книга)
+            for book in books:
+                self._entries[id(book)] = (book, next(self._seq), {})
+
+    def rebind(self, books):
+        """Привязывает индекс к новому списку с теми же книгами.
+
+        Args:
+            books (list): Список, содержащий ровно книги из индекса.
+        """
+        with self.lock:
+            self.source = books
+
+    def covers(self, books):
+        """Проверяет, построен ли индекс для этого списка книг.
+
+        Args:
+            books (list): Список книг.
+
+        Returns:
+            bool: True, если индекс можно использовать для этого списка.
+        """
+        return books is self.source
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, entry, field):
+        """Возвращает ключ книги по полю, вычисляя его один раз."""
+        keys = entry[2]
+        if field not in keys:
+            keys[field] = _sort_key(entry[0], field)
+        return keys[field]
+
+    def _order(self, field):
+        """Возвращает порядок по полю, строя его при первом обращении."""
+        order = self._orders.get(field)
+        if order is None:
+            order = sorted((self._key(e, field), e[1], e[0]) for e in self._entries.values())
+            self._orders[field] = order
+        return order
+
+    def add(self, book):
+        """Добавляет книгу в индекс.
+
+        Args:
+            book (Book): Новая книга.
+        """
+        with self.lock:
+            entry = (book, next(self._seq), {})
+            self._entries[id(book)] = entry
+            for field, order in self._orders.items():
+                insort(order, (self._key(entry, field), entry[1], book))
+
+    def remove(self, book):
+        """Удаляет книгу из индекса.
+
+        Args:
+            book (Book): Книга, ранее добавленная в индекс.
+        """
+        with self.lock:
+            entry = self._entries.pop(id(book), None)
+            if entry is None:
+                return
+            for field, order in self._orders.items():
+                item = (self._key(entry, field), entry[1])
+                i = bisect_left(order, item)
+                if i < len(order) and order[i][2] is book:
+                    del order[i]
+
+    def update(self, book):
+        """Пересчитывает ключи книги после изменения ее полей.
+
+        Args:
+            book (Book): Измененная книга.
+        """
+        with self.lock:
+            self.remove(book)
+            self.add(book)
+
+    def ordered(self, field, reverse=False, limit=None):
+        """Возвращает книги в порядке сортировки по полю.
+
+        Результат совпадает с sorted(books, key=..., reverse=reverse)[:limit],
+        включая порядок книг с одинаковыми ключами.
+
+        Args:
+            field (str): Одно из SORT_FIELDS.
+            reverse (bool, optional): Сортировка по убыванию.
+            limit (int, optional): Сколько первых книг вернуть.
+
+        Returns:
+            list: Отсортированный список книг.
+        """
+        with self.lock:
+            return self._ordered(field, reverse, limit)
+
+    def _ordered(self, field, reverse, limit):
+        """Реализация ordered() (вызывается под блокировкой)."""
+        order = self._order(field)
+        if not reverse:
+            stop = len(order) if limit is None else limit
+            return [item[2] for item in order[:stop]]
+
+        # По убыванию ключа, но одинаковые ключи в исходном порядке (как у sorted)
+        result = []
+        end = len(order)
+        while end > 0 and (limit is None or len(result) < limit):
+            key = order[end - 1][0]
+            start = end - 1
+            while start > 0 and order[start - 1][0] == key:
+                start -= 1
+            result.extend(item[2] for item in order[start:end])
+            end = start
+        return result if limit is None else result[:limit]
+
+
+class YearIndex:
+    """Отсортированный массив лет каталога для выборки диапазонов лет.
+
+    Для списка книг хранит годы по возрастанию (array) и номера книг
+    в списке в том же порядке. Диапазон лет находится двумя bisect,
+    а номера книг диапазона сортируются обратно в порядок каталога,
+    так что остальные условия запроса проверяются только для них.
+
+    Массив строится для конкретного снимка списка книг; хранилище
+    публикует новый список при каждом изменении, поэтому индекс
+    строится лениво - когда по снимку выполнено build_after запросов
+    с условием на год.
+
+    Attributes:
+        source (list or None): Список книг, для которого строится индекс.
+        build_after (int): После скольких запросов по снимку строить массив.
+    """
+
+    def __init__(self, build_after=1):
+        """Создает пустой индекс.
+
+        Args:
+            build_after (int, optional): Сколько запросов по снимку
+                выполнить полным проходом до построения массива.
+        """
+        self.build_after = build_after
+        self._lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, books):
+        """Привязывает индекс к новому списку книг (вызывается под блокировкой)."""
+        self.source = books
+        self._years = None      # годы по возрастанию
+        self._positions = None  # номера книг в списке в том же порядке
+        self._queries = 0
+
+    def _ranges(self, criteria):
+        """Возвращает диапазоны лет из условий верхнего уровня или None."""
+        ranges = []
+        year = criteria.get('year')
+        if isinstance(year, MULTI_VALUE_TYPES):
+            ranges.append([(y, y) for y in year])
+        elif year is not None:
+            ranges.append([(year, year)])
+        low, high = criteria.get('year_from'), criteria.get('year_to')
+        if low is not None or high is not None:
+            ranges.append([(low, high)])
+        return ranges or None
+
+    def candidates(self, books, criteria):
+        """Отбирает книги, подходящие под условия на год.
+
+        Args:
+            books (list): Список книг каталога.
+            criteria (dict): Критерии поиска (см. booklib.query).
+
+        Returns:
+            list or None: Книги с подходящим годом в порядке каталога;
+                None, если в запросе нет условия на год, индекс еще не
+                построен или условие отбирает слишком большую часть
+                каталога (тогда быстрее полный проход).
+        """
+        alternatives = self._ranges(criteria)
+        if alternatives is None:
+            return None
+        with self._lock:
+            if books is not self.source:
+                self._reset(books)
+            if self._years is None:
+                self._queries += 1
+                if self._queries <= self.build_after:
+                    return None
+                positions = sorted(range(len(books)), key=lambda i: books[i].year)
+                self._years = array('i', (books[i].year for i in positions))
+                self._positions = array('q', positions)
+                METRICS.incr('year_index.builds')
+            years, positions = self._years, self._positions
+
+        # Из нескольких условий на год берется самое узкое, остальные проверит план
+        best = None
+        for ranges in alternatives:
+            slices = []
+            for low, high in ranges:
+                lo = bisect_left(years, low) if low is not None else 0
+                hi = bisect_right(years, high) if high is not None else len(years)
+                if lo < hi:
+                    slices.append((lo, hi))
+            count = sum(hi - lo for lo, hi in slices)
+            if best is None or count < best[0]:
+                best = (count, slices)
+        count, slices = best
+        if count > YEAR_INDEX_MAX_FRACTION * len(years):
+            return None
+        METRICS.incr('year_index.hits')
+        selected = sorted(itertools.chain.from_iterable(positions[lo:hi] for lo, hi in slices))
+        return [books[i] for i in selected]
+
 
 class BookFilter:
     """Класс для фильтрации и сортировки коллекций книг.
 
     Предоставляет методы для поиска книг по различным критериям
     (автор, название, год, жанр) и сортировки результатов.
+
+    Attributes:
+        index (SortIndex or None): Индекс сортировки каталога. Если он
+            построен для сортируемого списка, сортировка берется из него.
+        stats (TokenStats or None): Статистика каталога для выбора порядка
+            проверки условий поиска.
+        parallel (ParallelCatalogue or None): Снимок каталога в разделяемой
+            памяти. Если он построен для списка книг, поиск выполняется
+            параллельно в пуле процессов.
+        cache (QueryCache or None): Кеш результатов. Если он относится
+            к списку книг, повторные запросы берутся из него.
+        dimensions (Dimensions or None): Справочники авторов и жанров.
+            Если они построены для списка книг, условия на автора и жанр
+            проверяются по идентификаторам.
+        years (YearIndex or None): Индекс лет. Условия на год и диапазон
+            лет выбирают книги через bisect, а не полным проходом.
     """
 
+    def __init__(self, index=None, stats=None, parallel=None, cache=None, dimensions=None, years=None):
+        """Инициализирует фильтр.
+
+        Args:
+            index (SortIndex, optional): Индекс сортировки каталога.
+            stats (TokenStats, optional): Статистика слов каталога.
+            parallel (ParallelCatalogue, optional): Снимок для параллельного поиска.
+            cache (QueryCache, optional): Кеш результатов запросов.
+            dimensions (Dimensions, optional): Справочники авторов и жанров.
+            years (YearIndex, optional): Индекс лет каталога.
+        """
+        self.index = index
+        self.stats = stats
+        self.parallel = parallel
+        self.cache = cache
+        self.dimensions = dimensions
+        self.years = years
+
+    def _cached(self, books, key, compute):
+        """Возвращает результат из кеша или вычисляет и сохраняет его."""
+        key = self.cache.key(books, *key) if self.cache is not None else None
+        if key is None:
+            return compute()
+        result = self.cache.get(key)
+        if result is None:
+            result = compute()
+            self.cache.put(key, result)
+        return result
+
+    @METRICS.timed('filter.search_books')
     def search_books(self, books, **kwargs):
         """Универсальный поиск книг по нескольким критериям.
 
@@ -23,12 +382,21 @@ class BookFilter:
         Критерии можно комбинировать.
 
         Args:
-            books (list): Список объектов Book для поиска.
+            books (list or ColumnarCatalogue): Список объектов Book или
+                упакованный каталог (см. booklib.columnar.open_catalogue).
             **kwargs: Ключевые аргументы для фильтрации. Возможные ключи:
-                author (str, optional): Часть имени автора для поиска.
-                title (str, optional): Часть названия книги для поиска.
-                year (int, optional): Точный год издания.
-                genre (str, optional): Часть названия жанра для поиска.
+                author (str or list, optional): Часть имени автора для
+                    поиска или список вариантов (подходит любой).
+                title (str or list, optional): Часть названия книги для поиска.
+                year (int or list, optional): Точный год издания или список лет.
+                genre (str or list, optional): Часть названия жанра для поиска.
+                year_from, year_to (int, optional): Диапазон лет включительно.
+                author_id, genre_id (int or set, optional): Идентификаторы
+                    справочников (см. booklib.dimensions).
+                not_author, not_title, not_genre, not_year (optional):
+                    Исключить книги, подходящие под условие.
+                any_of (list, optional): Список словарей критериев,
+                    объединенных через ИЛИ.
 
         Returns:
             list: Список объектов Book, удовлетворяющих всем критериям поиска.
@@ -36,25 +404,32 @@ class BookFilter:
         Note:
             Поиск по строковым полям (автор, название, жанр) не чувствителен
             к регистру. Год проверяется на точное совпадение.
+            Критерии компилируются в один предикат (см. booklib.query),
+            который проверяет каждую книгу за один проход.
+            Повторный запрос к тому же каталогу берется из кеша, пока
+            книги не изменились. В упакованном каталоге поиск идет по
+            столбцам буфера, а объекты Book создаются только для найденных.
         """
-        results = books  # нужно временную переменную, чтобы списки книг обновлялись
-
-        for key, value in kwargs.items():  # key='author', value='Толстой'
-            if value is None:
-                continue
-
-            if key == 'author':
-                results = [b for b in results if value.lower() in b.author.lower()]
-            elif key == 'title':
-                results = [b for b in results if value.lower() in b.title.lower()]
-            elif key == 'year':
-                results = [b for b in results if b.year == value]
-            elif key == 'genre':
-                results = [b for b in results if value.lower() in b.genre.lower()]
+        return self._cached(books, ('search', normalize_query(kwargs)),
+                            lambda: self._search(books, kwargs))
 
-        return results
+    def _search(self, books, criteria):
+        """Выполняет поиск без кеша."""
+        if isinstance(books, ColumnarCatalogue):
+            return [books.book(i) for i in books.search(criteria)]
+        if self.parallel is not None and self.parallel.covers(books):
+            return self.parallel.search(**criteria)
+        if self.dimensions is not None and self.dimensions.covers(books):
+            # Подстрока сравнивается с каждым написанием один раз, книги - по id
+            criteria = self.dimensions.rewrite(criteria) or criteria
+        if self.years is not None:
+            candidates = self.years.candidates(books, criteria)
+            if candidates is not None:
+                books = candidates
+        return compile_query(criteria, self.stats).execute(books)
 
-    def sort_books(self, books, sort_by='title', reverse=False):
+    @METRICS.timed('filter.sort_books')
+    def sort_books(self, books, sort_by='title', reverse=False, limit=None):
         """Сортирует книги по указанному полю.
 
         Сортирует список книг по возрастанию или убыванию (если reverse=True)
@@ -69,21 +444,36 @@ class BookFilter:
                 'genre' - по жанру
             reverse (bool, optional): Если True, сортировка в обратном порядке.
                 По умолчанию False.
+            limit (int, optional): Сколько первых книг вернуть. По умолчанию все.
 
         Returns:
             list: Отсортированный список объектов Book.
 
         Note:
+            Строки сравниваются через collation_key(): без учета регистра
+            и с 'ё' рядом с 'е'. Если для списка построен индекс, результат
+            берется из него; иначе при заданном limit используется
+            heapq вместо полной сортировки.
             Если указано неизвестное поле сортировки, возвращается исходный
             список без изменений.
         """
-        if sort_by == 'title':
-            return sorted(books, key=lambda x: x.title, reverse=reverse)
-        elif sort_by == 'author':
-            return sorted(books, key=lambda x: x.author, reverse=reverse)
-        elif sort_by == 'year':
-            return sorted(books, key=lambda x: x.year, reverse=reverse)
-        elif sort_by == 'genre':
-            return sorted(books, key=lambda x: x.genre, reverse=reverse)
-        else:
-            return books
\ No newline at end of file
+        if sort_by not in SORT_FIELDS:
+            return books if limit is None else books[:limit]
+        return self._cached(books, ('sort', sort_by, bool(reverse), limit),
+                            lambda: self._sort(books, sort_by, reverse, limit))
+
+    def _sort(self, books, sort_by, reverse, limit):
+        """Выполняет сортировку без кеша."""
+        if self.index is not None:
+            with self.index.lock:  # проверка и выборка - над одним состоянием индекса
+                if self.index.covers(books):
+                    return self.index.ordered(sort_by, reverse, limit)
+
+        def key(book):
+            return _sort_key(book, sort_by)
+
+        if limit is not None:
+            if reverse:
+                return heapq.nlargest(limit, books, key=key)
+            return heapq.nsmallest(limit, books, key=key)
+        return sorted(books, key=key, reverse=reverse)
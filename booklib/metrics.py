@@ -0,0 +1,318 @@
+"""Модуль инструментирования книжной библиотеки.
+
+Содержит реестр метрик с таймерами операций и счетчиками событий
+(открытые подключения, выполненные запросы, полученные строки, попадания
+и промахи кеша), а также обертки над подключением DB-API, которые считают
+запросы к базе данных.
+
+По умолчанию сбор метрик выключен: обертки при этом сводятся к одной
+проверке флага, поэтому накладные расходы почти нулевые.
+
+Классы:
+    Metrics: Реестр таймеров и счетчиков.
+    InstrumentedConnection: Подключение DB-API, считающее запросы.
+    InstrumentedCursor: Курсор DB-API, замеряющий запросы и строки.
+    JsonLogFormatter: Форматтер logging для структурированных логов.
+
+Объекты:
+    METRICS: Глобальный реестр метрик, используемый всем пакетом.
+"""
+
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('booklib')
+
+
+class Metrics:
+    """Реестр таймеров операций и счетчиков событий.
+
+    Attributes:
+        enabled (bool): Включен ли сбор метрик.
+        timers (dict): Имя операции -> [количество вызовов, суммарное время, максимум].
+        counters (dict): Имя события -> количество.
+    """
+
+    def __init__(self):
+        """Создает пустой выключенный реестр."""
+        self.enabled = False
+        self.timers = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        """Включает или выключает сбор метрик.
+
+        Args:
+            enabled (bool, optional): Новое состояние. По умолчанию True.
+        """
+        self.enabled = enabled
+
+    def reset(self):
+        """Обнуляет все накопленные таймеры и счетчики."""
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def incr(self, name, value=1):
+        """Увеличивает счетчик события.
+
+        Args:
+            name (str): Имя счетчика, например 'db.queries'.
+            value (int, optional): Величина приращения. По умолчанию 1.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """Учитывает одно выполнение операции.
+
+        Args:
+            name (str): Имя операции, например 'storage.load_books'.
+            seconds (float): Длительность выполнения в секундах.
+        """
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+        logger.debug("op=%s duration_ms=%.3f", name, seconds * 1000,
+                     extra={'op': name, 'duration_ms': round(seconds * 1000, 3)})
+
+    @contextmanager
+    def timer(self, name):
+        """Контекстный менеджер, замеряющий время блока кода.
+
+        Args:
+            name (str): Имя операции.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name):
+        """Декоратор, замеряющий время каждого вызова функции.
+
+        Args:
+            name (str): Имя операции.
+
+        Returns:
+            callable: Декоратор функции.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Возвращает копию накопленных метрик.
+
+        Returns:
+            dict: Словарь с ключами 'timers' и 'counters'. Для каждой
+                операции указаны count, total_ms, avg_ms и max_ms.
+        """
+        with self._lock:
+            timers = {
+                name: {
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'avg_ms': round(total * 1000 / count, 3),
+                    'max_ms': round(maximum * 1000, 3),
+                }
+                for name, (count, total, maximum) in sorted(self.timers.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        return {'timers': timers, 'counters': counters}
+
+    def format_text(self):
+        """Форматирует метрики в виде таблицы для вывода в консоль.
+
+        Returns:
+            str: Многострочная таблица операций и счетчиков.
+        """
+        data = self.snapshot()
+        lines = [f"{'Операция':<32} {'вызовов':>8} {'всего, мс':>12} {'макс, мс':>10}"]
+        for name, t in data['timers'].items():
+            lines.append(f"{name:<32} {t['count']:>8} {t['total_ms']:>12.3f} {t['max_ms']:>10.3f}")
+        for name, value in data['counters'].items():
+            lines.append(f"{name:<32} {value:>8}")
+        return '\n'.join(lines)
+
+    def to_prometheus(self):
+        """Форматирует метрики в текстовом формате Prometheus.
+
+        Returns:
+            str: Текст для textfile-коллектора или страницы /metrics.
+        """
+        with self._lock:
+            timers = sorted(self.timers.items())
+            counters = sorted(self.counters.items())
+
+        lines = [
+            '# HELP booklib_operation_seconds Время выполнения операций библиотеки.',
+            '# TYPE booklib_operation_seconds summary',
+        ]
+        for name, (count, total, _) in timers:
+            lines.append(f'booklib_operation_seconds_count{{op="{name}"}} {count}')
+            lines.append(f'booklib_operation_seconds_sum{{op="{name}"}} {total:.6f}')
+        lines.append('# HELP booklib_operation_seconds_max Максимальное время операции.')
+        lines.append('# TYPE booklib_operation_seconds_max gauge')
+        for name, (_, _, maximum) in timers:
+            lines.append(f'booklib_operation_seconds_max{{op="{name}"}} {maximum:.6f}')
+        for name, value in counters:
+            metric = 'booklib_' + name.replace('.', '_').replace('-', '_') + '_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+class InstrumentedCursor:
+    """Курсор DB-API, считающий запросы, их время и полученные строки."""
+
+    def __init__(self, cursor, metrics):
+        """Оборачивает курсор.
+
+        Args:
+            cursor: Исходный курсор DB-API.
+            metrics (Metrics): Реестр для учета метрик.
+        """
+        self._cursor = cursor
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def execute(self, sql, params=None):
+        """Выполняет запрос и учитывает его в метриках."""
+        self._metrics.incr('db.queries')
+        with self._metrics.timer('db.query'):
+            return self._cursor.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        """Выполняет пакет запросов и учитывает его в метриках."""
+        self._metrics.incr('db.queries')
+        with self._metrics.timer('db.query'):
+            return self._cursor.executemany(sql, seq_of_params)
+
+    def fetchone(self):
+        """Возвращает следующую строку и учитывает ее в метриках."""
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._metrics.incr('db.rows_fetched')
+        return row
+
+    def fetchall(self):
+        """Возвращает все строки и учитывает их в метриках."""
+        rows = self._cursor.fetchall()
+        self._metrics.incr('db.rows_fetched', len(rows))
+        return rows
+
+    def fetchmany(self, *args):
+        """Возвращает часть строк и учитывает их в метриках."""
+        rows = self._cursor.fetchmany(*args)
+        self._metrics.incr('db.rows_fetched', len(rows))
+        return rows
+
+
+class InstrumentedConnection:
+    """Подключение DB-API, выдающее инструментированные курсоры."""
+
+    def __init__(self, conn, metrics):
+        """Оборачивает подключение.
+
+        Args:
+            conn: Исходное подключение DB-API.
+            metrics (Metrics): Реестр для учета метрик.
+        """
+        self._conn = conn
+        self._metrics = metrics
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name in ('_conn', '_metrics'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def cursor(self, *args, **kwargs):
+        """Создает инструментированный курсор."""
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._metrics)
+
+    def commit(self):
+        """Фиксирует транзакцию и учитывает время фиксации."""
+        with self._metrics.timer('db.commit'):
+            self._conn.commit()
+
+
+def instrument_connection(connect, metrics=METRICS):
+    """Открывает подключение и оборачивает его, если метрики включены.
+
+    Args:
+        connect (callable): Функция без аргументов, открывающая подключение.
+        metrics (Metrics, optional): Реестр метрик. По умолчанию METRICS.
+
+    Returns:
+        Подключение DB-API (обернутое, если сбор метрик включен).
+    """
+    if not metrics.enabled:
+        return connect()
+    metrics.incr('db.connections')
+    with metrics.timer('db.connect'):
+        conn = connect()
+    return InstrumentedConnection(conn, metrics)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Форматтер, записывающий каждую запись лога одной строкой JSON."""
+
+    _FIELDS = ('op', 'duration_ms', 'error')
+
+    def format(self, record):
+        """Преобразует запись лога в строку JSON.
+
+        Args:
+            record (logging.LogRecord): Запись лога.
+
+        Returns:
+            str: Строка JSON с временем, уровнем, сообщением и доп. полями.
+        """
+        data = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in self._FIELDS:
+            if hasattr(record, field):
+                data[field] = getattr(record, field)
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
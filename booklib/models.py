@@ -5,8 +5,70 @@
 
 Классы:
     Book: Основной класс, представляющий книгу в библиотеке.
+
+Функции:
+    normalize_name: Нормализация строки (регистр, 'ё', пробелы).
+    natural_key: Нормализованный ключ книги (название, автор, год).
+    quote_hash: Хеш текста цитаты для поиска повторов.
+
+Цитаты книги могут загружаться лениво: хранилище передает книге загрузчик
+(объект с методом load(book)), и цитаты запрашиваются из базы данных только
+при первом обращении к Book.quotes.
 """
 
+import hashlib
+
+# Разделитель частей ключа книги (название, автор, год)
+KEY_SEPARATOR = '\x1f'
+
+
+def normalize_name(text):
+    """Нормализует строку для сравнения без учета написания.
+
+    Приводит строку к нижнему регистру, 'ё' к 'е' и схлопывает пробелы.
+    Используется в ключе книги и в справочниках авторов и жанров.
+
+    Args:
+        text (str): Исходная строка.
+
+    Returns:
+        str: Нормализованная строка.
+    """
+    return ' '.join(text.casefold().split()).replace('ё', 'е')
+
+
+def natural_key(title, author, year):
+    """Возвращает нормализованный ключ книги.
+
+    Книги, отличающиеся только регистром, буквой 'ё' или пробелами
+    в названии и имени автора, считаются одной книгой.
+
+    Args:
+        title (str): Название книги.
+        author (str): Автор книги.
+        year (int): Год издания.
+
+    Returns:
+        str: Ключ для уникального индекса books.natural_key.
+
+    Examples:
+        natural_key("Война и  мир", "Лев Толстой", 1869) == natural_key("война и мир", "ЛЕВ ТОЛСТОЙ", 1869)
+        True
+    """
+    return KEY_SEPARATOR.join((normalize_name(title), normalize_name(author), str(int(year))))
+
+
+def quote_hash(quote):
+    """Возвращает хеш содержимого цитаты.
+
+    Args:
+        quote (str): Текст цитаты.
+
+    Returns:
+        str: Шестнадцатеричный SHA-256 текста в UTF-8.
+    """
+    return hashlib.sha256(quote.encode('utf-8')).hexdigest()
+
 
 class Book:
     """Класс, представляющий книгу в библиотеке.
@@ -19,9 +81,12 @@ class Book:
         author (str): Автор книги.
         year (int): Год издания книги.
         genre (str): Жанр книги.
-        quotes (list): Список цитат из книги.
+        quotes (list): Список цитат из книги. Если цитаты загружаются
+            лениво, первое обращение к атрибуту загружает их из БД.
         id (int or None): Уникальный идентификатор книги в базе данных.
             None означает, что книга еще не сохранена в БД.
+        author_id (int or None): Идентификатор автора в справочнике authors.
+        genre_id (int or None): Идентификатор жанра в справочнике genres.
     """
 
     def __init__(self, title, author, year, genre, quotes=None):
@@ -39,8 +104,54 @@ class Book:
         self.author = author
         self.year = year
         self.genre = genre
-        self.quotes = quotes or []
+        self._quotes = quotes or []
+        self._quote_loader = None
+        self._quote_count = None
         self.id = None
+        self.author_id = None
+        self.genre_id = None
+
+    @property
+    def quotes(self):
+        """list: Список цитат из книги (загружается при первом обращении)."""
+        if self._quotes is None:
+            self._quote_loader.load(self)
+        return self._quotes
+
+    @quotes.setter
+    def quotes(self, quotes):
+        self._quotes = quotes
+        self._quote_loader = None
+        self._quote_count = None
+
+    @property
+    def quotes_loaded(self):
+        """bool: Загружены ли цитаты книги в память."""
+        return self._quotes is not None
+
+    @property
+    def quote_count(self):
+        """int: Количество цитат без загрузки их текста, если оно известно."""
+        if self._quotes is None and self._quote_count is not None:
+            return self._quote_count
+        return len(self.quotes)
+
+    def set_lazy_quotes(self, loader, count=None):
+        """Откладывает загрузку цитат до первого обращения к quotes.
+
+        Args:
+            loader: Объект с методом load(book), который заполняет
+                цитаты книги (обычно QuoteLoader хранилища).
+            count (int, optional): Известное количество цитат.
+        """
+        self._quotes = None
+        self._quote_loader = loader
+        self._quote_count = count
+
+    @property
+    def natural_key(self):
+        """str: Нормализованный ключ книги (см. natural_key())."""
+        return natural_key(self.title, self.author, self.year)
 
     def to_dict(self):
         """Преобразует объект книги в словарь.
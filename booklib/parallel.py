@@ -0,0 +1,176 @@
+"""Модуль параллельного поиска и экспорта по большому каталогу.
+
+Каталог упаковывается в колоночный буфер (см. booklib.columnar) и кладется
+в разделяемую память. Пул процессов делит каталог на части по номерам
+книг; каждый процесс читает свою часть прямо из разделяемой памяти, а не
+получает сериализованные объекты Book. Результаты частей объединяются
+в исходном порядке каталога.
+
+Классы:
+    ParallelCatalogue: Каталог в разделяемой памяти с пулом процессов.
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+
+from .columnar import QUOTE_SEPARATOR, ColumnarCatalogue, encode_catalogue
+from .metrics import METRICS
+
+# Размер части каталога, обрабатываемой одной задачей пула
+DEFAULT_CHUNK_SIZE = 50000
+
+# Кеш подключений к разделяемой памяти внутри процесса пула
+_attached = {}
+
+
+def _attach(name):
+    """Подключает процесс пула к разделяемой памяти каталога.
+
+    Args:
+        name (str): Имя сегмента разделяемой памяти.
+
+    Returns:
+        ColumnarCatalogue: Каталог поверх разделяемой памяти.
+    """
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = (shm, ColumnarCatalogue(shm.buf))
+    return _attached[name][1]
+
+
+def _search_chunk(task):
+    """Ищет книги в части каталога (выполняется в процессе пула).
+
+    Args:
+        task (tuple): (имя сегмента, начало, конец, критерии поиска).
+
+    Returns:
+        list: Номера подходящих книг.
+    """
+    name, start, stop, criteria = task
+    return _attach(name).search(criteria, start, stop)
+
+
+def _export_chunk(task):
+    """Сериализует часть каталога в CSV или JSONL (выполняется в процессе пула).
+
+    Args:
+        task (tuple): (имя сегмента, начало, конец, формат 'csv' или 'jsonl').
+
+    Returns:
+        str: Текст части файла экспорта.
+    """
+    name, start, stop, fmt = task
+    catalogue = _attach(name)
+    columns = zip(
+        catalogue.column('title', start, stop),
+        catalogue.column('author', start, stop),
+        catalogue.years[start:stop],
+        catalogue.column('genre', start, stop),
+        catalogue.column('quotes', start, stop),
+    )
+    out = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        for title, author, year, genre, quotes in columns:
+            writer.writerow([title, author, year, genre, quotes.replace(QUOTE_SEPARATOR, '|')])
+    else:
+        for title, author, year, genre, quotes in columns:
+            record = {'title': title, 'author': author, 'year': year, 'genre': genre,
+                      'quotes': quotes.split(QUOTE_SEPARATOR) if quotes else []}
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write('\n')
+    return out.getvalue()
+
+
+class ParallelCatalogue:
+    """Снимок каталога в разделяемой памяти с пулом процессов.
+
+    Снимок не обновляется при изменении книг: после изменений нужно
+    создать новый (LibraryStorage.parallel() делает это сам).
+
+    Attributes:
+        books (list): Книги, для которых построен снимок.
+        workers (int): Количество процессов пула.
+        chunk_size (int): Количество книг в одной задаче пула.
+    """
+
+    def __init__(self, books, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Упаковывает книги в разделяемую память и запускает пул.
+
+        Args:
+            books (list): Список объектов Book.
+            workers (int, optional): Количество процессов. По умолчанию
+                количество ядер процессора.
+            chunk_size (int, optional): Количество книг в одной задаче.
+        """
+        self.books = books
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+
+        with METRICS.timer('parallel.encode'):
+            data = encode_catalogue(books)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        self._shm.buf[:len(data)] = data
+        self._pool = multiprocessing.Pool(self.workers)
+
+    def covers(self, books):
+        """Проверяет, построен ли снимок для этого списка книг."""
+        return books is self.books
+
+    def _chunks(self, extra):
+        """Возвращает задачи пула для всех частей каталога."""
+        n = len(self.books)
+        return [(self._shm.name, start, min(start + self.chunk_size, n), extra)
+                for start in range(0, n, self.chunk_size)]
+
+    def search(self, **criteria):
+        """Ищет книги параллельно во всех частях каталога.
+
+        Args:
+            **criteria: Критерии поиска, как у BookFilter.search_books.
+
+        Returns:
+            list: Подходящие книги в исходном порядке каталога.
+        """
+        with METRICS.timer('parallel.search'):
+            result = []
+            for indices in self._pool.imap(_search_chunk, self._chunks(criteria)):
+                result.extend(self.books[i] for i in indices)
+            return result
+
+    def export(self, filename, fmt='csv'):
+        """Экспортирует каталог параллельно в CSV или JSONL.
+
+        Части сериализуются в процессах пула и записываются в файл
+        по порядку по мере готовности.
+
+        Args:
+            filename (str): Имя файла.
+            fmt (str, optional): 'csv' (по умолчанию) или 'jsonl'.
+        """
+        with METRICS.timer('parallel.export'), \
+                open(filename, 'w', newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                csv.writer(f).writerow(['title', 'author', 'year', 'genre', 'quotes'])
+            for text in self._pool.imap(_export_chunk, self._chunks(fmt)):
+                f.write(text)
+
+    def close(self):
+        """Останавливает пул и освобождает разделяемую память."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._shm.close()
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
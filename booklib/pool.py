@@ -0,0 +1,265 @@
+"""Модуль пула подключений и подготовленных запросов хранилища.
+
+Раньше каждая операция хранилища открывала новое подключение, а сервер
+заново разбирал и планировал каждый запрос. Пул держит несколько
+открытых подключений, а постоянный набор запросов хранилища (STATEMENTS)
+подготавливается на сервере один раз на подключение (PREPARE) и дальше
+выполняется по имени (EXECUTE) - без разбора и планирования.
+
+Независимые однотипные запросы (например, отметки updated_at для многих
+книг) отправляются пачками: с psycopg2 через psycopg2.extras.execute_batch,
+который передает страницу запросов за один обмен с сервером, с другими
+драйверами - через executemany.
+
+Классы:
+    ConnectionPool: Пул открытых подключений к БД.
+    PooledConnection: Подключение, возвращаемое в пул при закрытии.
+
+Функции:
+    execute_prepared: Выполнение запроса из STATEMENTS.
+    execute_pipelined: Выполнение запроса из STATEMENTS для многих наборов параметров.
+"""
+
+import re
+import threading
+import time
+
+from psycopg2.extras import execute_batch
+
+from .export import SERVER_TIMESTAMP
+from .metrics import METRICS
+
+# Количество подключений, которые пул держит открытыми
+DEFAULT_POOL_SIZE = 4
+
+# Количество запросов в одной передаче execute_batch
+PIPELINE_PAGE_SIZE = 100
+
+# Постоянный набор запросов горячих путей хранилища (параметры в стиле psycopg2).
+# Запросы к book_quotes содержат условие на book_id, чтобы PostgreSQL читал
+# только секцию книги (create_db, миграция 10)
+STATEMENTS = {
+    'book_quotes': "SELECT bq.book_id, qt.quote FROM book_quotes bq "
+                   "JOIN quote_texts qt ON qt.quote_hash = bq.quote_hash WHERE bq.book_id = %s ORDER BY bq.id",
+    'quote_ids': "SELECT id, quote_hash FROM book_quotes WHERE book_id = %s ORDER BY id",
+    'delete_book_quotes': "DELETE FROM book_quotes WHERE book_id = %s RETURNING quote_hash",
+    'insert_quote_text': "INSERT INTO quote_texts (quote_hash, quote) VALUES (%s, %s) "
+                         "ON CONFLICT (quote_hash) DO NOTHING",
+    'insert_quote': "INSERT INTO book_quotes (book_id, quote_hash) VALUES (%s, %s) "
+                    "ON CONFLICT (book_id, quote_hash) DO NOTHING RETURNING id",
+    'delete_quote': "DELETE FROM book_quotes WHERE book_id = %s AND id = %s",
+    'delete_orphan_text': "DELETE FROM quote_texts WHERE quote_hash = %s "
+                          "AND NOT EXISTS (SELECT 1 FROM book_quotes WHERE quote_hash = %s)",
+    'touch_book': f"UPDATE books SET updated_at = {SERVER_TIMESTAMP} WHERE id = %s",
+    'delete_book': "DELETE FROM books WHERE id = %s",
+    'insert_tombstone': f"INSERT INTO book_tombstones (book_id, deleted_at) VALUES (%s, {SERVER_TIMESTAMP})",
+    'update_book': "UPDATE books SET title = %s, author = %s, year = %s, genre = %s, natural_key = %s, "
+                   f"updated_at = {SERVER_TIMESTAMP}, author_id = %s, genre_id = %s WHERE id = %s",
+}
+
+
+def _numbered(sql):
+    """Заменяет параметры '%s' на нумерованные '$1', '$2', ... для PREPARE."""
+    counter = iter(range(1, sql.count('%s') + 1))
+    return re.sub(r'%s', lambda match: f'${next(counter)}', sql)
+
+
+def _statement(cur, name, prepared):
+    """Возвращает текст запроса, при необходимости подготавливая его.
+
+    Args:
+        cur: Курсор DB-API.
+        name (str): Имя запроса в STATEMENTS.
+        prepared (set or None): Имена запросов, уже подготовленных в этом
+            подключении. None - подключение не из пула, запрос выполняется
+            как обычный текст.
+
+    Returns:
+        str: Текст запроса для execute() с параметрами '%s'.
+    """
+    sql = STATEMENTS[name]
+    if prepared is None:
+        return sql
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {_numbered(sql)}")
+        prepared.add(name)
+        METRICS.incr('db.prepared')
+    return f"EXECUTE {name} ({', '.join(['%s'] * sql.count('%s'))})"
+
+
+def execute_prepared(cur, name, params, prepared=None):
+    """Выполняет запрос из STATEMENTS.
+
+    Args:
+        cur: Курсор DB-API.
+        name (str): Имя запроса в STATEMENTS.
+        params (tuple): Параметры запроса.
+        prepared (set, optional): Имена запросов, подготовленных в
+            подключении курсора (см. ConnectionPool.prepared).
+    """
+    cur.execute(_statement(cur, name, prepared), params)
+
+
+def execute_pipelined(cur, name, params_list, prepared=None):
+    """Выполняет запрос из STATEMENTS для каждого набора параметров.
+
+    Запросы передаются страницами по PIPELINE_PAGE_SIZE, поэтому время
+    определяется пропускной способностью, а не задержкой обмена с сервером.
+    Результаты запросов (RETURNING) не возвращаются.
+
+    Args:
+        cur: Курсор DB-API.
+        name (str): Имя запроса в STATEMENTS.
+        params_list (list): Наборы параметров.
+        prepared (set, optional): Имена запросов, подготовленных в
+            подключении курсора.
+    """
+    if not params_list:
+        return
+    sql = _statement(cur, name, prepared)
+    if hasattr(cur, 'mogrify'):  # psycopg2: несколько запросов за одну передачу
+        execute_batch(cur, sql, params_list, page_size=PIPELINE_PAGE_SIZE)
+    else:
+        cur.executemany(sql, params_list)
+
+
+class PooledConnection:
+    """Подключение из пула: close() возвращает его в пул, а не закрывает."""
+
+    def __init__(self, pool, conn):
+        """Оборачивает подключение.
+
+        Args:
+            pool (ConnectionPool): Пул, которому принадлежит подключение.
+            conn: Исходное подключение DB-API.
+        """
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        """Возвращает подключение в пул (повторный вызов ничего не делает)."""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.put(conn)
+
+
+class ConnectionPool:
+    """Пул открытых подключений к БД.
+
+    Подключение выдается одному пользователю до вызова close(). При
+    возврате незавершенная транзакция откатывается; подключения, сверх
+    size или сломанные, закрываются. С каждым подключением пул хранит
+    имена подготовленных в нем запросов.
+
+    Attributes:
+        size (int): Сколько свободных подключений держать открытыми
+            (0 - пул выключен: каждое подключение закрывается после
+            использования, запросы не подготавливаются).
+        max_idle (float or None): Подключение, простоявшее в пуле дольше
+            max_idle секунд, закрывается вместо повторного использования
+            (сервер или сетевое оборудование могли его уже разорвать).
+    """
+
+    def __init__(self, connect, size=DEFAULT_POOL_SIZE, max_idle=None):
+        """Создает пустой пул.
+
+        Args:
+            connect (callable): Функция без аргументов, открывающая подключение.
+            size (int, optional): Количество свободных подключений в пуле.
+            max_idle (float, optional): Наибольший простой подключения в пуле
+                (секунды). По умолчанию не ограничен.
+        """
+        self.size = size
+        self.max_idle = max_idle
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._idle = []  # (подключение, time.monotonic() возврата в пул)
+        self._prepared = {}  # id(подключения) -> имена подготовленных запросов
+        self._opened = set()  # id открытых пулом подключений
+
+    def get(self):
+        """Выдает подключение: свободное из пула или новое.
+
+        Returns:
+            PooledConnection: Подключение; close() возвращает его в пул.
+        """
+        conn = None
+        while conn is None:
+            with self._lock:
+                conn, returned_at = self._idle.pop() if self._idle else (None, None)
+            if conn is None:
+                break
+            if self.max_idle and time.monotonic() - returned_at > self.max_idle:
+                self._discard(conn)
+                METRICS.incr('pool.expired')
+                conn = None
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self._opened.add(id(conn))
+        else:
+            METRICS.incr('pool.reused')
+        return PooledConnection(self, conn)
+
+    def put(self, conn):
+        """Принимает подключение обратно в пул.
+
+        Args:
+            conn: Исходное подключение DB-API.
+        """
+        try:
+            conn.rollback()  # читающие запросы тоже открывают транзакцию
+        except Exception:
+            self._discard(conn)
+            return
+        with self._lock:
+            if len(self._idle) < self.size and not getattr(conn, 'closed', 0):
+                self._idle.append((conn, time.monotonic()))
+                return
+        self._discard(conn)
+
+    def prepared(self, conn):
+        """Возвращает имена запросов, подготовленных в подключении.
+
+        Args:
+            conn: Исходное подключение DB-API (cursor.connection).
+
+        Returns:
+            set or None: Изменяемое множество имен; None, если пул выключен.
+        """
+        if not self.size:
+            return None
+        with self._lock:
+            return self._prepared.setdefault(id(conn), set())
+
+    def owns(self, conn):
+        """Проверяет, открыто ли подключение этим пулом.
+
+        Args:
+            conn: Исходное подключение DB-API (cursor.connection).
+
+        Returns:
+            bool: True, если подключение выдано пулом и еще не закрыто им.
+        """
+        with self._lock:
+            return id(conn) in self._opened
+
+    def _discard(self, conn):
+        """Закрывает подключение и забывает его подготовленные запросы."""
+        with self._lock:
+            self._prepared.pop(id(conn), None)
+            self._opened.discard(id(conn))
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Закрывает все свободные подключения пула."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
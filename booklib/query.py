@@ -0,0 +1,616 @@
+"""Модуль компиляции поисковых запросов по книгам.
+
+Превращает критерии поиска (именованные аргументы BookFilter.search_books)
+в один предикат, который проверяет каждую книгу за один проход, без
+промежуточных списков. Условия упорядочиваются по оценке селективности:
+сначала точный год, затем самые редкие слова. Скомпилированные планы
+кешируются по форме запроса (набору полей и операций), поэтому повторные
+запросы с другими значениями не компилируются заново.
+
+Поддерживаемые критерии:
+    author, title, genre: подстрока без учета регистра или список
+        подстрок (книга подходит, если содержит любую из них).
+    year: точный год или список лет.
+    year_from, year_to: диапазон лет (включительно), можно задать одну границу.
+    author_id, genre_id: идентификатор справочника или множество
+        идентификаторов (см. booklib.dimensions); в упакованном каталоге
+        и при параллельном поиске не поддерживаются.
+    not_author, not_title, not_genre, not_year, not_author_id, not_genre_id:
+        отрицание условия.
+    any_of: список словарей критериев, объединенных через ИЛИ
+        (условия внутри одного словаря объединяются через И).
+
+Те же критерии переводятся в условие WHERE одного запроса SQL
+(compile_sql), чтобы искать в БД, не загружая каталог.
+
+Классы:
+    QueryPlan: Скомпилированный план поиска.
+    TokenStats: Частоты слов каталога для оценки селективности.
+
+Функции:
+    compile_query: Компиляция критериев поиска в план.
+    compile_sql: Перевод критериев поиска в условие WHERE.
+    validate_criteria: Строгая проверка критериев из внешнего ввода.
+"""
+
+import functools
+from collections import Counter
+
+STRING_FIELDS = ('title', 'author', 'genre')
+ID_FIELDS = ('author_id', 'genre_id')
+
+# Значения критерия, задающие список вариантов
+MULTI_VALUE_TYPES = (list, tuple, set, frozenset)
+
+# Оценки селективности, если статистика каталога недоступна
+_DEFAULT_YEAR_EQ = 0.005
+_YEARS_SPAN = 225
+_DEFAULT_ID_EQ = 0.001
+
+
+class TokenStats:
+    """Частоты слов и лет в каталоге для оценки селективности условий.
+
+    Построение статистики стоит примерно как несколько полных поисков,
+    поэтому она строится лениво, только когда по каталогу выполнено
+    build_after запросов (до этого используются эвристики), и дальше
+    поддерживается при добавлении и удалении книг. Оценки приблизительные:
+    изменения полей книги на месте в них не учитываются.
+
+    Attributes:
+        total (int): Количество книг в статистике.
+        build_after (int): После скольких запросов строить статистику.
+    """
+
+    def __init__(self, books=(), build_after=0):
+        """Создает статистику для списка книг.
+
+        Args:
+            books (list, optional): Список книг каталога.
+            build_after (int, optional): Сколько запросов выполнить на
+                эвристиках до построения статистики. По умолчанию 0.
+        """
+        self.build_after = build_after
+        self.reset(books)
+
+    def reset(self, books):
+        """Сбрасывает статистику; она будет построена заново для books.
+
+        Args:
+            books (list): Новый список книг каталога.
+        """
+        self._source = books
+        self._tokens = None
+        self._years = None
+        self._queries = 0
+        self.total = 0
+
+    def ready(self):
+        """Учитывает очередной запрос и сообщает, можно ли опираться на статистику.
+
+        Returns:
+            bool: True, если статистика построена или пора ее построить.
+        """
+        if self._tokens is None:
+            self._queries += 1
+            if self._queries <= self.build_after:
+                return False
+        return True
+
+    def _build(self):
+        """Строит частоты по исходному списку книг."""
+        self._tokens = {field: Counter() for field in STRING_FIELDS}
+        self._years = Counter()
+        self.total = 0
+        for book in self._source:
+            self._count(book, 1)
+
+    def _count(self, book, sign):
+        """Учитывает (sign=1) или исключает (sign=-1) слова книги."""
+        for field in STRING_FIELDS:
+            counter = self._tokens[field]
+            for token in set(getattr(book, field).lower().split()):
+                counter[token] += sign
+        self._years[book.year] += sign
+        self.total += sign
+
+    def add(self, book):
+        """Учитывает новую книгу, если статистика уже построена."""
+        if self._tokens is not None:
+            self._count(book, 1)
+
+    def remove(self, book):
+        """Исключает книгу, если статистика уже построена."""
+        if self._tokens is not None:
+            self._count(book, -1)
+
+    def year_fraction(self, low, high=None):
+        """Оценивает долю книг с годом в диапазоне [low, high].
+
+        Args:
+            low (int): Нижняя граница или точный год.
+            high (int, optional): Верхняя граница. По умолчанию равна low.
+
+        Returns:
+            float: Доля книг от 0 до 1.
+        """
+        if self._tokens is None:
+            self._build()
+        if not self.total:
+            return 0.0
+        high = low if high is None else high
+        count = sum(n for year, n in self._years.items() if low <= year <= high)
+        return max(count, 0) / self.total
+
+    def token_fraction(self, field, needle):
+        """Оценивает долю книг, у которых поле содержит подстроку.
+
+        Берется самое редкое из целых слов подстроки. Если подстрока не
+        совпадает ни с одним словом целиком, возвращается None.
+
+        Args:
+            field (str): Одно из 'title', 'author', 'genre'.
+            needle (str): Искомая подстрока в нижнем регистре.
+
+        Returns:
+            float or None: Доля книг или None, если оценить нельзя.
+        """
+        if self._tokens is None:
+            self._build()
+        if not self.total:
+            return 0.0
+        counter = self._tokens[field]
+        counts = [counter[token] for token in needle.split() if token in counter]
+        if not counts:
+            return None
+        return max(min(counts), 0) / self.total
+
+
+class _Term:
+    """Одно условие запроса: поле, операция, значение и отрицание."""
+
+    __slots__ = ('field', 'op', 'value', 'negate')
+
+    def __init__(self, field, op, value, negate=False):
+        self.field = field
+        self.op = op          # 'contains', 'contains_any', 'eq', 'range', 'in' или 'any'
+        self.value = value    # для 'any' - список групп (списков условий), для 'in' - frozenset,
+                              # для 'contains_any' - кортеж подстрок
+        self.negate = negate
+
+    def shape(self):
+        """Возвращает форму условия без значений (ключ кеша планов)."""
+        if self.op == 'any':
+            value_shape = tuple(tuple(t.shape() for t in group) for group in self.value)
+        elif self.op == 'range':
+            value_shape = (self.value[0] is not None, self.value[1] is not None)
+        else:
+            value_shape = None
+        return (self.field, self.op, self.negate, value_shape)
+
+    def values(self):
+        """Возвращает значения условия в порядке параметров плана."""
+        if self.op == 'any':
+            return [v for group in self.value for term in group for v in term.values()]
+        if self.op == 'range':
+            return [v for v in self.value if v is not None]
+        return [self.value]
+
+    def selectivity(self, stats):
+        """Оценивает долю книг, удовлетворяющих условию."""
+        if self.op == 'any':
+            estimate = min(1.0, sum(_group_selectivity(g, stats) for g in self.value))
+        elif self.op == 'in' and self.field == 'year':
+            if stats is not None:
+                estimate = min(1.0, sum(stats.year_fraction(year) for year in self.value))
+            else:
+                estimate = min(1.0, len(self.value) * _DEFAULT_YEAR_EQ)
+        elif self.op == 'in':
+            # Проверка по множеству дешевая; без частот идентификаторов
+            # селективность оценивается по размеру множества
+            estimate = min(1.0, len(self.value) * _DEFAULT_ID_EQ)
+        elif self.op == 'contains_any':
+            estimate = min(1.0, sum(_contains_selectivity(self.field, needle, stats)
+                                    for needle in self.value))
+        elif self.op == 'eq':
+            estimate = stats.year_fraction(self.value) if stats is not None else _DEFAULT_YEAR_EQ
+        elif self.op == 'range':
+            low, high = self.value
+            if stats is not None:
+                estimate = stats.year_fraction(low if low is not None else -10 ** 9,
+                                               high if high is not None else 10 ** 9)
+            else:
+                span = (high if high is not None else 2025) - (low if low is not None else 1800) + 1
+                estimate = min(1.0, max(span, 1) / _YEARS_SPAN)
+        else:
+            estimate = _contains_selectivity(self.field, self.value, stats)
+        return 1.0 - estimate if self.negate else estimate
+
+
+def _contains_selectivity(field, needle, stats):
+    """Оценивает долю книг, у которых поле содержит подстроку."""
+    estimate = stats.token_fraction(field, needle) if stats is not None else None
+    if estimate is None:
+        # Чем длиннее подстрока, тем реже она встречается
+        estimate = 0.5 / (1 + len(needle))
+    return estimate
+
+
+def _group_selectivity(group, stats):
+    """Оценивает селективность группы условий, объединенных через И."""
+    estimate = 1.0
+    for term in group:
+        estimate *= term.selectivity(stats)
+    return estimate
+
+
+def _parse(criteria):
+    """Разбирает словарь критериев в список условий.
+
+    Args:
+        criteria (dict): Критерии поиска.
+
+    Returns:
+        list: Список объектов _Term. Пустые (None) критерии пропускаются,
+            неизвестные ключи игнорируются.
+    """
+    terms = []
+    year_from = criteria.get('year_from')
+    year_to = criteria.get('year_to')
+    if year_from is not None or year_to is not None:
+        terms.append(_Term('year', 'range', (year_from, year_to)))
+
+    for key, value in criteria.items():
+        if value is None:
+            continue
+        negate = key.startswith('not_')
+        field = key[4:] if negate else key
+
+        if field in STRING_FIELDS and isinstance(value, MULTI_VALUE_TYPES):
+            needles = tuple(dict.fromkeys(v.lower() for v in value))
+            if len(needles) == 1:
+                terms.append(_Term(field, 'contains', needles[0], negate))
+            else:
+                terms.append(_Term(field, 'contains_any', needles, negate))
+        elif field in STRING_FIELDS:
+            terms.append(_Term(field, 'contains', value.lower(), negate))
+        elif field == 'year' and isinstance(value, MULTI_VALUE_TYPES):
+            terms.append(_Term('year', 'in', frozenset(value), negate))
+        elif field == 'year':
+            terms.append(_Term('year', 'eq', value, negate))
+        elif field in ID_FIELDS:
+            ids = frozenset([value] if isinstance(value, int) else value)
+            terms.append(_Term(field, 'in', ids, negate))
+        elif key == 'any_of':
+            groups = [_parse(group) for group in value]
+            if any(not group for group in groups):
+                continue  # пустая группа истинна, значит и все ИЛИ истинно
+            terms.append(_Term(None, 'any', groups))
+    return terms
+
+
+def _term_source(term, names, columnar=False):
+    """Генерирует выражение Python для условия.
+
+    Args:
+        term (_Term): Условие.
+        names (iterator): Итератор имен параметров плана (v0, v1, ...).
+        columnar (bool, optional): Если True, выражение строится над
+            переменными title, author, year, genre (строки уже в нижнем
+            регистре), а не над книгой b.
+
+    Returns:
+        str: Выражение над переменной b (книга) или над переменными полей.
+    """
+    year = 'year' if columnar else 'b.year'
+    if term.op == 'contains':
+        field = term.field if columnar else f"b.{term.field}.lower()"
+        source = f"{next(names)} in {field}"
+    elif term.op == 'contains_any':
+        field = term.field if columnar else f"b.{term.field}.lower()"
+        source = f"_contains_any({field}, {next(names)})"
+    elif term.op == 'in' and term.field == 'year':
+        source = f"{year} in {next(names)}"
+    elif term.op == 'in':
+        # В столбцах упакованного каталога идентификаторов нет: такие планы
+        # отклоняет ColumnarCatalogue.search, выражение только занимает параметр
+        source = f"{next(names)} is None" if columnar else f"b.{term.field} in {next(names)}"
+    elif term.op == 'eq':
+        source = f"{year} == {next(names)}"
+    elif term.op == 'range':
+        low, high = term.value
+        if low is not None and high is not None:
+            source = f"{next(names)} <= {year} <= {next(names)}"
+        elif low is not None:
+            source = f"{year} >= {next(names)}"
+        else:
+            source = f"{year} <= {next(names)}"
+    else:
+        groups = [' and '.join(_term_source(t, names, columnar) for t in group)
+                  for group in term.value]
+        source = ' or '.join(f"({g})" for g in groups)
+    return f"not ({source})" if term.negate else f"({source})"
+
+
+def _contains_any(text, needles):
+    """Проверяет, содержит ли строка любую из подстрок."""
+    for needle in needles:
+        if needle in text:
+            return True
+    return False
+
+
+@functools.lru_cache(maxsize=256)
+def _compile(shape):
+    """Компилирует функцию поиска для формы запроса.
+
+    Значения в исходный код не попадают, только имена полей из белого
+    списка; значения передаются параметрами при выполнении.
+
+    Args:
+        shape (tuple): Формы условий в порядке проверки.
+
+    Returns:
+        tuple: (функция matches(b, *values), функция execute(books, *values),
+            функция execute_columns(titles, authors, years, genres, *values)).
+    """
+    terms = [_term_from_shape(s) for s in shape]
+    n_values = sum(len(_shape_values(s)) for s in shape)
+    params = ', '.join(f"v{i}" for i in range(n_values))
+    args = f", {params}" if params else ''
+    names = iter(f"v{i}" for i in range(n_values))
+    condition = ' and '.join(_term_source(t, names) for t in terms) or 'True'
+    names = iter(f"v{i}" for i in range(n_values))
+    column_condition = ' and '.join(_term_source(t, names, True) for t in terms) or 'True'
+    source = (
+        f"def matches(b{args}):\n"
+        f"    return {condition}\n"
+        f"def execute(books{args}):\n"
+        f"    return [b for b in books if {condition}]\n"
+        f"def execute_columns(titles, authors, years, genres{args}):\n"
+        f"    return [i for i, (title, author, year, genre)\n"
+        f"            in enumerate(zip(titles, authors, years, genres))\n"
+        f"            if {column_condition}]\n"
+    )
+    namespace = {'_contains_any': _contains_any}
+    exec(compile(source, '<booklib query plan>', 'exec'), namespace)
+    return namespace['matches'], namespace['execute'], namespace['execute_columns']
+
+
+def _shape_values(shape):
+    """Возвращает заглушки значений для формы условия (для подсчета параметров)."""
+    field, op, negate, value_shape = shape
+    if op == 'any':
+        return [v for group in value_shape for s in group for v in _shape_values(s)]
+    if op == 'range':
+        return [None for present in value_shape if present]
+    return [None]
+
+
+def _term_from_shape(shape):
+    """Восстанавливает условие без значений по его форме."""
+    field, op, negate, value_shape = shape
+    if op == 'any':
+        value = [[_term_from_shape(s) for s in group] for group in value_shape]
+    elif op == 'range':
+        value = tuple(0 if present else None for present in value_shape)
+    else:
+        value = None
+    return _Term(field, op, value, negate)
+
+
+class QueryPlan:
+    """Скомпилированный план поиска книг.
+
+    Attributes:
+        terms (list): Условия в порядке проверки (от самых селективных).
+        values (tuple): Значения параметров плана.
+    """
+
+    def __init__(self, terms):
+        """Создает план для упорядоченного списка условий.
+
+        Args:
+            terms (list): Условия в порядке проверки.
+        """
+        self.terms = terms
+        self.values = tuple(v for term in terms for v in term.values())
+        self._matches, self._execute, self._execute_columns = _compile(
+            tuple(t.shape() for t in terms))
+
+    def matches(self, book):
+        """Проверяет, удовлетворяет ли книга запросу.
+
+        Args:
+            book (Book): Книга (или любой объект с полями книги).
+
+        Returns:
+            bool: True, если книга подходит.
+        """
+        return self._matches(book, *self.values)
+
+    def execute(self, books):
+        """Отбирает книги, удовлетворяющие запросу, за один проход.
+
+        Args:
+            books (iterable): Коллекция книг.
+
+        Returns:
+            list: Подходящие книги в исходном порядке.
+        """
+        if not self.terms:
+            return books
+        return self._execute(books, *self.values)
+
+    @property
+    def fields(self):
+        """frozenset: Строковые поля и поля идентификаторов, которые проверяет план."""
+        def collect(terms):
+            for term in terms:
+                if term.op == 'any':
+                    for group in term.value:
+                        yield from collect(group)
+                elif term.field in STRING_FIELDS or term.field in ID_FIELDS:
+                    yield term.field
+        return frozenset(collect(self.terms))
+
+    def execute_columns(self, titles, authors, years, genres):
+        """Отбирает номера подходящих книг по столбцам каталога.
+
+        Используется при поиске по колоночному представлению, где
+        объектов Book нет.
+
+        Args:
+            titles (list): Названия в нижнем регистре.
+            authors (list): Авторы в нижнем регистре.
+            years (sequence): Годы издания.
+            genres (list): Жанры в нижнем регистре.
+
+        Returns:
+            list: Номера подходящих книг по порядку.
+        """
+        return self._execute_columns(titles, authors, years, genres, *self.values)
+
+    def explain(self):
+        """Описывает порядок проверки условий.
+
+        Returns:
+            str: Условия через ' -> ', например 'year = ? -> author ~ ?'.
+        """
+        def describe(term):
+            if term.op == 'any':
+                text = ' OR '.join('(' + ' AND '.join(describe(t) for t in g) + ')'
+                                   for g in term.value)
+            elif term.op == 'range':
+                text = 'year BETWEEN ? AND ?'
+            elif term.op == 'in':
+                text = f'{term.field} IN (?)'
+            elif term.op == 'eq':
+                text = 'year = ?'
+            elif term.op == 'contains_any':
+                text = f'{term.field} ~ ANY(?)'
+            else:
+                text = f'{term.field} ~ ?'
+            return f'NOT {text}' if term.negate else text
+        return ' -> '.join(describe(t) for t in self.terms) or 'ALL'
+
+
+def compile_query(criteria, stats=None):
+    """Компилирует критерии поиска в план.
+
+    Args:
+        criteria (dict): Критерии поиска (см. описание модуля).
+        stats (TokenStats, optional): Статистика каталога для оценки
+            селективности. Без нее используются эвристики: точный год
+            считается самым селективным, затем более длинные подстроки.
+
+    Returns:
+        QueryPlan: План поиска.
+    """
+    terms = _parse(criteria)
+    if stats is not None and len(terms) > 1 and not stats.ready():
+        stats = None
+    terms.sort(key=lambda term: term.selectivity(stats))
+    return QueryPlan(terms)
+
+
+def _like_pattern(needle):
+    """Возвращает шаблон LIKE для подстроки (символы шаблона экранируются)."""
+    escaped = needle.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _term_sql(term, params):
+    """Переводит условие в выражение SQL, добавляя значения в params."""
+    if term.op == 'contains':
+        params.append(_like_pattern(term.value))
+        sql = f"LOWER({term.field}) LIKE %s ESCAPE '\\'"
+    elif term.op == 'contains_any':
+        params.extend(_like_pattern(needle) for needle in term.value)
+        sql = ' OR '.join([f"LOWER({term.field}) LIKE %s ESCAPE '\\'"] * len(term.value)) or 'FALSE'
+    elif term.op == 'in':
+        values = sorted(term.value)
+        params.extend(values)
+        sql = f"{term.field} IN ({', '.join(['%s'] * len(values))})" if values else 'FALSE'
+    elif term.op == 'eq':
+        params.append(term.value)
+        sql = "year = %s"
+    elif term.op == 'range':
+        low, high = term.value
+        params.extend(v for v in (low, high) if v is not None)
+        if low is not None and high is not None:
+            sql = "year BETWEEN %s AND %s"
+        else:
+            sql = "year >= %s" if low is not None else "year <= %s"
+    else:
+        sql = ' OR '.join('(' + (' AND '.join(_term_sql(t, params) for t in group)) + ')'
+                          for group in term.value) or 'FALSE'
+    return f"NOT ({sql})" if term.negate else f"({sql})"
+
+
+def compile_sql(criteria):
+    """Переводит критерии поиска в условие WHERE для таблицы books.
+
+    Подстроки сравниваются через LOWER(поле) LIKE, поэтому результат
+    совпадает с поиском по кешу (QueryPlan.execute), и книги не нужно
+    загружать, чтобы найти несколько из них.
+
+    Args:
+        criteria (dict): Критерии поиска (см. описание модуля).
+
+    Returns:
+        tuple: (условие SQL с параметрами '%s', список значений параметров).
+    """
+    params = []
+    sql = ' AND '.join(_term_sql(term, params) for term in _parse(criteria))
+    return sql or 'TRUE', params
+
+
+def validate_criteria(criteria):
+    """Строго проверяет критерии поиска, полученные извне (например, JSON).
+
+    В отличие от compile_sql, который пропускает неизвестные ключи и
+    пустые значения, любая неточность считается ошибкой: для массового
+    удаления опечатка в ключе расширила бы выборку.
+
+    Args:
+        criteria: Проверяемое значение.
+
+    Raises:
+        ValueError: Если criteria не словарь, пуст (подходит под любую
+            книгу), содержит неизвестный ключ, значение неверного типа
+            или пустое значение.
+    """
+    if not isinstance(criteria, dict):
+        raise ValueError("Критерии должны быть объектом JSON (словарем)")
+    if not criteria:
+        raise ValueError("Критерии не ограничивают выборку: подходят все книги")
+    for key, value in criteria.items():
+        field = key[4:] if key.startswith('not_') else key
+        if field in STRING_FIELDS:
+            values = value if isinstance(value, list) else [value]
+            if not values or not all(isinstance(v, str) and v.strip() for v in values):
+                raise ValueError(f"Критерий '{key}': нужна непустая строка или список непустых строк")
+        elif field in ('year',) + ID_FIELDS:
+            values = value if isinstance(value, list) else [value]
+            if not values or not all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                raise ValueError(f"Критерий '{key}': нужно целое число или список целых чисел")
+        elif key in ('year_from', 'year_to'):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError(f"Критерий '{key}': нужно целое число")
+        elif key == 'any_of':
+            if not isinstance(value, list) or not value:
+                raise ValueError("Критерий 'any_of': нужен непустой список групп критериев")
+            for group in value:
+                validate_criteria(group)
+        else:
+            raise ValueError(f"Неизвестный критерий '{key}'")
+
+
+def plan_cache_info():
+    """Возвращает статистику кеша скомпилированных планов.
+
+    Returns:
+        functools._CacheInfo: Попадания, промахи и размер кеша.
+    """
+    return _compile.cache_info()
@@ -0,0 +1,261 @@
+"""Модуль маршрутизации чтения на реплики PostgreSQL.
+
+Изменения хранилища всегда идут на основной сервер (primary), а чтение
+(загрузка каталога, поиск запросом к БД, загрузка цитат, экспорт,
+статистика) - на реплики, если они заданы. Так тяжелые выгрузки и
+отчеты не конкурируют с записью редакторов.
+
+Реплика выбирается по кругу среди пригодных для чтения. Отставание
+реплики измеряется запросом LAG_SQL не чаще раза в check_interval
+секунд; реплика, отстающая больше max_lag или недоступная, пропускается
+(недоступная - на retry_after секунд). Если пригодной реплики нет,
+чтение идет на основной сервер.
+
+Чтение своих записей (read-your-writes): после фиксации хранилище
+запоминает позицию WAL основного сервера (wal_position()), и реплика
+используется, только если по последнему измерению она воспроизвела WAL
+до этой позиции. Нулевое отставание само по себе этого не доказывает:
+реплика могла воспроизвести все полученное, но еще не получить запись.
+Блок primary() направляет на основной сервер все чтение текущего потока.
+
+Классы:
+    Replica: Реплика с пулом подключений и последним измерением отставания.
+    ReplicaRouter: Выбор подключения для чтения.
+
+Функции:
+    parse_lsn: Переводит позицию WAL из текстового вида в число.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import METRICS
+from .pool import DEFAULT_POOL_SIZE, ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+# Наибольшее допустимое отставание реплики (секунды)
+DEFAULT_MAX_LAG = 5.0
+
+# Как часто измерять отставание реплики (секунды)
+DEFAULT_CHECK_INTERVAL = 1.0
+
+# Сколько секунд не обращаться к недоступной реплике
+DEFAULT_RETRY_AFTER = 10.0
+
+# Отставание реплики в секундах (0, если воспроизведено все полученное;
+# на основном сервере функции возвращают NULL, и запрос тоже дает 0)
+# и позиция WAL, до которой реплика воспроизвела изменения
+LAG_SQL = ("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+           "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END, "
+           "pg_last_wal_replay_lsn()")
+
+# Позиция WAL основного сервера (после фиксации - не раньше конца транзакции)
+WAL_POSITION_SQL = "SELECT pg_current_wal_lsn()"
+
+
+def parse_lsn(text):
+    """Переводит позицию WAL из текстового вида PostgreSQL в число.
+
+    Args:
+        text (str or None): Позиция вида '16/B374D848'.
+
+    Returns:
+        int: Позиция для сравнения; 0 для None.
+
+    Examples:
+        >>> parse_lsn('1/2A')
+        4294967338
+    """
+    if not text:
+        return 0
+    high, low = str(text).split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class Replica:
+    """Реплика: пул подключений и последнее измерение отставания.
+
+    Attributes:
+        name (str): Имя реплики для логов (номер или строка подключения).
+        pool (ConnectionPool): Пул подключений к реплике.
+        lag (float or None): Отставание по последнему измерению (секунды).
+        replayed (int): Позиция WAL, до которой реплика воспроизвела
+            изменения по последнему измерению (см. parse_lsn()).
+        checked_at (float): Время последнего измерения (time.time()).
+        down_until (float): До какого времени реплика считается недоступной.
+    """
+
+    def __init__(self, name, pool):
+        """Создает реплику без измерений.
+
+        Args:
+            name (str): Имя реплики.
+            pool (ConnectionPool): Пул подключений к реплике.
+        """
+        self.name = name
+        self.pool = pool
+        self.lag = None
+        self.replayed = 0
+        self.checked_at = 0.0
+        self.down_until = 0.0
+
+
+class ReplicaRouter:
+    """Выбор подключения для чтения: реплика или основной сервер.
+
+    Attributes:
+        primary (ConnectionPool): Пул подключений к основному серверу.
+        replicas (list): Реплики (объекты Replica).
+        max_lag (float): Наибольшее допустимое отставание реплики.
+        check_interval (float): Интервал измерения отставания.
+        retry_after (float): Пауза перед повторным обращением к
+            недоступной реплике.
+    """
+
+    def __init__(self, primary, replicas=(), pool_size=DEFAULT_POOL_SIZE, max_lag=DEFAULT_MAX_LAG,
+                 check_interval=DEFAULT_CHECK_INTERVAL, retry_after=DEFAULT_RETRY_AFTER, max_idle=None):
+        """Создает маршрутизатор.
+
+        Args:
+            primary (ConnectionPool): Пул подключений к основному серверу.
+            replicas (iterable, optional): Функции без аргументов,
+                открывающие подключение к каждой реплике.
+            pool_size (int, optional): Размер пула каждой реплики.
+            max_lag (float, optional): Наибольшее допустимое отставание.
+            check_interval (float, optional): Интервал измерения отставания.
+            retry_after (float, optional): Пауза для недоступной реплики.
+            max_idle (float, optional): Наибольший простой подключения
+                в пуле реплики (см. ConnectionPool).
+        """
+        self.primary = primary
+        self.replicas = [Replica(str(number), ConnectionPool(connect, pool_size, max_idle))
+                         for number, connect in enumerate(replicas, 1)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._next = itertools.count()
+        self._local = threading.local()
+
+    def pools(self):
+        """Возвращает пулы основного сервера и всех реплик.
+
+        Returns:
+            list: Объекты ConnectionPool.
+        """
+        return [self.primary] + [replica.pool for replica in self.replicas]
+
+    def pool_of(self, conn):
+        """Возвращает пул, открывший подключение.
+
+        Args:
+            conn: Исходное подключение DB-API (cursor.connection).
+
+        Returns:
+            ConnectionPool: Пул подключения (основной, если не найден).
+        """
+        for pool in self.pools():
+            if pool.owns(conn):
+                return pool
+        return self.primary
+
+    @contextmanager
+    def primary_reads(self):
+        """Направляет чтение текущего потока внутри блока на основной сервер."""
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            self._local.depth -= 1
+
+    def wal_position(self, conn):
+        """Возвращает позицию WAL основного сервера после фиксации транзакции.
+
+        Args:
+            conn: Подключение к основному серверу, только что
+                зафиксировавшее изменения.
+
+        Returns:
+            int or None: Позиция WAL (см. parse_lsn()); None без реплик -
+            тогда лишний запрос не выполняется.
+        """
+        if not self.replicas:
+            return None
+        cur = conn.cursor()
+        cur.execute(WAL_POSITION_SQL)
+        position = parse_lsn(cur.fetchone()[0])
+        cur.close()
+        return position
+
+    def _usable(self, replica, since):
+        """Проверяет по последнему измерению, можно ли читать с реплики."""
+        return (replica.lag is not None and replica.lag <= self.max_lag
+                and replica.replayed >= (since or 0))
+
+    def _measure(self, replica, conn):
+        """Измеряет отставание и воспроизведенную позицию WAL реплики через открытое подключение."""
+        cur = conn.cursor()
+        cur.execute(LAG_SQL)
+        lag, replayed = cur.fetchone()
+        cur.close()
+        replica.lag = float(lag or 0)
+        replica.replayed = parse_lsn(replayed)
+        replica.checked_at = time.time()
+        METRICS.incr('replicas.lag_checks')
+
+    def _failed(self, replica, error):
+        """Помечает реплику недоступной на retry_after секунд."""
+        replica.down_until = time.time() + self.retry_after
+        replica.lag = None
+        logger.warning("Реплика %s недоступна: %s", replica.name, error, extra={'error': str(error)})
+        METRICS.incr('replicas.errors')
+
+    def get_read(self, since=None):
+        """Выдает подключение для чтения.
+
+        Args:
+            since (int, optional): Позиция WAL последней записи читающего
+                (см. wal_position()): реплика должна воспроизвести WAL
+                хотя бы до нее.
+
+        Returns:
+            PooledConnection: Подключение к реплике или к основному серверу.
+        """
+        if not self.replicas or getattr(self._local, 'depth', 0):
+            return self.primary.get()
+        now = time.time()
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.down_until > now:
+                continue
+            stale = now - replica.checked_at >= self.check_interval
+            if not stale and not self._usable(replica, since):
+                continue
+            try:
+                conn = replica.pool.get()
+            except Exception as e:
+                self._failed(replica, e)
+                continue
+            if stale:
+                try:
+                    self._measure(replica, conn)
+                except Exception as e:
+                    conn.close()
+                    self._failed(replica, e)
+                    continue
+                if not self._usable(replica, since):
+                    conn.close()
+                    continue
+            METRICS.incr('replicas.reads')
+            return conn
+        METRICS.incr('replicas.fallbacks')
+        return self.primary.get()
+
+    def close(self):
+        """Закрывает свободные подключения пулов реплик."""
+        for replica in self.replicas:
+            replica.pool.close()
@@ -0,0 +1,810 @@
+"""Модуль шардирования каталога по нескольким серверам PostgreSQL.
+
+Книги распределяются по N узлам (шардам) по идентификатору: книга
+с id живет на шарде id % N вместе со всеми своими цитатами (book_quotes
+и нужные им тексты quote_texts), поэтому любое изменение книги - одна
+транзакция на одном узле. Новая книга попадает на шард, выбранный хешем
+ее нормализованного ключа, и получает id из диапазона этого шарда:
+каждый узел выдает id с шагом N из строки shard_config (миграция 9),
+так что id остаются уникальными во всем каталоге. Ключ уникален только
+в пределах узла, а книга может лежать не на шарде хеша своего ключа
+(после rebalance, переноса каталога из одной базы или изменения
+названия), поэтому ключи книг, которых нет в кеше, перед добавлением
+ищутся на всех шардах.
+
+Справочники авторов и жанров ведутся на шарде 0 и копируются на
+остальные шарды с теми же идентификаторами, поэтому author_id и
+genre_id книг разных шардов сравнимы, а поиск по идентификаторам
+работает по общему кешу.
+
+Чтение (загрузка каталога, поиск запросом к БД, загрузка цитат,
+статистика, экспорт) выполняется на всех шардах параллельно
+(scatter-gather), а результаты сливаются в порядке id. Сортировка
+списка книг идет по общему кешу с индексом сортировки, поэтому вывод
+упорядочен по всему каталогу, а не по каждому шарду.
+
+Перераспределение книг при изменении состава узлов выполняет
+rebalance(): книги, чей шард изменился, переносятся вместе с цитатами,
+идентификаторы сохраняются. Перенос одной книги не атомарен между
+узлами (сначала копия, затем удаление), поэтому rebalance можно
+безопасно повторить после сбоя, а чтение до удаления видит книгу один
+раз - с шарда-владельца.
+
+Ограничения: изменения нескольких шардов (пакет batch() или импорт
+книг разных шардов) фиксируются по очереди, а не двухфазной фиксацией;
+книга, добавленная одновременно с изменением другой книги на тот же
+ключ, может оказаться дубликатом на другом шарде; реплики
+(settings.replicas) в шардированном режиме не используются.
+
+Классы:
+    ShardedStorage: Хранилище, распределяющее книги по шардам.
+    ShardedQuoteLoader: Пакетная загрузка цитат со всех шардов.
+    ShardedBatch: Пакет изменений с транзакцией на каждом затронутом шарде.
+    ShardedExport: Инкрементальный экспорт всех шардов в один файл.
+
+Функции:
+    shard_for: Номер шарда книги по ее идентификатору.
+    placement: Номер шарда новой книги по ее ключу.
+    rebalance: Перераспределение книг по новому составу узлов.
+
+Исключения:
+    ShardingError: Раскладка шардов в БД не совпадает с настройками.
+"""
+
+import heapq
+import logging
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .dimensions import RESOLVE_CHUNK_SIZE
+from .export import DEFAULT_CHUNK_SIZE, IncrementalExport
+from .metrics import METRICS, instrument_connection
+from .models import normalize_name
+from .pool import ConnectionPool
+from .replicas import ReplicaRouter
+from .stats import merge_stats
+from .storage import UPSERT_CHUNK_SIZE, LibraryStorage, QuoteLoader, StorageBatch, _exclusive
+
+logger = logging.getLogger(__name__)
+
+# Количество книг, переносимых rebalance() одной парой транзакций
+REBALANCE_CHUNK_SIZE = 500
+
+# Столбцы книги, переносимые между узлами
+_BOOK_COLUMNS = 'id, title, author, year, genre, natural_key, updated_at, author_id, genre_id'
+
+
+class ShardingError(Exception):
+    """Раскладка шардов в БД не совпадает с настройками."""
+
+
+def shard_for(book_id, shards):
+    """Возвращает номер шарда книги.
+
+    Args:
+        book_id (int): Идентификатор книги.
+        shards (int): Количество шардов.
+
+    Returns:
+        int: Номер шарда (0 .. shards - 1).
+    """
+    return book_id % shards
+
+
+def placement(key, shards):
+    """Возвращает номер шарда для новой книги.
+
+    Одинаковые ключи попадают на один шард, поэтому одновременное
+    добавление одной новой книги упирается в уникальный ключ одного узла.
+    Уже сохраненная книга может лежать на другом шарде (rebalance
+    переносит книги на id % N, изменение книги не переносит ее), поэтому
+    перед размещением ключ ищется на всех шардах (см.
+    ShardedStorage.add_books).
+
+    Args:
+        key (str): Нормализованный ключ книги (Book.natural_key).
+        shards (int): Количество шардов.
+
+    Returns:
+        int: Номер шарда.
+    """
+    return zlib.crc32(key.encode('utf-8')) % shards
+
+
+class ShardedQuoteLoader(QuoteLoader):
+    """Пакетная загрузка цитат: книги группируются по шардам, шарды читаются параллельно."""
+
+    def _load_many(self, books):
+        """Загружает цитаты книг (вызывается под блокировкой)."""
+        groups = {}
+        for book in books:
+            if not book.quotes_loaded:
+                groups.setdefault(self._storage.shard_of(book.id), []).append(book)
+        load = super()._load_many
+        self._storage._gather(lambda index: load(groups[index]), sorted(groups))
+
+
+class ShardedBatch:
+    """Пакет изменений шардированного хранилища (см. ShardedStorage.batch).
+
+    Транзакция открывается на шарде при первом изменении его книг;
+    изменения каждого шарда выполняются в точках сохранения, как в
+    StorageBatch.
+    """
+
+    def __init__(self, storage):
+        """Создает пустой пакет.
+
+        Args:
+            storage (ShardedStorage): Хранилище пакета.
+        """
+        self._storage = storage
+        self._parts = {}  # номер шарда -> (подключение, StorageBatch)
+
+    @property
+    def operations(self):
+        """int: Количество успешно выполненных изменений на всех шардах."""
+        return sum(batch.operations for _, batch in self._parts.values())
+
+    def savepoint(self):
+        """Выполняет одно изменение в точке сохранения транзакции текущего шарда.
+
+        Returns:
+            Контекстный менеджер, выдающий курсор транзакции шарда.
+        """
+        index = self._storage._shard()
+        if index not in self._parts:
+            conn = self._storage._open()
+            self._parts[index] = (conn, StorageBatch(conn))
+        return self._parts[index][1].savepoint()
+
+    @contextmanager
+    def reference(self):
+        """Точка сохранения шарда 0 для записей справочников; изменением не считается."""
+        with self.savepoint() as cur:
+            yield cur
+        self._parts[0][1].operations -= 1
+
+    def commit(self):
+        """Фиксирует транзакции шардов по порядку номеров (шард 0 со справочниками - первым)."""
+        for index in sorted(self._parts):
+            self._parts[index][0].commit()
+
+    def rollback(self):
+        """Откатывает транзакции всех шардов пакета."""
+        for conn, _ in self._parts.values():
+            conn.rollback()
+
+    def close(self):
+        """Возвращает подключения в пулы."""
+        for conn, _ in self._parts.values():
+            conn.close()
+
+
+class ShardedExport(IncrementalExport):
+    """Инкрементальный экспорт шардированного каталога в один файл.
+
+    Шарды выгружаются по очереди; номер шарда хранится в контрольной
+    точке, поэтому прерванный экспорт продолжается с того же шарда.
+    Водяной знак - наибольший по всем шардам.
+    """
+
+    def _watermark(self):
+        """Возвращает наибольший водяной знак шардов."""
+        watermark = super()._watermark
+        marks = [mark for mark in self._storage._gather(lambda index: watermark()) if mark is not None]
+        return max(marks) if marks else None
+
+    def _export(self, writer, f, state):
+        """Выгружает изменения шардов, начиная с шарда из контрольной точки."""
+        export = super()._export
+        for index in range(state.get('shard', 0), len(self._storage.routers)):
+            with self._storage._on(index):
+                export(writer, f, state)
+            state.update(shard=index + 1, phase='upsert', last_id=0)
+            self._commit_chunk(f, state)
+
+
+class ShardedStorage(LibraryStorage):
+    """Хранилище книжной библиотеки, распределенное по нескольким узлам.
+
+    Кеш книг, индексы и справочники - общие для всего каталога, как
+    у LibraryStorage; запросы к БД направляются на шард книги или на все
+    шарды параллельно. Каждая операция с БД выполняется в контексте
+    шарда (_on): _open() выдает подключение к его узлу.
+
+    Attributes:
+        routers (list): Подключения шардов по номерам (ReplicaRouter без
+            реплик: чтение и запись идут на узел шарда).
+    """
+
+    def __init__(self, shards=None, lazy=False, **options):
+        """Создает хранилище и загружает книги со всех шардов.
+
+        Args:
+            shards (iterable, optional): Узлы шардов по порядку номеров
+                (вместо settings.shards): строки подключения или функции
+                без аргументов, открывающие подключение.
+            lazy (bool, optional): Отложить загрузку книг до первого
+                обращения к books.
+            **options: Остальные параметры LibraryStorage.
+
+        Raises:
+            ValueError: Если шарды не заданы.
+        """
+        super().__init__(lazy=True, **options)
+        if shards is not None:
+            self.settings = self.settings.replace(shards=tuple(shards))
+        if not self.settings.shards:
+            raise ValueError("Не заданы шарды (settings.shards)")
+        self.pool.close()
+        self.router.close()
+        self.routers = [ReplicaRouter(ConnectionPool(self._node_connect(node), self.pool.size,
+                                                     self.settings.idle_timeout))
+                        for node in self.settings.shards]
+        self.router = self.routers[0]
+        self.pool = self.router.primary
+        self.quote_loader = ShardedQuoteLoader(self)
+        self._current = threading.local()
+        self._keys = (None, {})  # (снимок кеша, ключ книги -> id)
+        if not lazy:
+            self.books = self.load_books()
+
+    def shard_of(self, book_id):
+        """Возвращает номер шарда книги.
+
+        Args:
+            book_id (int): Идентификатор книги.
+
+        Returns:
+            int: Номер шарда.
+        """
+        return shard_for(book_id, len(self.routers))
+
+    @contextmanager
+    def _on(self, index):
+        """Направляет операции с БД текущего потока внутри блока на шард index."""
+        previous = getattr(self._current, 'index', None)
+        self._current.index = index
+        try:
+            yield
+        finally:
+            self._current.index = previous
+
+    def _shard(self):
+        """Возвращает номер шарда текущей операции.
+
+        Raises:
+            ShardingError: Если операция выполняется вне контекста шарда.
+        """
+        index = getattr(self._current, 'index', None)
+        if index is None:
+            raise ShardingError("Операция хранилища не привязана к шарду")
+        return index
+
+    def _gather(self, fetch, indexes=None):
+        """Выполняет fetch(номер шарда) на шардах параллельно, каждый в контексте своего шарда.
+
+        Args:
+            fetch (callable): Функция чтения одного шарда.
+            indexes (iterable, optional): Номера шардов. По умолчанию все.
+
+        Returns:
+            list: Результаты fetch в порядке indexes.
+        """
+        indexes = list(range(len(self.routers)) if indexes is None else indexes)
+
+        def run(index):
+            with self._on(index):
+                return fetch(index)
+
+        METRICS.incr('shards.scatter')
+        if len(indexes) <= 1:
+            return [run(index) for index in indexes]
+        with ThreadPoolExecutor(len(indexes)) as executor:
+            return list(executor.map(run, indexes))
+
+    def _merge(self, parts):
+        """Сливает отсортированные по id списки книг шардов в один.
+
+        Книга, которую rebalance уже скопировал на новый шард, но еще не
+        удалил со старого, берется с шарда-владельца.
+
+        Args:
+            parts (list): Списки книг шардов по номерам шардов.
+
+        Returns:
+            list: Книги всех шардов в порядке id.
+        """
+        merged = []
+        tagged = ([(book.id, index, book) for book in part] for index, part in enumerate(parts))
+        for book_id, index, book in heapq.merge(*tagged):
+            if merged and merged[-1].id == book_id:
+                if index == self.shard_of(book_id):
+                    merged[-1] = book
+                continue
+            merged.append(book)
+        return merged
+
+    def _open(self, read=False):
+        """Берет подключение к узлу текущего шарда (см. LibraryStorage._open)."""
+        router = self.routers[self._shard()]
+        if read:
+            return instrument_connection(lambda: router.get_read(self._written_lsn))
+        return instrument_connection(router.primary.get)
+
+    def _pool_of(self, conn):
+        """Возвращает пул шарда, открывший подключение."""
+        for router in self.routers:
+            for pool in router.pools():
+                if pool.owns(conn):
+                    return pool
+        return self.pool
+
+    def close(self):
+        """Освобождает ресурсы хранилища и закрывает подключения всех шардов."""
+        super().close()
+        for router in self.routers:
+            router.primary.close()
+            router.close()
+
+    def _fetch_books(self, eager_quotes):
+        """Читает книги всех шардов параллельно и сливает их в порядке id."""
+        fetch = super()._fetch_books
+        return self._merge(self._gather(lambda index: fetch(eager_quotes)))
+
+    def _fetch_query(self, where, params):
+        """Ищет книги на всех шардах параллельно и сливает результаты в порядке id."""
+        fetch = super()._fetch_query
+        return self._merge(self._gather(lambda index: fetch(where, params)))
+
+    def _query_stats(self, top):
+        """Считает статистику каждого шарда запросами к БД и объединяет ее."""
+        fetch = super()._query_stats
+        return merge_stats(self._gather(lambda index: fetch(None)), top)
+
+    def _allocate_ids(self, cur, count):
+        """Выделяет id новых книг из диапазона текущего шарда (shard_config).
+
+        Raises:
+            ShardingError: Если узел не настроен как этот шард
+                (состав шардов изменился без rebalance).
+        """
+        index = self._shard()
+        cur.execute("UPDATE shard_config SET next_id = next_id + shards * %s "
+                    "RETURNING shard, shards, next_id", (count,))
+        row = cur.fetchone()
+        if row is None or tuple(row[:2]) != (index, len(self.routers)):
+            raise ShardingError(f"Узел не настроен как шард {index} из {len(self.routers)}; "
+                                f"выполните rebalance")
+        _, shards, next_id = row
+        first = next_id - shards * count
+        return [first + shards * i for i in range(count)]
+
+    def _resolve(self, cur, dimension, names):
+        """Разрешает имена справочника на шарде 0 и копирует записи на текущий шард."""
+        if self._shard() == 0:
+            return dimension.resolve(cur, names)
+        with self._reference() as reference:
+            ids = dimension.resolve(reference, names)
+        rows = {}
+        for name in names:
+            rows.setdefault(ids[name], (ids[name], dimension.name(ids[name]) or name, normalize_name(name)))
+        rows = list(rows.values())
+        for start in range(0, len(rows), RESOLVE_CHUNK_SIZE):
+            chunk = rows[start:start + RESOLVE_CHUNK_SIZE]
+            values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+            cur.execute(f"INSERT INTO {dimension.table} (id, name, normalized_name) VALUES {values} "
+                        f"ON CONFLICT DO NOTHING", [value for row in chunk for value in row])
+        return ids
+
+    @contextmanager
+    def _reference(self):
+        """Открывает транзакцию на шарде 0 (в пакете - его точку сохранения)."""
+        with self._on(0):
+            if self._batch is None:
+                with self._transaction() as cur:
+                    yield cur
+            else:
+                with self._batch.reference() as cur:
+                    yield cur
+
+    def _key_ids(self):
+        """Возвращает словарь ключ книги -> id для текущего снимка кеша."""
+        books = self.books
+        source, ids = self._keys
+        if source is not books:
+            ids = {book.natural_key: book.id for book in books}
+            self._keys = (books, ids)
+        return ids
+
+    def _locate(self, keys):
+        """Ищет книги с ключами keys на всех шардах параллельно.
+
+        Args:
+            keys (list): Ключи книг (Book.natural_key), которых нет в кеше.
+
+        Returns:
+            dict: Ключ -> id найденной книги.
+        """
+        def fetch(index):
+            rows = []
+            conn = self._open()
+            try:
+                cur = conn.cursor()
+                for start in range(0, len(keys), UPSERT_CHUNK_SIZE):
+                    chunk = keys[start:start + UPSERT_CHUNK_SIZE]
+                    cur.execute(f"SELECT id, natural_key FROM books "
+                                f"WHERE natural_key IN ({', '.join(['%s'] * len(chunk))})", chunk)
+                    rows.extend(cur.fetchall())
+                cur.close()
+            finally:
+                conn.close()
+            return rows
+
+        return {key: book_id for rows in self._gather(fetch) for book_id, key in rows}
+
+    def add_books(self, books):
+        """Добавляет книги, направляя каждую на ее шард (см. LibraryStorage.add_books).
+
+        Книга, которая уже есть в каталоге, сохраняется на шарде, где она
+        лежит: ключи книг, которых нет в кеше (он мог устареть), сначала
+        ищутся на всех шардах. Новая книга сохраняется на шарде
+        placement(ключа). Книги каждого шарда сохраняются одной
+        транзакцией этого шарда.
+
+        Returns:
+            list or None: Для каждой книги ADDED, UPDATED или UNCHANGED;
+                None, если запись хотя бы на один шард не удалась (книги
+                других шардов сохранены, повтор не создаст дубликатов).
+        """
+        with self._lock:
+            keys = self._key_ids()
+            missing = list(dict.fromkeys(book.natural_key for book in books if book.natural_key not in keys))
+            try:
+                found = self._locate(missing) if missing and len(self.routers) > 1 else {}
+            except Exception as e:
+                self._write_failed("Ошибка добавления", e)
+                return None
+            groups = {}
+            for position, book in enumerate(books):
+                book_id = keys.get(book.natural_key, found.get(book.natural_key))
+                index = self.shard_of(book_id) if book_id is not None else placement(
+                    book.natural_key, len(self.routers))
+                groups.setdefault(index, []).append(position)
+
+            statuses = [None] * len(books)
+            failed = False
+            for index, positions in sorted(groups.items()):
+                with self._on(index):
+                    results = super().add_books([books[position] for position in positions])
+                if results is None:
+                    failed = True
+                    continue
+                for position, status in zip(positions, results):
+                    statuses[position] = status
+            return None if failed else statuses
+
+    def remove_book(self, book_id):
+        """Удаляет книгу на ее шарде (см. LibraryStorage.remove_book)."""
+        with self._on(self.shard_of(book_id)):
+            return super().remove_book(book_id)
+
+    def update_book(self, old_book, new_book):
+        """Обновляет книгу на ее шарде (см. LibraryStorage.update_book)."""
+        with self._on(self.shard_of(old_book.id)):
+            return super().update_book(old_book, new_book)
+
+    def _count_where(self, where, params):
+        """Считает книги на всех шардах параллельно; копии после rebalance не учитываются."""
+        fetch = super()._count_where
+        shards = len(self.routers)
+        return sum(self._gather(lambda index: fetch(f"({where}) AND mod(id, {shards}) = {index}", params)))
+
+    def _delete_where(self, where, params):
+        """Удаляет подходящие книги на каждом шарде (см. LibraryStorage.remove_books)."""
+        return self._on_each_shard(super()._delete_where, where, params)
+
+    def _update_where(self, where, params, changes):
+        """Изменяет подходящие книги на каждом шарде (см. LibraryStorage.update_books)."""
+        results = self._on_each_shard(super()._update_where, where, params, changes, collect=False)
+        # Справочники общие (см. _resolve), поэтому id автора и жанра на всех шардах одни
+        _, author_id, genre_id = results[0]
+        return [book_id for ids, _, _ in results for book_id in ids], author_id, genre_id
+
+    def _on_each_shard(self, write, *args, collect=True):
+        """Выполняет запись на шардах по очереди, каждую в транзакции своего шарда.
+
+        Вне пакета транзакции шардов фиксируются по очереди: при ошибке
+        изменения ранее обработанных шардов остаются, поэтому загруженный
+        кеш перечитывается из БД.
+
+        Returns:
+            list: Результаты write; при collect - объединенный список.
+        """
+        results = []
+        try:
+            for index in range(len(self.routers)):
+                with self._on(index):
+                    result = write(*args)
+                if collect:
+                    results.extend(result)
+                else:
+                    results.append(result)
+        except Exception:
+            if self._batch is None and self.loaded:
+                self.books = self.load_books()
+            raise
+        return results
+
+    def _add_quote(self, book_id, quote):
+        """Добавляет цитату на шарде книги."""
+        with self._on(self.shard_of(book_id)):
+            return super()._add_quote(book_id, quote)
+
+    def remove_quote(self, book_id, quote_index):
+        """Удаляет цитату на шарде книги (см. LibraryStorage.remove_quote)."""
+        with self._on(self.shard_of(book_id)):
+            return super().remove_quote(book_id, quote_index)
+
+    def _commit_items(self, items):
+        """Фиксирует очередь отложенной записи: по транзакции на шард."""
+        groups = {}
+        for item in items:
+            groups.setdefault(self.shard_of(item.book_id), []).append(item)
+        for index, group in sorted(groups.items()):
+            with self._on(index):
+                super()._commit_items(group)
+
+    @contextmanager
+    def batch(self):
+        """Выполняет изменения внутри блока в транзакциях затронутых шардов.
+
+        Как LibraryStorage.batch(), но транзакции шардов фиксируются по
+        очереди: при ошибке фиксации одного шарда изменения ранее
+        зафиксированных остаются (кеш перечитывается из БД).
+
+        Yields:
+            ShardedBatch: Текущий пакет.
+
+        Raises:
+            RuntimeError: При вложенном вызове batch().
+        """
+        with self._lock:
+            if self._batch is not None:
+                raise RuntimeError("Пакет изменений уже открыт")
+            self._commit_pending()
+            batch = self._batch = ShardedBatch(self)
+            try:
+                try:
+                    yield batch
+                    batch.commit()
+                except BaseException:
+                    batch.rollback()
+                    self._batch = None
+                    self.books = self.load_books()  # в кеше остались отмененные изменения
+                    raise
+            finally:
+                self._batch = None
+                batch.close()
+
+    @_exclusive
+    def clear(self):
+        """Удаляет книги и цитаты на всех шардах (см. LibraryStorage.clear)."""
+        for index in range(len(self.routers)):
+            with self._on(index), self._transaction() as cur:
+                self._clear_tables(cur)
+        self.books = []
+
+    def export_changes(self, filename, since=None, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+        """Экспортирует изменения всех шардов в один файл (см. LibraryStorage.export_changes)."""
+        export = ShardedExport(self, filename, since, fmt, chunk_size)
+        export.run()
+        return export
+
+
+def rebalance(nodes, shards, chunk_size=REBALANCE_CHUNK_SIZE, verbose=True):
+    """Распределяет книги по новому составу шардов.
+
+    Первые shards узлов становятся шардами 0 .. shards - 1, остальные
+    узлы освобождаются (все их книги переносятся). Книга переносится на
+    шард id % shards вместе с цитатами; идентификаторы книг, авторов и
+    жанров сохраняются. Узлы получают строку shard_config: номер шарда
+    и следующий id книги, больший всех id каталога (включая удаленные).
+
+    Книги переносятся частями по chunk_size: сначала фиксируется копия
+    на новом шарде, затем удаление со старого. После сбоя rebalance
+    можно запустить повторно с теми же узлами. Изменения каталога на
+    время перераспределения нужно остановить.
+
+    Args:
+        nodes (list): Функции без аргументов, открывающие подключение
+            к каждому узлу (у всех узлов должна быть актуальная схема).
+        shards (int): Количество шардов (не больше len(nodes)).
+        chunk_size (int, optional): Книг в одной паре транзакций переноса.
+        verbose (bool, optional): Печатать ход переноса.
+
+    Returns:
+        dict: 'moved' - количество перенесенных книг, 'books' - количество
+            книг на каждом шарде после переноса.
+
+    Raises:
+        ShardingError: Если узлы указывают на одну базу или справочники
+            узлов противоречат друг другу.
+        ValueError: Если shards меньше 1 или больше количества узлов.
+        Exception: При ошибках SQL-запросов (текущая часть откатывается).
+    """
+    if not 1 <= shards <= len(nodes):
+        raise ValueError(f"Количество шардов должно быть от 1 до {len(nodes)}")
+    conns = []
+    try:
+        for connect in nodes:
+            conns.append(connect())
+        _check_distinct(conns)
+        for table in ('authors', 'genres'):
+            _sync_dimension(conns, table)
+        _configure(conns, shards)
+
+        moved = 0
+        for source, conn in enumerate(conns):
+            count = _move_books(conn, conns, source, shards, chunk_size)
+            moved += count
+            if verbose and count:
+                print(f"Узел {source}: перенесено книг {count}")
+
+        books = []
+        for conn in conns[:shards]:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM books")
+            books.append(cur.fetchone()[0])
+            cur.close()
+            conn.commit()
+        METRICS.incr('shards.moved', moved)
+        return {'moved': moved, 'books': books}
+    except Exception:
+        for conn in conns:
+            conn.rollback()
+        raise
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def _check_distinct(conns):
+    """Проверяет меткой в shard_config, что все узлы - разные базы."""
+    tokens = [uuid.uuid4().hex for _ in conns]
+    for conn, token in zip(conns, tokens):
+        cur = conn.cursor()
+        cur.execute("INSERT INTO shard_config (id, shard, shards, next_id, node) VALUES (1, 0, 0, 0, %s) "
+                    "ON CONFLICT (id) DO UPDATE SET node = EXCLUDED.node", (token,))
+        cur.close()
+        conn.commit()
+    for index, conn in enumerate(conns):
+        cur = conn.cursor()
+        cur.execute("SELECT node FROM shard_config")
+        token = cur.fetchone()[0]
+        cur.close()
+        conn.commit()
+        if token != tokens[index]:
+            raise ShardingError(f"Узлы {index} и {tokens.index(token)} - одна и та же база данных")
+
+
+def _sync_dimension(conns, table):
+    """Дополняет справочник каждого узла записями остальных узлов с теми же id."""
+    rows = {}  # id -> (name, normalized_name)
+    ids = {}  # normalized_name -> id
+    present = []
+    for conn in conns:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id, name, normalized_name FROM {table}")
+        node_rows = cur.fetchall()
+        cur.close()
+        for dimension_id, name, normalized in node_rows:
+            if rows.get(dimension_id, (name, normalized))[1] != normalized or \
+                    ids.get(normalized, dimension_id) != dimension_id:
+                raise ShardingError(f"Справочник {table} различается на узлах: '{name}' (id {dimension_id})")
+            rows.setdefault(dimension_id, (name, normalized))
+            ids[normalized] = dimension_id
+        present.append({row[0] for row in node_rows})
+
+    for conn, known in zip(conns, present):
+        missing = [(dimension_id,) + rows[dimension_id] for dimension_id in sorted(set(rows) - known)]
+        cur = conn.cursor()
+        _insert_rows(cur, f"INSERT INTO {table} (id, name, normalized_name) VALUES",
+                     missing, "ON CONFLICT DO NOTHING")
+        if rows:  # новые записи на узле не должны получить занятые id
+            cur.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), (SELECT MAX(id) FROM {table}))",
+                        (table,))
+        cur.close()
+        conn.commit()
+
+
+def _configure(conns, shards):
+    """Записывает узлам номер шарда и следующий id книги; освобождаемым - удаляет строку."""
+    top = 0
+    for conn in conns:
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM books")
+        top = max(top, cur.fetchone()[0])
+        cur.execute("SELECT COALESCE(MAX(book_id), 0) FROM book_tombstones")
+        top = max(top, cur.fetchone()[0])
+        cur.execute("SELECT COALESCE(MAX(next_id), 1) - 1 FROM shard_config")
+        top = max(top, cur.fetchone()[0])
+        cur.close()
+        conn.commit()
+
+    for index, conn in enumerate(conns):
+        cur = conn.cursor()
+        if index < shards:
+            # Наименьший id больше top, который принадлежит шарду index
+            first = top + 1 + (index - (top + 1)) % shards
+            cur.execute("INSERT INTO shard_config (id, shard, shards, next_id) VALUES (1, %s, %s, %s) "
+                        "ON CONFLICT (id) DO UPDATE SET shard = EXCLUDED.shard, shards = EXCLUDED.shards, "
+                        "next_id = EXCLUDED.next_id", (index, shards, first))
+        else:
+            cur.execute("DELETE FROM shard_config")
+        cur.close()
+        conn.commit()
+
+
+def _move_books(conn, conns, source, shards, chunk_size):
+    """Переносит с узла source книги, которые принадлежат другим шардам."""
+    moved = 0
+    after = 0
+    cur = conn.cursor()
+    while True:
+        if source < shards:
+            cur.execute(f"SELECT {_BOOK_COLUMNS} FROM books WHERE id > %s AND mod(id, %s) <> %s "
+                        f"ORDER BY id LIMIT %s", (after, shards, source, chunk_size))
+        else:
+            cur.execute(f"SELECT {_BOOK_COLUMNS} FROM books WHERE id > %s ORDER BY id LIMIT %s",
+                        (after, chunk_size))
+        books = cur.fetchall()
+        if not books:
+            break
+        ids = [book[0] for book in books]
+        placeholders = ', '.join(['%s'] * len(ids))
+        cur.execute(f"SELECT bq.book_id, bq.quote_hash, qt.quote FROM book_quotes bq "
+                    f"JOIN quote_texts qt ON qt.quote_hash = bq.quote_hash "
+                    f"WHERE bq.book_id IN ({placeholders}) ORDER BY bq.id", ids)
+        quotes = cur.fetchall()
+
+        # Копия на новом шарде фиксируется до удаления со старого
+        for target in sorted({shard_for(book_id, shards) for book_id in ids}):
+            target_cur = conns[target].cursor()
+            _insert_rows(target_cur, f"INSERT INTO books ({_BOOK_COLUMNS}) VALUES",
+                         [book for book in books if shard_for(book[0], shards) == target],
+                         "ON CONFLICT (id) DO NOTHING")
+            own = [row for row in quotes if shard_for(row[0], shards) == target]
+            _insert_rows(target_cur, "INSERT INTO quote_texts (quote_hash, quote) VALUES",
+                         list({row[1]: (row[1], row[2]) for row in own}.values()), "ON CONFLICT DO NOTHING")
+            _insert_rows(target_cur, "INSERT INTO book_quotes (book_id, quote_hash) VALUES",
+                         [row[:2] for row in own], "ON CONFLICT DO NOTHING")
+            target_cur.close()
+            conns[target].commit()
+
+        hashes = list({row[1] for row in quotes})
+        cur.execute(f"DELETE FROM books WHERE id IN ({placeholders})", ids)  # связи с цитатами - каскадно
+        for start in range(0, len(hashes), REBALANCE_CHUNK_SIZE):
+            chunk = hashes[start:start + REBALANCE_CHUNK_SIZE]
+            cur.execute(f"DELETE FROM quote_texts WHERE quote_hash IN ({', '.join(['%s'] * len(chunk))}) "
+                        f"AND NOT EXISTS (SELECT 1 FROM book_quotes bq WHERE bq.quote_hash = quote_texts.quote_hash)",
+                        chunk)
+        conn.commit()
+        moved += len(ids)
+        after = ids[-1]
+    cur.close()
+    conn.commit()
+    return moved
+
+
+def _insert_rows(cur, insert, rows, conflict):
+    """Вставляет строки многострочными INSERT частями по REBALANCE_CHUNK_SIZE."""
+    for start in range(0, len(rows), REBALANCE_CHUNK_SIZE):
+        chunk = rows[start:start + REBALANCE_CHUNK_SIZE]
+        row = '(' + ', '.join(['%s'] * len(chunk[0])) + ')'
+        cur.execute(f"{insert} {', '.join([row] * len(chunk))} {conflict}",
+                    [value for values in chunk for value in values])
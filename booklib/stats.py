@@ -0,0 +1,142 @@
+"""Модуль сводной статистики каталога книг.
+
+Считает количество книг по жанрам, авторам и десятилетиям и распределение
+количества цитат по книгам. Статистика считается либо запросами GROUP BY
+на стороне БД (не требует загрузки каталога в память и использует
+индексы по author, genre, year и book_quotes.book_id), либо по уже загруженному
+кешу книг хранилища. Оба способа возвращают одинаковый словарь, который
+можно сразу выводить в JSON.
+
+Функции:
+    decade: Десятилетие года издания.
+    collect_stats: Статистика по списку книг в памяти.
+    query_stats: Статистика запросами GROUP BY к БД.
+    merge_stats: Объединение статистики частей каталога.
+"""
+
+from collections import Counter
+
+
+def decade(year):
+    """Возвращает десятилетие года издания (1869 -> 1860).
+
+    Округление к нулю, как при целочисленном делении в SQL.
+
+    Args:
+        year (int): Год издания.
+
+    Returns:
+        int: Первый год десятилетия.
+    """
+    return int(year / 10) * 10
+
+
+def _ranked(counts, top=None):
+    """Упорядочивает группы по убыванию количества, затем по названию."""
+    items = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return dict(items[:top] if top else items)
+
+
+def _result(books, quotes, by_genre, by_author, by_decade, per_book, top, source):
+    """Собирает словарь статистики из посчитанных групп."""
+    return {
+        'source': source,
+        'books': books,
+        'quotes': quotes,
+        'by_genre': _ranked(by_genre),
+        'by_author': _ranked(by_author, top),
+        'by_decade': {str(key): by_decade[key] for key in sorted(by_decade)},
+        'quotes_per_book': {
+            'avg': round(quotes / books, 2) if books else 0.0,
+            'max': max(per_book) if per_book else 0,
+            'distribution': {str(key): per_book[key] for key in sorted(per_book)},
+        },
+    }
+
+
+def collect_stats(books, top=None):
+    """Считает статистику по списку книг в памяти.
+
+    Цитаты не загружаются: используется Book.quote_count.
+
+    Args:
+        books (list): Список объектов Book.
+        top (int, optional): Сколько самых частых авторов вернуть.
+            По умолчанию все.
+
+    Returns:
+        dict: Статистика (см. query_stats) с source = 'cache'.
+    """
+    by_genre, by_author, by_decade, per_book = Counter(), Counter(), Counter(), Counter()
+    quotes = 0
+    for book in books:
+        count = book.quote_count
+        quotes += count
+        by_genre[book.genre] += 1
+        by_author[book.author] += 1
+        by_decade[decade(book.year)] += 1
+        per_book[count] += 1
+    return _result(len(books), quotes, by_genre, by_author, by_decade, per_book, top, 'cache')
+
+
+def query_stats(cur, top=None):
+    """Считает статистику запросами GROUP BY на стороне БД.
+
+    Args:
+        cur: Курсор DB-API.
+        top (int, optional): Сколько самых частых авторов вернуть.
+            По умолчанию все.
+
+    Returns:
+        dict: Словарь с ключами source ('sql'), books, quotes, by_genre,
+            by_author, by_decade (количество книг в группах) и
+            quotes_per_book (avg, max и distribution - количество книг
+            с данным числом цитат).
+    """
+    cur.execute("SELECT COUNT(*) FROM books")
+    books = cur.fetchone()[0]
+    cur.execute("SELECT genre, COUNT(*) FROM books GROUP BY genre")
+    by_genre = dict(cur.fetchall())
+    if top:
+        cur.execute("SELECT author, COUNT(*) AS n FROM books GROUP BY author "
+                    "ORDER BY n DESC, author LIMIT %s", (top,))
+    else:
+        cur.execute("SELECT author, COUNT(*) FROM books GROUP BY author")
+    by_author = dict(cur.fetchall())
+    cur.execute("SELECT year / 10 * 10 AS decade, COUNT(*) FROM books GROUP BY decade")
+    by_decade = {int(key): count for key, count in cur.fetchall()}
+
+    # Книги без цитат в book_quotes не встречаются, их количество - остаток
+    cur.execute("SELECT n, COUNT(*) FROM (SELECT COUNT(*) AS n FROM book_quotes GROUP BY book_id) "
+                "AS per_book GROUP BY n")
+    per_book = dict(cur.fetchall())
+    quotes = sum(n * count for n, count in per_book.items())
+    without_quotes = books - sum(per_book.values())
+    if without_quotes:
+        per_book[0] = without_quotes
+    return _result(books, quotes, by_genre, by_author, by_decade, per_book, top, 'sql')
+
+
+def merge_stats(parts, top=None):
+    """Объединяет статистику частей каталога (например, шардов).
+
+    Args:
+        parts (list): Словари статистики частей (см. query_stats),
+            посчитанные без ограничения top.
+        top (int, optional): Сколько самых частых авторов вернуть.
+            По умолчанию все.
+
+    Returns:
+        dict: Статистика всего каталога с source первой части.
+    """
+    by_genre, by_author, by_decade, per_book = Counter(), Counter(), Counter(), Counter()
+    books = quotes = 0
+    for part in parts:
+        books += part['books']
+        quotes += part['quotes']
+        by_genre.update(part['by_genre'])
+        by_author.update(part['by_author'])
+        by_decade.update({int(key): count for key, count in part['by_decade'].items()})
+        per_book.update({int(key): count for key, count in part['quotes_per_book']['distribution'].items()})
+    source = parts[0]['source'] if parts else 'sql'
+    return _result(books, quotes, by_genre, by_author, by_decade, per_book, top, source)
@@ -4,12 +4,229 @@
 с базой данных PostgreSQL для операций CRUD (создание, чтение, обновление,
 удаление) с книгами и цитатами.
 
+Хранилище можно использовать из нескольких потоков: кеш книг устроен как
+копирование при записи (читатели работают с неизменяемым снимком списка
+и не блокируются), а изменяющие методы выполняются под общей блокировкой,
+так что запись в БД и обновление кеша видны другим потокам атомарно.
+
+В режиме отложенной записи (write_behind) цитаты ставятся в очередь
+и фиксируются фоновым потоком группами (booklib.writeback).
+
+Подключения берутся из пула (booklib.pool), а запросы горячих путей
+выполняются как подготовленные на сервере; пакет книг сохраняется
+многострочными запросами, а не запросом на каждую книгу.
+
+Если заданы реплики, чтение из БД идет на них (booklib.replicas),
+а изменения - на основной сервер.
+
+Текст цитаты хранится в БД один раз (quote_texts, ключ - хеш текста),
+книги ссылаются на него через book_quotes; в кеше одинаковые тексты
+разных книг - один объект строки (intern_quote).
+
 Классы:
     LibraryStorage: Основной класс для работы с хранилищем данных.
+    QuoteLoader: Пакетная отложенная загрузка цитат книг.
+    StorageBatch: Общая транзакция пакета изменений.
 """
 
-import psycopg2
-from .models import Book
+import functools
+import logging
+import threading
+from contextlib import contextmanager
+
+from .models import KEY_SEPARATOR, Book, normalize_name, quote_hash
+from .cache import QueryCache
+from .columnar import save_catalogue
+from .connection import connect, load_settings
+from .dimensions import Dimensions
+from .export import DEFAULT_CHUNK_SIZE as EXPORT_CHUNK_SIZE, SERVER_TIMESTAMP, IncrementalExport
+from .filters import SortIndex, YearIndex
+from .parallel import ParallelCatalogue
+from .pool import DEFAULT_POOL_SIZE, ConnectionPool, execute_pipelined, execute_prepared
+from .query import TokenStats, compile_sql, validate_criteria
+from .replicas import ReplicaRouter
+from .stats import collect_stats, query_stats
+from .writeback import PendingQuote, WriteBehindQueue
+from .metrics import METRICS, instrument_connection
+
+logger = logging.getLogger(__name__)
+
+
+# Максимальное количество книг в одном запросе пакетной загрузки цитат
+# (и цитат в одном запросе сохранения)
+QUOTE_BATCH_SIZE = 1000
+
+# Максимальное количество книг в одном запросе сохранения
+UPSERT_CHUNK_SIZE = 500
+
+# Результаты add_book/add_books для каждой книги
+ADDED = 'added'          # новая книга
+UPDATED = 'updated'      # книга уже была, изменился жанр или добавлены цитаты
+UNCHANGED = 'unchanged'  # книга уже была со всеми этими данными
+
+
+def _unique_chunks(books, size):
+    """Делит книги на части не больше size без повторов ключа внутри части.
+
+    Один INSERT ... ON CONFLICT DO UPDATE не может изменить строку дважды,
+    поэтому повтор книги начинает новую часть (и сохраняется после первой).
+    """
+    chunk, keys = [], set()
+    for book in books:
+        if len(chunk) == size or book.natural_key in keys:
+            yield chunk
+            chunk, keys = [], set()
+        chunk.append(book)
+        keys.add(book.natural_key)
+    if chunk:
+        yield chunk
+
+
+def _restricting_sql(criteria):
+    """Проверяет критерии массового изменения и компилирует их в условие WHERE.
+
+    Raises:
+        ValueError: Если критерии неверны или не ограничивают выборку
+            (см. booklib.query.validate_criteria).
+    """
+    validate_criteria(criteria)
+    return compile_sql(criteria)
+
+
+def _exclusive(method):
+    """Выполняет изменяющий метод хранилища под блокировкой записи.
+
+    Записи из очереди отложенной записи фиксируются до изменения, чтобы
+    порядок изменений в БД совпадал с порядком в кеше.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            self._commit_pending()
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class QuoteLoader:
+    """Пакетная отложенная загрузка цитат книг (в стиле DataLoader).
+
+    Книги с ленивыми цитатами ставятся в очередь методом touch(). Первое
+    обращение к Book.quotes любой книги загружает цитаты всех книг из
+    очереди одним запросом (пакетами по QUOTE_BATCH_SIZE), поэтому
+    перебор найденных командой книг стоит один запрос, а не N.
+    """
+
+    def __init__(self, storage):
+        """Создает загрузчик для хранилища.
+
+        Args:
+            storage (LibraryStorage): Хранилище, через которое идут запросы.
+        """
+        self._storage = storage
+        self._queue = {}
+        self._lock = threading.RLock()
+
+    def touch(self, books):
+        """Добавляет книги в очередь следующей пакетной загрузки.
+
+        Args:
+            books (iterable): Книги, цитаты которых скоро понадобятся.
+        """
+        with self._lock:
+            for book in books:
+                if not book.quotes_loaded and book.id is not None:
+                    self._queue[book.id] = book
+
+    def load(self, book):
+        """Загружает цитаты книги вместе со всей очередью.
+
+        Args:
+            book (Book): Книга, к цитатам которой обратились.
+        """
+        with self._storage._lock, self._lock:
+            self._queue[book.id] = book
+            queue, self._queue = self._queue, {}
+            self.load_many(list(queue.values()))
+
+    def load_many(self, books):
+        """Загружает цитаты переданных книг пакетными запросами.
+
+        Args:
+            books (list): Книги с еще не загруженными цитатами.
+
+        Note:
+            Загрузка идет под блокировкой хранилища: изменение цитат
+            другим потоком не может попасть между чтением из БД и
+            заполнением книги, а книги, которые другой поток уже
+            загрузил, повторно не запрашиваются.
+        """
+        with self._storage._lock, self._lock:
+            self._load_many(books)
+
+    def _load_many(self, books):
+        """Загружает цитаты книг (вызывается под блокировкой)."""
+        books = [b for b in books if not b.quotes_loaded]
+        if not books:
+            return
+        METRICS.incr('quotes.batches')
+        loaded = {book.id: [] for book in books}
+        intern = self._storage.intern_quote
+        conn = self._storage._open(read=True)
+        try:
+            cur = conn.cursor()
+            ids = list(loaded)
+            if len(ids) == 1:  # цитаты одной книги - подготовленным запросом
+                self._storage._execute(cur, 'book_quotes', (ids[0],))
+                loaded[ids[0]] = [intern(quote) for _, quote in cur.fetchall()]
+                ids = []
+            for start in range(0, len(ids), QUOTE_BATCH_SIZE):
+                chunk = ids[start:start + QUOTE_BATCH_SIZE]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cur.execute(f"SELECT bq.book_id, qt.quote FROM book_quotes bq "
+                            f"JOIN quote_texts qt ON qt.quote_hash = bq.quote_hash "
+                            f"WHERE bq.book_id IN ({placeholders}) ORDER BY bq.id", chunk)
+                for book_id, quote in cur.fetchall():
+                    loaded[book_id].append(intern(quote))
+            cur.close()
+        finally:
+            conn.close()
+
+        for book in books:
+            book.quotes = loaded[book.id]
+        METRICS.incr('quotes.loaded_books', len(books))
+
+
+class StorageBatch:
+    """Общая транзакция пакета изменений (см. LibraryStorage.batch).
+
+    Attributes:
+        operations (int): Количество успешно выполненных изменений.
+    """
+
+    def __init__(self, conn):
+        """Создает пакет поверх открытого подключения.
+
+        Args:
+            conn: Подключение DB-API, в котором выполняется транзакция.
+        """
+        self._cur = conn.cursor()
+        self.operations = 0
+
+    @contextmanager
+    def savepoint(self):
+        """Выполняет одно изменение в точке сохранения.
+
+        Yields:
+            Курсор общей транзакции.
+        """
+        self._cur.execute("SAVEPOINT batch_operation")
+        try:
+            yield self._cur
+        except BaseException:
+            self._cur.execute("ROLLBACK TO SAVEPOINT batch_operation")
+            raise
+        self._cur.execute("RELEASE SAVEPOINT batch_operation")
+        self.operations += 1
 
 
 class LibraryStorage:
@@ -19,17 +236,220 @@ class LibraryStorage:
     из базы данных. Также поддерживает локальный кеш загруженных книг
     для повышения производительности.
 
+    Список books никогда не изменяется на месте: каждое изменение создает
+    новый список и публикует его одной операцией присваивания. Поток,
+    получивший books, может обходить его без блокировок.
+
     Attributes:
         books (list): Локальный кеш загруженных книг (объектов Book).
+            В отложенном режиме (lazy) загружается при первом обращении.
+        eager_quotes (bool): Загружать ли цитаты вместе с книгами. Если
+            False, цитаты загружаются при первом обращении через quote_loader.
+        quote_loader (QuoteLoader): Загрузчик ленивых цитат.
+        sort_index (SortIndex): Порядки сортировки кеша, поддерживаемые
+            при каждом изменении книг.
+        token_stats (TokenStats): Частоты слов кеша для планирования поиска.
+        year_index (YearIndex): Отсортированные годы кеша для выборки
+            диапазонов лет.
+        dimensions (Dimensions): Кеш справочников авторов и жанров: имена
+            разрешаются в идентификаторы без запросов к БД.
+        query_cache (QueryCache): Кеш результатов поиска и сортировки,
+            сбрасываемый при каждом изменении книг.
+        pool (ConnectionPool): Пул подключений к основному серверу
+            с подготовленными запросами.
+        router (ReplicaRouter): Выбор подключения для чтения (реплика
+            или основной сервер).
+        writes (WriteBehindQueue or None): Очередь отложенной записи цитат
+            (None - цитаты записываются сразу).
     """
 
-    def __init__(self):
+    def __init__(self, eager_quotes=False, lazy=False, pool_size=DEFAULT_POOL_SIZE, write_behind=False,
+                 settings=None, dsn=None, replicas=None, max_replica_lag=None):
         """Инициализирует объект LibraryStorage и загружает книги из БД.
 
         При создании объекта автоматически загружает все книги
         из базы данных в локальный кеш.
+
+        Args:
+            eager_quotes (bool, optional): Сразу загрузить цитаты всех книг
+                (нужно для show-quotes и export). По умолчанию цитаты
+                загружаются лениво.
+            lazy (bool, optional): Отложить загрузку книг до первого
+                обращения к books. Нужно командам, которые работают
+                запросами к БД и не используют кеш (например, stats).
+            pool_size (int, optional): Сколько подключений держать открытыми
+                между операциями. 0 - открывать подключение на каждую
+                операцию и не подготавливать запросы.
+            write_behind (bool or dict, optional): Добавлять цитаты в режиме
+                отложенной записи (см. booklib.writeback). Словарь задает
+                параметры очереди (max_items, interval, max_pending).
+            settings (ConnectionSettings, optional): Параметры подключения
+                и тайм-ауты (см. booklib.connection). По умолчанию читаются
+                из файла конфигурации и переменных окружения.
+            dsn (str, optional): Строка подключения к основному серверу
+                (вместо settings.dsn).
+            replicas (iterable, optional): Реплики для чтения (вместо
+                settings.replicas): строки подключения или функции без
+                аргументов, открывающие подключение.
+            max_replica_lag (float, optional): Наибольшее отставание реплики
+                (секунды), при котором с нее еще читают.
         """
-        self.books = self.load_books()
+        self.eager_quotes = eager_quotes
+        overrides = {'dsn': dsn, 'replicas': replicas, 'max_replica_lag': max_replica_lag}
+        self.settings = (settings or load_settings()).replace(
+            **{name: value for name, value in overrides.items() if value is not None})
+        self.pool = ConnectionPool(lambda: self._connect(), pool_size, self.settings.idle_timeout)
+        self.router = ReplicaRouter(self.pool, [self._node_connect(replica) for replica in self.settings.replicas],
+                                    pool_size, self.settings.max_replica_lag, max_idle=self.settings.idle_timeout)
+        self._written_lsn = None  # позиция WAL основного сервера после последней фиксации
+        self._lock = threading.RLock()
+        self.quote_loader = QuoteLoader(self)
+        self._parallel = None
+        self.sort_index = SortIndex()
+        self.token_stats = TokenStats(build_after=3)  # разовые запросы CLI обходятся без статистики
+        self.year_index = YearIndex()
+        self.query_cache = QueryCache()
+        self.dimensions = Dimensions()
+        self._quote_texts = {}
+        self._batch = None
+        self.writes = None
+        if write_behind:
+            options = write_behind if isinstance(write_behind, dict) else {}
+            self.writes = WriteBehindQueue(self.flush_writes, **options)
+        self._books = None
+        self._ids = {}
+        if not lazy:
+            self.books = self.load_books()
+
+    @property
+    def books(self):
+        """list: Локальный кеш загруженных книг (объектов Book)."""
+        books = self._books
+        if books is None:
+            with self._lock:
+                if self._books is None:
+                    self.books = self.load_books()
+                books = self._books
+        return books
+
+    @property
+    def loaded(self):
+        """bool: Загружен ли кеш книг."""
+        return self._books is not None
+
+    @books.setter
+    def books(self, books):
+        # При полной замене кеша индекс сортировки строится заново
+        with self._lock, self.sort_index.lock:
+            self._books = books
+            self._ids = {book.id: book for book in books}
+            self.sort_index.reset(books)
+            self.token_stats.reset(books)
+            self.dimensions.reset(books)
+            # Пул строк цитат строится заново: тексты удаленных книг не удерживаются
+            self._quote_texts = {quote: quote for book in books if book.quotes_loaded
+                                 for quote in book.quotes}
+            self._touch()
+
+    def intern_quote(self, quote):
+        """Возвращает общий объект строки для текста цитаты.
+
+        Известные цитаты цитируются многими книгами; одинаковые тексты
+        из разных запросов хранятся в кеше одной строкой.
+
+        Args:
+            quote (str): Текст цитаты.
+
+        Returns:
+            str: Равная quote строка из пула хранилища.
+        """
+        return self._quote_texts.setdefault(quote, quote)
+
+    def _publish(self, books, added=(), removed=()):
+        """Публикует новый снимок кеша книг (вызывается под блокировкой).
+
+        Индекс сортировки и статистика обновляются вместе с подменой списка,
+        так что читатели видят либо старый, либо новый снимок целиком.
+
+        Args:
+            books (list): Новый список книг.
+            added (iterable, optional): Книги, которых не было в старом списке.
+            removed (iterable, optional): Книги, которых нет в новом списке.
+        """
+        with self.sort_index.lock:
+            for book in removed:
+                self._ids.pop(book.id, None)
+                self.sort_index.remove(book)
+                self.token_stats.remove(book)
+            for book in added:
+                self._ids[book.id] = book
+                self.sort_index.add(book)
+                self.token_stats.add(book)
+                self.dimensions.add(book)
+            self._books = books
+            self.sort_index.rebind(books)
+            self.dimensions.rebind(books)
+        self._touch()
+
+    def _touch(self, books_changed=True):
+        """Отмечает изменение кеша: сбрасывает производные снимки каталога.
+
+        Args:
+            books_changed (bool, optional): Изменились ли состав или поля книг.
+                Изменение одних цитат не влияет на результаты поиска и
+                сортировки, поэтому кеш запросов при нем сохраняется.
+        """
+        if books_changed:
+            self.query_cache.invalidate(self._books)
+        if self._parallel is not None:
+            self._parallel.close()
+            self._parallel = None
+
+    @_exclusive
+    def reindex_book(self, book):
+        """Обновляет индексы кеша после изменения полей книги на месте.
+
+        Args:
+            book (Book): Книга из кеша, поля которой были изменены.
+        """
+        with self.sort_index.lock:
+            self.sort_index.update(book)
+            book.author_id = self.dimensions.authors.id_for(book.author)
+            book.genre_id = self.dimensions.genres.id_for(book.genre)
+            self.dimensions.add(book)
+        self._touch()
+
+    def parallel(self, workers=None):
+        """Возвращает снимок кеша для параллельного поиска и экспорта.
+
+        Снимок создается при первом вызове и пересоздается после
+        изменения книг. Пул процессов рассчитан на использование из одного
+        потока: изменение книг закрывает снимок.
+
+        Args:
+            workers (int, optional): Количество процессов пула.
+                По умолчанию количество ядер процессора.
+
+        Returns:
+            ParallelCatalogue: Снимок каталога в разделяемой памяти.
+        """
+        if self._parallel is not None and workers and self._parallel.workers != workers:
+            self._touch(books_changed=False)
+        if self._parallel is None:
+            self.load_all_quotes()
+            self._parallel = ParallelCatalogue(self.books, workers)
+        return self._parallel
+
+    def close(self):
+        """Освобождает ресурсы хранилища (пул процессов, разделяемую память, подключения).
+
+        Записи из очереди отложенной записи предварительно фиксируются.
+        """
+        if self.writes is not None:
+            self.writes.close()
+        self._touch(books_changed=False)
+        self.pool.close()
+        self.router.close()
 
     def _connect(self):
         """Создает подключение к базе данных PostgreSQL.
@@ -38,23 +458,179 @@ class LibraryStorage:
             psycopg2.extensions.connection: Объект подключения к БД.
 
         Note:
-            Параметры подключения жестко закодированы в методе.
-            Для продакшн-окружения рекомендуется выносить их в конфигурационный файл.
+            Параметры подключения и тайм-ауты берутся из self.settings;
+            при временной ошибке подключение повторяется (booklib.connection).
+        """
+        return connect(self.settings)
+
+    def _node_connect(self, node):
+        """Возвращает функцию подключения к другому серверу (реплике или шарду).
+
+        Args:
+            node (str or callable): Строка подключения или функция.
+
+        Returns:
+            callable: Функция без аргументов, открывающая подключение
+                с тайм-аутами и повторами из self.settings.
+        """
+        if callable(node):
+            return node
+        return functools.partial(connect, self.settings.replace(dsn=node))
+
+    def _open(self, read=False):
+        """Берет подключение из пула с учетом метрик.
+
+        Args:
+            read (bool, optional): Подключение только для чтения: может
+                быть выдано репликой (см. booklib.replicas).
+
+        Returns:
+            Подключение DB-API. Если сбор метрик включен, подключение
+            обернуто и считает запросы и полученные строки.
+        """
+        if read:
+            return instrument_connection(lambda: self.router.get_read(self._written_lsn))
+        return instrument_connection(self.pool.get)
+
+    def primary(self):
+        """Направляет чтение текущего потока внутри блока на основной сервер.
+
+        Нужно, когда читающему важны изменения других клиентов,
+        которые реплика может еще не получить. Свои изменения хранилище
+        и без этого читает с реплики, только если она их уже получила.
+
+        Returns:
+            Контекстный менеджер.
         """
-        return psycopg2.connect(
-            dbname="book_library",
-            user="postgres",
-            password="11111",
-            host="localhost",
-            port="5432",
-            client_encoding='utf8'
-        )
+        return self.router.primary_reads()
 
-    def load_books(self):
-        """Загружает все книги и их цитаты из базы данных.
+    def _pool_of(self, conn):
+        """Возвращает пул, открывший подключение (для подготовленных запросов).
 
-        Выполняет запросы к таблицам books и quotes для получения
-        полной информации о книгах и связанных с ними цитатах.
+        Args:
+            conn: Исходное подключение DB-API (cursor.connection).
+
+        Returns:
+            ConnectionPool: Пул подключения.
+        """
+        return self.router.pool_of(conn)
+
+    def _execute(self, cur, name, params):
+        """Выполняет запрос из booklib.pool.STATEMENTS, подготовленный в подключении курсора.
+
+        Args:
+            cur: Курсор подключения из пула.
+            name (str): Имя запроса.
+            params (tuple): Параметры запроса.
+        """
+        execute_prepared(cur, name, params, self._pool_of(cur.connection).prepared(cur.connection))
+
+    def _execute_many(self, cur, name, params_list):
+        """Выполняет запрос из booklib.pool.STATEMENTS пачкой для многих наборов параметров.
+
+        Args:
+            cur: Курсор подключения из пула.
+            name (str): Имя запроса.
+            params_list (list): Наборы параметров.
+        """
+        execute_pipelined(cur, name, params_list, self._pool_of(cur.connection).prepared(cur.connection))
+
+    @contextmanager
+    def _transaction(self):
+        """Открывает подключение и транзакцию для изменения данных.
+
+        При выходе из блока транзакция фиксируется, при исключении -
+        откатывается; подключение закрывается в любом случае. Внутри
+        batch() вместо отдельной транзакции используется точка сохранения
+        общей транзакции пакета.
+
+        Yields:
+            Курсор DB-API внутри транзакции.
+        """
+        if self._batch is not None:
+            with self._batch.savepoint() as cur:
+                yield cur
+            return
+
+        conn = self._open()
+        try:
+            cur = conn.cursor()
+            yield cur
+            conn.commit()
+            cur.close()
+            self._written_lsn = self.router.wal_position(conn)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @contextmanager
+    def batch(self):
+        """Выполняет изменения внутри блока в одной транзакции.
+
+        Каждый изменяющий метод выполняется в своей точке сохранения:
+        при ошибке откатывается только он, а исключение передается
+        вызывающему коду (вместо печати сообщения). Транзакция
+        фиксируется при выходе из блока; при исключении из блока она
+        откатывается, и кеш книг загружается из БД заново.
+
+        На время блока хранилище заблокировано для изменений из других
+        потоков.
+
+        Yields:
+            StorageBatch: Текущий пакет.
+
+        Raises:
+            RuntimeError: При вложенном вызове batch().
+        """
+        with self._lock:
+            if self._batch is not None:
+                raise RuntimeError("Пакет изменений уже открыт")
+            self._commit_pending()
+            conn = self._open()
+            try:
+                self._batch = StorageBatch(conn)
+                try:
+                    yield self._batch
+                    conn.commit()
+                    self._written_lsn = self.router.wal_position(conn)
+                except BaseException:
+                    conn.rollback()
+                    self._batch = None
+                    self.books = self.load_books()  # в кеше остались отмененные изменения
+                    raise
+            finally:
+                self._batch = None
+                conn.close()
+
+    def _write_failed(self, message, error):
+        """Обрабатывает ошибку изменяющего метода.
+
+        Вне пакета сообщение печатается, и метод возвращает признак
+        неудачи; внутри batch() исключение передается дальше.
+
+        Args:
+            message (str): Описание операции, например 'Ошибка удаления'.
+            error (Exception): Исключение.
+        """
+        logger.error("%s: %s", message, error, exc_info=True, extra={'error': str(error)})
+        METRICS.incr('storage.errors')
+        if self._batch is not None:
+            raise error
+        print(f"{message}: {error}")
+
+    @METRICS.timed('storage.load_books')
+    def load_books(self, eager_quotes=None):
+        """Загружает все книги из базы данных.
+
+        Цитаты либо загружаются сразу одним запросом (eager_quotes), либо
+        откладываются до первого обращения к Book.quotes; в этом случае
+        загружается только количество цитат каждой книги.
+
+        Args:
+            eager_quotes (bool, optional): Загрузить цитаты сразу.
+                По умолчанию используется self.eager_quotes.
 
         Returns:
             list: Список объектов Book, загруженных из базы данных.
@@ -63,35 +639,143 @@ class LibraryStorage:
             В случае ошибки подключения или выполнения запроса
             метод возвращает пустой список.
         """
+        if eager_quotes is None:
+            eager_quotes = self.eager_quotes
+        METRICS.incr('cache.misses')
+        try:
+            return self._fetch_books(eager_quotes)
+        except Exception as e:
+            logger.error("Ошибка загрузки: %s", e, exc_info=True, extra={'error': str(e)})
+            METRICS.incr('storage.errors')
+            print(f"Ошибка загрузки: {e}")
+            return []
+
+    def _fetch_books(self, eager_quotes):
+        """Читает все книги из БД (см. load_books); ошибки не перехватываются."""
         books = []
+        conn = self._open(read=True)
         try:
-            conn = self._connect()
             cur = conn.cursor()
 
             # Выборка всех книг с сортировкой по id
-            cur.execute("SELECT id, title, author, year, genre FROM books ORDER BY id")
+            cur.execute("SELECT id, title, author, year, genre, author_id, genre_id FROM books ORDER BY id")
             books_data = cur.fetchall()
 
-            for book_data in books_data:
-                book_id, title, author, year, genre = book_data
+            if eager_quotes:
+                # Все цитаты одним запросом вместо запроса на каждую книгу
+                quotes_by_book = {}
+                cur.execute("SELECT bq.book_id, qt.quote FROM book_quotes bq "
+                            "JOIN quote_texts qt ON qt.quote_hash = bq.quote_hash ORDER BY bq.id")
+                for book_id, quote in cur.fetchall():
+                    quotes_by_book.setdefault(book_id, []).append(self.intern_quote(quote))
+            else:
+                cur.execute("SELECT book_id, COUNT(*) FROM book_quotes GROUP BY book_id")
+                counts = dict(cur.fetchall())
 
-                # Загрузка цитат для текущей книги
-                cur.execute("SELECT quote FROM quotes WHERE book_id = %s", (book_id,))
-                quotes_data = cur.fetchall()
-                quotes = [q[0] for q in quotes_data]
+            for book_data in books_data:
+                book_id, title, author, year, genre, author_id, genre_id = book_data
 
-                book = Book(title, author, year, genre, quotes)
+                if eager_quotes:
+                    book = Book(title, author, year, genre, quotes_by_book.get(book_id))
+                else:
+                    book = Book(title, author, year, genre)
+                    book.set_lazy_quotes(self.quote_loader, counts.get(book_id, 0))
                 book.id = book_id  # Сохраняем связь между объектом Python и записью в БД
+                book.author_id = author_id
+                book.genre_id = genre_id
                 books.append(book)
 
             cur.close()
+        finally:
             conn.close()
+        return books
+
+    @METRICS.timed('storage.query_books')
+    def query_books(self, criteria):
+        """Ищет книги запросом к БД, не загружая каталог в кеш.
+
+        Критерии переводятся в условие WHERE (booklib.query.compile_sql),
+        поэтому из БД читаются только найденные книги. Результат совпадает
+        с поиском по кешу; цитаты найденных книг загружаются лениво.
+
+        Args:
+            criteria (dict): Критерии поиска (см. booklib.query).
+
+        Returns:
+            list: Найденные книги (объекты Book) в порядке id.
 
+        Note:
+            В случае ошибки подключения или выполнения запроса
+            метод возвращает пустой список.
+        """
+        where, params = compile_sql(criteria)
+        try:
+            return self._fetch_query(where, params)
         except Exception as e:
-            print(f"Ошибка загрузки: {e}")
+            logger.error("Ошибка поиска: %s", e, exc_info=True, extra={'error': str(e)})
+            METRICS.incr('storage.errors')
+            print(f"Ошибка поиска: {e}")
+            return []
 
+    def _fetch_query(self, where, params):
+        """Читает из БД книги по условию WHERE (см. query_books); ошибки не перехватываются."""
+        books = []
+        conn = self._open(read=True)
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT id, title, author, year, genre, author_id, genre_id, "
+                        "(SELECT COUNT(*) FROM book_quotes bq WHERE bq.book_id = books.id) "
+                        f"FROM books WHERE {where} ORDER BY id", params)
+            for book_id, title, author, year, genre, author_id, genre_id, count in cur.fetchall():
+                book = Book(title, author, year, genre)
+                book.set_lazy_quotes(self.quote_loader, count)
+                book.id = book_id
+                book.author_id = author_id
+                book.genre_id = genre_id
+                books.append(book)
+            cur.close()
+        finally:
+            conn.close()
         return books
 
+    def count_books(self, criteria):
+        """Считает книги, подходящие под критерии поиска, запросом к БД.
+
+        Args:
+            criteria (dict): Критерии поиска (см. booklib.query).
+
+        Returns:
+            int or None: Количество книг; None при ошибке запроса.
+        """
+        where, params = compile_sql(criteria)
+        try:
+            return self._count_where(where, params)
+        except Exception as e:
+            logger.error("Ошибка поиска: %s", e, exc_info=True, extra={'error': str(e)})
+            METRICS.incr('storage.errors')
+            print(f"Ошибка поиска: {e}")
+            return None
+
+    def _count_where(self, where, params):
+        """Считает книги по условию WHERE (см. count_books); ошибки не перехватываются."""
+        conn = self._open(read=True)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT COUNT(*) FROM books WHERE {where}", params)
+            count = cur.fetchone()[0]
+            cur.close()
+        finally:
+            conn.close()
+        return count
+
+    def load_all_quotes(self):
+        """Загружает цитаты всех книг кеша, которые еще не загружены.
+
+        Используется перед операциями, которым нужны все цитаты
+        (экспорт, просмотр цитат всех книг).
+        """
+        self.quote_loader.load_many(self.books)
+
     def get_all_books(self):
         """Возвращает все книги из локального кеша.
 
@@ -102,51 +786,248 @@ class LibraryStorage:
             Если требуется свежие данные из БД, следует вызвать load_books()
             или пересоздать объект LibraryStorage.
         """
+        METRICS.incr('cache.hits')
         return self.books
 
-    def add_book(self, book):
-        """Добавляет новую книгу в базу данных.
+    def get_book(self, book_id):
+        """Возвращает книгу из локального кеша по идентификатору.
 
-        Сохраняет книгу в таблицу books и все связанные с ней цитаты
-        в таблицу quotes. Также обновляет локальный кеш.
+        Args:
+            book_id (int): Идентификатор книги.
+
+        Returns:
+            Book or None: Книга или None, если ее нет в кеше.
+        """
+        self.books  # загружает кеш в отложенном режиме
+        return self._ids.get(book_id)
+
+    def _upsert(self, cur, books):
+        """Сохраняет книги и их цитаты по нормализованному ключу (внутри транзакции).
+
+        Книги сохраняются многострочными INSERT ... ON CONFLICT частями по
+        UPSERT_CHUNK_SIZE, цитаты всех книг - частями по QUOTE_BATCH_SIZE,
+        отметки updated_at - пачкой через execute_pipelined. Число обменов
+        с сервером не зависит от количества книг в части.
 
         Args:
-            book (Book): Объект книги для добавления.
+            cur: Курсор транзакции.
+            books (list): Сохраняемые книги.
 
-        Note:
-            После успешного добавления объекту book присваивается
-            сгенерированный БД идентификатор (id).
+        Returns:
+            list: Для каждой книги кортеж (id книги, id автора, id жанра,
+                изменилась ли запись книги, список новых цитат).
         """
-        try:
-            conn = self._connect()
-            cur = conn.cursor()
+        authors = self._resolve(cur, self.dimensions.authors, [book.author for book in books])
+        genres = self._resolve(cur, self.dimensions.genres, [book.genre for book in books])
+
+        saved = []  # (id книги, изменилась ли запись) по порядку книг
+        for chunk in _unique_chunks(books, UPSERT_CHUNK_SIZE):
+            # Повтор по ключу не создает новую запись; запись (и updated_at)
+            # меняется, только если жанр действительно другой (для инкрементального экспорта)
+            columns = 'title, author, year, genre, natural_key, author_id, genre_id, updated_at'
+            rows = [(book.title, book.author, book.year, book.genre, book.natural_key,
+                     authors[book.author], genres[book.genre]) for book in chunk]
+            ids = self._allocate_ids(cur, len(chunk))
+            if ids is not None:
+                columns = 'id, ' + columns
+                rows = [(book_id,) + row for book_id, row in zip(ids, rows)]
+            values = ', '.join(['(' + ', '.join(['%s'] * len(rows[0])) + f', {SERVER_TIMESTAMP})'] * len(rows))
+            params = [value for row in rows for value in row]
+            cur.execute(f"""
+                INSERT INTO books ({columns})
+                VALUES {values}
+                ON CONFLICT (natural_key) DO UPDATE SET
+                    genre = EXCLUDED.genre,
+                    genre_id = EXCLUDED.genre_id,
+                    updated_at = EXCLUDED.updated_at
+                WHERE books.genre <> EXCLUDED.genre
+                RETURNING id, natural_key
+            """, params)
+            # RETURNING возвращает только вставленные и измененные книги;
+            # порядок строк не гарантирован, сопоставление - по ключу
+            rows = {key: (book_id, True) for book_id, key in cur.fetchall()}
+            unchanged = [book.natural_key for book in chunk if book.natural_key not in rows]
+            if unchanged:
+                # Строки повторов заблокированы ON CONFLICT до конца транзакции
+                cur.execute(f"SELECT id, natural_key FROM books "
+                            f"WHERE natural_key IN ({', '.join(['%s'] * len(unchanged))})", unchanged)
+                rows.update((key, (book_id, False)) for book_id, key in cur.fetchall())
+            saved.extend(rows[book.natural_key] for book in chunk)
+
+        inserted = self._insert_quotes(cur, [(book_id, quote) for book, (book_id, _) in zip(books, saved)
+                                             for quote in book.quotes])
+
+        results = []
+        touched = {}
+        for book, (book_id, changed) in zip(books, saved):
+            # Если книга повторяется в списке, новая цитата достается первому повтору
+            new_quotes = [quote for quote in dict.fromkeys(book.quotes) if (book_id, quote) in inserted]
+            inserted.difference_update((book_id, quote) for quote in new_quotes)
+            if new_quotes and not changed:
+                touched[book_id] = (book_id,)
+            results.append((book_id, authors[book.author], genres[book.genre], changed, new_quotes))
+        self._execute_many(cur, 'touch_book', list(touched.values()))
+        return results
+
+    def _resolve(self, cur, dimension, names):
+        """Возвращает идентификаторы имен справочника внутри транзакции.
 
-            # Вставка книги и получение сгенерированного id
-            cur.execute("""
-                INSERT INTO books (title, author, year, genre)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id
-            """, (book.title, book.author, book.year, book.genre))
+        Args:
+            cur: Курсор транзакции.
+            dimension (Dimension): Справочник авторов или жанров.
+            names (list): Имена в любом написании.
 
-            book_id = cur.fetchone()[0]
+        Returns:
+            dict: Имя -> идентификатор записи справочника.
+        """
+        return dimension.resolve(cur, names)
 
-            # Вставка всех цитат книги
-            for quote in book.quotes:
-                cur.execute("""
-                    INSERT INTO quotes (book_id, quote)
-                    VALUES (%s, %s)
-                """, (book_id, quote))
+    def _allocate_ids(self, cur, count):
+        """Выделяет идентификаторы новых записей books.
 
-            conn.commit()
-            cur.close()
-            conn.close()
+        Args:
+            cur: Курсор транзакции.
+            count (int): Сколько идентификаторов нужно.
 
-            book.id = book_id
-            self.books.append(book)
+        Returns:
+            list or None: Идентификаторы; None - их назначает БД (SERIAL).
+        """
+        return None
+
+    @staticmethod
+    def _insert_quotes(cur, quotes):
+        """Сохраняет цитаты книг многострочными запросами.
+
+        Текст хранится один раз в quote_texts, книги ссылаются на него
+        из book_quotes; цитаты, уже сохраненные у книги, отсеиваются по
+        хешу содержимого.
 
+        Args:
+            cur: Курсор транзакции.
+            quotes (list): Пары (id книги, текст цитаты).
+
+        Returns:
+            set: Пары (id книги, текст цитаты), действительно добавленные.
+        """
+        quotes = list(dict.fromkeys(quotes))
+        hashes = {quote: quote_hash(quote) for _, quote in quotes}
+        texts = list(hashes.items())
+        for start in range(0, len(texts), QUOTE_BATCH_SIZE):
+            chunk = texts[start:start + QUOTE_BATCH_SIZE]
+            values = ', '.join(['(%s, %s)'] * len(chunk))
+            cur.execute(f"INSERT INTO quote_texts (quote_hash, quote) VALUES {values} "
+                        f"ON CONFLICT (quote_hash) DO NOTHING",
+                        [value for quote, digest in chunk for value in (digest, quote)])
+        by_hash = {digest: quote for quote, digest in texts}
+        inserted = set()
+        for start in range(0, len(quotes), QUOTE_BATCH_SIZE):
+            chunk = quotes[start:start + QUOTE_BATCH_SIZE]
+            values = ', '.join(['(%s, %s)'] * len(chunk))
+            params = [value for book_id, quote in chunk for value in (book_id, hashes[quote])]
+            cur.execute(f"INSERT INTO book_quotes (book_id, quote_hash) VALUES {values} "
+                        f"ON CONFLICT (book_id, quote_hash) DO NOTHING RETURNING book_id, quote_hash", params)
+            inserted.update((book_id, by_hash[digest]) for book_id, digest in cur.fetchall())
+        return inserted
+
+    @METRICS.timed('storage.add_books')
+    @_exclusive
+    def add_books(self, books):
+        """Добавляет книги в базу данных без создания дубликатов.
+
+        Книга определяется нормализованным ключом (название, автор, год без
+        учета регистра и лишних пробелов, см. Book.natural_key). Если книга
+        уже есть, обновляется ее жанр и добавляются только новые цитаты
+        (повторы определяются по хешу текста). Поэтому повторный импорт или
+        повтор упавшего пакета ничего не дублирует. Все книги сохраняются
+        в одной транзакции.
+
+        Args:
+            books (list): Объекты Book для добавления.
+
+        Returns:
+            list or None: Для каждой книги ADDED, UPDATED или UNCHANGED;
+                None, если транзакция не удалась (ничего не сохранено).
+
+        Note:
+            Каждой книге присваивается идентификатор (id) записи в БД.
+        """
+        current = self.books  # по кешу до записи определяется, какие книги новые
+        try:
+            with self._transaction() as cur:
+                results = self._upsert(cur, books)
         except Exception as e:
-            print(f"Ошибка добавления: {e}")
+            self._write_failed("Ошибка добавления", e)
+            return None
+
+        # Изменения кеша применяются одним новым снимком после фиксации
+        statuses = []
+        pending = {}     # id -> книга в новом снимке (новая или заменяющая)
+        quotes_only = False
+        for book, (book_id, author_id, genre_id, changed, new_quotes) in zip(books, results):
+            new_quotes = [self.intern_quote(quote) for quote in new_quotes]
+            book.id = book_id
+            book.author_id, book.genre_id = author_id, genre_id
+            cached = pending.get(book_id) or self._ids.get(book_id)
+            if cached is None:
+                # Как в БД: без повторов, общие с другими книгами тексты - одним объектом
+                book.quotes = [self.intern_quote(quote) for quote in dict.fromkeys(book.quotes)]
+                pending[book_id] = book
+                statuses.append(ADDED)
+            elif changed:
+                updated = Book(cached.title, cached.author, cached.year, book.genre)
+                updated.id = book_id
+                updated.author_id, updated.genre_id = cached.author_id, genre_id
+                if cached.quotes_loaded:
+                    updated.quotes = cached.quotes + new_quotes
+                else:
+                    updated.set_lazy_quotes(self.quote_loader, cached.quote_count + len(new_quotes))
+                pending[book_id] = updated
+                statuses.append(UPDATED)
+            elif new_quotes:
+                # Поиск и сортировка от цитат не зависят: книга остается той же
+                if cached.quotes_loaded:
+                    cached.quotes = cached.quotes + new_quotes
+                else:
+                    cached.set_lazy_quotes(self.quote_loader, cached.quote_count + len(new_quotes))
+                quotes_only = True
+                statuses.append(UPDATED)
+            else:
+                statuses.append(UNCHANGED)
+
+        if pending:
+            replaced = {i: b for i, b in pending.items() if i in self._ids}
+            removed = [self._ids[i] for i in replaced]
+            # Без замен старый список только дополняется, без обхода по id
+            snapshot = [replaced.get(b.id, b) for b in current] if replaced else current[:]
+            snapshot += [b for i, b in pending.items() if i not in replaced]
+            self._publish(snapshot, added=list(pending.values()), removed=removed)
+        elif quotes_only:
+            self._touch(books_changed=False)
+        return statuses
+
+    @METRICS.timed('storage.add_book')
+    def add_book(self, book):
+        """Добавляет новую книгу в базу данных.
+
+        Сохраняет книгу в таблицу books и все связанные с ней цитаты
+        в таблицы quote_texts и book_quotes одним вызовом add_books(): если такая книга уже
+        есть, дубликат не создается. Также обновляет локальный кеш.
 
+        Args:
+            book (Book): Объект книги для добавления.
+
+        Returns:
+            str or None: ADDED, UPDATED или UNCHANGED; None при ошибке.
+
+        Note:
+            После успешного добавления объекту book присваивается
+            идентификатор (id) записи в БД.
+        """
+        statuses = self.add_books([book])
+        return statuses[0] if statuses else None
+
+    @METRICS.timed('storage.remove_book')
+    @_exclusive
     def remove_book(self, book_id):
         """Удаляет книгу из базы данных по идентификатору.
 
@@ -154,57 +1035,227 @@ class LibraryStorage:
             book_id (int): Идентификатор книги для удаления.
 
         Note:
-            Благодаря каскадному удалению (ON DELETE CASCADE) все цитаты,
-            связанные с книгой, также будут автоматически удалены.
+            Ссылки книги на цитаты удаляются одним запросом по book_id
+            (он читает одну секцию book_quotes и возвращает хеши цитат;
+            каскадному удалению ON DELETE CASCADE остается нечего делать);
+            тексты цитат, не нужные другим книгам, удаляются в той же транзакции.
         """
         try:
-            conn = self._connect()
-            cur = conn.cursor()
+            with self._transaction() as cur:
+                self._execute(cur, 'delete_book_quotes', (book_id,))
+                hashes = [digest for digest, in cur.fetchall()]
+                self._execute(cur, 'delete_book', (book_id,))
+                if cur.rowcount:
+                    # Отметка об удалении для инкрементального экспорта
+                    self._execute(cur, 'insert_tombstone', (book_id,))
+                # Тексты, на которые больше не ссылается ни одна книга
+                self._execute_many(cur, 'delete_orphan_text', [(digest, digest) for digest in hashes])
+
+            # Обновляем локальный кеш и индекс сортировки
+            books = self.books
+            removed = [b for b in books if b.id == book_id]
+            self._publish([b for b in books if b.id != book_id], removed=removed)
 
-            cur.execute("DELETE FROM books WHERE id = %s", (book_id,))
-            conn.commit()
+        except Exception as e:
+            self._write_failed("Ошибка удаления", e)
 
-            cur.close()
-            conn.close()
+    @METRICS.timed('storage.remove_books')
+    @_exclusive
+    def remove_books(self, criteria):
+        """Удаляет все книги, подходящие под критерии поиска, одной транзакцией.
 
-            # Обновляем локальный кеш
-            self.books = [b for b in self.books if b.id != book_id]
+        Книги удаляются запросом DELETE ... WHERE с условием из
+        booklib.query.compile_sql, без загрузки каталога; загруженный кеш
+        исправляется за один проход.
 
-        except Exception as e:
-            print(f"Ошибка удаления: {e}")
+        Args:
+            criteria (dict): Критерии поиска (см. booklib.query).
+
+        Returns:
+            int or None: Количество удаленных книг; None при ошибке.
 
+        Raises:
+            ValueError: Если критерии не ограничивают выборку (удалили бы
+                весь каталог; для этого есть clear()).
+        """
+        where, params = _restricting_sql(criteria)
+        try:
+            ids = set(self._delete_where(where, params))  # копия книги на старом шарде - та же книга
+        except Exception as e:
+            self._write_failed("Ошибка удаления", e)
+            return None
+
+        if self.loaded and ids:
+            books = self.books
+            self._publish([b for b in books if b.id not in ids], removed=[b for b in books if b.id in ids])
+        return len(ids)
+
+    def _delete_where(self, where, params):
+        """Удаляет книги по условию WHERE (см. remove_books); возвращает их id."""
+        with self._transaction() as cur:
+            cur.execute(f"DELETE FROM book_quotes WHERE book_id IN (SELECT id FROM books WHERE {where}) "
+                        f"RETURNING quote_hash", params)
+            hashes = list({digest for digest, in cur.fetchall()})
+            cur.execute(f"DELETE FROM books WHERE {where} RETURNING id", params)
+            ids = [book_id for book_id, in cur.fetchall()]
+            self._execute_many(cur, 'insert_tombstone', [(book_id,) for book_id in ids])
+            self._execute_many(cur, 'delete_orphan_text', [(digest, digest) for digest in hashes])
+        return ids
+
+    @METRICS.timed('storage.add_quote_to_book')
     def add_quote_to_book(self, book_id, quote):
         """Добавляет цитату к существующей книге.
 
+        В режиме отложенной записи (write_behind) цитата сразу добавляется
+        в кеш, а в БД записывается фоновой групповой фиксацией.
+
         Args:
             book_id (int): Идентификатор книги, к которой добавляется цитата.
             quote (str): Текст цитаты для добавления.
 
         Returns:
-            None: Метод ничего не возвращает, но обновляет БД и локальный кеш.
+            Future or None: В режиме отложенной записи - результат фиксации
+                (True - цитата добавлена, False - у книги она уже была;
+                исключение при ошибке записи). Иначе None: метод обновляет
+                БД и локальный кеш до возврата.
+        """
+        if self.writes is not None and self._batch is None:
+            return self._enqueue_quote(book_id, quote)
+        self._add_quote(book_id, quote)
+
+    def _enqueue_quote(self, book_id, quote):
+        """Ставит цитату в очередь отложенной записи, сразу обновляя кеш."""
+        item = PendingQuote(book_id, self.intern_quote(quote))
+        with self._lock:
+            book = self._ids.get(book_id)
+            if book is not None and book.quotes_loaded and quote in book.quotes:
+                item.future.set_result(False)  # повтор не сохранился бы и в БД
+                return item.future
+            # Фоновая фиксация ждет блокировки, поэтому кеш меняется после постановки
+            full = self.writes.put(item)
+            if book is not None:
+                if book.quotes_loaded:
+                    book.quotes = book.quotes + [item.quote]
+                    item.appended = True
+                else:
+                    book.set_lazy_quotes(self.quote_loader, book.quote_count + 1)
+                item.applied = True
+                self._touch(books_changed=False)
+        METRICS.incr('writes.queued')
+        if full:  # очередь заполнена: фиксирует тот, кто пишет
+            self.flush_writes()
+        return item.future
+
+    def flush_writes(self):
+        """Фиксирует записи из очереди отложенной записи, не дожидаясь интервала."""
+        with self._lock:
+            self._commit_pending()
+
+    def _commit_pending(self):
+        """Фиксирует очередь отложенной записи (вызывается под блокировкой).
+
+        Все записи очереди сохраняются одной транзакцией. Если она не
+        удалась, записи повторяются каждая в своей транзакции, чтобы
+        ошибка одной (например, книга уже удалена) не отменила остальные.
         """
+        items = self.writes.take() if self.writes is not None else None
+        if items:
+            self._commit_items(items)
+
+    def _commit_items(self, items):
+        """Фиксирует записи очереди отложенной записи (см. _commit_pending)."""
+        METRICS.incr('writes.batches')
+        METRICS.incr('writes.items', len(items))
+        pairs = list(dict.fromkeys((item.book_id, item.quote) for item in items))
         try:
-            conn = self._connect()
-            cur = conn.cursor()
+            with self._transaction() as cur:
+                results = self._commit_quotes(cur, pairs)
+        except Exception:
+            results = {}
+            for pair in pairs:
+                try:
+                    with self._transaction() as cur:
+                        results.update(self._commit_quotes(cur, [pair]))
+                except Exception as e:
+                    logger.error("Ошибка отложенной записи цитаты: %s", e, exc_info=True,
+                                 extra={'error': str(e)})
+                    METRICS.incr('storage.errors')
+                    results[pair] = e
+
+        claimed = set()  # повтор той же цитаты в очереди получает False
+        for item in items:
+            pair = (item.book_id, item.quote)
+            result = results[pair]
+            inserted = result is True and pair not in claimed
+            if inserted:
+                claimed.add(pair)
+            self._reconcile_quote(item, inserted)
+            if isinstance(result, Exception):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(inserted)
+        self._touch(books_changed=False)
 
-            cur.execute("""
-                INSERT INTO quotes (book_id, quote)
-                VALUES (%s, %s)
-            """, (book_id, quote))
+    def _commit_quotes(self, cur, pairs):
+        """Сохраняет цитаты группы и отмечает изменение их книг.
 
-            conn.commit()
-            cur.close()
-            conn.close()
+        Returns:
+            dict: Пара (id книги, цитата) -> добавлена ли цитата.
+        """
+        inserted = self._insert_quotes(cur, pairs)
+        self._execute_many(cur, 'touch_book', [(book_id,) for book_id in dict.fromkeys(b for b, _ in inserted)])
+        return {pair: pair in inserted for pair in pairs}
 
-            # Обновляем локальный кеш
-            for book in self.books:
-                if book.id == book_id:
-                    book.quotes.append(quote)
-                    break
+    def _reconcile_quote(self, item, inserted):
+        """Приводит кеш книги в соответствие с результатом фиксации цитаты.
+
+        Цитаты книги могли загрузиться из БД, пока запись ждала в очереди,
+        а повтор цитаты у ленивой книги при постановке не виден.
+        """
+        book = self._ids.get(item.book_id)
+        if book is None:
+            return
+        if inserted:
+            if book.quotes_loaded:
+                if item.quote not in book.quotes:  # загружены из БД до фиксации
+                    book.quotes = book.quotes + [item.quote]
+            elif not item.applied:
+                book.set_lazy_quotes(self.quote_loader, book.quote_count + 1)
+        elif book.quotes_loaded:
+            if item.appended and item.quote in book.quotes:
+                quotes = list(book.quotes)
+                del quotes[len(quotes) - 1 - quotes[::-1].index(item.quote)]
+                book.quotes = quotes
+        elif item.applied:
+            book.set_lazy_quotes(self.quote_loader, book.quote_count - 1)
+
+    @_exclusive
+    def _add_quote(self, book_id, quote):
+        """Добавляет цитату к книге сразу, в своей транзакции."""
+        try:
+            with self._transaction() as cur:
+                # Та же цитата у книги уже есть - повтор не сохраняется
+                digest = quote_hash(quote)
+                self._execute(cur, 'insert_quote_text', (digest, quote))
+                self._execute(cur, 'insert_quote', (book_id, digest))
+                inserted = cur.fetchone() is not None
+                if inserted:
+                    self._execute(cur, 'touch_book', (book_id,))
+
+            # Обновляем локальный кеш (незагруженные цитаты не трогаем, только счетчик)
+            book = self._ids.get(book_id)
+            if inserted and book is not None:
+                if book.quotes_loaded:
+                    book.quotes = book.quotes + [self.intern_quote(quote)]  # читатели сохраняют старый список
+                else:
+                    book.set_lazy_quotes(self.quote_loader, book.quote_count + 1)
+                self._touch(books_changed=False)
 
         except Exception as e:
-            print(f"Ошибка добавления цитаты: {e}")
+            self._write_failed("Ошибка добавления цитаты", e)
 
+    @METRICS.timed('storage.remove_quote')
+    @_exclusive
     def remove_quote(self, book_id, quote_index):
         """Удаляет цитату из книги по индексу.
 
@@ -219,44 +1270,108 @@ class LibraryStorage:
             Метод удаляет цитату как из базы данных, так и из локального кеша.
         """
         try:
-            conn = self._connect()
-            cur = conn.cursor()
-
-            # Находим все цитаты книги для получения их id
-            cur.execute("SELECT id FROM quotes WHERE book_id = %s ORDER BY id", (book_id,))
-            quotes = cur.fetchall()
-
-            if 0 <= quote_index < len(quotes):
-                # Получаем id конкретной цитаты по индексу
-                quote_id = quotes[quote_index][0]
-                cur.execute("DELETE FROM quotes WHERE id = %s", (quote_id,))
-                conn.commit()
-                success = True
-            else:
-                success = False
-
-            cur.close()
-            conn.close()
+            with self._transaction() as cur:
+                # Находим все цитаты книги для получения их id
+                self._execute(cur, 'quote_ids', (book_id,))
+                quotes = cur.fetchall()
+
+                if 0 <= quote_index < len(quotes):
+                    # Получаем id конкретной цитаты по индексу
+                    quote_id, digest = quotes[quote_index]
+                    self._execute(cur, 'delete_quote', (book_id, quote_id))
+                    self._execute(cur, 'delete_orphan_text', (digest, digest))
+                    self._execute(cur, 'touch_book', (book_id,))
+                    success = True
+                else:
+                    success = False
 
             # Обновляем локальный кеш
             if success:
                 for book in self.books:
-                    if book.id == book_id and quote_index < len(book.quotes):
-                        book.quotes.pop(quote_index)
+                    if book.id == book_id and quote_index < book.quote_count:
+                        if book.quotes_loaded:
+                            quotes = book.quotes
+                            book.quotes = quotes[:quote_index] + quotes[quote_index + 1:]
+                        else:
+                            book.set_lazy_quotes(self.quote_loader, book.quote_count - 1)
                         break
+                self._touch(books_changed=False)
 
             return success
 
         except Exception as e:
-            print(f"Ошибка удаления цитаты: {e}")
+            self._write_failed("Ошибка удаления цитаты", e)
             return False
 
-    def export_to_csv(self, filename='export.csv'):
+    @METRICS.timed('storage.pack')
+    def pack(self, filename, compress=False):
+        """Сохраняет каталог с цитатами в упакованный файл для чтения через mmap.
+
+        Args:
+            filename (str): Имя файла каталога.
+            compress (bool, optional): Сжимать длинные тексты цитат zlib.
+
+        Returns:
+            int or None: Размер файла в байтах; None при ошибке записи.
+        """
+        self.load_all_quotes()
+        try:
+            return save_catalogue(self.books, filename, compress)
+        except OSError as e:
+            logger.error("Ошибка упаковки: %s", e, exc_info=True, extra={'error': str(e)})
+            METRICS.incr('storage.errors')
+            print(f"Ошибка упаковки: {e}")
+            return None
+
+    @METRICS.timed('storage.stats')
+    def stats(self, top=None, source=None):
+        """Возвращает сводную статистику каталога.
+
+        Args:
+            top (int, optional): Сколько самых частых авторов вернуть.
+                По умолчанию все.
+            source (str, optional): 'cache' - по кешу книг (загружает его
+                при необходимости), 'sql' - запросами GROUP BY к БД.
+                По умолчанию кеш, если он уже загружен, иначе БД.
+
+        Returns:
+            dict or None: Статистика (см. booklib.stats.query_stats);
+                None при ошибке запроса.
+        """
+        if source is None:
+            source = 'cache' if self.loaded else 'sql'
+        if source == 'cache':
+            return collect_stats(self.books, top)
+
+        try:
+            result = self._query_stats(top)
+        except Exception as e:
+            logger.error("Ошибка статистики: %s", e, exc_info=True, extra={'error': str(e)})
+            METRICS.incr('storage.errors')
+            print(f"Ошибка статистики: {e}")
+            return None
+        return result
+
+    def _query_stats(self, top):
+        """Считает статистику запросами к БД (см. stats); ошибки не перехватываются."""
+        conn = self._open(read=True)
+        try:
+            cur = conn.cursor()
+            result = query_stats(cur, top)
+            cur.close()
+        finally:
+            conn.close()
+        return result
+
+    @METRICS.timed('storage.export_to_csv')
+    def export_to_csv(self, filename='export.csv', workers=None):
         """Экспортирует все книги и цитаты в CSV файл.
 
         Args:
             filename (str, optional): Имя файла для экспорта.
                 По умолчанию 'export.csv'.
+            workers (int, optional): Если больше 1, строки файла
+                формируются параллельно в пуле процессов (см. parallel()).
 
         Note:
             Цитаты в файле разделяются символом '|'.
@@ -264,6 +1379,11 @@ class LibraryStorage:
         """
         import csv
 
+        if workers and workers > 1:
+            self.parallel(workers).export(filename, 'csv')
+            return
+        self.load_all_quotes()
+
         with open(filename, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
             writer.writerow(['title', 'author', 'year', 'genre', 'quotes'])
@@ -272,6 +1392,53 @@ class LibraryStorage:
                 quotes_str = '|'.join(book.quotes)
                 writer.writerow([book.title, book.author, book.year, book.genre, quotes_str])
 
+    @METRICS.timed('storage.export_to_jsonl')
+    def export_to_jsonl(self, filename='export.jsonl', workers=None):
+        """Экспортирует все книги и цитаты в файл JSON Lines.
+
+        Каждая строка файла - словарь Book.to_dict() одной книги.
+
+        Args:
+            filename (str, optional): Имя файла для экспорта.
+                По умолчанию 'export.jsonl'.
+            workers (int, optional): Если больше 1, строки файла
+                формируются параллельно в пуле процессов (см. parallel()).
+        """
+        import json
+
+        if workers and workers > 1:
+            self.parallel(workers).export(filename, 'jsonl')
+            return
+        self.load_all_quotes()
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            for book in self.books:
+                f.write(json.dumps(book.to_dict(), ensure_ascii=False))
+                f.write('\n')
+
+    def export_changes(self, filename, since=None, fmt='csv', chunk_size=EXPORT_CHUNK_SIZE):
+        """Экспортирует книги, измененные после водяного знака, и удаления.
+
+        Данные читаются из БД частями; прерванный экспорт с теми же
+        параметрами продолжается с последней контрольной точки.
+
+        Args:
+            filename (str): Имя файла дельты.
+            since (str, optional): Водяной знак предыдущего экспорта. Если не
+                указан, выгружается весь каталог (база для дельт).
+            fmt (str, optional): 'csv' (по умолчанию) или 'jsonl'.
+            chunk_size (int, optional): Количество книг между контрольными точками.
+
+        Returns:
+            IncrementalExport: Выполненный экспорт; его watermark передается
+                как since следующему экспорту.
+        """
+        export = IncrementalExport(self, filename, since, fmt, chunk_size)
+        export.run()
+        return export
+
+    @METRICS.timed('storage.update_book')
+    @_exclusive
     def update_book(self, old_book, new_book):
         """Обновляет информацию о книге в базе данных.
 
@@ -279,29 +1446,156 @@ class LibraryStorage:
             old_book (Book): Исходный объект книги (с оригинальными данными).
             new_book (Book): Обновленный объект книги с новыми данными.
 
+        Returns:
+            bool: True, если книга обновлена.
+
         Note:
             Метод обновляет запись в БД и локальный кеш.
-            Идентификатор книги (id) остается неизменным.
+            Идентификатор книги (id) остается неизменным. Цитаты в БД
+            не меняются, поэтому новая книга получает цитаты старой.
         """
         try:
-            conn = self._connect()
-            cur = conn.cursor()
-
-            cur.execute("""
-                UPDATE books 
-                SET title = %s, author = %s, year = %s, genre = %s
-                WHERE id = %s
-            """, (new_book.title, new_book.author, new_book.year, new_book.genre, old_book.id))
-
-            conn.commit()
-            cur.close()
-            conn.close()
+            with self._transaction() as cur:
+                author_id = self._resolve(cur, self.dimensions.authors, [new_book.author])[new_book.author]
+                genre_id = self._resolve(cur, self.dimensions.genres, [new_book.genre])[new_book.genre]
+                self._execute(cur, 'update_book', (
+                    new_book.title, new_book.author, new_book.year, new_book.genre,
+                    new_book.natural_key, author_id, genre_id, old_book.id))
+            new_book.author_id, new_book.genre_id = author_id, genre_id
 
             # Обновляем локальный кеш
-            for i, book in enumerate(self.books):
+            books = list(self.books)
+            for i, book in enumerate(books):
                 if book.id == old_book.id:
-                    self.books[i] = new_book
+                    new_book.id = book.id
+                    if book.quotes_loaded:
+                        new_book.quotes = list(book.quotes)
+                    else:
+                        new_book.set_lazy_quotes(self.quote_loader, book.quote_count)
+                    books[i] = new_book
+                    self._publish(books, added=[new_book], removed=[book])
                     break
+            return True
+
+        except Exception as e:
+            self._write_failed("Ошибка обновления", e)
+            return False
+
+    @METRICS.timed('storage.update_books')
+    @_exclusive
+    def update_books(self, criteria, title=None, author=None, year=None, genre=None):
+        """Изменяет поля всех книг, подходящих под критерии поиска, одним запросом.
+
+        Запрос UPDATE ... WHERE меняет только переданные поля; ключ книги
+        пересчитывается из частей прежнего ключа, поэтому книги не
+        читаются из БД. Если после изменения две книги совпадут по ключу,
+        запрос не выполняется (ошибка уникального ключа). Загруженный кеш
+        исправляется за один проход; цитаты книг не меняются.
 
+        Args:
+            criteria (dict): Критерии поиска (см. booklib.query).
+            title, author, year, genre (optional): Новые значения полей.
+
+        Returns:
+            int or None: Количество измененных книг; None при ошибке.
+
+        Raises:
+            ValueError: Если критерии не ограничивают выборку или не
+                передано ни одно новое значение.
+        """
+        where, params = _restricting_sql(criteria)
+        changes = {field: value for field, value in
+                   (('title', title), ('author', author), ('year', year), ('genre', genre)) if value is not None}
+        if not changes:
+            raise ValueError("Не заданы новые значения полей")
+        try:
+            ids, author_id, genre_id = self._update_where(where, params, changes)
         except Exception as e:
-            print(f"Ошибка обновления: {e}")
\ No newline at end of file
+            self._write_failed("Ошибка обновления", e)
+            return None
+
+        ids = set(ids)  # на шардах копия книги после rebalance изменяется вместе с оригиналом
+        if self.loaded and ids:
+            books = list(self.books)
+            added, removed = [], []
+            for i, book in enumerate(books):
+                if book.id not in ids:
+                    continue
+                new_book = Book(changes.get('title', book.title), changes.get('author', book.author),
+                                changes.get('year', book.year), changes.get('genre', book.genre))
+                new_book.id = book.id
+                new_book.author_id = book.author_id if author_id is None else author_id
+                new_book.genre_id = book.genre_id if genre_id is None else genre_id
+                if book.quotes_loaded:
+                    new_book.quotes = list(book.quotes)
+                else:
+                    new_book.set_lazy_quotes(self.quote_loader, book.quote_count)
+                books[i] = new_book
+                added.append(new_book)
+                removed.append(book)
+            self._publish(books, added=added, removed=removed)
+        return len(ids)
+
+    def _update_where(self, where, params, changes):
+        """Изменяет книги по условию WHERE (см. update_books).
+
+        Returns:
+            tuple: (id измененных книг, id нового автора или None, id нового жанра или None).
+        """
+        with self._transaction() as cur:
+            author_id = genre_id = None
+            assignments, values = [], []
+            for field in ('title', 'author', 'year', 'genre'):
+                if field in changes:
+                    assignments.append(f"{field} = %s")
+                    values.append(changes[field])
+            if 'author' in changes:
+                author_id = self._resolve(cur, self.dimensions.authors, [changes['author']])[changes['author']]
+                assignments.append("author_id = %s")
+                values.append(author_id)
+            if 'genre' in changes:
+                genre_id = self._resolve(cur, self.dimensions.genres, [changes['genre']])[changes['genre']]
+                assignments.append("genre_id = %s")
+                values.append(genre_id)
+            if changes.keys() & {'title', 'author', 'year'}:
+                # Ключ - части 'название, автор, год' (models.natural_key); неизменные берутся из прежнего
+                parts = []
+                for number, field in enumerate(('title', 'author', 'year'), 1):
+                    if parts:
+                        parts.append("%s")
+                        values.append(KEY_SEPARATOR)
+                    if field in changes:
+                        parts.append("%s")
+                        value = changes[field]
+                        values.append(str(int(value)) if field == 'year' else normalize_name(value))
+                    else:
+                        parts.append(f"split_part(natural_key, %s, {number})")
+                        values.append(KEY_SEPARATOR)
+                assignments.append("natural_key = " + " || ".join(parts))
+            assignments.append(f"updated_at = {SERVER_TIMESTAMP}")
+            cur.execute(f"UPDATE books SET {', '.join(assignments)} WHERE {where} RETURNING id", values + params)
+            ids = [book_id for book_id, in cur.fetchall()]
+        return ids, author_id, genre_id
+
+    @METRICS.timed('storage.clear')
+    @_exclusive
+    def clear(self):
+        """Удаляет из БД все книги и цитаты, оставляя структуру таблиц.
+
+        Для инкрементального экспорта каждая книга получает отметку об
+        удалении. Кеш книг очищается.
+
+        Raises:
+            Exception: При ошибке выполнения запросов (транзакция откатывается).
+        """
+        with self._transaction() as cur:
+            self._clear_tables(cur)
+        self.books = []
+
+    @staticmethod
+    def _clear_tables(cur):
+        """Удаляет книги и тексты цитат (внутри транзакции)."""
+        # Отметки об удалении нужны инкрементальному экспорту
+        cur.execute(f"INSERT INTO book_tombstones (book_id, deleted_at) SELECT id, {SERVER_TIMESTAMP} FROM books")
+        cur.execute("DELETE FROM books")
+        cur.execute("DELETE FROM quote_texts")  # ссылки book_quotes удалены каскадно
@@ -0,0 +1,415 @@
+"""Модуль записи и воспроизведения нагрузки (workload).
+
+В режиме записи (main.py --record FILE) каждый вызов методов
+LibraryCommands и LibraryStorage записывается строкой JSON Lines:
+аргументы, время начала, длительность, количество запросов к БД и
+полученных строк, ошибка. Вложенные вызовы (методы хранилища, которые
+вызвала команда) тоже записываются, с глубиной вложенности depth.
+Файл дописывается, поэтому несколько запусков CLI складываются в одну
+нагрузку.
+
+Воспроизведение (main.py replay) повторяет вызовы верхнего уровня
+записанной нагрузки на любом хранилище (с другими параметрами пула,
+отложенной записью, другой БД) с заданным количеством потоков и
+ускорением и сравнивает перцентили задержек, пропускную способность
+и количество запросов с записанными:
+
+    {"ts": 1760000000.25, "target": "commands", "method": "search_books",
+     "args": [], "kwargs": {"author": "Толстой"}, "depth": 0,
+     "duration_ms": 12.5, "queries": 1, "rows": 3, "error": null}
+
+Воспроизведение изменяющих команд меняет данные хранилища, на котором
+оно выполняется. Интерактивный выбор книги при воспроизведении
+получает ответ '1' (первая книга; очистка БД при этом отменяется).
+
+Классы:
+    WorkloadRecorder: Запись вызовов команд и хранилища в файл JSON Lines.
+
+Функции:
+    read_workload: Чтение записанной нагрузки.
+    replay: Воспроизведение нагрузки и отчет о задержках.
+"""
+
+import builtins
+import contextlib
+import functools
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import InstrumentedConnection
+from .models import Book
+
+# Методы хранилища, которые не записываются: служебные или вызываемые
+# на каждую строку результата
+UNRECORDED_STORAGE_METHODS = ('close', 'intern_quote', 'reindex_book', 'parallel', 'batch', 'flush_writes')
+
+# Перцентили задержек в отчете
+PERCENTILES = (50, 90, 99)
+
+
+def public_methods(obj, skip=()):
+    """Возвращает имена открытых методов класса объекта.
+
+    Args:
+        obj: Объект (LibraryCommands или LibraryStorage).
+        skip (tuple, optional): Имена, которые не нужно возвращать.
+
+    Returns:
+        list: Имена методов в алфавитном порядке.
+    """
+    cls = type(obj)
+    return [name for name in sorted(dir(cls))
+            if not name.startswith('_') and name not in skip
+            and callable(getattr(cls, name)) and not isinstance(getattr(cls, name), type)]
+
+
+def encode_value(value):
+    """Переводит аргумент вызова в значение JSON.
+
+    Книги записываются словарем с ключом '__book__' (цитаты - только
+    загруженные), неизвестные объекты - их repr с ключом '__repr__'.
+
+    Args:
+        value: Аргумент вызова.
+
+    Returns:
+        Значение, которое можно передать в json.dumps.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, Book):
+        data = {'id': value.id, 'title': value.title, 'author': value.author,
+                'year': value.year, 'genre': value.genre}
+        if value.quotes_loaded:
+            data['quotes'] = value.quotes
+        return {'__book__': data}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+    return {'__repr__': repr(value)}
+
+
+def decode_value(value):
+    """Восстанавливает аргумент вызова из значения JSON (см. encode_value).
+
+    Args:
+        value: Значение из записи нагрузки.
+
+    Returns:
+        Аргумент вызова; объекты, записанные через repr, становятся None.
+    """
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if isinstance(value, dict):
+        if '__book__' in value:
+            data = value['__book__']
+            book = Book(data['title'], data['author'], data['year'], data['genre'], data.get('quotes'))
+            book.id = data.get('id')
+            return book
+        if '__repr__' in value:
+            return None
+        return {key: decode_value(item) for key, item in value.items()}
+    return value
+
+
+class _CallCounter:
+    """Счетчики запросов к БД для текущего вызова каждого потока.
+
+    Реализует ту часть интерфейса Metrics, которую использует
+    InstrumentedConnection. Запросы вложенного вызова учитываются
+    и в нем, и во всех внешних вызовах.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        """Создает счетчики без открытых вызовов."""
+        self._local = threading.local()
+
+    def _stack(self):
+        """Возвращает стек счетчиков открытых вызовов потока."""
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def begin(self):
+        """Открывает вызов.
+
+        Returns:
+            int: Глубина вложенности вызова (0 - вызов верхнего уровня).
+        """
+        stack = self._stack()
+        stack.append({})
+        return len(stack) - 1
+
+    def end(self):
+        """Закрывает вызов.
+
+        Returns:
+            dict: Счетчики вызова ('db.queries', 'db.rows_fetched').
+        """
+        stack = self._stack()
+        counts = stack.pop()
+        if stack:
+            for name, value in counts.items():
+                stack[-1][name] = stack[-1].get(name, 0) + value
+        return counts
+
+    def incr(self, name, value=1):
+        """Увеличивает счетчик открытого вызова (вне вызова ничего не делает)."""
+        stack = self._stack()
+        if stack:
+            stack[-1][name] = stack[-1].get(name, 0) + value
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """Время запросов не замеряется: его включает длительность вызова."""
+        yield
+
+
+def _instrument(commands, counter, on_call):
+    """Оборачивает методы команд и хранилища и подключения хранилища.
+
+    Args:
+        commands (LibraryCommands): Команды библиотеки.
+        counter (_CallCounter): Счетчики запросов вызовов.
+        on_call (callable): Функция (target, name, args, kwargs, depth,
+            start, duration, counts, error), вызываемая после каждого вызова.
+    """
+    storage = commands.storage
+    targets = (('commands', commands, public_methods(commands)),
+               ('storage', storage, public_methods(storage, UNRECORDED_STORAGE_METHODS)))
+    for target, obj, names in targets:
+        for name in names:
+            setattr(obj, name, _wrap(target, name, getattr(obj, name), counter, on_call))
+
+    open_connection = storage._open
+    storage._open = lambda read=False: InstrumentedConnection(open_connection(read), counter)
+
+
+def _wrap(target, name, method, counter, on_call):
+    """Возвращает обертку метода, сообщающую о каждом вызове."""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        depth = counter.begin()
+        start = time.time()
+        started = time.perf_counter()
+        error = None
+        try:
+            return method(*args, **kwargs)
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            on_call(target, name, args, kwargs, depth, start, duration, counter.end(), error)
+    return wrapper
+
+
+class WorkloadRecorder:
+    """Запись вызовов команд и хранилища в файл JSON Lines.
+
+    Attributes:
+        path (str): Файл нагрузки (дописывается).
+        calls (int): Количество записанных вызовов.
+    """
+
+    def __init__(self, path):
+        """Открывает файл нагрузки для дописывания.
+
+        Args:
+            path (str): Путь к файлу.
+        """
+        self.path = path
+        self.calls = 0
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def attach(self, commands):
+        """Начинает записывать вызовы команд и их хранилища.
+
+        Args:
+            commands (LibraryCommands): Команды библиотеки.
+        """
+        _instrument(commands, _CallCounter(), self._record)
+
+    def _record(self, target, name, args, kwargs, depth, start, duration, counts, error):
+        """Записывает один вызов."""
+        event = {
+            'ts': round(start, 6),
+            'target': target,
+            'method': name,
+            'args': encode_value(args),
+            'kwargs': encode_value(kwargs),
+            'depth': depth,
+            'duration_ms': round(duration * 1000, 3),
+            'queries': counts.get('db.queries', 0),
+            'rows': counts.get('db.rows_fetched', 0),
+            'error': error,
+        }
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self.calls += 1
+
+    def close(self):
+        """Закрывает файл нагрузки."""
+        with self._lock:
+            self._file.close()
+
+
+def read_workload(lines):
+    """Читает записанную нагрузку.
+
+    Args:
+        lines (iterable): Строки JSON Lines (например, открытый файл).
+
+    Returns:
+        list: Вызовы верхнего уровня (depth 0) в порядке времени начала.
+
+    Raises:
+        ValueError: Если строка не является записью вызова.
+    """
+    events = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict) or 'target' not in event or 'method' not in event:
+            raise ValueError(f"Строка {number}: не запись вызова")
+        if event.get('depth', 0) == 0:
+            events.append(event)
+    events.sort(key=lambda event: event.get('ts', 0))
+    return events
+
+
+def _percentile(values, percent):
+    """Возвращает перцентиль отсортированного списка (ближайший ранг)."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def latency_summary(durations):
+    """Сводка задержек: перцентили, среднее и максимум в миллисекундах.
+
+    Args:
+        durations (list): Длительности вызовов в миллисекундах.
+
+    Returns:
+        dict: {'count', 'p50', 'p90', 'p99', 'mean', 'max'}.
+    """
+    values = sorted(durations)
+    summary = {'count': len(values)}
+    for percent in PERCENTILES:
+        value = _percentile(values, percent)
+        summary[f'p{percent}'] = None if value is None else round(value, 3)
+    summary['mean'] = round(sum(values) / len(values), 3) if values else None
+    summary['max'] = round(values[-1], 3) if values else None
+    return summary
+
+
+@contextlib.contextmanager
+def _noninteractive(answer='1'):
+    """Отвечает на запросы input() одним и тем же ответом."""
+    original = builtins.input
+    builtins.input = lambda prompt='': answer
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def replay(events, commands, concurrency=1, speed=0.0):
+    """Воспроизводит нагрузку и сравнивает задержки с записанными.
+
+    Args:
+        events (list): Вызовы верхнего уровня (см. read_workload).
+        commands (LibraryCommands): Команды, на которых воспроизводить
+            нагрузку (их хранилище определяет бэкенд и его параметры).
+        concurrency (int, optional): Количество потоков, выполняющих вызовы.
+        speed (float, optional): Ускорение относительно записанных
+            интервалов между вызовами (2 - вдвое быстрее). 0 - выполнять
+            вызовы без пауз, как только освободится поток.
+
+    Returns:
+        dict: Отчет: количество вызовов и ошибок, время, пропускная
+            способность (вызовов в секунду), сводки задержек (latency_summary)
+            и запросов к БД - всего и по методам, для воспроизведения и записи.
+    """
+    counter = _CallCounter()
+    results = []
+    lock = threading.Lock()
+
+    def on_call(target, name, args, kwargs, depth, start, duration, counts, error):
+        if depth == 0:
+            with lock:
+                results.append((f'{target}.{name}', duration * 1000, counts.get('db.queries', 0), error))
+
+    _instrument(commands, counter, on_call)
+    targets = {'commands': commands, 'storage': commands.storage}
+
+    def call(event):
+        method = getattr(targets.get(event['target']), event['method'], None)
+        if method is None:
+            with lock:
+                results.append((f"{event['target']}.{event['method']}", 0.0, 0, "Метод не найден"))
+            return
+        try:
+            method(*decode_value(event.get('args', [])), **decode_value(event.get('kwargs', {})))
+        except Exception:
+            pass  # ошибка уже учтена оберткой метода
+
+    first = events[0].get('ts', 0) if events else 0
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+            contextlib.redirect_stdout(devnull), _noninteractive():
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            for event in events:
+                if speed > 0:
+                    delay = (event.get('ts', 0) - first) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                executor.submit(call, event)
+        if commands.storage.writes is not None:
+            commands.storage.flush_writes()  # отложенные записи входят во время воспроизведения
+        elapsed = time.perf_counter() - started
+
+    report = {
+        'calls': len(results),
+        'errors': sum(1 for *_, error in results if error),
+        'concurrency': concurrency,
+        'speed': speed,
+        'elapsed_s': round(elapsed, 6),
+        'throughput': round(len(results) / elapsed, 3) if elapsed > 0 else None,
+        'latency': latency_summary([duration for _, duration, _, _ in results]),
+        'queries': sum(queries for _, _, queries, _ in results),
+        'recorded': {
+            'latency': latency_summary([event.get('duration_ms', 0) for event in events]),
+            'queries': sum(event.get('queries', 0) for event in events),
+        },
+        'methods': {},
+    }
+    for name in sorted({name for name, *_ in results}):
+        replayed = [r for r in results if r[0] == name]
+        recorded = [e for e in events if f"{e['target']}.{e['method']}" == name]
+        report['methods'][name] = {
+            'errors': sum(1 for *_, error in replayed if error),
+            'latency': latency_summary([duration for _, duration, _, _ in replayed]),
+            'queries': sum(queries for _, _, queries, _ in replayed),
+            'recorded': {
+                'latency': latency_summary([e.get('duration_ms', 0) for e in recorded]),
+                'queries': sum(e.get('queries', 0) for e in recorded),
+            },
+        }
+    return report
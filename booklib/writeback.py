@@ -0,0 +1,173 @@
+"""Модуль отложенной записи (write-behind) изменений хранилища.
+
+В режиме отложенной записи add_quote_to_book не ждет подключения,
+вставки и фиксации: цитата сразу появляется в кеше книг, а запись
+ставится в очередь. Фоновый поток забирает накопленные записи и
+фиксирует их одной транзакцией (групповая фиксация) - как только
+в очереди набралось max_items записей или самой старой из них
+исполнилось interval секунд.
+
+Каждая запись возвращает Future: вызывающий код может дождаться
+фиксации (future.result()). Очередь ограничена: если в ней max_pending
+записей, поток, добавляющий запись, сам фиксирует очередь (обратное
+давление вместо неограниченного роста памяти). При закрытии хранилища
+и при завершении процесса оставшиеся записи фиксируются.
+
+Классы:
+    PendingQuote: Цитата, ожидающая фиксации.
+    WriteBehindQueue: Ограниченная очередь записей с фоновой групповой фиксацией.
+"""
+
+import atexit
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+# Количество записей, при котором очередь фиксируется, не дожидаясь интервала
+DEFAULT_MAX_ITEMS = 500
+
+# Наибольшее время ожидания записи в очереди до фиксации (секунды)
+DEFAULT_INTERVAL = 0.05
+
+# Наибольшее количество записей в очереди
+DEFAULT_MAX_PENDING = 10000
+
+
+class PendingQuote:
+    """Цитата, ожидающая фиксации.
+
+    Attributes:
+        book_id (int): Идентификатор книги.
+        quote (str): Текст цитаты.
+        future (Future): Результат фиксации: True - цитата добавлена,
+            False - такая цитата у книги уже была; исключение при ошибке.
+        applied (bool): Изменен ли кеш книги при постановке в очередь.
+        appended (bool): Добавлена ли цитата в загруженный список цитат
+            (иначе увеличен только счетчик ленивых цитат).
+    """
+
+    __slots__ = ('book_id', 'quote', 'future', 'applied', 'appended')
+
+    def __init__(self, book_id, quote):
+        """Создает запись.
+
+        Args:
+            book_id (int): Идентификатор книги.
+            quote (str): Текст цитаты.
+        """
+        self.book_id = book_id
+        self.quote = quote
+        self.future = Future()
+        self.applied = False
+        self.appended = False
+
+
+class WriteBehindQueue:
+    """Ограниченная очередь записей с фоновой групповой фиксацией.
+
+    Очередь только накапливает записи и решает, когда их фиксировать;
+    сама фиксация - функция flush хранилища, которая забирает записи
+    методом take() под блокировкой хранилища. Поэтому записи фиксируются
+    либо фоновым потоком, либо любым изменяющим методом хранилища до
+    его собственной записи - порядок изменений в БД совпадает с
+    порядком в кеше.
+
+    Attributes:
+        max_items (int): Размер группы, фиксируемой без ожидания интервала.
+        interval (float): Наибольшее время ожидания записи (секунды).
+        max_pending (int): Наибольшее количество записей в очереди.
+    """
+
+    def __init__(self, flush, max_items=DEFAULT_MAX_ITEMS, interval=DEFAULT_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING):
+        """Создает очередь и запускает фоновый поток фиксации.
+
+        Args:
+            flush (callable): Связанный метод хранилища, фиксирующий очередь.
+                Хранится слабой ссылкой: очередь не удерживает хранилище.
+            max_items (int, optional): Размер группы.
+            interval (float, optional): Наибольшее время ожидания записи.
+            max_pending (int, optional): Наибольшее количество записей.
+        """
+        self.max_items = max_items
+        self.interval = interval
+        self.max_pending = max_pending
+        self._flush = weakref.WeakMethod(flush)
+        self._ready = threading.Condition()
+        self._items = []
+        self._oldest = None  # time.monotonic() первой записи в очереди
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='booklib-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Ставит запись в очередь.
+
+        Args:
+            item (PendingQuote): Запись.
+
+        Returns:
+            bool: True, если очередь заполнена и вызывающий код должен
+                зафиксировать ее сам.
+
+        Raises:
+            RuntimeError: Если очередь уже закрыта.
+        """
+        with self._ready:
+            if self._closed:
+                raise RuntimeError("Очередь отложенной записи закрыта")
+            if not self._items:
+                self._oldest = time.monotonic()
+            self._items.append(item)
+            if len(self._items) == 1 or len(self._items) >= self.max_items:
+                self._ready.notify()  # поток начинает отсчет интервала или фиксирует группу
+            return len(self._items) >= self.max_pending
+
+    def take(self):
+        """Забирает все записи очереди.
+
+        Returns:
+            list: Записи в порядке постановки.
+        """
+        with self._ready:
+            items, self._items = self._items, []
+            self._oldest = None
+            return items
+
+    def _due(self):
+        """Возвращает, через сколько секунд фиксировать очередь (0 - сейчас, None - пуста)."""
+        if not self._items:
+            return 0 if self._closed else None
+        if self._closed or len(self._items) >= self.max_items:
+            return 0
+        return max(0.0, self._oldest + self.interval - time.monotonic())
+
+    def _run(self):
+        """Цикл фонового потока: фиксирует очередь по размеру или по времени."""
+        while True:
+            with self._ready:
+                delay = self._due()
+                while delay is None or delay > 0:
+                    self._ready.wait(delay)
+                    delay = self._due()
+                if self._closed and not self._items:
+                    return
+            flush = self._flush()
+            if flush is None:  # хранилище удалено сборщиком мусора
+                return
+            flush()
+            del flush
+
+    def close(self):
+        """Фиксирует оставшиеся записи и останавливает фоновый поток."""
+        atexit.unregister(self.close)
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
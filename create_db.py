@@ -6,102 +6,449 @@
 
 Функции:
     create_database: Основная функция создания БД и таблиц.
+    migrate: Применение версионированных миграций схемы.
+    schema_version: Номера примененных миграций.
+
+Исключения:
+    MigrationError: Данные не позволяют применить миграцию.
 """
 
+import time
+
 import psycopg2
+from psycopg2 import sql
+
+from booklib.connection import connect, load_settings
+from booklib.export import SERVER_TIMESTAMP
+from booklib.models import natural_key, normalize_name, quote_hash
+
+
+# Количество секций book_quotes (хеш book_id, миграция 10)
+QUOTE_PARTITIONS = 16
+
+
+class MigrationError(Exception):
+    """Ошибка применения миграции схемы."""
+
+
+def _check_no_duplicate_books(cur):
+    """Проверяет, что в books нет повторов (title, author, year).
+
+    Уникальный индекс нельзя построить поверх повторов, а удалять книги
+    молча миграция не должна.
+
+    Raises:
+        MigrationError: Если повторы есть.
+    """
+    cur.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT title, author, year FROM books
+            GROUP BY title, author, year HAVING COUNT(*) > 1
+        ) AS duplicates
+    """)
+    duplicates = cur.fetchone()[0]
+    if duplicates:
+        raise MigrationError(
+            f"В таблице books {duplicates} повторяющихся сочетаний (title, author, year); "
+            f"удалите повторы и запустите миграцию снова"
+        )
+
+
+def _backfill_natural_keys(cur):
+    """Заполняет books.natural_key для книг, сохраненных до миграции 6.
+
+    Raises:
+        MigrationError: Если разные записи дают один нормализованный ключ.
+    """
+    cur.execute("SELECT id, title, author, year, natural_key FROM books")
+    owners = {}
+    updates = []
+    for book_id, title, author, year, key in cur.fetchall():
+        if key is None:
+            key = natural_key(title, author, year)
+            updates.append((key, book_id))
+        if key in owners:
+            raise MigrationError(
+                f"Книги с id {owners[key]} и {book_id} совпадают без учета регистра и пробелов; "
+                f"объедините их и запустите миграцию снова"
+            )
+        owners[key] = book_id
+    if updates:
+        cur.executemany("UPDATE books SET natural_key = %s WHERE id = %s", updates)
+
+
+def _backfill_quote_hashes(cur):
+    """Заполняет quotes.quote_hash для цитат, сохраненных до миграции 6.
+
+    Уникальный индекс (book_id, quote_hash) нельзя построить поверх точных
+    повторов цитат одной книги, а удалять цитаты молча миграция не должна
+    (как и книги в миграции 5).
+
+    Raises:
+        MigrationError: Если у книги есть повторяющиеся цитаты.
+    """
+    cur.execute("SELECT id, book_id, quote, quote_hash FROM quotes ORDER BY id")
+    seen = {}
+    updates = []
+    duplicates = []
+    for quote_id, book_id, quote, digest in cur.fetchall():
+        digest = digest or quote_hash(quote)
+        if (book_id, digest) in seen:
+            duplicates.append(f"{quote_id} (повтор {seen[book_id, digest]})")
+            continue
+        seen[book_id, digest] = quote_id
+        updates.append((digest, quote_id))
+    if duplicates:
+        raise MigrationError(
+            f"В таблице quotes {len(duplicates)} повторяющихся цитат книг, id: {', '.join(duplicates)}; "
+            f"удалите повторы и запустите миграцию снова"
+        )
+    if updates:
+        cur.executemany("UPDATE quotes SET quote_hash = %s WHERE id = %s", updates)
+
+
+def _backfill_dimension(cur, table, column):
+    """Связывает книги без {column}_id со справочником table.
+
+    Написания, совпадающие после normalize_name(), получают одну запись
+    справочника; ее именем становится самое частое написание.
+    """
+    cur.execute(f"SELECT id, normalized_name FROM {table}")
+    ids = {key: dimension_id for dimension_id, key in cur.fetchall()}
+    cur.execute(f"SELECT {column}, COUNT(*) AS n FROM books WHERE {column}_id IS NULL "
+                f"GROUP BY {column} ORDER BY n DESC, {column}")
+    names = [row[0] for row in cur.fetchall()]
+    for name in names:
+        key = normalize_name(name)
+        if key not in ids:
+            cur.execute(f"INSERT INTO {table} (name, normalized_name) VALUES (%s, %s) RETURNING id",
+                        (name, key))
+            ids[key] = cur.fetchone()[0]
+    cur.executemany(f"UPDATE books SET {column}_id = %s WHERE {column} = %s AND {column}_id IS NULL",
+                    [(ids[normalize_name(name)], name) for name in names])
+
+
+def backfill_dimensions(cur):
+    """Заполняет books.author_id и books.genre_id там, где они не заданы.
+
+    Используется миграцией 7 и при массовой загрузке книг в обход
+    LibraryStorage (fakedb, bench.py).
+
+    Args:
+        cur: Курсор DB-API внутри транзакции.
+    """
+    _backfill_dimension(cur, 'authors', 'author')
+    _backfill_dimension(cur, 'genres', 'genre')
+
+
+def _create_quote_partitions(cur):
+    """Создает секции book_quotes_p0 .. book_quotes_p{QUOTE_PARTITIONS - 1} по хешу book_id."""
+    for remainder in range(QUOTE_PARTITIONS):
+        cur.execute(f"CREATE TABLE IF NOT EXISTS book_quotes_p{remainder} PARTITION OF book_quotes_partitioned "
+                    f"FOR VALUES WITH (MODULUS {QUOTE_PARTITIONS}, REMAINDER {remainder})")
 
 
-def create_database():
+# Версионированные миграции схемы: (версия, описание, шаги).
+# Шаг - SQL-запрос или функция, принимающая курсор. Все шаги идемпотентны
+# (IF NOT EXISTS), поэтому миграции безопасно применять к базам, созданным
+# до появления таблицы schema_migrations. Используются как при создании
+# настоящей БД, так и тестовой заглушкой fakedb.
+MIGRATIONS = [
+    (1, "Таблицы books и quotes", [
+        """
+        CREATE TABLE IF NOT EXISTS books (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            genre TEXT NOT NULL
+        )
+        """,
+        # Таблица для цитат с внешним ключом
+        """
+        CREATE TABLE IF NOT EXISTS quotes (
+            id SERIAL PRIMARY KEY,
+            book_id INTEGER NOT NULL,
+            quote TEXT NOT NULL,
+            FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
+        )
+        """,
+    ]),
+    (2, "Отслеживание изменений для инкрементального экспорта", [
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP",
+        """
+        CREATE TABLE IF NOT EXISTS book_tombstones (
+            book_id INTEGER PRIMARY KEY,
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    # Без индекса загрузка цитат книги и каскадное удаление читают всю таблицу
+    (3, "Индекс внешнего ключа quotes.book_id", [
+        "CREATE INDEX IF NOT EXISTS idx_quotes_book_id ON quotes (book_id)",
+    ]),
+    (4, "Индексы поиска и инкрементального экспорта", [
+        "CREATE INDEX IF NOT EXISTS idx_books_author ON books (author)",
+        "CREATE INDEX IF NOT EXISTS idx_books_year ON books (year)",
+        "CREATE INDEX IF NOT EXISTS idx_books_genre ON books (genre)",
+        "CREATE INDEX IF NOT EXISTS idx_books_updated_at ON books (updated_at)",
+        "CREATE INDEX IF NOT EXISTS idx_book_tombstones_deleted_at ON book_tombstones (deleted_at)",
+    ]),
+    (5, "Уникальный ключ книги (title, author, year)", [
+        _check_no_duplicate_books,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_books_title_author_year ON books (title, author, year)",
+    ]),
+    # Ключ для INSERT ... ON CONFLICT: повторный импорт не создает дубликатов.
+    # Он строже (title, author, year), поэтому прежний уникальный индекс не нужен
+    (6, "Нормализованный ключ книги и хеши цитат для дедупликации", [
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS natural_key TEXT",
+        "ALTER TABLE quotes ADD COLUMN IF NOT EXISTS quote_hash TEXT",
+        _backfill_natural_keys,
+        _backfill_quote_hashes,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_books_natural_key ON books (natural_key)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_quotes_book_hash ON quotes (book_id, quote_hash)",
+        "DROP INDEX IF EXISTS uq_books_title_author_year",
+    ]),
+    # Фильтры и группировки по автору и жанру сравнивают целые числа, а не строки;
+    # написания, отличающиеся регистром, 'ё' или пробелами, - один автор
+    (7, "Справочники авторов и жанров", [
+        """
+        CREATE TABLE IF NOT EXISTS authors (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            normalized_name TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS genres (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            normalized_name TEXT NOT NULL UNIQUE
+        )
+        """,
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS author_id INTEGER REFERENCES authors (id)",
+        "ALTER TABLE books ADD COLUMN IF NOT EXISTS genre_id INTEGER REFERENCES genres (id)",
+        backfill_dimensions,
+        "CREATE INDEX IF NOT EXISTS idx_books_author_id ON books (author_id)",
+        "CREATE INDEX IF NOT EXISTS idx_books_genre_id ON books (genre_id)",
+    ]),
+    # Известная цитата у многих книг и изданий хранится один раз: книги
+    # ссылаются на текст по хешу содержимого. Порядок цитат книги сохраняется
+    # порядком id связей (строки переносятся в порядке прежних id)
+    (8, "Общие тексты цитат: quote_texts и book_quotes", [
+        """
+        CREATE TABLE IF NOT EXISTS quote_texts (
+            quote_hash TEXT PRIMARY KEY,
+            quote TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS book_quotes (
+            id SERIAL PRIMARY KEY,
+            book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+            quote_hash TEXT NOT NULL REFERENCES quote_texts (quote_hash)
+        )
+        """,
+        "INSERT INTO quote_texts (quote_hash, quote) SELECT quote_hash, MIN(quote) FROM quotes GROUP BY quote_hash",
+        "INSERT INTO book_quotes (book_id, quote_hash) SELECT book_id, quote_hash FROM quotes ORDER BY id",
+        "DROP TABLE quotes",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_book_quotes_book_hash ON book_quotes (book_id, quote_hash)",
+        # Для проверки, остались ли у текста ссылки, при удалении цитат
+        "CREATE INDEX IF NOT EXISTS idx_book_quotes_hash ON book_quotes (quote_hash)",
+    ]),
+    # Строка есть только на узлах шардированного каталога (ее пишет
+    # booklib.shards.rebalance): номер шарда, количество шардов и следующий
+    # свободный id книги этого шарда (id % shards = shard)
+    (9, "Параметры шарда", [
+        """
+        CREATE TABLE IF NOT EXISTS shard_config (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            shard INTEGER NOT NULL,
+            shards INTEGER NOT NULL,
+            next_id BIGINT NOT NULL,
+            node TEXT
+        )
+        """,
+    ]),
+    # Ссылки на цитаты - самая большая таблица: секции по хешу book_id
+    # отдельно очищаются VACUUM, а выборка цитат книги и каскадное удаление
+    # при условии на book_id читают одну секцию. Первичный ключ секционированной
+    # таблицы должен включать ключ секционирования; (book_id, id) заодно
+    # выдает цитаты книги в порядке добавления без сортировки
+    (10, "Секционирование book_quotes по book_id", [
+        """
+        CREATE TABLE IF NOT EXISTS book_quotes_partitioned (
+            id SERIAL,
+            book_id INTEGER NOT NULL REFERENCES books (id) ON DELETE CASCADE,
+            quote_hash TEXT NOT NULL REFERENCES quote_texts (quote_hash),
+            PRIMARY KEY (book_id, id)
+        ) PARTITION BY HASH (book_id)
+        """,
+        _create_quote_partitions,
+        "INSERT INTO book_quotes_partitioned (id, book_id, quote_hash) "
+        "SELECT id, book_id, quote_hash FROM book_quotes ORDER BY id",
+        "DROP TABLE book_quotes",
+        "ALTER TABLE book_quotes_partitioned RENAME TO book_quotes",
+        "SELECT setval(pg_get_serial_sequence('book_quotes', 'id'), (SELECT MAX(id) FROM book_quotes))",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_book_quotes_book_hash ON book_quotes (book_id, quote_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_book_quotes_hash ON book_quotes (quote_hash)",
+    ]),
+    # CURRENT_TIMESTAMP - время в часовом поясе сессии, а приложение и
+    # водяные знаки экспорта считают отметки в UTC (booklib.export)
+    (11, "Отметки изменений по умолчанию - время сервера в UTC", [
+        f"ALTER TABLE books ALTER COLUMN updated_at SET DEFAULT {SERVER_TIMESTAMP}",
+        f"ALTER TABLE book_tombstones ALTER COLUMN deleted_at SET DEFAULT {SERVER_TIMESTAMP}",
+    ]),
+]
+
+
+def schema_version(cur):
+    """Возвращает номера примененных миграций.
+
+    Args:
+        cur: Курсор DB-API, подключенный к базе данных книжной библиотеки.
+
+    Returns:
+        set: Номера примененных миграций (пустое множество для новой БД).
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            duration_ms REAL NOT NULL
+        )
+    """)
+    cur.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cur.fetchall()}
+
+
+def migrate(conn, verbose=True, target=None):
+    """Применяет к базе данных все еще не примененные миграции.
+
+    Каждая миграция выполняется в своей транзакции вместе с записью
+    в schema_migrations, поэтому повторный запуск после ошибки продолжает
+    с неудавшейся миграции, а запуск на актуальной базе ничего не делает.
+
+    Args:
+        conn: Подключение DB-API к базе данных книжной библиотеки.
+        verbose (bool, optional): Печатать ли отчет о каждой миграции.
+            По умолчанию True.
+        target (int, optional): Последняя применяемая версия. По умолчанию
+            применяются все миграции.
+
+    Returns:
+        list: Примененные миграции: (версия, описание, длительность в секундах).
+
+    Raises:
+        MigrationError: Если данные не позволяют применить миграцию.
+        Exception: При ошибках выполнения SQL-запросов (транзакция
+            миграции откатывается).
+    """
+    cur = conn.cursor()
+    applied = schema_version(cur)
+    conn.commit()
+
+    report = []
+    for version, description, steps in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        start = time.perf_counter()
+        try:
+            for step in steps:
+                if callable(step):
+                    step(cur)
+                else:
+                    cur.execute(step)
+            duration = time.perf_counter() - start
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description, duration_ms) VALUES (%s, %s, %s)",
+                (version, description, round(duration * 1000, 3))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        report.append((version, description, duration))
+        if verbose:
+            print(f"Миграция {version} ({description}): {duration * 1000:.1f} мс")
+
+    if verbose and not report:
+        print("Схема базы данных актуальна.")
+    cur.close()
+    return report
+
+
+def create_database(settings=None):
     """Создает базу данных и необходимые таблицы для книжной библиотеки.
 
     Выполняет следующие операции:
-    1. Подключается к серверу PostgreSQL с помощью учетных данных по умолчанию.
-    2. Создает новую базу данных 'book_library'.
-    3. Подключается к созданной базе данных.
-    4. Создает таблицы 'books' и 'quotes' со связью один-ко-многим.
-    5. Настраивает каскадное удаление цитат при удалении книги.
+    1. Подключается к служебной базе 'postgres' сервера PostgreSQL.
+    2. Создает базу данных из настроек (по умолчанию 'book_library'), если ее еще нет.
+    3. Подключается к базе данных.
+    4. Применяет недостающие миграции схемы (MIGRATIONS): таблицы 'books',
+       'quote_texts' и 'book_quotes' (связь с каскадным удалением,
+       QUOTE_PARTITIONS секций по хешу book_id), отслеживание изменений,
+       индексы и уникальный ключ книги.
+    5. Печатает, какие миграции применены и сколько длилась каждая.
 
     Raises:
         psycopg2.OperationalError: При ошибках подключения к серверу БД.
-        psycopg2.errors.DuplicateDatabase: При попытке создать уже существующую БД.
+        MigrationError: Если данные не позволяют применить миграцию.
         Exception: При любых других ошибках выполнения SQL-запросов.
 
+    Args:
+        settings (ConnectionSettings, optional): Настройки подключения
+            (см. booklib.connection). По умолчанию читаются из файла
+            конфигурации и переменных окружения.
+
     Note:
         - Для работы функции требуется запущенный сервер PostgreSQL.
-        - Учетные данные подключения жестко закодированы в функции.
+        - Ограничения времени запроса и ожидания блокировок на миграции
+          не действуют: на большой базе они могут идти долго.
         - Функция создает базу данных с кодировкой UTF-8.
-        - Таблица 'quotes' имеет внешний ключ с каскадным удалением.
+        - Таблица 'book_quotes' имеет внешний ключ с каскадным удалением.
 
     Examples:
         create_database()
         База данных успешно создана.
 
-        # При повторном запуске
+        # При повторном запуске на существующей базе
         create_database()
-        Ошибка: база данных "book_library" уже существует
+        База данных 'book_library' уже существует, проверяем миграции.
+        Схема базы данных актуальна.
     """
     try:
+        settings = (settings or load_settings()).replace(statement_timeout=0, lock_timeout=0)
+        name = settings.database()
+
         # Подключение к системной базе данных postgres для создания новой БД
-        conn = psycopg2.connect(
-            dbname="postgres",
-            user="postgres",
-            password="11111",
-            host="localhost",
-            port="5432",
-            client_encoding='utf8'
-        )
+        conn = connect(settings, dbname="postgres")
         conn.autocommit = True  # Включение автоматического сохранения изменений
         cur = conn.cursor()
 
         # Создание новой базы данных
-        cur.execute("CREATE DATABASE book_library")
-        print("База данных 'book_library' создана.")
+        try:
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+            print(f"База данных '{name}' создана.")
+        except psycopg2.errors.DuplicateDatabase:
+            print(f"База данных '{name}' уже существует, проверяем миграции.")
 
         cur.close()
         conn.close()
 
         # Подключение к созданной базе данных
-        conn = psycopg2.connect(
-            dbname="book_library",
-            user="postgres",
-            password="11111",
-            host="localhost",
-            port="5432",
-            client_encoding='utf8'
-        )
-        cur = conn.cursor()
+        conn = connect(settings)
 
-        # Создание таблицы для книг
-        cur.execute("""
-            CREATE TABLE books (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                author TEXT NOT NULL,
-                year INTEGER NOT NULL,
-                genre TEXT NOT NULL
-            )
-        """)
-        print("Таблица 'books' создана.")
-
-        # Создание таблицы для цитат с внешним ключом
-        cur.execute("""
-            CREATE TABLE quotes (
-                id SERIAL PRIMARY KEY,
-                book_id INTEGER NOT NULL,
-                quote TEXT NOT NULL,
-                FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
-            )
-        """)
-        print("Таблица 'quotes' создана.")
-
-        conn.commit()
-        cur.close()
-        conn.close()
+        try:
+            migrate(conn)
+        finally:
+            conn.close()
 
         print("База данных успешно инициализирована.")
 
-    except psycopg2.errors.DuplicateDatabase:
-        print("Ошибка: база данных 'book_library' уже существует.")
+    except MigrationError as e:
+        print(f"Ошибка миграции: {e}")
     except psycopg2.OperationalError as e:
         print(f"Ошибка подключения к PostgreSQL: {e}")
         print("Убедитесь, что сервер PostgreSQL запущен.")
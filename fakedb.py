@@ -0,0 +1,386 @@
+"""Тестовая заглушка базы данных для книжной библиотеки.
+
+Предоставляет объект, совместимый с DB-API 2.0 (подключение и курсор),
+который хранит данные в SQLite вместо PostgreSQL. Это позволяет запускать
+тесты и бенчмарки LibraryStorage без работающего сервера PostgreSQL.
+
+Запросы пишутся в диалекте psycopg2 (параметры '%s', SERIAL,
+ADD COLUMN IF NOT EXISTS, PREPARE/EXECUTE и т.д.) и переводятся в диалект
+SQLite перед выполнением. Схема создается миграциями из create_db.
+Секционирования в SQLite нет: секционированная таблица создается обычной
+(ее столбец SERIAL - ключ строки), а создание секций пропускается.
+
+Реплика (FakeDatabase.replica()) - отдельный файл, который догоняет
+основную базу только при вызове sync(); ее отставание, которое видят
+функции репликации PostgreSQL (pg_last_wal_replay_lsn() и др.), задается
+атрибутом lag, а запись в нее запрещена, как на реплике PostgreSQL.
+Позиция WAL основной базы (pg_current_wal_lsn()) - число фиксаций с
+изменениями; реплика воспроизвела WAL до позиции на момент sync().
+
+Классы:
+    FakeDatabase: Временная база данных со схемой из create_db.
+    FakeReplica: Реплика FakeDatabase с управляемым отставанием.
+    FakeConnection: Подключение к FakeDatabase в стиле psycopg2.
+    FakeCursor: Курсор, переводящий запросы PostgreSQL в SQLite.
+"""
+
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from booklib.export import SERVER_TIMESTAMP, WATERMARK_FORMAT
+from booklib.models import quote_hash
+from create_db import backfill_dimensions, migrate
+
+
+def _translate(sql):
+    """Переводит запрос из диалекта PostgreSQL в диалект SQLite.
+
+    Args:
+        sql (str): Текст запроса в стиле psycopg2.
+
+    Returns:
+        str: Текст запроса для sqlite3.
+    """
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\$(\d+)', r'?\1', sql)  # параметры PREPARE: $1 -> ?1
+    sql = re.sub(r'\bSERIAL PRIMARY KEY\b', 'INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+    sql = sql.replace('EXTRACT(EPOCH FROM ', '(')  # время в заглушке - секунды (time.time())
+    sql = sql.replace(SERVER_TIMESTAMP, 'utc_timestamp()')
+    return sql
+
+
+def utc_now():
+    """Время сервера заглушки для отметок изменений (SERVER_TIMESTAMP); тесты подменяют его."""
+    return datetime.now(timezone.utc).strftime(WATERMARK_FORMAT)
+
+
+# Позиции WAL основных баз по путям к файлам: число фиксаций с изменениями
+_wal_positions = {}
+
+
+def _format_lsn(position):
+    """Позиция WAL в текстовом виде PostgreSQL ('0/2A')."""
+    return f"{position >> 32:X}/{position & 0xFFFFFFFF:X}"
+
+
+def _split_part(text, separator, number):
+    """split_part() PostgreSQL: часть строки по номеру с 1; '' за пределами."""
+    if text is None:
+        return None
+    parts = text.split(separator)
+    return parts[number - 1] if 1 <= number <= len(parts) else ''
+
+
+# ALTER TABLE ... ADD COLUMN IF NOT EXISTS, которого нет в SQLite
+_ADD_COLUMN = re.compile(r'^\s*ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) (.*)$', re.S | re.I)
+
+# Подготовленные запросы PostgreSQL: хранятся в подключении до его закрытия
+_PREPARE = re.compile(r'^\s*PREPARE (\w+) AS (.*)$', re.S | re.I)
+_EXECUTE = re.compile(r'^\s*EXECUTE (\w+)\b', re.I)
+
+# ALTER COLUMN ... SET DEFAULT, которого нет в SQLite (значения по умолчанию остаются прежними)
+_SET_DEFAULT = re.compile(r'^\s*ALTER TABLE \w+ ALTER COLUMN \w+ SET DEFAULT\b', re.I)
+
+# CREATE TABLE ... PARTITION BY и секции CREATE TABLE ... PARTITION OF
+_PARTITIONED = re.compile(r'^(\s*CREATE TABLE .*\))\s*PARTITION BY \w+ \([^)]*\)\s*$', re.S | re.I)
+_PARTITION_OF = re.compile(r'^\s*CREATE TABLE (IF NOT EXISTS )?\w+ PARTITION OF\b', re.I)
+
+
+class FakeCursor:
+    """Курсор DB-API поверх курсора sqlite3.
+
+    Attributes:
+        rowcount (int): Количество строк, затронутых последним запросом.
+    """
+
+    def __init__(self, cursor, connection):
+        """Инициализирует курсор.
+
+        Args:
+            cursor (sqlite3.Cursor): Настоящий курсор SQLite.
+            connection (FakeConnection): Подключение курсора.
+        """
+        self._cursor = cursor
+        self.connection = connection
+
+    def _prepared(self, sql):
+        """Подставляет текст подготовленного запроса вместо EXECUTE.
+
+        Returns:
+            str or None: Текст запроса или None, если это не EXECUTE.
+        """
+        match = _EXECUTE.match(sql)
+        return self.connection.prepared[match.group(1)] if match else None
+
+    @property
+    def rowcount(self):
+        """int: Количество строк, затронутых последним запросом."""
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        """tuple: Описание столбцов результата последнего запроса."""
+        return self._cursor.description
+
+    def execute(self, sql, params=None):
+        """Выполняет запрос.
+
+        Args:
+            sql (str): Текст запроса в стиле psycopg2.
+            params (tuple, optional): Параметры запроса.
+        """
+        prepare = _PREPARE.match(sql)
+        if prepare:
+            name, statement = prepare.groups()
+            if name in self.connection.prepared:
+                raise sqlite3.OperationalError(f'prepared statement "{name}" already exists')
+            self.connection.prepared[name] = statement
+            return
+        sql = self._prepared(sql) or sql
+        if _PARTITION_OF.match(sql) or _SET_DEFAULT.match(sql):
+            return
+        partitioned = _PARTITIONED.match(sql)
+        if partitioned:
+            # Составной ключ с ключом секционирования не нужен: SERIAL становится ключом строки
+            sql = re.sub(r',\s*PRIMARY KEY \([^)]*\)', '', partitioned.group(1))
+            sql = re.sub(r'\bSERIAL\b', 'INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+        match = _ADD_COLUMN.match(sql)
+        if match:
+            table, column, definition = match.groups()
+            columns = {row[1] for row in self._cursor.execute(f"PRAGMA table_info({table})")}
+            if column in columns:
+                return
+            # SQLite разрешает в ADD COLUMN только постоянное значение по умолчанию
+            definition = definition.replace('CURRENT_TIMESTAMP', "'1970-01-01 00:00:00'")
+            sql = f"ALTER TABLE {table} ADD COLUMN {column} {definition}"
+        elif sql.lstrip().upper().startswith('SAVEPOINT') and not self._cursor.connection.in_transaction:
+            # psycopg2 открывает транзакцию перед любым запросом, а sqlite3 - только
+            # перед изменяющим; иначе RELEASE такой точки сохранения сам фиксировал бы ее
+            self._cursor.execute("BEGIN")
+        self._cursor.execute(_translate(sql), tuple(params or ()))
+
+    def executemany(self, sql, seq_of_params):
+        """Выполняет запрос для каждого набора параметров.
+
+        Args:
+            sql (str): Текст запроса в стиле psycopg2.
+            seq_of_params (iterable): Наборы параметров.
+        """
+        sql = self._prepared(sql) or sql
+        self._cursor.executemany(_translate(sql), [tuple(p) for p in seq_of_params])
+
+    def fetchone(self):
+        """Возвращает следующую строку результата или None."""
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        """Возвращает все оставшиеся строки результата."""
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        """Возвращает не более size строк результата."""
+        if size is None:
+            return self._cursor.fetchmany()
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        """Закрывает курсор."""
+        self._cursor.close()
+
+
+class FakeConnection:
+    """Подключение DB-API к FakeDatabase в стиле psycopg2."""
+
+    def __init__(self, path, replica=None):
+        """Открывает подключение к файлу базы данных SQLite.
+
+        Args:
+            path (str): Путь к файлу базы данных.
+            replica (FakeReplica, optional): Реплика, к которой относится
+                подключение (None - основная база).
+        """
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA synchronous = OFF")
+        # Встроенная lower() SQLite переводит в нижний регистр только ASCII, как в PostgreSQL - любые буквы
+        self._conn.create_function('lower', 1, lambda text: text.lower() if text is not None else None,
+                                   deterministic=True)
+        # Функции репликации: на основной базе, как в PostgreSQL, возвращают NULL;
+        # реплика с отставанием получила одну запись сверх воспроизведенных
+        self._conn.create_function('now', 0, time.time)
+        self._conn.create_function('utc_timestamp', 0, lambda: utc_now())
+        self._conn.create_function('pg_current_wal_lsn', 0,
+                                   lambda: None if replica else _format_lsn(_wal_positions.get(path, 0)))
+        self._conn.create_function('pg_last_wal_receive_lsn', 0,
+                                   lambda: _format_lsn(replica.replayed + bool(replica.lag)) if replica else None)
+        self._conn.create_function('pg_last_wal_replay_lsn', 0,
+                                   lambda: _format_lsn(replica.replayed) if replica else None)
+        self._conn.create_function('pg_last_xact_replay_timestamp', 0,
+                                   lambda: time.time() - replica.lag if replica else None)
+        # mod() SQLite возвращает REAL, в PostgreSQL для целых - целое;
+        # последовательности AUTOINCREMENT продолжаются сами, setval() ничего не меняет
+        self._conn.create_function('mod', 2, lambda a, b: a % b if a is not None and b else None,
+                                   deterministic=True)
+        self._conn.create_function('pg_get_serial_sequence', 2, lambda table, column: f"{table}_{column}_seq")
+        self._conn.create_function('setval', 2, lambda sequence, value: value)
+        self._conn.create_function('split_part', 3, _split_part, deterministic=True)
+        if replica is not None:
+            self._conn.execute("PRAGMA query_only = ON")
+        self.prepared = {}  # имя -> текст запроса PREPARE
+        self.closed = 0
+        self._path = path
+        self._committed = 0  # total_changes на момент последней фиксации
+
+    def cursor(self):
+        """Создает новый курсор.
+
+        Returns:
+            FakeCursor: Курсор для выполнения запросов.
+        """
+        return FakeCursor(self._conn.cursor(), self)
+
+    def commit(self):
+        """Фиксирует текущую транзакцию; фиксация изменений сдвигает позицию WAL."""
+        self._conn.commit()
+        if self._conn.total_changes != self._committed:
+            self._committed = self._conn.total_changes
+            _wal_positions[self._path] = _wal_positions.get(self._path, 0) + 1
+
+    def rollback(self):
+        """Откатывает текущую транзакцию."""
+        self._conn.rollback()
+
+    def close(self):
+        """Закрывает подключение."""
+        self._conn.close()
+        self.closed = 1
+
+
+class FakeDatabase:
+    """Временная база данных SQLite со схемой книжной библиотеки.
+
+    Каждый вызов connect() открывает новое подключение к одному и тому же
+    файлу, поэтому данные видны между подключениями, как в PostgreSQL.
+
+    Attributes:
+        path (str): Путь к файлу базы данных.
+    """
+
+    def __init__(self, path=None):
+        """Создает файл базы данных и таблицы.
+
+        Args:
+            path (str, optional): Путь к файлу. По умолчанию создается
+                временный файл, который удаляется методом close().
+        """
+        self._owns_file = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='booklib-', suffix='.sqlite3')
+            os.close(fd)
+        self.path = path
+
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.close()
+
+        conn = self.connect()
+        try:
+            migrate(conn, verbose=False)
+        finally:
+            conn.close()
+
+    def connect(self):
+        """Открывает новое подключение к базе данных.
+
+        Returns:
+            FakeConnection: Подключение в стиле psycopg2.
+        """
+        return FakeConnection(self.path)
+
+    def populate(self, books):
+        """Быстро заполняет базу данных книгами и цитатами.
+
+        Книгам присваиваются идентификаторы по порядку, начиная с 1.
+
+        Args:
+            books (list): Список объектов Book.
+        """
+        conn = self.connect()
+        cur = conn.cursor()
+        cur.executemany(
+            "INSERT INTO books (id, title, author, year, genre, natural_key) VALUES (%s, %s, %s, %s, %s, %s)",
+            ((i, b.title, b.author, b.year, b.genre, b.natural_key) for i, b in enumerate(books, 1))
+        )
+        quotes = [(i, q, quote_hash(q)) for i, b in enumerate(books, 1) for q in dict.fromkeys(b.quotes)]
+        cur.executemany("INSERT INTO quote_texts (quote_hash, quote) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                        ((h, q) for _, q, h in quotes))
+        cur.executemany("INSERT INTO book_quotes (book_id, quote_hash) VALUES (%s, %s)",
+                        ((i, h) for i, _, h in quotes))
+        backfill_dimensions(cur)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    def replica(self):
+        """Создает реплику с копией текущих данных.
+
+        Returns:
+            FakeReplica: Реплика; файл удаляется ее методом close().
+        """
+        return FakeReplica(self)
+
+    def close(self):
+        """Удаляет временный файл базы данных."""
+        if self._owns_file:
+            for suffix in ('', '-wal', '-shm'):
+                try:
+                    os.remove(self.path + suffix)
+                except OSError:
+                    pass
+
+
+class FakeReplica(FakeDatabase):
+    """Реплика FakeDatabase: копия, которая догоняет основную базу по sync().
+
+    Attributes:
+        primary (FakeDatabase): Основная база.
+        lag (float): Отставание, которое сообщают функции репликации
+            (секунды; 0 - реплика воспроизвела все полученное).
+        replayed (int): Позиция WAL основной базы на момент sync().
+    """
+
+    def __init__(self, primary):
+        """Создает временный файл реплики и копирует в него данные.
+
+        Args:
+            primary (FakeDatabase): Основная база.
+        """
+        self.primary = primary
+        self.lag = 0.0
+        self._owns_file = True
+        fd, self.path = tempfile.mkstemp(prefix='booklib-replica-', suffix='.sqlite3')
+        os.close(fd)
+        self.sync()
+
+    def connect(self):
+        """Открывает подключение к реплике (только чтение).
+
+        Returns:
+            FakeConnection: Подключение в стиле psycopg2.
+        """
+        return FakeConnection(self.path, replica=self)
+
+    def sync(self):
+        """Копирует в реплику текущие данные основной базы."""
+        self.replayed = _wal_positions.get(self.primary.path, 0)
+        source = sqlite3.connect(self.primary.path)
+        target = sqlite3.connect(self.path)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
@@ -5,49 +5,103 @@
 а также дополнительные функции экспорта, импорта и управления базой данных.
 
 Основные команды:
-    create-db-Создание базы данных и таблиц
+    create-db-Создание базы данных и таблиц или обновление схемы существующей БД
     check- Проверка подключения и состояния БД
     add-Добавление новой книги
-    remove-Удаление книги
+    remove-Удаление книги (или всех книг по критериям поиска с --where)
     list-Просмотр списка книг с сортировкой
     search-Поиск книг по критериям
     add-quote-Добавление цитаты к книге
     remove-quote-Удаление цитаты из книги
     show-quotes-Просмотр цитат
-    export-Экспорт данных в CSV
+    export-Экспорт данных в CSV (или дельты изменений с --since)
+    batch-Выполнение команд из файла JSON Lines в одном процессе и транзакциях
+    pack-Упаковка каталога в файл для поиска без БД (mmap)
+    stats-Сводная статистика каталога в JSON (по жанрам, авторам, десятилетиям, цитатам)
+    replay-Воспроизведение нагрузки, записанной с --record, и отчет о задержках
+    rebalance-Перераспределение книг по новому составу шардов
+    import-Импорт книг из файла экспорта (без дубликатов)
+    apply-delta-Применение дельты к предыдущему экспорту
     clear-db-Очистка всех данных из таблиц
-    edit-Редактирование информации о книге
+    edit-Редактирование информации о книге (или всех книг по критериям поиска с --where)
 
 Примеры использования:
     python main.py create-db
     python main.py add --title "Война и мир" --author "Толстой" --year 1869 --genre "Роман"
     python main.py list --sort-by author --reverse
     python main.py search --author "Толстой" --genre "Роман"
+    python main.py search --genre "Роман" "Поэма" --year-from 1850 --year-to 1900
+    python main.py --stats list --sort-by year
+    python main.py --stats prometheus --stats-file metrics.prom list
+    python main.py export --since 0 --file base.csv
+    python main.py export --since "2026-10-18 02:00:00.000000" --file delta.csv
+    python main.py apply-delta --base base.csv --delta delta.csv --output new.csv
+    python main.py import --file export.csv
+    python main.py stats --top 10
+    python main.py batch --file ops.jsonl --batch-size 1000 --on-error skip
+    python main.py pack --file catalogue.pack --compress
+    python main.py search --pack catalogue.pack --author "Толстой"
+    python main.py --record workload.jsonl search --author "Толстой"
+    python main.py replay --file workload.jsonl --concurrency 8 --speed 10 --write-behind
+    python main.py --replica "host=replica1 dbname=book_library" export --since 0 --file base.csv
+    python main.py rebalance --to "host=db1" "host=db2" "host=db3"
+    python main.py --shard "host=db1" --shard "host=db2" --shard "host=db3" list
+    python main.py remove --where '{"author": "Толстой", "year_to": 1870}' --dry-run
+    python main.py edit --where '{"genre": "Повесть"}' --new-genre "Рассказ"
 """
 
 import argparse
-from booklib import LibraryCommands
+import functools
+import json
+import logging
+import sys
 
+from booklib import LibraryCommands, METRICS
+from booklib.batch import DEFAULT_BATCH_SIZE
+from booklib.metrics import JsonLogFormatter
+from booklib.pool import DEFAULT_POOL_SIZE
+from booklib.query import validate_criteria
+from booklib.connection import connect, load_settings
+from booklib.shards import REBALANCE_CHUNK_SIZE, rebalance
+from booklib.workload import WorkloadRecorder, read_workload, replay
 
-def main():
-    """Основная функция обработки командной строки.
-
-    Создает парсер аргументов, определяет все доступные команды и их параметры,
-    затем вызывает соответствующие методы LibraryCommands для выполнения операций.
 
-    Raises:
-        SystemExit: При вызове с флагом --help или при ошибках парсинга аргументов.
+def build_parser():
+    """Создает парсер аргументов командной строки со всеми командами.
 
     Returns:
-        None: Функция ничего не возвращает, но выводит результаты в консоль.
+        argparse.ArgumentParser: Готовый парсер.
     """
     # Создаем парсер аргументов командной строки
     parser = argparse.ArgumentParser(description='Книжная библиотека.')
+    parser.add_argument('--stats', nargs='?', const='text', choices=['text', 'json', 'prometheus'],
+                        help='Вывести метрики выполнения в stderr (по умолчанию таблицей)')
+    parser.add_argument('--stats-file', help='Записать метрики в файл в формате Prometheus')
+    parser.add_argument('--log-json', action='store_true',
+                        help='Писать структурированные логи (JSON) в stderr')
+    parser.add_argument('--config', metavar='FILE',
+                        help='Файл настроек подключения (INI, секция [database]); '
+                             'по умолчанию BOOKLIB_CONFIG или booklib.ini')
+    parser.add_argument('--dsn', help='Строка подключения к основному серверу PostgreSQL')
+    parser.add_argument('--replica', action='append', default=[], metavar='DSN',
+                        help='Строка подключения к реплике для чтения (можно указать несколько раз)')
+    parser.add_argument('--max-replica-lag', type=float,
+                        help='Наибольшее отставание реплики в секундах, при котором с нее читают')
+    parser.add_argument('--shard', action='append', default=[], metavar='DSN',
+                        help='Строка подключения к шарду (по порядку номеров, можно указать несколько раз)')
+    parser.add_argument('--record', metavar='FILE',
+                        help='Дописать вызовы команд и хранилища в файл нагрузки (JSON Lines) для replay')
     subparsers = parser.add_subparsers(dest='command')
 
     create_db_parser = subparsers.add_parser('create-db', help='Создать базу данных')
     check_parser = subparsers.add_parser('check', help='Проверить подключение к БД')
 
+    rebalance_parser = subparsers.add_parser('rebalance', help='Перераспределить книги по шардам')
+    rebalance_parser.add_argument('--to', nargs='+', required=True, metavar='DSN',
+                                  help='Строки подключения к шардам нового состава (по порядку номеров)')
+    rebalance_parser.add_argument('--chunk-size', type=int, default=REBALANCE_CHUNK_SIZE,
+                                  help='Количество книг, переносимых одной транзакцией')
+
     # Команда добавления книги
     add_parser = subparsers.add_parser('add', help='Добавить книгу')
     add_parser.add_argument('--title', required=True)  # обязательный аргумент
@@ -59,19 +113,32 @@ def main():
     remove_parser = subparsers.add_parser('remove', help='Удалить книгу')
     remove_parser.add_argument('--title', help='Название')
     remove_parser.add_argument('--author', help='Автор')
+    remove_parser.add_argument('--where', type=_where_criteria,
+                               help='Удалить все книги по критериям поиска в JSON (как у search): '
+                                    '\'{"author": "Толстой", "year_to": 1870}\'')
+    remove_parser.add_argument('--dry-run', action='store_true',
+                               help='С --where: только показать, сколько книг будет удалено')
 
     # Команда списка книг
     list_parser = subparsers.add_parser('list', help='Список книг')
     list_parser.add_argument('--sort-by', choices=['title', 'author', 'year', 'genre'],
                              default='title')  # выбор сортировки
     list_parser.add_argument('--reverse', action='store_true')  # флаг обратной сортировки
+    list_parser.add_argument('--limit', type=int, help='Показать только первые N книг')
 
     # Команда поиска
     search_parser = subparsers.add_parser('search', help='Поиск')
-    search_parser.add_argument('--author', help='Автор')
+    search_parser.add_argument('--author', nargs='+', help='Автор (несколько значений - любой из них)')
     search_parser.add_argument('--title', help='Название')
-    search_parser.add_argument('--year', type=int, help='Год')
-    search_parser.add_argument('--genre', help='Жанр')
+    search_parser.add_argument('--year', type=int, nargs='+', help='Год (несколько значений - любой из них)')
+    search_parser.add_argument('--year-from', type=int, help='Год издания не раньше')
+    search_parser.add_argument('--year-to', type=int, help='Год издания не позже')
+    search_parser.add_argument('--genre', nargs='+', help='Жанр (несколько значений - любой из них)')
+    search_parser.add_argument('--any-of', type=_any_of_groups,
+                               help='Группы критериев в JSON, книга подходит под любую: '
+                                    '\'[{"author": "Толстой"}, {"genre": "Поэма"}]\'')
+    search_parser.add_argument('--workers', type=int, help='Количество процессов для параллельного поиска')
+    search_parser.add_argument('--pack', help='Искать в упакованном каталоге (см. pack), без БД')
 
     # Команда добавления цитаты
     add_quote_parser = subparsers.add_parser('add-quote', help='Добавить цитату')
@@ -93,6 +160,57 @@ def main():
     # Команда экспорта в CSV
     export_parser = subparsers.add_parser('export', help='Экспорт в CSV')
     export_parser.add_argument('--file', default='export.csv', help='Имя файла')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='Формат файла')
+    export_parser.add_argument('--workers', type=int, help='Количество процессов для параллельного экспорта')
+    export_parser.add_argument('--since', help='Водяной знак предыдущего экспорта: выгрузить только '
+                                               'изменения (0 - весь каталог в формате дельты)')
+
+    # Команда пакетного выполнения операций
+    batch_parser = subparsers.add_parser('batch', help='Выполнить команды из файла JSON Lines')
+    batch_parser.add_argument('--file', required=True, help="Файл операций ('-' - стандартный ввод)")
+    batch_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                              help='Операций в одной транзакции (0 - все в одной)')
+    batch_parser.add_argument('--on-error', choices=['skip', 'stop', 'rollback'], default='rollback',
+                              help='При ошибке: пропустить операцию, остановиться или '
+                                   'откатить текущую транзакцию (по умолчанию)')
+    batch_parser.add_argument('--output', help='Файл результатов (по умолчанию вывод на экран)')
+
+    # Команда упаковки каталога
+    pack_parser = subparsers.add_parser('pack', help='Упаковать каталог в файл для поиска без БД')
+    pack_parser.add_argument('--file', default='catalogue.pack', help='Имя файла каталога')
+    pack_parser.add_argument('--compress', action='store_true',
+                             help='Сжимать длинные цитаты (zlib); чтение распаковывает их прозрачно')
+
+    # Команда воспроизведения нагрузки
+    replay_parser = subparsers.add_parser('replay', help='Воспроизвести записанную нагрузку (отчет в JSON)')
+    replay_parser.add_argument('--file', required=True, help='Файл нагрузки, записанный с --record')
+    replay_parser.add_argument('--concurrency', type=int, default=1, help='Количество потоков')
+    replay_parser.add_argument('--speed', type=float, default=0.0,
+                               help='Ускорение относительно записанных интервалов (0 - без пауз)')
+    replay_parser.add_argument('--pool-size', type=int, default=DEFAULT_POOL_SIZE,
+                               help='Размер пула подключений хранилища')
+    replay_parser.add_argument('--write-behind', action='store_true',
+                               help='Добавлять цитаты в режиме отложенной записи')
+    replay_parser.add_argument('--eager-quotes', action='store_true', help='Загрузить цитаты всех книг сразу')
+    replay_parser.add_argument('--output', help='Файл отчета (по умолчанию вывод на экран)')
+
+    # Команда сводной статистики
+    stats_parser = subparsers.add_parser('stats', help='Сводная статистика каталога (JSON)')
+    stats_parser.add_argument('--top', type=int, help='Сколько самых частых авторов показать')
+    stats_parser.add_argument('--source', choices=['sql', 'cache'], default='sql',
+                              help='Считать запросами к БД (по умолчанию) или по загруженному каталогу')
+
+    # Команда импорта книг из файла экспорта
+    import_parser = subparsers.add_parser('import', help='Импорт книг из файла экспорта')
+    import_parser.add_argument('--file', required=True, help='Имя файла')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='Формат файла')
+
+    # Команда применения дельты к предыдущему экспорту
+    apply_parser = subparsers.add_parser('apply-delta', help='Применить дельту к предыдущему экспорту')
+    apply_parser.add_argument('--base', required=True, help='Файл предыдущего экспорта')
+    apply_parser.add_argument('--delta', required=True, help='Файл дельты')
+    apply_parser.add_argument('--output', required=True, help='Файл результата')
+    apply_parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='Формат файлов')
 
     # Команда очистки данных
     clear_parser = subparsers.add_parser('clear-db', help='Очистить все данные из таблиц (безопасно)')
@@ -100,44 +218,180 @@ def main():
 
     # Команда редактирования книги
     edit_parser = subparsers.add_parser('edit', help='Редактировать книгу')
-    edit_parser.add_argument('--title', required=True, help='Текущее название')
-    edit_parser.add_argument('--author', required=True, help='Текущий автор')
+    edit_parser.add_argument('--title', help='Текущее название (обязательно без --where)')
+    edit_parser.add_argument('--author', help='Текущий автор (обязательно без --where)')
     edit_parser.add_argument('--new-title', help='Новое название')
     edit_parser.add_argument('--new-author', help='Новый автор')
     edit_parser.add_argument('--new-year', type=int, help='Новый год')
     edit_parser.add_argument('--new-genre', help='Новый жанр')
+    edit_parser.add_argument('--where', type=_where_criteria,
+                             help='Изменить все книги по критериям поиска в JSON (как у search)')
+    edit_parser.add_argument('--dry-run', action='store_true',
+                             help='С --where: только показать, сколько книг будет изменено')
 
-    args = parser.parse_args()
+    return parser
+
+
+def _where_criteria(text):
+    """Разбирает критерии --where: объект JSON с известными непустыми критериями поиска.
+
+    Raises:
+        argparse.ArgumentTypeError: Если текст - не JSON или критерии неверны
+            (см. booklib.query.validate_criteria).
+    """
+    criteria = _json_argument(text)
+    try:
+        validate_criteria(criteria)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return criteria
+
+
+def _any_of_groups(text):
+    """Разбирает группы --any-of: непустой список объектов JSON с известными критериями поиска.
+
+    Raises:
+        argparse.ArgumentTypeError: Если текст - не JSON или группы неверны
+            (см. booklib.query.validate_criteria).
+    """
+    groups = _json_argument(text)
+    try:
+        validate_criteria({'any_of': groups})
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return groups
+
+
+def _json_argument(text):
+    """Разбирает аргумент в JSON; ошибка разбора - ошибка аргумента."""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        raise argparse.ArgumentTypeError(f"неверный JSON: {e}") from None
+
+
+def _single(values):
+    """Возвращает единственное значение списка аргумента nargs='+' или сам список."""
+    if values is not None and len(values) == 1:
+        return values[0]
+    return values
+
+
+def connection_settings(args):
+    """Читает настройки подключения с учетом общих аргументов.
+
+    Args:
+        args (argparse.Namespace): Разобранные аргументы.
+
+    Returns:
+        ConnectionSettings: Настройки (см. booklib.connection).
+
+    Raises:
+        ValueError: Если файл конфигурации не найден или содержит неверные значения.
+    """
+    return load_settings(args.config, dsn=args.dsn, replicas=args.replica or None,
+                         max_replica_lag=args.max_replica_lag, shards=args.shard or None)
+
+
+def rebalance_shards(args, settings):
+    """Перераспределяет книги с текущих шардов (или основной базы) на шарды из --to.
+
+    Текущие узлы, которых нет в --to, освобождаются: их книги переносятся
+    на новые шарды.
+
+    Args:
+        args (argparse.Namespace): Аргументы команды rebalance.
+        settings (ConnectionSettings): Настройки подключения.
+    """
+    settings = settings.replace(statement_timeout=0, lock_timeout=0)
+    current = list(settings.shards) or [settings.dsn]
+    nodes = list(args.to) + [node for node in current if node not in args.to]
+    try:
+        report = rebalance([functools.partial(connect, settings.replace(dsn=node)) for node in nodes],
+                           len(args.to), args.chunk_size)
+    except Exception as e:
+        print(f"Ошибка перераспределения: {e}")
+        return
+    print(f"Перенесено книг: {report['moved']}")
+    for index, count in enumerate(report['books']):
+        print(f"Шард {index}: книг {count}")
+
+
+def replay_workload(args, settings):
+    """Воспроизводит записанную нагрузку и выводит отчет в JSON.
 
+    Args:
+        args (argparse.Namespace): Аргументы команды replay.
+        settings (ConnectionSettings): Настройки подключения.
+    """
+    try:
+        with open(args.file, encoding='utf-8') as f:
+            events = read_workload(f)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения нагрузки '{args.file}': {e}")
+        return
+
+    commands = LibraryCommands(eager_quotes=args.eager_quotes, pool_size=args.pool_size,
+                               write_behind=args.write_behind, settings=settings)
+    try:
+        report = replay(events, commands, args.concurrency, args.speed)
+    finally:
+        commands.storage.close()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"Отчет записан в '{args.output}': вызовов {report['calls']}, "
+              f"p99 {report['latency']['p99']} мс.")
+    else:
+        print(text)
+
+
+def run_command(args, parser):
+    """Выполняет команду, выбранную в аргументах командной строки.
+
+    Args:
+        args (argparse.Namespace): Разобранные аргументы.
+        parser (argparse.ArgumentParser): Парсер (для вывода справки).
+    """
     # Если нет введенной команды, выводим справочник команд
     if not args.command:
         parser.print_help()
         return
 
+    try:
+        settings = connection_settings(args)
+    except ValueError as e:
+        print(f"Ошибка настроек подключения: {e}")
+        return
+
     # Если введено создание базы, загружаем функцию из create_db.py
     if args.command == 'create-db':
         from create_db import create_database
-        create_database()  # начинаем функцию
+        for shard in settings.shards or [settings.dsn]:  # схема нужна каждому шарду
+            create_database(settings.replace(dsn=shard))
+        return
+
+    if args.command == 'rebalance':
+        rebalance_shards(args, settings)
         return
 
     if args.command == 'check':
+        import psycopg2
         try:
-            import psycopg2
-            conn = psycopg2.connect(
-                database="book_library",
-                user="postgres",
-                password="11111",
-                host="localhost",
-                client_encoding='utf8'
-            )
+            conn = connect(settings)
 
             cur = conn.cursor()
             cur.execute(
                 "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'books')")  # возвращает true или false поиск таблицы книги
             books_table_exists = cur.fetchone()[0]  # t или f
 
-            cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'quotes')")
-            quotes_table_exists = cur.fetchone()[0]
+            # Цитаты после миграции 8: тексты в quote_texts, связи с книгами в book_quotes
+            quote_tables = {}
+            for table in ('quote_texts', 'book_quotes'):
+                cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = %s)", (table,))
+                quote_tables[table] = cur.fetchone()[0]
 
             # Считаем количество книг
             if books_table_exists:
@@ -146,18 +400,50 @@ def main():
             else:
                 books_count = 0
 
+            # Версия схемы (номер последней примененной миграции)
+            cur.execute("SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'schema_migrations')")
+            if cur.fetchone()[0]:
+                cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+                version = cur.fetchone()[0]
+            else:
+                version = 0
+
             cur.close()
             conn.close()
 
+            from create_db import MIGRATIONS
             print(f"Таблица 'books' существует: {'Да' if books_table_exists else 'Нет'}")
-            print(f"Таблица 'quotes' существует: {'Да' if quotes_table_exists else 'Нет'}")
+            for table, exists in quote_tables.items():
+                print(f"Таблица '{table}' существует: {'Да' if exists else 'Нет'}")
             print(f"Книг в базе: {books_count}")
+            print(f"Версия схемы: {version} из {len(MIGRATIONS)}"
+                  f"{'' if version >= len(MIGRATIONS) else ' (запустите create-db для обновления)'}")
 
         except psycopg2.OperationalError as e:
             # Ошибка подключения
             print(f"Ошибка подключения: {e}")
 
-    commands = LibraryCommands()
+    # Применение дельты работает только с файлами, без подключения к БД
+    if args.command == 'apply-delta':
+        from booklib.export import apply_delta
+        count = apply_delta(args.base, args.delta, args.output, args.format)
+        print(f"Дельта применена, книг в '{args.output}': {count}")
+        return
+
+    if args.command == 'replay':
+        replay_workload(args, settings)
+        return
+
+    # Цитаты нужны сразу всех книг только для просмотра цитат и полного экспорта
+    full_export = args.command == 'export' and args.since is None
+    commands = LibraryCommands(eager_quotes=args.command == 'show-quotes' or full_export,
+                               lazy=args.command == 'stats' or (args.command == 'search' and not (args.workers or 0) > 1)
+                               or getattr(args, 'where', None) is not None,
+                               settings=settings)
+    recorder = None
+    if args.record:
+        recorder = WorkloadRecorder(args.record)
+        recorder.attach(commands)
 
     # Обработка команды добавления книги
     if args.command == 'add':
@@ -165,15 +451,20 @@ def main():
 
     # Обработка команды удаления книги
     elif args.command == 'remove':
-        commands.remove_book(args.title, args.author)
+        if args.where is not None:
+            commands.remove_books_where(args.where, args.dry_run)
+        else:
+            commands.remove_book(args.title, args.author)
 
     # Обработка команды списка книг
     elif args.command == 'list':
-        commands.list_books(args.sort_by, args.reverse)
+        commands.list_books(args.sort_by, args.reverse, args.limit)
 
     # Обработка команды поиска
     elif args.command == 'search':
-        commands.search_books(author=args.author, title=args.title, year=args.year, genre=args.genre)
+        commands.search_books(author=_single(args.author), title=args.title, year=_single(args.year),
+                              genre=_single(args.genre), workers=args.workers, pack=args.pack,
+                              year_from=args.year_from, year_to=args.year_to, any_of=args.any_of)
 
     # Обработка команды добавления цитаты
     elif args.command == 'add-quote':
@@ -189,7 +480,26 @@ def main():
 
     # Обработка команды экспорта
     elif args.command == 'export':
-        commands.export_to_csv(args.file)  # используем переданное имя файла
+        if args.since is not None:
+            commands.export_changes(args.file, args.since, args.format)
+        else:
+            commands.export_to_csv(args.file, args.format, args.workers)  # используем переданное имя файла
+
+    # Обработка пакетного выполнения
+    elif args.command == 'batch':
+        commands.run_batch(args.file, args.batch_size, args.on_error, args.output)
+
+    # Обработка команды упаковки
+    elif args.command == 'pack':
+        commands.pack_catalogue(args.file, args.compress)
+
+    # Обработка команды статистики
+    elif args.command == 'stats':
+        commands.show_stats(args.top, args.source)
+
+    # Обработка команды импорта
+    elif args.command == 'import':
+        commands.import_books(args.file, args.format)
 
     # Обработка команды очистки базы данных
     elif args.command == 'clear-db':
@@ -200,11 +510,71 @@ def main():
 
     # Обработка команды редактирования книги
     elif args.command == 'edit':
-        commands.edit_book(
-            args.title, args.author,
-            args.new_title, args.new_author,
-            args.new_year, args.new_genre
-        )
+        if args.where is not None:
+            commands.edit_books_where(args.where, args.new_title, args.new_author, args.new_year,
+                                      args.new_genre, args.dry_run)
+        else:
+            commands.edit_book(
+                args.title, args.author,
+                args.new_title, args.new_author,
+                args.new_year, args.new_genre
+            )
+
+    commands.storage.close()  # останавливаем пул процессов, если он запускался
+    if recorder is not None:
+        recorder.close()
+
+
+def main():
+    """Основная функция обработки командной строки.
+
+    Создает парсер аргументов, определяет все доступные команды и их параметры,
+    затем вызывает соответствующие методы LibraryCommands для выполнения операций.
+    С флагами --stats и --stats-file после выполнения команды выводит метрики.
+
+    Raises:
+        SystemExit: При вызове с флагом --help или при ошибках парсинга аргументов.
+
+    Returns:
+        None: Функция ничего не возвращает, но выводит результаты в консоль.
+    """
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command in ('remove', 'edit'):
+        if args.where is not None and (args.title or args.author):
+            parser.error("--where нельзя сочетать с --title и --author")
+        if args.where is None and args.dry_run:
+            parser.error("--dry-run используется только с --where")
+        if args.command == 'edit' and args.where is None and not (args.title and args.author):
+            parser.error("без --where обязательны --title и --author")
+        if args.command == 'edit' and args.where is not None and all(
+                value is None for value in (args.new_title, args.new_author, args.new_year, args.new_genre)):
+            parser.error("с --where нужно хотя бы одно из --new-title, --new-author, --new-year, --new-genre")
+
+    if args.log_json:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonLogFormatter())
+        booklib_logger = logging.getLogger('booklib')
+        booklib_logger.addHandler(handler)
+        booklib_logger.setLevel(logging.DEBUG)
+
+    if args.stats or args.stats_file or args.log_json:
+        METRICS.enable()
+
+    try:
+        with METRICS.timer(f'command.{args.command}'):
+            run_command(args, parser)
+    finally:
+        if args.stats == 'json':
+            print(json.dumps(METRICS.snapshot(), ensure_ascii=False, indent=2), file=sys.stderr)
+        elif args.stats == 'prometheus':
+            print(METRICS.to_prometheus(), end='', file=sys.stderr)
+        elif args.stats:
+            print(METRICS.format_text(), file=sys.stderr)
+
+        if args.stats_file:
+            with open(args.stats_file, 'w', encoding='utf-8') as f:
+                f.write(METRICS.to_prometheus())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,92 @@
+"""Тесты для модуля batch.py."""
+
+import io
+import json
+import unittest
+
+from booklib.batch import run_batch
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+def ops(*records):
+    return [json.dumps(r, ensure_ascii=False) + '\n' for r in records]
+
+
+class TestBatch(StorageTestCase):
+    """Тесты пакетного выполнения операций."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LibraryStorage()
+
+    def run_ops(self, lines, **kwargs):
+        out = io.StringIO()
+        summary = run_batch(self.storage, lines, out, **kwargs)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[-1], {'summary': summary})
+        return records[:-1], summary
+
+    def titles(self):
+        return sorted(b.title for b in LibraryStorage().books)
+
+    def test_all_commands(self):
+        """Все команды выполняются с аргументами в форме CLI."""
+        records, summary = self.run_ops(ops(
+            {'command': 'add', 'title': 'Чайка', 'author': 'Антон Чехов', 'year': '1896', 'genre': 'Пьеса'},
+            {'command': 'add-quote', 'title': 'Чайка', 'author': 'Чехов', 'quote': 'Я - чайка'},
+            {'command': 'edit', 'title': 'Чайка', 'author': 'Чехов', 'new-genre': 'Комедия'},
+            {'command': 'remove-quote', 'title': 'Война', 'author': 'Толстой', 'quote_index': 0},
+            {'command': 'remove', 'id': 3},
+        ), batch_size=2)
+        self.assertEqual([r['result'] for r in records], ['added', 'added', 'updated', 'removed', 'removed'])
+        self.assertEqual(summary['ok'], 5)
+
+        expected = [("Война и мир", "Роман", ["Цитата 2"]),
+                    ("Мастер и Маргарита", "Роман", ["Рукописи не горят"]),
+                    ("Чайка", "Комедия", ["Я - чайка"])]
+        for storage in (self.storage, LibraryStorage()):
+            self.assertEqual([(b.title, b.genre, b.quotes) for b in storage.books], expected)
+
+    def test_skip(self):
+        """При политике skip откатывается только ошибочная операция."""
+        records, summary = self.run_ops(ops(
+            {'command': 'add', 'title': 'Чайка', 'author': 'Антон Чехов', 'year': 1896, 'genre': 'Пьеса'},
+            {'command': 'add-quote', 'title': 'Нет такой', 'quote': '...'},
+            {'command': 'add', 'title': 'Вишневый сад', 'author': 'Антон Чехов', 'year': 'никогда', 'genre': 'Пьеса'},
+        ) + ['не json\n', '\n'], on_error='skip')
+        self.assertEqual([r['status'] for r in records], ['ok', 'error', 'error', 'error'])
+        self.assertEqual(records[3]['line'], 4)
+        self.assertEqual(summary, {'ok': 1, 'error': 3, 'rolled_back': 0, 'not_run': 0})
+        self.assertIn("Чайка", self.titles())
+
+    def test_stop(self):
+        """При политике stop операции до ошибки фиксируются."""
+        records, summary = self.run_ops(ops(
+            {'command': 'remove', 'title': 'Палата'},
+            {'command': 'edit', 'author': 'о'},  # несколько книг
+            {'command': 'remove', 'title': 'Мастер'},
+        ), on_error='stop')
+        self.assertIn("несколько книг", records[1]['error'])
+        self.assertEqual(summary, {'ok': 1, 'error': 1, 'rolled_back': 0, 'not_run': 1})
+        self.assertEqual(self.titles(), ["Война и мир", "Мастер и Маргарита"])
+
+    def test_rollback(self):
+        """При политике rollback текущая транзакция откатывается, прошлые остаются."""
+        records, summary = self.run_ops(ops(
+            {'command': 'remove', 'title': 'Палата'},
+            {'command': 'remove', 'title': 'Мастер'},
+            {'command': 'add-quote', 'id': 1, 'quote': 'Новая'},
+            {'command': 'remove-quote', 'id': 1, 'quote-index': 10},
+            {'command': 'remove', 'title': 'Война'},
+        ), batch_size=2)
+        self.assertEqual([r['status'] for r in records], ['ok', 'ok', 'rolled_back', 'error'])
+        self.assertEqual(summary, {'ok': 2, 'error': 1, 'rolled_back': 1, 'not_run': 1})
+        self.assertEqual(self.titles(), ["Война и мир"])
+        # Кеш хранилища совпадает с БД после отката
+        self.assertEqual([b.quote_count for b in self.storage.books], [2])
+        self.assertEqual(self.storage.books[0].quotes, ["Цитата 1", "Цитата 2"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Тесты для генератора каталога bench.py и тестовой базы fakedb.py."""
+
+import collections
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from bench import generate_catalogue
+from booklib.models import Book
+from booklib.storage import LibraryStorage
+from fakedb import FakeDatabase
+
+
+class TestGenerateCatalogue(unittest.TestCase):
+    """Тесты генератора синтетического каталога."""
+
+    def test_deterministic(self):
+        """Одно и то же зерно дает один и тот же каталог."""
+        first = [b.to_dict() for b in generate_catalogue(200, seed=7)]
+        second = [b.to_dict() for b in generate_catalogue(200, seed=7)]
+        self.assertEqual(first, second)
+
+    def test_zipf_authors(self):
+        """Самый частый автор встречается намного чаще среднего."""
+        books = generate_catalogue(2000, seed=1)
+        counts = collections.Counter(b.author for b in books)
+        average = len(books) / len(counts)
+        self.assertGreater(counts.most_common(1)[0][1], 5 * average)
+
+
+class TestFakeDatabase(unittest.TestCase):
+    """Тесты работы LibraryStorage поверх FakeDatabase."""
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.addCleanup(self.db.close)
+        self.db.populate([
+            Book("Война и мир", "Лев Толстой", 1869, "Роман", ["Цитата 1", "Цитата 2"]),
+            Book("Мастер и Маргарита", "Михаил Булгаков", 1967, "Роман"),
+        ])
+        patcher = mock.patch.object(LibraryStorage, '_connect', lambda s: self.db.connect())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_load_books(self):
+        """Книги и цитаты загружаются из базы."""
+        storage = LibraryStorage()
+        self.assertEqual(len(storage.books), 2)
+        self.assertEqual(storage.books[0].quotes, ["Цитата 1", "Цитата 2"])
+        self.assertEqual(storage.books[1].id, 2)
+
+    def test_add_and_remove_book(self):
+        """Добавленная и удаленная книга отражается в новой загрузке."""
+        storage = LibraryStorage()
+        book = Book("Идиот", "Фёдор Достоевский", 1869, "Роман", ["Красота спасет мир"])
+        storage.add_book(book)
+        self.assertEqual(len(LibraryStorage().books), 3)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            storage.remove_book(1)
+        reloaded = LibraryStorage().books
+        self.assertEqual([b.title for b in reloaded], ["Мастер и Маргарита", "Идиот"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""Тесты для модуля cache.py."""
+
+import threading
+import unittest
+from unittest import mock
+
+from booklib.cache import QueryCache, normalize_query
+from booklib.filters import BookFilter
+from booklib.models import Book
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+class TestQueryCache(unittest.TestCase):
+    """Тесты класса QueryCache."""
+
+    def setUp(self):
+        self.books = [Book("Война и мир", "Лев Толстой", 1869, "Роман"),
+                      Book("Анна Каренина", "Лев Толстой", 1877, "Роман")]
+        self.cache = QueryCache()
+        self.cache.invalidate(self.books)
+
+    def test_normalize_query(self):
+        """Регистр, порядок и пустые критерии не влияют на ключ."""
+        self.assertEqual(normalize_query({'author': 'Толстой', 'title': None, 'year': 1869}),
+                         normalize_query({'year': 1869, 'author': 'толстой'}))
+
+    def test_hit_and_miss(self):
+        """Повторный запрос берется из кеша, результат - копия."""
+        key = self.cache.key(self.books, 'search', normalize_query({'author': 'Толстой'}))
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, self.books)
+        result = self.cache.get(key)
+        self.assertEqual(result, self.books)
+        result.clear()
+        self.assertEqual(self.cache.get(key), self.books)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_invalidate_drops_stale_results(self):
+        """Результат, посчитанный до изменения книг, не сохраняется."""
+        key = self.cache.key(self.books, 'sort', 'title', False, None)
+        self.cache.invalidate()
+        self.cache.put(key, self.books)
+        self.assertIsNone(self.cache.get(self.cache.key(self.books, 'sort', 'title', False, None)))
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не использованная запись."""
+        cache = QueryCache(max_entries=2)
+        cache.invalidate(self.books)
+        keys = [cache.key(self.books, 'sort', field, False, None)
+                for field in ('title', 'author', 'year')]
+        cache.put(keys[0], self.books)
+        cache.put(keys[1], self.books)
+        cache.get(keys[0])
+        cache.put(keys[2], self.books)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_ttl(self):
+        """Запись с истекшим сроком жизни не используется."""
+        cache = QueryCache(ttl=10)
+        cache.invalidate(self.books)
+        key = cache.key(self.books, 'sort', 'title', False, None)
+        with mock.patch('booklib.cache.time.monotonic', return_value=100.0):
+            cache.put(key, self.books)
+        with mock.patch('booklib.cache.time.monotonic', return_value=105.0):
+            self.assertIsNotNone(cache.get(key))
+        with mock.patch('booklib.cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get(key))
+
+    def test_memory_bound(self):
+        """Записи вытесняются при превышении ограничения памяти."""
+        cache = QueryCache(max_bytes=2000)
+        cache.invalidate(self.books)
+        for i in range(10):
+            cache.put(cache.key(self.books, 'search', i), self.books * 10)
+        self.assertLessEqual(cache.stats()['bytes'], 2000)
+        self.assertGreater(cache.stats()['evictions'], 0)
+
+    def test_concurrent_access(self):
+        """Кеш можно использовать из нескольких потоков одновременно."""
+        book_filter = BookFilter(cache=self.cache)
+        errors = []
+
+        def worker():
+            try:
+                for i in range(200):
+                    result = book_filter.search_books(self.books, author='толстой')
+                    if len(result) != 2:
+                        errors.append(result)
+                    if i % 50 == 0:
+                        self.cache.invalidate()
+            except Exception as e:  # pragma: no cover - ошибка попадет в assert
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_other_list_not_cached(self):
+        """Запросы к другому списку книг в кеш не попадают."""
+        self.assertIsNone(self.cache.key(list(self.books), 'sort', 'title', False, None))
+
+
+class TestStorageQueryCache(StorageTestCase):
+    """Тесты инвалидации кеша запросов хранилищем."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LibraryStorage()
+        self.filter = BookFilter(cache=self.storage.query_cache)
+
+    def search(self, **criteria):
+        return [b.title for b in self.filter.search_books(self.storage.books, **criteria)]
+
+    def test_add_book_invalidates(self):
+        """Добавленная книга видна в повторном поиске."""
+        self.assertEqual(self.search(author='Толстой'), ["Война и мир"])
+        self.storage.add_book(Book("Анна Каренина", "Лев Толстой", 1877, "Роман"))
+        self.assertEqual(self.search(author='Толстой'), ["Война и мир", "Анна Каренина"])
+
+    def test_remove_and_update_invalidate(self):
+        """Удаление и изменение книг сбрасывают кеш."""
+        self.assertEqual(len(self.search(genre='роман')), 2)
+        war = self.storage.books[0]
+        self.storage.remove_book(war.id)
+        self.assertEqual(self.search(genre='роман'), ["Мастер и Маргарита"])
+
+        chekhov = self.storage.books[1]
+        self.storage.update_book(chekhov, Book(chekhov.title, chekhov.author, 1892, "Роман"))
+        self.assertEqual(len(self.search(genre='роман')), 2)
+
+    def test_reindex_invalidates_sort(self):
+        """Изменение полей книги на месте сбрасывает кеш сортировки."""
+        first = self.filter.sort_books(self.storage.books, 'title')[0]
+        self.assertEqual(first.title, "Война и мир")
+        first.title = "Яма"
+        self.storage.reindex_book(first)
+        self.assertEqual(self.filter.sort_books(self.storage.books, 'title')[-1].title, "Яма")
+
+    def test_quotes_keep_cache(self):
+        """Добавление цитаты не сбрасывает кеш запросов."""
+        self.search(author='Толстой')
+        generation = self.storage.query_cache.generation
+        self.storage.add_quote_to_book(self.storage.books[0].id, "Новая цитата")
+        self.assertEqual(self.storage.query_cache.generation, generation)
+        self.search(author='Толстой')
+        self.assertEqual(self.storage.query_cache.stats()['hits'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Тесты для модуля connection.py (настройки и фабрика подключений)."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import psycopg2
+
+from booklib.connection import ConnectionSettings, connect, load_settings
+
+
+class TestLoadSettings(unittest.TestCase):
+    """Тесты чтения настроек из файла, окружения и параметров."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.ini')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write("[database]\nhost = db1\nport = 6432\nstatement_timeout = 15\n"
+                    "replicas = host=db2; host=db3\nunknown = 1\n")
+        self.addCleanup(os.remove, self.path)
+
+    def test_precedence(self):
+        """Параметры важнее окружения, окружение - файла, файл - значений по умолчанию."""
+        settings = load_settings(self.path, environ={'BOOKLIB_PORT': '7432', 'BOOKLIB_USER': 'reader'},
+                                 user='admin', dsn=None)
+        self.assertEqual((settings.host, settings.port, settings.user), ('db1', 7432, 'admin'))
+        self.assertEqual(settings.statement_timeout, 15.0)
+        self.assertEqual(settings.replicas, ('host=db2', 'host=db3'))
+        self.assertEqual(settings.dbname, 'book_library')
+
+        settings = load_settings(environ={'BOOKLIB_CONFIG': self.path})
+        self.assertEqual(settings.host, 'db1')
+
+    def test_errors(self):
+        """Неверное значение, отсутствующий файл и неизвестный параметр - ошибки."""
+        with self.assertRaises(ValueError):
+            load_settings(environ={'BOOKLIB_PORT': 'пять'})
+        with self.assertRaises(ValueError):
+            load_settings(self.path + '.missing', environ={})
+        with self.assertRaises(TypeError):
+            ConnectionSettings(hots='db1')
+
+    def test_connect_kwargs(self):
+        """Тайм-ауты и keepalive передаются каждому подключению."""
+        kwargs = ConnectionSettings(statement_timeout=2.5, idle_timeout=0).connect_kwargs()
+        self.assertIn('-c statement_timeout=2500', kwargs['options'])
+        self.assertIn('-c idle_in_transaction_session_timeout=0', kwargs['options'])
+        self.assertEqual((kwargs['connect_timeout'], kwargs['keepalives']), (5, 1))
+        self.assertEqual(kwargs['dbname'], 'book_library')
+
+        settings = ConnectionSettings(dsn="host=db9 dbname=library password=secret")
+        kwargs = settings.connect_kwargs(dbname='postgres')
+        self.assertEqual((kwargs['dsn'], kwargs['dbname']), (settings.dsn, 'postgres'))
+        self.assertNotIn('host', kwargs)
+        self.assertEqual(settings.database(), 'library')
+        self.assertNotIn('secret', repr(settings))
+
+
+class TestConnect(unittest.TestCase):
+    """Тесты повтора подключения при временных ошибках."""
+
+    def setUp(self):
+        patcher = mock.patch('booklib.connection.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_with_backoff(self):
+        """Временная ошибка повторяется с растущей паузой."""
+        refused = psycopg2.OperationalError("could not connect to server: Connection refused")
+        with mock.patch('psycopg2.connect', side_effect=[refused, refused, 'conn']) as pg_connect:
+            self.assertEqual(connect(ConnectionSettings(retry_backoff=1.0)), 'conn')
+        self.assertEqual(pg_connect.call_count, 3)
+        first, second = (call.args[0] for call in self.sleep.call_args_list)
+        self.assertTrue(0.5 <= first <= 1.0 and 1.0 <= second <= 2.0)
+
+    def test_give_up(self):
+        """Постоянная ошибка не повторяется, временная - не больше retries раз."""
+        denied = psycopg2.OperationalError('password authentication failed for user "postgres"')
+        with mock.patch('psycopg2.connect', side_effect=denied) as pg_connect:
+            with self.assertRaises(psycopg2.OperationalError):
+                connect(ConnectionSettings())
+        self.assertEqual(pg_connect.call_count, 1)
+
+        with mock.patch('psycopg2.connect', side_effect=psycopg2.OperationalError("timeout")) as pg_connect:
+            with self.assertRaises(psycopg2.OperationalError):
+                connect(ConnectionSettings(retries=2))
+        self.assertEqual(pg_connect.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
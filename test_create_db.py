@@ -0,0 +1,169 @@
+"""Тесты миграций схемы из create_db.py (поверх тестовой базы fakedb)."""
+
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from create_db import MIGRATIONS, MigrationError, migrate, schema_version
+from fakedb import FakeConnection, FakeDatabase
+
+
+class TestMigrations(unittest.TestCase):
+    """Тесты версионированных миграций."""
+
+    def legacy_database(self, books):
+        """Создает базу в старой схеме (без schema_migrations) с книгами."""
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        for suffix in ('', '-wal', '-shm'):
+            self.addCleanup(lambda p=path + suffix: os.path.exists(p) and os.remove(p))
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE books (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, "
+                     "author TEXT NOT NULL, year INTEGER NOT NULL, genre TEXT NOT NULL)")
+        conn.execute("CREATE TABLE quotes (id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER NOT NULL, "
+                     "quote TEXT NOT NULL, FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE)")
+        conn.executemany("INSERT INTO books (title, author, year, genre) VALUES (?, ?, ?, ?)", books)
+        conn.commit()
+        conn.close()
+        return path
+
+    def indexes(self, db):
+        conn = db.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%'")
+        names = {row[0] for row in cur.fetchall()}
+        conn.close()
+        return names
+
+    def test_fresh_database(self):
+        """Новая база получает все миграции, индексы и уникальный ключ."""
+        db = FakeDatabase()
+        self.addCleanup(db.close)
+        conn = db.connect()
+        self.assertEqual(schema_version(conn.cursor()), {m[0] for m in MIGRATIONS})
+        conn.close()
+        self.assertIn('idx_book_quotes_hash', self.indexes(db))
+        self.assertIn('uq_books_natural_key', self.indexes(db))
+        self.assertIn('uq_book_quotes_book_hash', self.indexes(db))
+
+    def test_idempotent(self):
+        """Повторный запуск на актуальной базе ничего не делает."""
+        db = FakeDatabase()
+        self.addCleanup(db.close)
+        conn = db.connect()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(migrate(conn), [])
+        conn.close()
+        self.assertIn("актуальна", out.getvalue())
+
+    def test_upgrade_existing_database(self):
+        """Старая база обновляется без потери данных, с отчетом о времени."""
+        path = self.legacy_database([("Война и мир", "Лев Толстой", 1869, "Роман")])
+        db = FakeDatabase(path)  # применяет миграции к существующим таблицам
+        conn = db.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT title, updated_at FROM books")
+        self.assertEqual(cur.fetchall(), [("Война и мир", '1970-01-01 00:00:00')])
+        cur.execute("SELECT version, duration_ms FROM schema_migrations ORDER BY version")
+        rows = cur.fetchall()
+        self.assertEqual([r[0] for r in rows], [m[0] for m in MIGRATIONS])
+        self.assertTrue(all(r[1] >= 0 for r in rows))
+        conn.close()
+
+    def test_duplicates_block_unique_key(self):
+        """Повторы книг не дают построить уникальный ключ, остальное применяется."""
+        path = self.legacy_database([("Война и мир", "Лев Толстой", 1869, "Роман")] * 2)
+        with self.assertRaises(MigrationError):
+            FakeDatabase(path)
+
+        conn = FakeConnection(path)
+        cur = conn.cursor()
+        self.assertEqual(schema_version(cur), {1, 2, 3, 4})
+        cur.execute("DELETE FROM books WHERE id = 2")
+        conn.commit()
+        report = migrate(conn, verbose=False)
+        self.assertEqual([r[0] for r in report], [5, 6, 7, 8, 9, 10, 11])
+        conn.close()
+
+    def test_natural_key_backfill(self):
+        """Ключи заполняются для старых книг; повторы цитат останавливают миграцию, а не удаляются."""
+        path = self.legacy_database([("Война и мир", "Лев Толстой", 1869, "Роман"),
+                                     ("Анна Каренина", "Лев Толстой", 1877, "Роман")])
+        conn = sqlite3.connect(path)
+        conn.executemany("INSERT INTO quotes (book_id, quote) VALUES (?, ?)",
+                         [(1, "Цитата"), (1, "Цитата"), (2, "Цитата")])
+        conn.commit()
+        conn.close()
+        with self.assertRaisesRegex(MigrationError, r"id: 2 \(повтор 1\)"):
+            FakeDatabase(path)
+
+        conn = sqlite3.connect(path)
+        conn.execute("DELETE FROM quotes WHERE id = 2")
+        conn.commit()
+        conn.close()
+        db = FakeDatabase(path)
+        conn = db.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT natural_key FROM books ORDER BY id")
+        self.assertEqual(cur.fetchone()[0], "война и мир\x1fлев толстой\x1f1869")
+        cur.execute("SELECT book_id FROM book_quotes ORDER BY id")
+        self.assertEqual(cur.fetchall(), [(1,), (2,)])
+        cur.execute("SELECT COUNT(*) FROM quote_texts")
+        self.assertEqual(cur.fetchone()[0], 1)  # текст общий для обеих книг
+        conn.close()
+
+    def test_dimensions_backfill(self):
+        """Варианты написания автора получают один id, имя - самое частое."""
+        path = self.legacy_database([("Война и мир", "Лев Толстой", 1869, "Роман"),
+                                     ("Анна Каренина", "Лев Толстой", 1877, "роман"),
+                                     ("Воскресение", "лев  толстой", 1899, "Роман"),
+                                     ("Идиот", "Федор Достоевский", 1869, "Роман")])
+        db = FakeDatabase(path)
+        conn = db.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT author_id, genre_id FROM books ORDER BY id")
+        rows = cur.fetchall()
+        self.assertEqual(len({r[0] for r in rows[:3]}), 1)
+        self.assertNotEqual(rows[3][0], rows[0][0])
+        self.assertEqual(len({r[1] for r in rows}), 1)
+        cur.execute("SELECT name FROM authors WHERE id = %s", (rows[0][0],))
+        self.assertEqual(cur.fetchone()[0], "Лев Толстой")
+        self.assertIn('idx_books_author_id', self.indexes(db))
+        conn.close()
+
+    def test_partition_book_quotes(self):
+        """Перенос book_quotes в секционированную таблицу сохраняет id и порядок цитат."""
+        path = self.legacy_database([("Война и мир", "Лев Толстой", 1869, "Роман"),
+                                     ("Анна Каренина", "Лев Толстой", 1877, "Роман")])
+        conn = sqlite3.connect(path)
+        conn.executemany("INSERT INTO quotes (book_id, quote) VALUES (?, ?)",
+                         [(2, "Первая"), (1, "Вторая"), (2, "Третья")])
+        conn.commit()
+        conn.close()
+
+        conn = FakeConnection(path)
+        self.assertEqual([r[0] for r in migrate(conn, verbose=False, target=9)], list(range(1, 10)))
+        cur = conn.cursor()
+        cur.execute("SELECT id, book_id, quote_hash FROM book_quotes ORDER BY id")
+        before = cur.fetchall()
+        self.assertEqual([r[0] for r in migrate(conn, verbose=False)], [10, 11])
+        cur.execute("SELECT id, book_id, quote_hash FROM book_quotes ORDER BY id")
+        self.assertEqual(cur.fetchall(), before)
+        cur.execute("INSERT INTO book_quotes (book_id, quote_hash) VALUES (1, %s) RETURNING id", (before[0][2],))
+        self.assertEqual(cur.fetchone()[0], before[-1][0] + 1)
+        conn.close()
+
+    def test_case_variants_block_natural_key(self):
+        """Книги, различающиеся только регистром, не объединяются молча."""
+        path = self.legacy_database([("Война и мир", "Лев Толстой", 1869, "Роман"),
+                                     ("ВОЙНА И МИР", "лев толстой", 1869, "Роман")])
+        with self.assertRaises(MigrationError):
+            FakeDatabase(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
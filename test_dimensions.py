@@ -0,0 +1,111 @@
+"""Тесты для модуля dimensions.py (справочники авторов и жанров)."""
+
+import unittest
+
+from booklib.dimensions import Dimensions
+from booklib.filters import BookFilter
+from booklib.models import Book
+from booklib.query import compile_query
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+def titles(books):
+    return [b.title for b in books]
+
+
+class TestDimensions(unittest.TestCase):
+    """Тесты переписывания условий на идентификаторы."""
+
+    def setUp(self):
+        self.books = []
+        for i, (author, genre) in enumerate([("Лев Толстой", "Роман"), ("лев  толстой", "Роман"),
+                                             ("Антон Чехов", "Повесть")]):
+            book = Book(f"Книга {i}", author, 1900 + i, genre)
+            book.author_id = 1 if i < 2 else 2
+            book.genre_id = 10 if genre == "Роман" else 11
+            self.books.append(book)
+        self.dimensions = Dimensions()
+        self.dimensions.reset(self.books)
+
+    def test_rewrite(self):
+        """Подстрока автора и жанра заменяется множеством идентификаторов."""
+        self.assertEqual(self.dimensions.rewrite({'author': 'Чехов', 'not_genre': 'роман', 'year': 1902}),
+                         {'author_id': frozenset({2}), 'not_genre_id': frozenset({10}), 'year': 1902})
+        self.assertEqual(self.dimensions.rewrite({'any_of': [{'author': 'толстой'}, {'title': 'Книга'}]}),
+                         {'any_of': [{'author_id': frozenset({1})}, {'title': 'Книга'}]})
+
+    def test_mixed_variants_not_rewritten(self):
+        """Если подстроку содержит только часть написаний автора, условие остается строковым."""
+        self.assertIsNone(self.dimensions.rewrite({'author': 'лев толстой'}))
+
+    def test_covers(self):
+        """Поиск по идентификаторам только для своего списка и книг с известными id."""
+        self.assertTrue(self.dimensions.covers(self.books))
+        self.assertFalse(self.dimensions.covers(list(self.books)))
+        self.dimensions.add(Book("Без справочника", "Автор", 2000, "Роман"))
+        self.assertFalse(self.dimensions.covers(self.books))
+
+    def test_same_results(self):
+        """Поиск со справочниками находит те же книги, что и по строкам."""
+        with_ids = BookFilter(dimensions=self.dimensions)
+        for criteria in ({'author': 'толстой'}, {'author': 'лев толстой'}, {'not_author': 'чехов'},
+                         {'genre': 'ман', 'year_from': 1901}, {'author': 'нет такого'}):
+            with self.subTest(criteria=criteria):
+                self.assertEqual(titles(with_ids.search_books(self.books, **criteria)),
+                                 titles(BookFilter().search_books(self.books, **criteria)))
+
+    def test_id_criteria(self):
+        """Идентификатор можно указать числом или множеством."""
+        self.assertEqual(titles(compile_query({'author_id': 2}).execute(self.books)), ["Книга 2"])
+        plan = compile_query({'not_genre_id': {11}})
+        self.assertEqual(titles(plan.execute(self.books)), ["Книга 0", "Книга 1"])
+        self.assertEqual(plan.explain(), 'NOT genre_id IN (?)')
+
+
+class TestStorageDimensions(StorageTestCase):
+    """Тесты идентификаторов справочников в хранилище."""
+
+    def test_loaded_ids(self):
+        """Книги из БД получают author_id и genre_id, одинаковые для одного жанра."""
+        storage = LibraryStorage()
+        self.assertTrue(storage.dimensions.covers(storage.books))
+        genre_ids = [b.genre_id for b in storage.books]
+        self.assertEqual(genre_ids[0], genre_ids[1])
+        self.assertNotEqual(genre_ids[0], genre_ids[2])
+
+    def test_variant_reuses_id(self):
+        """Вариант написания известного автора не создает новую запись справочника."""
+        storage = LibraryStorage()
+        tolstoy = storage.books[0].author_id
+        storage.add_book(Book("Анна Каренина", "лев ТОЛСТОЙ", 1877, "Роман"))
+        storage.add_book(Book("Дама с собачкой", "Новый Автор", 1899, "Рассказ"))
+        self.assertEqual(storage.books[3].author_id, tolstoy)
+        self.assertNotIn(storage.books[4].author_id, {b.author_id for b in storage.books[:4]})
+
+        conn = self.db.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM authors")
+        self.assertEqual(cur.fetchone()[0], 4)
+        cur.execute("SELECT author_id, genre_id FROM books ORDER BY id")
+        self.assertEqual(cur.fetchall(), [(b.author_id, b.genre_id) for b in storage.books])
+        conn.close()
+
+        # Новый список после перезагрузки дает те же идентификаторы
+        reloaded = LibraryStorage()
+        self.assertEqual([b.author_id for b in reloaded.books], [b.author_id for b in storage.books])
+
+    def test_update_and_search(self):
+        """После изменения автора поиск по справочнику находит книгу по новому имени."""
+        storage = LibraryStorage()
+        book_filter = BookFilter(dimensions=storage.dimensions)
+        book = storage.books[2]
+        storage.update_book(book, Book(book.title, "Лев Толстой", book.year, "Роман"))
+        self.assertTrue(storage.dimensions.covers(storage.books))
+        self.assertEqual(titles(book_filter.search_books(storage.books, author='толстой')),
+                         ["Война и мир", "Палата №6"])
+        self.assertEqual(storage.books[2].genre_id, storage.books[0].genre_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
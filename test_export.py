@@ -0,0 +1,140 @@
+"""Тесты для модуля export.py (инкрементальный экспорт)."""
+
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from booklib.export import IncrementalExport, apply_delta, format_watermark
+from booklib.models import Book
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))
+
+
+class TestIncrementalExport(StorageTestCase):
+    """Тесты экспорта изменений, применения дельт и возобновления."""
+
+    def setUp(self):
+        super().setUp()
+        self.storage = LibraryStorage()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def test_format_watermark(self):
+        """Отметки времени из разных источников приводятся к одной строке."""
+        self.assertIsNone(format_watermark('0'))
+        self.assertEqual(format_watermark('2026-01-02 03:04:05'), '2026-01-02 03:04:05.000000')
+        with self.assertRaises(ValueError):
+            format_watermark('вчера')
+
+    def test_delta_contains_only_changes(self):
+        """Дельта содержит измененные книги и удаления, но не весь каталог."""
+        base = self.storage.export_changes(self.path('base.csv'))
+        rows = read_csv(self.path('base.csv'))
+        self.assertEqual(rows[0], ['op', 'id', 'title', 'author', 'year', 'genre', 'quotes'])
+        self.assertEqual([r[1] for r in rows[1:]], ['1', '2', '3'])
+
+        self.storage.add_quote_to_book(2, "Никогда ничего не просите")
+        self.storage.remove_book(3)
+        self.storage.add_book(Book("Анна Каренина", "Лев Толстой", 1877, "Роман", ["Все счастливые семьи"]))
+
+        delta = self.storage.export_changes(self.path('delta.csv'), since=base.watermark)
+        rows = read_csv(self.path('delta.csv'))[1:]
+        self.assertEqual([(r[0], r[1]) for r in rows], [('upsert', '2'), ('upsert', '4'), ('delete', '3')])
+        self.assertEqual(rows[0][6], "Рукописи не горят|Никогда ничего не просите")
+        self.assertGreater(delta.watermark, base.watermark)
+
+        # Изменения моложе WATERMARK_MARGIN повторяются в следующей дельте
+        self.storage.export_changes(self.path('again.csv'), since=delta.watermark)
+        self.assertEqual(len(read_csv(self.path('again.csv'))), 4)
+        with mock.patch('booklib.export.WATERMARK_MARGIN', 0):
+            last = self.storage.export_changes(self.path('last.csv'), since=delta.watermark)
+            self.storage.export_changes(self.path('empty.csv'), since=last.watermark)
+        self.assertEqual(len(read_csv(self.path('empty.csv'))), 1)
+
+    def test_late_commit_not_lost(self):
+        """Изменение с ранней отметкой, зафиксированное после экспорта, попадает в следующую дельту."""
+        def at(time):
+            return mock.patch('fakedb.utc_now', return_value=f'2026-10-19 {time}.000000')
+
+        with at('11:00:00'):
+            base = self.storage.export_changes(self.path('base.csv'))
+        with at('12:00:05'):
+            self.storage.add_quote_to_book(2, "Вторая транзакция")
+        with at('12:00:10'):
+            delta = self.storage.export_changes(self.path('delta.csv'), since=base.watermark)
+        self.assertEqual(delta.watermark, '2026-10-19 11:50:10.000000')
+        # Транзакция, начатая раньше, отметила книгу в 12:00:00 и зафиксирована только сейчас
+        with at('12:00:00'):
+            self.storage.add_quote_to_book(1, "Первая транзакция")
+        with at('12:30:00'):
+            self.storage.export_changes(self.path('next.csv'), since=delta.watermark)
+        self.assertEqual([r[1] for r in read_csv(self.path('next.csv'))[1:]], ['1', '2'])
+
+    def test_apply_delta_matches_full_export(self):
+        """База с примененной дельтой совпадает с новым полным экспортом."""
+        for fmt in ('csv', 'jsonl'):
+            with self.subTest(fmt=fmt):
+                base = self.storage.export_changes(self.path(f'base.{fmt}'), fmt=fmt)
+                book = self.storage.books[0]
+                self.storage.update_book(book, Book("Война и мир (т. 1)", book.author, 1869, "Роман"))
+                self.storage.remove_book(self.storage.books[1].id)
+                self.storage.add_book(Book(f"Новая {fmt}", "Автор", 2000, "Роман"))
+
+                self.storage.export_changes(self.path(f'delta.{fmt}'), since=base.watermark, fmt=fmt)
+                apply_delta(self.path(f'base.{fmt}'), self.path(f'delta.{fmt}'),
+                            self.path(f'merged.{fmt}'), fmt)
+                self.storage.export_changes(self.path(f'full.{fmt}'), fmt=fmt)
+                with open(self.path(f'merged.{fmt}'), encoding='utf-8') as merged, \
+                        open(self.path(f'full.{fmt}'), encoding='utf-8') as full:
+                    self.assertEqual(merged.read(), full.read())
+
+    def test_jsonl_records(self):
+        """JSONL содержит операцию, id и поля книги."""
+        self.storage.export_changes(self.path('base.jsonl'), fmt='jsonl')
+        with open(self.path('base.jsonl'), encoding='utf-8') as f:
+            first = json.loads(f.readline())
+        self.assertEqual(first['op'], 'upsert')
+        self.assertEqual(first['quotes'], ["Цитата 1", "Цитата 2"])
+
+    def test_resume_after_interruption(self):
+        """Прерванный экспорт продолжается с последней контрольной точки."""
+        for i in range(10):
+            self.storage.add_book(Book(f"Книга {i}", "Автор", 2000 + i, "Роман", [f"Цитата {i}"]))
+        IncrementalExport(self.storage, self.path('expected.csv'), chunk_size=2).run()
+
+        original = IncrementalExport._commit_chunk
+        calls = []
+
+        def interrupt(export, f, state):
+            original(export, f, state)
+            calls.append(state['last_id'])
+            if len(calls) == 3:
+                f.write("upsert,999,недописанная строка\n")  # часть после контрольной точки
+                raise KeyboardInterrupt
+
+        with mock.patch.object(IncrementalExport, '_commit_chunk', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                IncrementalExport(self.storage, self.path('export.csv'), chunk_size=2).run()
+        self.assertTrue(os.path.exists(self.path('export.csv.checkpoint')))
+
+        export = IncrementalExport(self.storage, self.path('export.csv'), chunk_size=2)
+        export.run()
+        self.assertTrue(export.resumed)
+        self.assertFalse(os.path.exists(self.path('export.csv.checkpoint')))
+        self.assertEqual(read_csv(self.path('export.csv')), read_csv(self.path('expected.csv')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,7 @@
 
 import unittest
 from booklib.models import Book
-from booklib.filters import BookFilter
+from booklib.filters import BookFilter, SortIndex, YearIndex, collation_key
 
 class TestBookFilter(unittest.TestCase):
     """Тесты для класса BookFilter."""
@@ -48,6 +48,54 @@ class TestBookFilter(unittest.TestCase):
         authors = [b.author for b in sorted_books]
         self.assertEqual(authors[0], "Лев Толстой")
 
+    def test_sort_cyrillic_yo(self):
+        """Буква 'ё' сортируется рядом с 'е', а не после 'я'."""
+        names = ["Яковлев", "Ёлкин", "Ершов", "ёжиков", "Евдокимов"]
+        self.assertEqual(sorted(names, key=collation_key),
+                         ["Евдокимов", "ёжиков", "Ёлкин", "Ершов", "Яковлев"])
+
+    def test_sort_with_limit(self):
+        """Первые k книг совпадают с началом полной сортировки."""
+        for reverse in (False, True):
+            full = self.filter.sort_books(self.books, sort_by='year', reverse=reverse)
+            top = self.filter.sort_books(self.books, sort_by='year', reverse=reverse, limit=2)
+            self.assertEqual(top, full[:2])
+
+    def test_sort_index_incremental(self):
+        """Индекс после добавления и удаления книг совпадает с полной сортировкой."""
+        index = SortIndex(self.books)
+        indexed = BookFilter(index=index)
+        self.assertEqual(indexed.sort_books(self.books, 'author'),
+                         self.filter.sort_books(self.books, 'author'))
+
+        extra = Book("Ёлка", "Антон Чехов", 1869, "Рассказ")
+        self.books.append(extra)
+        index.add(extra)
+        index.remove(self.books[0])
+        del self.books[0]
+
+        for field in ('title', 'author', 'year', 'genre'):
+            for reverse in (False, True):
+                self.assertEqual(indexed.sort_books(self.books, field, reverse),
+                                 self.filter.sort_books(self.books, field, reverse))
+        self.assertEqual(indexed.sort_books(self.books, 'year', True, limit=1),
+                         self.filter.sort_books(self.books, 'year', True)[:1])
+
+    def test_year_index(self):
+        """Индекс лет отбирает книги диапазона в порядке каталога."""
+        books = [Book(f"Книга {year}", "Автор", year, "Роман") for year in range(2000, 1900, -1)]
+        years = YearIndex(build_after=1)
+        self.assertIsNone(years.candidates(books, {'year_from': 1950, 'year_to': 1952}))  # еще не построен
+        found = years.candidates(books, {'year_from': 1950, 'year_to': 1952})
+        self.assertEqual([b.year for b in found], [1952, 1951, 1950])
+        self.assertEqual([b.year for b in years.candidates(books, {'year': [1901, 1999]})], [1999, 1901])
+        self.assertIsNone(years.candidates(books, {'year_from': 1910}))  # почти весь каталог
+        self.assertIsNone(years.candidates(books, {'author': "Автор"}))
+
+        indexed = BookFilter(years=years)
+        criteria = {'year': [1930, 1931, 1990], 'title': "3"}
+        self.assertEqual(indexed.search_books(books, **criteria), self.filter.search_books(books, **criteria))
+
     def test_assert_raises_in_filters(self):
         """Демонстрация assertRaises в контексте фильтров."""
         def validate_search_params(author):
@@ -0,0 +1,76 @@
+"""Тесты для модуля metrics.py."""
+
+import unittest
+from unittest import mock
+
+from booklib.filters import BookFilter
+from booklib.metrics import Metrics, METRICS
+from booklib.models import Book
+from booklib.storage import LibraryStorage
+from fakedb import FakeDatabase
+
+
+class TestMetrics(unittest.TestCase):
+    """Тесты для реестра метрик."""
+
+    def test_disabled_collects_nothing(self):
+        """Выключенный реестр ничего не накапливает."""
+        metrics = Metrics()
+        metrics.incr('db.queries')
+        with metrics.timer('op'):
+            pass
+        self.assertEqual(metrics.snapshot(), {'timers': {}, 'counters': {}})
+
+    def test_timed_and_prometheus(self):
+        """Декоратор замеряет вызовы, а метрики выводятся в формате Prometheus."""
+        metrics = Metrics()
+        metrics.enable()
+
+        @metrics.timed('filter.search_books')
+        def search():
+            return 42
+
+        self.assertEqual(search(), 42)
+        search()
+        metrics.incr('db.queries', 3)
+
+        self.assertEqual(metrics.snapshot()['timers']['filter.search_books']['count'], 2)
+        text = metrics.to_prometheus()
+        self.assertIn('booklib_operation_seconds_count{op="filter.search_books"} 2', text)
+        self.assertIn('booklib_db_queries_total 3', text)
+
+
+class TestStorageInstrumentation(unittest.TestCase):
+    """Тесты счетчиков запросов LibraryStorage."""
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.addCleanup(self.db.close)
+        self.db.populate([
+            Book("Война и мир", "Лев Толстой", 1869, "Роман", ["Цитата"]),
+            Book("Мастер и Маргарита", "Михаил Булгаков", 1967, "Роман"),
+        ])
+        patcher = mock.patch.object(LibraryStorage, '_connect', lambda s: self.db.connect())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        METRICS.reset()
+        METRICS.enable()
+        self.addCleanup(METRICS.enable, False)
+        self.addCleanup(METRICS.reset)
+
+    def test_load_books_counters(self):
+        """Загрузка каталога учитывает подключения, запросы и строки."""
+        storage = LibraryStorage()
+        BookFilter().search_books(storage.get_all_books(), author="Толстой")
+
+        data = METRICS.snapshot()
+        self.assertEqual(data['counters']['db.connections'], 1)
+        self.assertEqual(data['counters']['db.queries'], 2)  # книги и количество цитат
+        self.assertEqual(data['counters']['db.rows_fetched'], 3)
+        self.assertEqual(data['counters']['cache.hits'], 1)
+        self.assertIn('storage.load_books', data['timers'])
+        self.assertIn('filter.search_books', data['timers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Тесты для модулей columnar.py и parallel.py."""
+
+import os
+import tempfile
+import unittest
+
+from bench import generate_catalogue
+from booklib.columnar import ColumnarCatalogue, encode_catalogue, open_catalogue, save_catalogue
+from booklib.filters import BookFilter
+from booklib.parallel import ParallelCatalogue
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+class TestColumnarCatalogue(unittest.TestCase):
+    """Тесты колоночного буфера."""
+
+    def test_roundtrip(self):
+        """Значения столбцов читаются из буфера без изменений."""
+        books = generate_catalogue(50, seed=3)
+        for i, book in enumerate(books):
+            book.id = i + 10
+        catalogue = ColumnarCatalogue(encode_catalogue(books))
+
+        self.assertEqual(len(catalogue), 50)
+        self.assertEqual(catalogue.column('author'), [b.author for b in books])
+        self.assertEqual(catalogue.column('title', 5, 8), [b.title for b in books[5:8]])
+        self.assertEqual(catalogue.value('genre', 7), books[7].genre)
+        self.assertEqual(list(catalogue.years), [b.year for b in books])
+        self.assertEqual(catalogue.ids[3], 13)
+
+    def test_shared_and_compressed_quotes(self):
+        """Общие цитаты хранятся в словаре один раз, сжатые читаются прозрачно."""
+        books = generate_catalogue(300, seed=4, shared_quotes=0.5)
+        plain = encode_catalogue(books)
+        packed = encode_catalogue(books, compress=True)
+        self.assertLess(len(packed), len(plain))
+        catalogue = ColumnarCatalogue(packed)
+        self.assertEqual([catalogue.book(i).quotes for i in range(300)], [b.quotes for b in books])
+        self.assertEqual(catalogue.column('quotes', 0, 3), [catalogue.value('quotes', i) for i in range(3)])
+        texts = {}
+        for i in range(300):
+            for quote in catalogue.quotes(i):
+                self.assertIs(texts.setdefault(quote, quote), quote)
+
+
+class TestPackedCatalogue(unittest.TestCase):
+    """Тесты файла каталога, открываемого через mmap."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.pack')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_search_file(self):
+        """Поиск по файлу дает те же книги, что и по списку."""
+        books = generate_catalogue(2000, seed=7)
+        for i, book in enumerate(books):
+            book.id = i + 1
+        save_catalogue(books, self.path)
+
+        serial = BookFilter()
+        with open_catalogue(self.path) as catalogue:
+            for criteria in ({'author': 'толстой'}, {'genre': 'Роман', 'year_from': 1900},
+                             {'any_of': [{'title': 'мир'}, {'year': 1869}]}):
+                found = BookFilter().search_books(catalogue, **criteria)
+                expected = serial.search_books(books, **criteria)
+                self.assertEqual([b.id for b in found], [b.id for b in expected])
+            book = catalogue[-1]
+            self.assertEqual((book.id, book.title, book.quotes), (2000, books[-1].title, books[-1].quotes))
+
+    def test_not_a_catalogue(self):
+        """Файл другого формата не открывается."""
+        with open(self.path, 'wb') as f:
+            f.write(b'title,author\n')
+        with self.assertRaises(ValueError):
+            open_catalogue(self.path)
+
+
+class TestStoragePack(StorageTestCase):
+    """Тесты упаковки каталога из БД."""
+
+    def test_pack(self):
+        """Упакованный каталог содержит книги и цитаты из БД."""
+        fd, path = tempfile.mkstemp(suffix='.pack')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        storage = LibraryStorage()
+        self.assertEqual(storage.pack(path), os.path.getsize(path))
+        with open_catalogue(path) as catalogue:
+            books = BookFilter().search_books(catalogue, genre='роман')
+            self.assertEqual([(b.id, b.title, b.quotes) for b in books],
+                             [(1, "Война и мир", ["Цитата 1", "Цитата 2"]),
+                              (2, "Мастер и Маргарита", ["Рукописи не горят"])])
+
+
+class TestParallelCatalogue(unittest.TestCase):
+    """Тесты параллельного поиска и экспорта."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.books = generate_catalogue(3000, seed=5)
+        cls.parallel = ParallelCatalogue(cls.books, workers=2, chunk_size=700)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parallel.close()
+
+    def test_search_matches_serial(self):
+        """Параллельный поиск дает те же книги в том же порядке."""
+        serial = BookFilter()
+        parallel = BookFilter(parallel=self.parallel)
+        for criteria in ({'author': 'толстой'}, {'genre': 'Роман', 'year_from': 1900},
+                         {'title': 'мир', 'not_genre': 'Роман'}):
+            self.assertEqual(parallel.search_books(self.books, **criteria),
+                             serial.search_books(self.books, **criteria))
+
+    def test_export_matches_serial(self):
+        """Параллельный экспорт CSV совпадает с последовательным."""
+        import csv
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        self.parallel.export(path, 'csv')
+
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['title', 'author', 'year', 'genre', 'quotes'])
+        self.assertEqual(len(rows), len(self.books) + 1)
+        book = self.books[1234]
+        self.assertEqual(rows[1235], [book.title, book.author, str(book.year), book.genre,
+                                      '|'.join(book.quotes)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""Тесты для модуля pool.py (пул подключений и подготовленные запросы)."""
+
+import unittest
+from unittest import mock
+
+from booklib.metrics import METRICS
+from booklib.models import Book
+from booklib.pool import ConnectionPool, _numbered, execute_pipelined, execute_prepared
+from booklib.storage import LibraryStorage
+from fakedb import FakeDatabase
+from test_storage import StorageTestCase
+
+
+class TestConnectionPool(unittest.TestCase):
+    """Тесты выдачи и возврата подключений."""
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.addCleanup(self.db.close)
+        self.opened = []
+
+        def connect():
+            conn = self.db.connect()
+            self.opened.append(conn)
+            return conn
+
+        self.pool = ConnectionPool(connect, size=1)
+        self.addCleanup(self.pool.close)
+
+    def test_reuse(self):
+        """Возвращенное подключение выдается снова, лишние закрываются."""
+        first, second = self.pool.get(), self.pool.get()
+        first.close()
+        second.close()
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.opened[1].closed, 1)  # пул держит только одно свободное
+        self.pool.get().close()
+        self.assertEqual(len(self.opened), 2)
+
+    def test_uncommitted_changes_rolled_back(self):
+        """Незафиксированные изменения не переживают возврат в пул."""
+        conn = self.pool.get()
+        conn.cursor().execute("DELETE FROM books")
+        conn.close()
+        conn.close()  # повторный close ничего не делает
+        self.assertFalse(self.opened[0]._conn.in_transaction)
+
+    def test_prepared_once_per_connection(self):
+        """Запрос подготавливается один раз, дальше выполняется по имени."""
+        self.db.populate([Book("Война и мир", "Лев Толстой", 1869, "Роман", ["Цитата"])])
+        for _ in range(3):
+            conn = self.pool.get()
+            cur = conn.cursor()
+            execute_prepared(cur, 'book_quotes', (1,), self.pool.prepared(cur.connection))
+            self.assertEqual(cur.fetchall(), [(1, "Цитата")])
+            conn.close()
+        self.assertEqual(list(self.opened[0].prepared), ['book_quotes'])
+        self.assertEqual(self.opened[0].prepared['book_quotes'],
+                         "SELECT bq.book_id, qt.quote FROM book_quotes bq JOIN quote_texts qt "
+                         "ON qt.quote_hash = bq.quote_hash WHERE bq.book_id = $1 ORDER BY bq.id")
+
+    def test_pipelined(self):
+        """Пачка запросов выполняется для всех наборов параметров."""
+        self.db.populate([Book(f"Книга {i}", "Автор", 2000 + i, "Роман") for i in range(3)])
+        conn = self.pool.get()
+        cur = conn.cursor()
+        with mock.patch('fakedb.utc_now', return_value='2030-01-01 00:00:00'):
+            execute_pipelined(cur, 'touch_book', [(i,) for i in (1, 3)], self.pool.prepared(cur.connection))
+        cur.execute("SELECT id FROM books WHERE updated_at = %s ORDER BY id", ('2030-01-01 00:00:00',))
+        self.assertEqual(cur.fetchall(), [(1,), (3,)])
+        conn.close()
+
+    def test_idle_expired(self):
+        """Подключение, простоявшее в пуле дольше max_idle, открывается заново."""
+        self.pool.max_idle = 60
+        with mock.patch('booklib.pool.time.monotonic', side_effect=[0, 30, 30, 100]):
+            self.pool.get().close()
+            self.pool.get().close()  # простой 30 с - подключение используется снова
+            self.assertEqual(len(self.opened), 1)
+            self.pool.get()  # простой 70 с - закрыто
+        self.assertEqual(len(self.opened), 2)
+        self.assertEqual(self.opened[0].closed, 1)
+        self.assertTrue(self.pool.owns(self.opened[1]))
+        self.assertFalse(self.pool.owns(self.opened[0]))
+
+    def test_disabled(self):
+        """Пул размера 0 закрывает подключения и не подготавливает запросы."""
+        pool = ConnectionPool(self.db.connect, size=0)
+        conn = pool.get()
+        self.assertIsNone(pool.prepared(conn.cursor().connection))
+        conn.close()
+        self.assertEqual(conn._pool._idle, [])
+
+    def test_numbered(self):
+        """Параметры '%s' нумеруются для PREPARE."""
+        self.assertEqual(_numbered("UPDATE t SET a = %s WHERE id = %s"), "UPDATE t SET a = $1 WHERE id = $2")
+
+
+class TestStoragePool(StorageTestCase):
+    """Тесты хранилища с пулом подключений."""
+
+    def setUp(self):
+        super().setUp()
+        METRICS.reset()
+        METRICS.enable()
+        self.addCleanup(METRICS.enable, False)
+        self.addCleanup(METRICS.reset)
+
+    def test_hot_paths_prepared(self):
+        """Повторные операции используют одно подключение и подготовленные запросы."""
+        storage = LibraryStorage()
+        self.addCleanup(storage.close)
+        for i in range(5):
+            storage.add_quote_to_book(1, f"Новая цитата {i}")
+        storage.remove_quote(1, 0)
+        counters = METRICS.snapshot()['counters']
+        # insert_quote_text, insert_quote, touch_book, quote_ids, delete_quote, delete_orphan_text
+        self.assertEqual(counters['db.prepared'], 6)
+        self.assertGreaterEqual(counters['pool.reused'], 6)
+        self.assertEqual(LibraryStorage(pool_size=0).books[0].quote_count, 6)
+
+    def test_bulk_add_round_trips(self):
+        """Пакет книг сохраняется числом запросов, не зависящим от числа книг."""
+        storage = LibraryStorage()
+        self.addCleanup(storage.close)
+        books = [Book(f"Книга {i}", f"Автор {i % 7}", 2000, "Роман", [f"Цитата {i}"]) for i in range(200)]
+        METRICS.reset()
+        self.assertEqual(storage.add_books(books).count('added'), 200)
+        # новые авторы - INSERT и SELECT (жанр уже известен), книги - 1, тексты цитат - 1, ссылки - 1
+        self.assertEqual(METRICS.snapshot()['counters']['db.queries'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Тесты для модуля query.py."""
+
+import unittest
+
+from booklib.models import Book
+from booklib.query import TokenStats, compile_query, compile_sql, plan_cache_info, validate_criteria
+
+
+class TestCompileQuery(unittest.TestCase):
+    """Тесты компиляции и выполнения поисковых планов."""
+
+    def setUp(self):
+        self.books = [
+            Book("Война и мир", "Лев Толстой", 1869, "Роман"),
+            Book("Анна Каренина", "Лев Толстой", 1877, "Роман"),
+            Book("Преступление и наказание", "Фёдор Достоевский", 1866, "Роман"),
+            Book("Палата №6", "Антон Чехов", 1892, "Повесть"),
+            Book("Мастер и Маргарита", "Михаил Булгаков", 1967, "Роман"),
+        ]
+
+    def titles(self, **criteria):
+        return [b.title for b in compile_query(criteria).execute(self.books)]
+
+    def test_year_range(self):
+        """Диапазон лет включает обе границы."""
+        self.assertEqual(self.titles(year_from=1866, year_to=1877),
+                         ["Война и мир", "Анна Каренина", "Преступление и наказание"])
+        self.assertEqual(self.titles(year_from=1890), ["Палата №6", "Мастер и Маргарита"])
+
+    def test_negation(self):
+        """Отрицание исключает подходящие книги."""
+        self.assertEqual(self.titles(genre="роман", not_author="толстой"),
+                         ["Преступление и наказание", "Мастер и Маргарита"])
+
+    def test_any_of(self):
+        """Группы any_of объединяются через ИЛИ."""
+        self.assertEqual(
+            self.titles(any_of=[{'genre': "Повесть"}, {'author': "Булгаков", 'year': 1967}]),
+            ["Палата №6", "Мастер и Маргарита"])
+
+    def test_value_lists(self):
+        """Список значений подходит, если подходит любое из них."""
+        self.assertEqual(self.titles(author=["чехов", "булгаков"]), ["Палата №6", "Мастер и Маргарита"])
+        self.assertEqual(self.titles(year=[1866, 1892]), ["Преступление и наказание", "Палата №6"])
+        self.assertEqual(self.titles(genre=["Повесть"]), self.titles(genre="Повесть"))
+        self.assertEqual(self.titles(author=[]), [])
+        self.assertEqual(compile_query({'genre': ["роман", "повесть"], 'year': [1869, 1892]}).explain(),
+                         "year IN (?) -> genre ~ ANY(?)")
+
+    def test_compile_sql(self):
+        """Критерии переводятся в условие WHERE с параметрами."""
+        where, params = compile_sql({'author': "50%", 'year_from': 1900, 'not_genre': "роман"})
+        self.assertIn("LOWER(author) LIKE %s", where)
+        self.assertIn("year >= %s", where)
+        self.assertIn("NOT (", where)
+        self.assertCountEqual(params, ["%50\\%%", 1900, "%роман%"])
+        where, params = compile_sql({'any_of': [{'year': [1869, 1866]}, {'genre': ["а", "б"]}]})
+        self.assertEqual(where.count("OR"), 2)
+        self.assertCountEqual(params, [1866, 1869, "%а%", "%б%"])
+        self.assertEqual(compile_sql({}), ('TRUE', []))
+
+    def test_validate_criteria(self):
+        """Строгая проверка отклоняет неизвестные ключи, неверные типы и пустые значения."""
+        validate_criteria({'author': ["толстой", "чехов"], 'year_from': 1850, 'not_year': [1869],
+                           'any_of': [{'genre': "роман"}, {'author_id': 3}]})
+        for criteria in ([1], {}, {'autor': "Булгаков", 'year': 1869}, {'author': 5}, {'title': ""},
+                         {'genre': []}, {'year': "1869"}, {'year_to': True}, {'any_of': [{}]}, {'any_of': []}):
+            with self.subTest(criteria=criteria), self.assertRaises(ValueError):
+                validate_criteria(criteria)
+
+    def test_no_criteria_returns_all(self):
+        """Без критериев возвращается исходная коллекция."""
+        self.assertIs(compile_query({'author': None}).execute(self.books), self.books)
+
+    def test_selectivity_order(self):
+        """Точный год проверяется первым, затем самое редкое слово."""
+        stats = TokenStats(self.books)
+        plan = compile_query({'genre': "роман", 'author': "толстой", 'year': 1869}, stats)
+        self.assertEqual(plan.explain(), "year = ? -> author ~ ? -> genre ~ ?")
+
+    def test_plan_cached_by_shape(self):
+        """Запросы одной формы с разными значениями используют один план."""
+        compile_query({'author': "Толстой", 'year': 1869})
+        before = plan_cache_info()
+        plan = compile_query({'author': "Чехов", 'year': 1892})
+        self.assertEqual(plan_cache_info().hits, before.hits + 1)
+        self.assertEqual([b.title for b in plan.execute(self.books)], ["Палата №6"])
+
+
+if __name__ == '__main__':
+    unittest.main()
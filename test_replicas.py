@@ -0,0 +1,101 @@
+"""Тесты для модуля replicas.py (чтение с реплик)."""
+
+import unittest
+
+from booklib.metrics import METRICS
+from booklib.models import Book
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+class TestReplicaRouting(StorageTestCase):
+    """Тесты маршрутизации чтения хранилища на реплику FakeReplica."""
+
+    def setUp(self):
+        super().setUp()
+        self.replica = self.db.replica()
+        self.addCleanup(self.replica.close)
+        # Книга есть только на основном сервере: по ней видно, откуда читали
+        LibraryStorage(pool_size=0).add_book(Book("Мцыри", "Михаил Лермонтов", 1839, "Поэма"))
+        METRICS.reset()
+        METRICS.enable()
+        self.addCleanup(METRICS.enable, False)
+        self.addCleanup(METRICS.reset)
+
+    def storage(self, **options):
+        storage = LibraryStorage(replicas=[self.replica.connect], **options)
+        self.addCleanup(storage.close)
+        return storage
+
+    def counters(self):
+        return METRICS.snapshot()['counters']
+
+    def test_reads_from_replica(self):
+        """Каталог и поиск читаются с реплики, изменения пишутся на основной сервер."""
+        storage = self.storage()
+        self.assertEqual(len(storage.books), 3)
+        self.assertEqual(storage.query_books({'author': "лермонтов"}), [])
+        self.assertEqual(self.counters()['replicas.reads'], 2)
+
+        storage.add_quote_to_book(1, "Цитата 3")  # реплика только для чтения: ошибка была бы напечатана
+        self.assertEqual(LibraryStorage(pool_size=0).books[0].quote_count, 3)
+
+    def test_read_your_writes(self):
+        """После своей записи чтение идет на основной сервер, пока реплика не догонит."""
+        storage = self.storage()
+        storage.add_quote_to_book(3, "Новая цитата")
+        self.assertEqual(storage.books[2].quotes, ["Новая цитата"])
+        self.assertEqual(self.counters().get('replicas.fallbacks'), 1)
+
+        self.replica.sync()
+        storage.router.check_interval = 0  # следующее чтение заново измерит отставание
+        self.assertEqual(len(storage.query_books({'author': "лермонтов"})), 1)
+        self.assertEqual(self.counters()['replicas.reads'], 2)
+
+    def test_replica_without_write(self):
+        """Реплика без отставания, но не получившая запись, не читается до нее."""
+        storage = self.storage()
+        storage.router.check_interval = 0
+        storage.add_quote_to_book(3, "Новая цитата")
+        reads = self.counters().get('replicas.reads', 0)
+        conn = self.replica.connect()
+        cur = conn.cursor()
+        cur.execute("SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()")
+        self.assertEqual(cur.fetchone()[0], 1)  # отставание 0: все полученное воспроизведено
+        conn.close()
+        self.assertEqual(storage.load_books()[2].quotes, ["Новая цитата"])
+        self.assertEqual(self.counters().get('replicas.reads', 0), reads)
+
+        self.replica.sync()
+        self.assertEqual(storage.load_books()[2].quotes, ["Новая цитата"])
+        self.assertGreater(self.counters()['replicas.reads'], reads)
+
+    def test_lagging_replica(self):
+        """Отстающая больше max_replica_lag реплика пропускается."""
+        self.replica.lag = 30
+        storage = self.storage(max_replica_lag=10)
+        self.assertEqual(len(storage.books), 4)
+        self.assertNotIn('replicas.reads', self.counters())
+
+        self.replica.lag = 0
+        storage.router.check_interval = 0
+        with storage.primary():
+            self.assertEqual(len(storage.load_books()), 4)
+        self.assertEqual(len(storage.load_books()), 3)
+
+    def test_unavailable_replica(self):
+        """Недоступная реплика пропускается до истечения retry_after."""
+        def broken():
+            raise OSError("нет связи")
+
+        storage = LibraryStorage(replicas=[broken])
+        self.addCleanup(storage.close)
+        self.assertEqual(len(storage.books), 4)
+        self.assertGreater(storage.router.replicas[0].down_until, 0)
+        storage.load_books()
+        self.assertEqual(self.counters()['replicas.errors'], 1)
+        self.assertEqual(self.counters()['replicas.fallbacks'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
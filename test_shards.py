@@ -0,0 +1,222 @@
+"""Тесты для модуля shards.py (шардирование каталога поверх нескольких баз fakedb)."""
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from booklib.models import Book
+from booklib.shards import ShardedStorage, ShardingError, rebalance
+from booklib.storage import ADDED, UNCHANGED, LibraryStorage
+from fakedb import FakeDatabase
+from test_export import read_csv
+from test_storage import StorageTestCase
+
+
+class ShardsTestCase(StorageTestCase):
+    """Базовый класс: каталог StorageTestCase перераспределен по трем базам."""
+
+    def setUp(self):
+        super().setUp()
+        self.nodes = [self.db]
+        for _ in range(2):
+            db = FakeDatabase()
+            self.addCleanup(db.close)
+            self.nodes.append(db)
+        self.report = rebalance(self.connects(), 3, verbose=False)
+
+    def connects(self, count=None):
+        return [db.connect for db in self.nodes[:count]]
+
+    def storage(self, shards=3, **options):
+        storage = ShardedStorage(shards=self.connects(shards), **options)
+        self.addCleanup(storage.close)
+        return storage
+
+    def rows(self, index, query):
+        conn = self.nodes[index].connect()
+        cur = conn.cursor()
+        cur.execute(query)
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    def node_ids(self, index):
+        return [row[0] for row in self.rows(index, "SELECT id FROM books ORDER BY id")]
+
+
+class TestRebalance(ShardsTestCase):
+    """Тесты перераспределения книг между узлами."""
+
+    def test_moves_books_with_quotes(self):
+        """Книга переносится на шард id % N вместе с цитатами; каталог не меняется."""
+        self.assertEqual(self.report, {'moved': 2, 'books': [1, 1, 1]})
+        self.assertEqual([self.node_ids(index) for index in range(3)], [[3], [1], [2]])
+
+        storage = self.storage()
+        self.assertEqual([b.title for b in storage.books], ["Война и мир", "Мастер и Маргарита", "Палата №6"])
+        self.assertEqual([b.quotes for b in storage.books], [["Цитата 1", "Цитата 2"], ["Рукописи не горят"], []])
+        # Справочники скопированы на все узлы с теми же id
+        authors = self.rows(0, "SELECT id, name FROM authors ORDER BY id")
+        self.assertEqual(len(authors), 3)
+        self.assertEqual(self.rows(2, "SELECT id, name FROM authors ORDER BY id"), authors)
+
+    def test_shrink(self):
+        """Освобождаемый узел отдает все книги; повторный запуск ничего не переносит."""
+        storage = self.storage()
+        storage.add_books([Book(f"Книга {i}", "Автор", 2000 + i, "Роман", [f"Цитата {i}"]) for i in range(6)])
+        catalogue = sorted((b.id, b.title, b.quotes) for b in storage.books)
+
+        report = rebalance(self.connects(), 2, verbose=False)
+        self.assertEqual(sum(report['books']), 9)
+        self.assertEqual(self.node_ids(2), [])
+        for index in range(2):
+            self.assertTrue(all(book_id % 2 == index for book_id in self.node_ids(index)))
+        self.assertEqual(rebalance(self.connects(), 2, verbose=False)['moved'], 0)
+
+        shrunk = self.storage(2)
+        self.assertEqual([(b.id, b.title, b.quotes) for b in shrunk.books], catalogue)
+
+    def test_same_database(self):
+        """Два узла, указывающие на одну базу, - ошибка до переноса книг."""
+        with self.assertRaises(ShardingError):
+            rebalance([self.db.connect, self.db.connect], 2, verbose=False)
+        self.assertEqual(self.node_ids(0), [3])
+
+
+class TestShardedStorage(ShardsTestCase):
+    """Тесты маршрутизации чтения и записи по шардам."""
+
+    def test_add_books_placement(self):
+        """Новые книги получают id своего шарда, повтор не создает дубликат."""
+        storage = self.storage()
+        books = [Book(f"Книга {i}", "Новый Автор", 2000 + i, "Роман") for i in range(9)]
+        self.assertEqual(storage.add_books(books), [ADDED] * 9)
+        for index in range(3):
+            self.assertTrue(all(book_id % 3 == index for book_id in self.node_ids(index)))
+        self.assertEqual(len(set(b.id for b in storage.books)), 12)
+
+        again = self.storage()
+        self.assertEqual(again.add_books([Book("книга 0", "новый автор", 2000, "Роман"),
+                                          Book("Война и мир", "Лев Толстой", 1869, "Роман")]),
+                         [UNCHANGED, UNCHANGED])
+        self.assertEqual(sum(len(self.node_ids(index)) for index in range(3)), 12)
+        # Справочник авторов - общий: у книг разных шардов один author_id
+        self.assertEqual(len({b.author_id for b in again.books if b.author == "Новый Автор"}), 1)
+
+    def test_readd_edited_book(self):
+        """Книга после изменения ключа лежит не на placement(ключа); повтор из устаревшего кеша ее находит."""
+        storage = self.storage()
+        stale = self.storage()
+        storage.update_book(storage.books[2], Book("Палата № 6", "Антон Чехов", 1892, "Повесть"))
+        self.assertIsNotNone(stale.add_books([Book("Палата № 6", "Антон Чехов", 1892, "Повесть")]))
+        self.assertEqual([self.node_ids(index) for index in range(3)], [[3], [1], [2]])
+        self.assertEqual([b.title for b in self.storage().books].count("Палата № 6"), 1)
+
+    def test_readd_after_rebalance(self):
+        """Книги, перенесенные rebalance из одной базы на шарды id % N, не дублируются."""
+        nodes = [FakeDatabase() for _ in range(3)]
+        for db in nodes:
+            self.addCleanup(db.close)
+        rebalance([db.connect for db in nodes], 3, verbose=False)
+        stale = ShardedStorage(shards=[db.connect for db in nodes])
+        self.addCleanup(stale.close)
+        self.assertEqual(stale.books, [])
+
+        books = [Book("Война и мир", "Лев Толстой", 1869, "Роман"),
+                 Book("Мастер и Маргарита", "Михаил Булгаков", 1967, "Роман")]
+        nodes[0].populate(books)  # каталог, перенесенный из одной базы
+        rebalance([db.connect for db in nodes], 3, verbose=False)
+        self.assertIsNotNone(stale.add_books(books))
+        self.assertEqual(sorted(b.id for b in stale.books), [1, 2])
+        reloaded = ShardedStorage(shards=[db.connect for db in nodes])
+        self.addCleanup(reloaded.close)
+        self.assertEqual([b.id for b in reloaded.books], [1, 2])
+
+    def test_changes_routed(self):
+        """Цитаты, обновление и удаление выполняются на шарде книги."""
+        storage = self.storage()
+        storage.add_quote_to_book(2, "Никогда не разговаривайте с неизвестными")
+        storage.update_book(storage.books[2], Book("Палата № 6", "Антон Чехов", 1892, "Повесть"))
+        storage.remove_book(1)
+        self.assertEqual(self.node_ids(1), [])
+
+        reloaded = self.storage()
+        self.assertEqual([b.title for b in reloaded.books], ["Мастер и Маргарита", "Палата № 6"])
+        self.assertEqual(reloaded.books[0].quote_count, 2)
+
+    def test_queries_match_single_database(self):
+        """Поиск запросом к БД и статистика совпадают с каталогом в одной базе."""
+        single = FakeDatabase()
+        self.addCleanup(single.close)
+        single.populate([Book("Война и мир", "Лев Толстой", 1869, "Роман", ["Цитата 1", "Цитата 2"]),
+                         Book("Мастер и Маргарита", "Михаил Булгаков", 1967, "Роман", ["Рукописи не горят"]),
+                         Book("Палата №6", "Антон Чехов", 1892, "Повесть")])
+        expected = LibraryStorage(lazy=True)
+        expected._connect = single.connect
+        storage = self.storage(lazy=True)
+        for criteria in ({'genre': "роман"}, {'year_from': 1860, 'year_to': 1900}, {'author': "чехов"}):
+            self.assertEqual([b.id for b in storage.query_books(criteria)],
+                             [b.id for b in expected.query_books(criteria)])
+        self.assertEqual(storage.stats(source='sql'), expected.stats(source='sql'))
+
+    def test_bulk_changes(self):
+        """Массовое изменение и удаление выполняются на всех шардах."""
+        storage = self.storage()
+        self.assertEqual(storage.count_books({'genre': "роман"}), 2)
+        self.assertEqual(storage.update_books({'genre': "роман"}, genre="Проза"), 2)
+        self.assertEqual(storage.remove_books({'year_to': 1900}), 2)
+        self.assertEqual([(b.title, b.genre) for b in storage.books], [("Мастер и Маргарита", "Проза")])
+        self.assertEqual([(b.title, b.genre) for b in self.storage().books], [("Мастер и Маргарита", "Проза")])
+        self.assertEqual([self.node_ids(index) for index in range(3)], [[], [], [2]])
+
+    def test_batch_and_write_behind(self):
+        """Пакет изменений охватывает несколько шардов; отложенная запись - тоже."""
+        storage = self.storage()
+        with storage.batch() as batch:
+            storage.add_quote_to_book(1, "Цитата 3")
+            storage.add_quote_to_book(2, "Цитата 4")
+            storage.add_book(Book("Мцыри", "Михаил Лермонтов", 1839, "Поэма"))
+        self.assertEqual(batch.operations, 3)
+
+        with self.assertRaises(ValueError):
+            with storage.batch():
+                storage.add_quote_to_book(3, "Откат")
+                raise ValueError("откат пакета")
+        self.assertEqual(self.storage().books[2].quote_count, 0)
+
+        writer = self.storage(write_behind={'interval': 60})
+        futures = [writer.add_quote_to_book(book_id, "Отложенная") for book_id in (1, 2, 3)]
+        writer.flush_writes()
+        self.assertTrue(all(future.result() for future in futures))
+        self.assertEqual([b.quote_count for b in self.storage().books], [4, 3, 1, 0])
+
+    def test_export_changes(self):
+        """Инкрементальный экспорт собирает изменения всех шардов в один файл."""
+        storage = self.storage()
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        base = storage.export_changes(os.path.join(tmpdir, 'base.csv'))
+        self.assertEqual(sorted(row[1] for row in read_csv(os.path.join(tmpdir, 'base.csv'))[1:]), ['1', '2', '3'])
+
+        storage.remove_book(2)
+        storage.add_quote_to_book(3, "Новая цитата")
+        storage.export_changes(os.path.join(tmpdir, 'delta.csv'), since=base.watermark)
+        self.assertEqual(sorted((row[0], row[1]) for row in read_csv(os.path.join(tmpdir, 'delta.csv'))[1:]),
+                         [('delete', '2'), ('upsert', '3')])
+
+    def test_misconfigured_shards(self):
+        """Хранилище с другим количеством шардов, чем в БД, не пишет книги."""
+        storage = self.storage(2)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertIsNone(storage.add_books([Book("Мцыри", "Михаил Лермонтов", 1839, "Поэма")]))
+        self.assertIn("rebalance", output.getvalue())
+        with self.assertRaises(ValueError):
+            ShardedStorage(shards=[])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Тесты для модуля stats.py."""
+
+import unittest
+
+from booklib.models import Book
+from booklib.stats import collect_stats, decade
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+class TestStats(StorageTestCase):
+    """Тесты сводной статистики каталога."""
+
+    def setUp(self):
+        super().setUp()
+        LibraryStorage().add_books([
+            Book("Анна Каренина", "Лев Толстой", 1877, "Роман", ["Все счастливые семьи"]),
+            Book("Чайка", "Антон Чехов", 1896, "Пьеса"),
+        ])
+
+    def test_decade(self):
+        """Год округляется до начала десятилетия."""
+        self.assertEqual(decade(1869), 1860)
+        self.assertEqual(decade(2000), 2000)
+
+    def test_sql_stats(self):
+        """Группировки считаются запросами к БД без загрузки каталога."""
+        storage = LibraryStorage(lazy=True)
+        result = storage.stats()
+        self.assertFalse(storage.loaded)
+        self.assertEqual(result['source'], 'sql')
+        self.assertEqual((result['books'], result['quotes']), (5, 4))
+        self.assertEqual(result['by_genre'], {"Роман": 3, "Повесть": 1, "Пьеса": 1})
+        self.assertEqual(result['by_author'], {"Антон Чехов": 2, "Лев Толстой": 2, "Михаил Булгаков": 1})
+        self.assertEqual(result['by_decade'], {"1860": 1, "1870": 1, "1890": 2, "1960": 1})
+        self.assertEqual(result['quotes_per_book'],
+                         {'avg': 0.8, 'max': 2, 'distribution': {"0": 2, "1": 2, "2": 1}})
+
+    def test_cache_matches_sql(self):
+        """Статистика по кешу совпадает со статистикой запросами к БД."""
+        storage = LibraryStorage()
+        for top in (None, 2):
+            with self.subTest(top=top):
+                cached = storage.stats(top)
+                self.assertEqual(cached['source'], 'cache')
+                self.assertEqual(dict(cached, source='sql'), storage.stats(top, source='sql'))
+        self.assertFalse(any(b.quotes_loaded for b in storage.books))
+
+    def test_reflects_changes(self):
+        """Изменения книг сразу видны в статистике."""
+        storage = LibraryStorage()
+        storage.remove_book(1)
+        storage.add_quote_to_book(2, "Никогда ничего не просите")
+        self.assertEqual(collect_stats(storage.books)['quotes'], 3)
+        self.assertEqual(storage.stats(source='sql')['by_genre'], {"Роман": 2, "Повесть": 1, "Пьеса": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,351 @@
+"""Тесты для модуля storage.py (поверх тестовой базы fakedb)."""
+
+import contextlib
+import io
+import random
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import main as cli
+from booklib.commands import LibraryCommands
+from booklib.filters import BookFilter
+from booklib.metrics import METRICS
+from booklib.models import Book
+from booklib.storage import ADDED, UNCHANGED, UPDATED, LibraryStorage
+from fakedb import FakeDatabase
+
+
+class StorageTestCase(unittest.TestCase):
+    """Базовый класс: LibraryStorage подключается к временной FakeDatabase."""
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.addCleanup(self.db.close)
+        self.db.populate([
+            Book("Война и мир", "Лев Толстой", 1869, "Роман", ["Цитата 1", "Цитата 2"]),
+            Book("Мастер и Маргарита", "Михаил Булгаков", 1967, "Роман", ["Рукописи не горят"]),
+            Book("Палата №6", "Антон Чехов", 1892, "Повесть"),
+        ])
+        patcher = mock.patch.object(LibraryStorage, '_connect', lambda s: self.db.connect())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TestLazyQuotes(StorageTestCase):
+    """Тесты ленивой загрузки цитат."""
+
+    def setUp(self):
+        super().setUp()
+        METRICS.reset()
+        METRICS.enable()
+        self.addCleanup(METRICS.enable, False)
+        self.addCleanup(METRICS.reset)
+
+    def test_counts_without_loading(self):
+        """Количество цитат известно без загрузки их текста."""
+        storage = LibraryStorage()
+        self.assertEqual([b.quote_count for b in storage.books], [2, 1, 0])
+        self.assertFalse(any(b.quotes_loaded for b in storage.books))
+
+    def test_batch_load(self):
+        """Цитаты книг из очереди загружаются одним запросом."""
+        storage = LibraryStorage()
+        storage.quote_loader.touch(storage.books)
+        self.assertEqual(storage.books[1].quotes, ["Рукописи не горят"])
+        self.assertTrue(all(b.quotes_loaded for b in storage.books))
+        self.assertEqual(storage.books[0].quotes, ["Цитата 1", "Цитата 2"])
+        self.assertEqual(METRICS.snapshot()['counters']['quotes.batches'], 1)
+
+    def test_eager_mode(self):
+        """В жадном режиме цитаты загружаются вместе с книгами."""
+        storage = LibraryStorage(eager_quotes=True)
+        self.assertTrue(all(b.quotes_loaded for b in storage.books))
+        self.assertEqual(storage.books[0].quotes, ["Цитата 1", "Цитата 2"])
+
+    def test_add_quote_keeps_lazy(self):
+        """Добавление цитаты к незагруженной книге меняет только счетчик."""
+        storage = LibraryStorage()
+        storage.add_quote_to_book(1, "Цитата 3")
+        book = storage.books[0]
+        self.assertFalse(book.quotes_loaded)
+        self.assertEqual(book.quote_count, 3)
+        self.assertEqual(book.quotes, ["Цитата 1", "Цитата 2", "Цитата 3"])
+
+
+class TestQueryBooks(StorageTestCase):
+    """Тесты поиска запросом к БД без загрузки кеша."""
+
+    CRITERIA = [
+        {'author': "ТОЛСТОЙ"},
+        {'genre': ["повесть", "поэма"]},
+        {'year_from': 1860, 'year_to': 1900, 'not_title': "мир"},
+        {'year': [1967, 1869], 'title': "м"},
+        {'any_of': [{'author': "чехов"}, {'title': "маргарита", 'year': 1967}]},
+        {'title': "%"},
+        {},
+    ]
+
+    def test_same_as_cache(self):
+        """Результат запроса к БД совпадает с поиском по кешу."""
+        lazy = LibraryStorage(lazy=True)
+        cached = LibraryStorage()
+        for criteria in self.CRITERIA:
+            with self.subTest(criteria=criteria):
+                found = lazy.query_books(criteria)
+                expected = BookFilter().search_books(cached.books, **criteria)
+                self.assertEqual([(b.id, b.quote_count) for b in found],
+                                 [(b.id, b.quote_count) for b in expected])
+        self.assertFalse(lazy.loaded)
+        self.assertEqual(lazy.query_books({'author': "толстой"})[0].quotes, ["Цитата 1", "Цитата 2"])
+
+    def test_cli_any_of(self):
+        """Неверные группы --any-of - ошибка аргумента, верные ищутся запросом к БД."""
+        for any_of in ('[{"author": 5}]', '{"author": "x"}', '["x"]', '[{"autor": "x"}]', '[{'):
+            with self.subTest(any_of=any_of), mock.patch.object(sys, 'argv', ['main.py', 'search', '--any-of', any_of]), \
+                    contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as raised:
+                cli.main()
+            self.assertEqual(raised.exception.code, 2)
+        argv = ['main.py', 'search', '--any-of', '[{"author": "чехов"}, {"year": 1967}]']
+        with mock.patch.object(sys, 'argv', argv), contextlib.redirect_stdout(io.StringIO()) as out:
+            cli.main()
+        self.assertIn("Найдено 2 книг.", out.getvalue())
+
+
+class TestBulkChanges(StorageTestCase):
+    """Тесты массового удаления и изменения книг по критериям поиска."""
+
+    def rows(self, query):
+        conn = self.db.connect()
+        cur = conn.cursor()
+        cur.execute(query)
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    def test_remove_books(self):
+        """Книги по критериям удаляются с цитатами; кеш исправляется без перечитывания."""
+        storage = LibraryStorage()
+        books = storage.books
+        self.assertEqual(storage.count_books({'genre': "роман"}), 2)
+        self.assertEqual(storage.remove_books({'genre': "роман"}), 2)
+        self.assertEqual([b.title for b in storage.books], ["Палата №6"])
+        self.assertIsNone(storage.get_book(books[0].id))
+        self.assertEqual(self.rows("SELECT COUNT(*) FROM book_quotes"), [(0,)])
+        self.assertEqual(sorted(self.rows("SELECT book_id FROM book_tombstones")), [(1,), (2,)])
+        self.assertEqual(storage.remove_books({'author': "нет такого"}), 0)
+        with self.assertRaises(ValueError):
+            storage.remove_books({})
+
+    def test_update_books(self):
+        """Изменяются только переданные поля, ключ книги пересчитывается."""
+        storage = LibraryStorage()
+        self.assertEqual(storage.update_books({'year_to': 1900}, author="Неизвестный  Автор", genre="Проза"), 2)
+        self.assertEqual([(b.title, b.author, b.genre) for b in storage.books],
+                         [("Война и мир", "Неизвестный  Автор", "Проза"),
+                          ("Мастер и Маргарита", "Михаил Булгаков", "Роман"),
+                          ("Палата №6", "Неизвестный  Автор", "Проза")])
+        self.assertEqual(storage.books[0].quotes, ["Цитата 1", "Цитата 2"])
+        self.assertEqual(self.rows("SELECT natural_key FROM books ORDER BY id"),
+                         [(b.natural_key,) for b in storage.books])
+        self.assertEqual([b.id for b in storage.query_books({'author': "неизвестный"})], [1, 3])
+        self.assertEqual(len({b.author_id for b in LibraryStorage().books}), 2)
+
+    def test_update_books_duplicate_key(self):
+        """Если книги совпадут по ключу, не меняется ни одна."""
+        storage = LibraryStorage()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertIsNone(storage.update_books({'genre': "роман"}, title="Книга", year=1900, author="Автор"))
+        self.assertIn("Ошибка обновления", output.getvalue())
+        self.assertEqual([b.title for b in LibraryStorage().books], ["Война и мир", "Мастер и Маргарита", "Палата №6"])
+        with self.assertRaises(ValueError):
+            storage.update_books({'genre': "роман"})
+
+    def test_commands_dry_run(self):
+        """Команды с dry_run только считают книги и не загружают каталог."""
+        commands = LibraryCommands(lazy=True)
+        self.addCleanup(commands.storage.close)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            commands.remove_books_where({'genre': "роман"}, dry_run=True)
+            commands.edit_books_where({'author': "чехов"}, new_genre="Рассказ", dry_run=True)
+            commands.remove_books_where({})
+        self.assertEqual(out.getvalue().splitlines()[:2], ["Будет удалено книг: 2", "Будет изменено книг: 1"])
+        self.assertIn("Критерии не ограничивают выборку", out.getvalue())
+        self.assertFalse(commands.storage.loaded)
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            commands.edit_books_where({'author': "чехов"}, new_genre="Рассказ")
+        self.assertEqual(out.getvalue(), "Изменено книг: 1.\n")
+        self.assertEqual(LibraryStorage().books[2].genre, "Рассказ")
+
+    def test_invalid_criteria(self):
+        """Неверные критерии отклоняются командами и CLI до запроса к БД."""
+        commands = LibraryCommands(lazy=True)
+        self.addCleanup(commands.storage.close)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            commands.remove_books_where({'autor': "Булгаков", 'year': 1869})
+            commands.remove_books_where({'title': ""}, dry_run=True)
+            commands.edit_books_where([1], new_genre="Рассказ")
+        self.assertEqual([line.split(':')[0] for line in out.getvalue().splitlines()], ["Ошибка"] * 3)
+
+        for where in ('[1]', '{"author": 5}', '{"title": ""}', '{"autor": "Булгаков", "year": 1869}', '{'):
+            with self.subTest(where=where), mock.patch.object(sys, 'argv', ['main.py', 'remove', '--where', where]), \
+                    contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as raised:
+                cli.main()
+            self.assertEqual(raised.exception.code, 2)
+        with mock.patch.object(sys, 'argv', ['main.py', 'remove', '--where', '{"year": 1869}']), \
+                contextlib.redirect_stdout(io.StringIO()) as out:
+            cli.main()
+        self.assertEqual(out.getvalue(), "Удалено книг: 1.\n")
+        self.assertEqual([b.title for b in LibraryStorage().books], ["Мастер и Маргарита", "Палата №6"])
+
+
+class TestUpsert(StorageTestCase):
+    """Тесты добавления книг без дубликатов."""
+
+    def count(self, table):
+        conn = self.db.connect()
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        count = cur.fetchone()[0]
+        conn.close()
+        return count
+
+    def test_repeat_add_is_idempotent(self):
+        """Повторное добавление той же книги не создает дубликат."""
+        storage = LibraryStorage()
+        book = Book("Анна Каренина", "Лев Толстой", 1877, "Роман", ["Все счастливые семьи"])
+        self.assertEqual(storage.add_book(book), ADDED)
+        again = Book("Анна Каренина", "Лев Толстой", 1877, "Роман", ["Все счастливые семьи"])
+        self.assertEqual(storage.add_book(again), UNCHANGED)
+        self.assertEqual(again.id, book.id)
+        self.assertEqual((self.count('books'), self.count('book_quotes')), (4, 4))
+        self.assertEqual(len(storage.books), 4)
+
+    def test_repeat_add_same_timestamp(self):
+        """Повтор книги с той же отметкой времени, что и у записи, не считается изменением."""
+        storage = LibraryStorage()
+        with mock.patch('fakedb.utc_now', return_value='2026-10-19 12:00:00.000000'):
+            self.assertEqual(storage.add_book(Book("Анна Каренина", "Лев Толстой", 1877, "Роман")), ADDED)
+            self.assertEqual(storage.add_book(Book("Анна Каренина", "Лев Толстой", 1877, "Роман")), UNCHANGED)
+            self.assertEqual(storage.add_book(Book("Анна Каренина", "Лев Толстой", 1877, "Проза")), UPDATED)
+
+    def test_case_and_spaces_variants(self):
+        """Регистр и лишние пробелы не делают книгу новой; жанр обновляется."""
+        storage = LibraryStorage()
+        status = storage.add_book(Book("ВОЙНА  И МИР", " лев толстой", 1869, "Эпопея"))
+        self.assertEqual(status, UPDATED)
+        self.assertEqual(self.count('books'), 3)
+        self.assertEqual([b.genre for b in storage.books if b.id == 1], ["Эпопея"])
+        self.assertEqual(storage.books[0].title, "Война и мир")  # исходное написание сохраняется
+
+    def test_only_new_quotes_added(self):
+        """Из повторно присланных цитат сохраняются только новые."""
+        storage = LibraryStorage()
+        status = storage.add_book(Book("Война и мир", "Лев Толстой", 1869, "Роман",
+                                       ["Цитата 2", "Цитата 3", "Цитата 3"]))
+        self.assertEqual(status, UPDATED)
+        self.assertEqual(storage.books[0].quotes, ["Цитата 1", "Цитата 2", "Цитата 3"])
+        storage.add_quote_to_book(1, "Цитата 1")
+        self.assertEqual(self.count('book_quotes'), 4)
+        self.assertEqual(LibraryStorage().books[0].quote_count, 3)
+
+    def test_bulk_import(self):
+        """Пакетное добавление сообщает результат для каждой книги."""
+        storage = LibraryStorage()
+        books = [Book("Палата №6", "Антон Чехов", 1892, "Повесть"),
+                 Book("Чайка", "Антон Чехов", 1896, "Пьеса", ["Я - чайка"]),
+                 Book("ЧАЙКА", "Антон Чехов", 1896, "Комедия")]
+        self.assertEqual(storage.add_books(books), [UNCHANGED, ADDED, UPDATED])
+        self.assertEqual([b.genre for b in storage.books], ["Роман", "Роман", "Повесть", "Комедия"])
+        self.assertEqual(storage.books[-1].quotes, ["Я - чайка"])
+        self.assertEqual(storage.add_books(books), [UNCHANGED, UPDATED, UPDATED])
+        self.assertEqual(self.count('books'), 4)
+
+
+class TestSharedQuotes(TestUpsert):
+    """Тесты общего хранения одинаковых цитат разных книг."""
+
+    def test_text_stored_once(self):
+        """Текст цитаты хранится один раз и удаляется с последней ссылкой."""
+        storage = LibraryStorage(eager_quotes=True)
+        storage.add_books([Book("Чайка", "Антон Чехов", 1896, "Пьеса", ["Рукописи не горят"])])
+        storage.add_quote_to_book(3, "Рукописи не горят")
+        self.assertEqual((self.count('book_quotes'), self.count('quote_texts')), (5, 3))
+        quotes = [b.quotes[-1] for b in storage.books[1:]]
+        self.assertTrue(all(quote is quotes[0] for quote in quotes))  # одна строка в кеше
+
+        storage.remove_book(2)
+        storage.remove_quote(3, 0)
+        self.assertEqual(self.count('quote_texts'), 3)
+        storage.remove_book(4)
+        self.assertEqual(self.count('quote_texts'), 2)
+        self.assertEqual(LibraryStorage(eager_quotes=True).books[0].quotes, ["Цитата 1", "Цитата 2"])
+
+
+class TestThreadSafety(StorageTestCase):
+    """Нагрузочный тест: одно хранилище на много потоков."""
+
+    THREADS = 8
+    ITERATIONS = 150
+
+    def test_mixed_readers_and_writers(self):
+        """Поиск, сортировка и изменения книг и цитат из многих потоков."""
+        storage = LibraryStorage()
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def worker(n):
+            rnd = random.Random(n)
+            book_filter = BookFilter(index=storage.sort_index, stats=storage.token_stats,
+                                     cache=storage.query_cache)
+            try:
+                start.wait()
+                for i in range(self.ITERATIONS):
+                    books = storage.books  # неизменяемый снимок
+                    found = book_filter.search_books(books, genre='роман')
+                    if not all(b in books and b.genre == "Роман" for b in found):
+                        errors.append(('search', n, i))
+                    ordered = book_filter.sort_books(books, 'title', limit=5)
+                    titles = [b.title.casefold() for b in ordered]
+                    if titles != sorted(titles) or len(ordered) != min(5, len(books)):
+                        errors.append(('sort', n, i))
+
+                    target = rnd.choice(books)
+                    action = rnd.random()
+                    if action < 0.4:
+                        storage.add_quote_to_book(target.id, f"Цитата {n}-{i}")
+                    elif action < 0.7:
+                        storage.remove_quote(target.id, 0)
+                    elif action < 0.85:
+                        storage.add_book(Book(f"Книга {n}-{i}", "Поток", 2000, "Роман"))
+                    else:
+                        extra = [b for b in books if b.author == "Поток"]
+                        if extra:
+                            storage.remove_book(rnd.choice(extra).id)
+                    len(target.quotes)  # ленивая загрузка цитат параллельно с записью
+            except Exception as e:  # pragma: no cover - ошибка попадет в assert
+                errors.append(e)
+
+        # Цитата к книге, которую другой поток уже удалил, не добавится:
+        # хранилище печатает ошибку, это ожидаемо
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.THREADS)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+
+        # Кеш совпадает с базой, индекс сортировки - с кешем
+        fresh = LibraryStorage(eager_quotes=True)
+        cached = {b.id: (b.title, b.quotes) for b in storage.books}
+        self.assertEqual(cached, {b.id: (b.title, b.quotes) for b in fresh.books})
+        self.assertEqual(storage.sort_index.ordered('title'),
+                         BookFilter().sort_books(storage.books, 'title'))
+
+
+if __name__ == '__main__':
+    unittest.main()
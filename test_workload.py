@@ -0,0 +1,85 @@
+"""Тесты для модуля workload.py (запись и воспроизведение нагрузки)."""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import main as cli
+from booklib.commands import LibraryCommands
+from booklib.models import Book
+from booklib.workload import decode_value, encode_value, latency_summary, read_workload, replay
+from test_storage import StorageTestCase
+
+
+class TestWorkload(StorageTestCase):
+    """Тесты записи нагрузки через CLI и ее воспроизведения."""
+
+    def setUp(self):
+        super().setUp()
+        fd, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def run_cli(self, *argv):
+        with mock.patch.object(sys, 'argv', ['main.py', *argv]), \
+                contextlib.redirect_stdout(io.StringIO()) as out:
+            cli.main()
+        return out.getvalue()
+
+    def record(self):
+        self.run_cli('--record', self.path, 'list', '--sort-by', 'year')
+        self.run_cli('--record', self.path, 'search', '--genre', 'роман', 'повесть')
+        self.run_cli('--record', self.path, 'add-quote', '--title', 'Палата', '--author', 'Чехов',
+                     '--quote', 'Новая цитата')
+        with open(self.path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_record(self):
+        """Записываются вызовы команд и вложенные вызовы хранилища."""
+        events = self.record()
+        top = [e for e in events if e['depth'] == 0]
+        self.assertEqual([e['method'] for e in top], ['list_books', 'search_books', 'add_quote'])
+        self.assertEqual(top[1]['kwargs']['genre'], ['роман', 'повесть'])
+        self.assertEqual(top[1]['queries'], 1)  # поиск одним запросом к БД
+        nested = [e['method'] for e in events if e['depth'] == 1]
+        self.assertIn('add_quote_to_book', nested)
+        self.assertEqual([e['method'] for e in read_workload(json.dumps(e) for e in events)],
+                         [e['method'] for e in top])
+
+    def test_replay(self):
+        """Нагрузка воспроизводится в несколько потоков, отчет сравнивает ее с записью."""
+        events = read_workload(json.dumps(e) for e in self.record())
+        commands = LibraryCommands(write_behind=True)
+        self.addCleanup(commands.storage.close)
+        report = replay(events * 3, commands, concurrency=3)
+        self.assertEqual(report['calls'], 9)
+        self.assertEqual(report['errors'], 0)
+        self.assertEqual(report['methods']['commands.add_quote']['latency']['count'], 3)
+        self.assertEqual(report['recorded']['latency']['count'], 9)
+        self.assertEqual(commands.storage.books[2].quotes, ["Новая цитата"])  # повторы не добавились
+
+        output = self.run_cli('replay', '--file', self.path, '--speed', '1000', '--pool-size', '0')
+        self.assertEqual(json.loads(output)['calls'], 3)
+
+    def test_values_round_trip(self):
+        """Книги и вложенные значения переживают запись в JSON."""
+        book = Book("Идиот", "Фёдор Достоевский", 1869, "Роман", ["Красота спасет мир"])
+        book.id = 7
+        decoded = decode_value(json.loads(json.dumps(encode_value([book, {'year': (1, 2)}, object()]))))
+        self.assertEqual((decoded[0].id, decoded[0].to_dict()), (7, book.to_dict()))
+        self.assertEqual(decoded[1:], [{'year': [1, 2]}, None])
+
+    def test_latency_summary(self):
+        """Перцентили считаются по ближайшему рангу."""
+        summary = latency_summary(list(range(1, 101)))
+        self.assertEqual((summary['p50'], summary['p90'], summary['p99'], summary['max']), (50, 90, 99, 100))
+        self.assertIsNone(latency_summary([])['p50'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""Тесты для модуля writeback.py (отложенная запись цитат)."""
+
+from booklib.metrics import METRICS
+from booklib.storage import LibraryStorage
+from test_storage import StorageTestCase
+
+
+class TestWriteBehind(StorageTestCase):
+    """Тесты очереди отложенной записи хранилища."""
+
+    def setUp(self):
+        super().setUp()
+        METRICS.reset()
+        METRICS.enable()
+        self.addCleanup(METRICS.enable, False)
+        self.addCleanup(METRICS.reset)
+
+    def storage(self, **options):
+        options.setdefault('interval', 60)  # фиксация только по размеру группы или явно
+        storage = LibraryStorage(eager_quotes=True, write_behind=options)
+        self.addCleanup(storage.close)
+        return storage
+
+    def stored_quotes(self, book_id):
+        return LibraryStorage(eager_quotes=True, pool_size=0).books[book_id - 1].quotes
+
+    def test_group_commit(self):
+        """Цитаты сразу видны в кеше и фиксируются одной транзакцией."""
+        storage = self.storage()
+        futures = [storage.add_quote_to_book(2, f"Цитата {i}") for i in range(20)]
+        self.assertEqual(storage.books[1].quote_count, 21)
+        self.assertFalse(any(f.done() for f in futures))
+        self.assertEqual(self.stored_quotes(2), ["Рукописи не горят"])
+
+        storage.flush_writes()
+        self.assertTrue(all(f.result() for f in futures))
+        self.assertEqual(self.stored_quotes(2), storage.books[1].quotes)
+        self.assertEqual(METRICS.snapshot()['counters']['writes.batches'], 1)
+
+    def test_duplicates(self):
+        """Повтор цитаты не сохраняется; у ленивой книги счетчик исправляется после фиксации."""
+        storage = self.storage()
+        self.assertFalse(storage.add_quote_to_book(1, "Цитата 1").result())
+
+        lazy = LibraryStorage(write_behind={'interval': 60})
+        self.addCleanup(lazy.close)
+        futures = [lazy.add_quote_to_book(1, quote) for quote in ("Цитата 2", "Цитата 3", "Цитата 3")]
+        self.assertEqual(lazy.books[0].quote_count, 5)
+        lazy.flush_writes()
+        self.assertEqual([f.result() for f in futures], [False, True, False])
+        self.assertEqual(lazy.books[0].quote_count, 3)
+        self.assertFalse(lazy.books[0].quotes_loaded)
+
+    def test_flushed_by_size_and_time(self):
+        """Группа фиксируется фоновым потоком по размеру и по интервалу."""
+        storage = self.storage(max_items=3)
+        futures = [storage.add_quote_to_book(3, f"Цитата {i}") for i in range(3)]
+        self.assertTrue(all(f.result(timeout=5) for f in futures))
+
+        storage = self.storage(interval=0.01)
+        self.assertTrue(storage.add_quote_to_book(3, "Еще одна").result(timeout=5))
+        self.assertEqual(self.stored_quotes(3), ["Цитата 0", "Цитата 1", "Цитата 2", "Еще одна"])
+
+    def test_bounded_queue(self):
+        """Заполненная очередь фиксируется потоком, который в нее пишет."""
+        storage = self.storage(max_pending=2)
+        first = storage.add_quote_to_book(3, "Первая")
+        self.assertFalse(first.done())
+        storage.add_quote_to_book(3, "Вторая")
+        self.assertTrue(first.done())
+        self.assertEqual(len(storage.writes), 0)
+
+    def test_failed_item_isolated(self):
+        """Ошибка одной записи не отменяет остальные записи группы."""
+        storage = self.storage()
+        good = storage.add_quote_to_book(3, "Сохранится")
+        bad = storage.add_quote_to_book(999, "Книги нет")
+        storage.flush_writes()
+        self.assertTrue(good.result())
+        self.assertIsInstance(bad.exception(), Exception)
+        self.assertEqual(self.stored_quotes(3), ["Сохранится"])
+
+    def test_sync_changes_see_pending(self):
+        """Изменения вне очереди сначала фиксируют ее: индексы цитат совпадают с БД."""
+        storage = self.storage()
+        storage.add_quote_to_book(2, "Новая")
+        self.assertTrue(storage.remove_quote(2, 1))
+        self.assertEqual(storage.books[1].quotes, ["Рукописи не горят"])
+        self.assertEqual(self.stored_quotes(2), ["Рукописи не горят"])
+
+    def test_close_flushes(self):
+        """При закрытии хранилища очередь фиксируется."""
+        storage = self.storage()
+        future = storage.add_quote_to_book(1, "Последняя")
+        storage.close()
+        self.assertTrue(future.result(timeout=0))
+        self.assertEqual(self.stored_quotes(1)[-1], "Последняя")
+        with self.assertRaises(RuntimeError):
+            storage.add_quote_to_book(1, "После закрытия")
+        self.assertEqual(storage.books[0].quotes[-1], "Последняя")